@@ -30,13 +30,12 @@ sudo apt-get install bzr gfortran haproxy  \
     libevent-dev libgfortran3 liblapack-dev liblapack3gf \
     libpq-dev libyaml-dev libxml2-dev libxslt1-dev libumfpack5.4.0 \
     openssl python2.7-dev python-m2crypto python-numpy python-pip \
-    python-scipy python-zdaemon swig uuid-dev uuid-runtime
+    python-zdaemon swig uuid-dev uuid-runtime
 
 mkdir $CURDIR/zato_extra_paths
 
 symlink_py 'M2Crypto'
 symlink_py 'numpy'
-symlink_py 'scipy'
 
 sudo pip install --upgrade distribute
 sudo pip install --upgrade virtualenv
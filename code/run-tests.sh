@@ -1,2 +1,4 @@
 #!/bin/sh
-./bin/nosetests ./zato-* --with-coverage --cover-package=zato --nocapture
+
+# Benchmarks only log their timings and are not run by default, use ./bin/nosetests ./zato-* -a benchmark to run them
+./bin/nosetests ./zato-* --with-coverage --cover-package=zato --nocapture -a '!benchmark'
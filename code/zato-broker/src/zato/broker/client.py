@@ -10,10 +10,10 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import logging, os, time
+from functools import partial
+from sys import maxint
 from threading import Thread
-
-# anyjson
-from anyjson import dumps, loads
+from traceback import format_exc
 
 # Bunch
 from bunch import Bunch
@@ -23,15 +23,27 @@ import redis
 
 # Zato
 from zato.common import BROKER, ZATO_NONE
+from zato.common.json import dumps, loads
 from zato.common.util import new_cid, TRACE1
 from zato.common.broker_message import KEYS, MESSAGE_TYPE, TOPICS
 
 logger = logging.getLogger(__name__)
 
 REMOTE_END_CLOSED_SOCKET = 'Socket closed on remote end'
-NEEDS_TMP_KEY = [v for k,v in TOPICS.items() if k in(
-    MESSAGE_TYPE.TO_PARALLEL_ANY, 
-)]
+# Message types delivered through queues rather than published on topics
+QUEUE_MSG_TYPES = (MESSAGE_TYPE.TO_PARALLEL_ANY,)
+
+def get_queue_key(msg_type):
+    return b'zato:broker:queue{}'.format(KEYS[msg_type])
+
+def get_in_flight_key(queue_key, name):
+    return b'{}:in-flight:{}'.format(queue_key, name)
+
+def get_consumers_key(queue_key):
+    return b'{}:consumers'.format(queue_key)
+
+def get_consumer_alive_key(queue_key, name):
+    return b'{}:alive:{}'.format(queue_key, name)
 
 class _ClientThread(Thread):
     def __init__(self, kvdb, pubsub, name, topic_callbacks=None, on_message=None):
@@ -75,6 +87,136 @@ class _ClientThread(Thread):
         self.keep_running = False
         self.client.close()
 
+class _QueueClientThread(Thread):
+    """ Consumes messages off a KVDB list which other clients push the messages onto.
+    Each message is atomically moved with BRPOPLPUSH onto a list of messages being
+    processed by this consumer and removed from it once it's been handled, so each message
+    is delivered to exactly one consumer without being broadcast to all of them.
+    
+    If on_message returns an object with an add_done_callback method, such as a task
+    of the server's executor, the message is removed only once the callback is called,
+    i.e. when the message has been processed rather than merely handed over.
+
+    Each consumer keeps a key of its own alive, should it not be refreshed in time,
+    another consumer will move all the messages the former one had in flight back
+    onto the queue so they can be redelivered. The key is refreshed in a thread of its own
+    so that a consumer whose on_message blocks is not taken for a dead one.
+    """
+    def __init__(self, kvdb, name, queue_key, on_message):
+        Thread.__init__(self)
+        self.kvdb = kvdb
+        self.name = name
+        self.queue_key = queue_key
+        self.in_flight_key = get_in_flight_key(queue_key, name)
+        self.consumers_key = get_consumers_key(queue_key)
+        self.alive_key = get_consumer_alive_key(queue_key, name)
+        self.on_message = on_message
+        self.keep_running = ZATO_NONE
+        self.last_heartbeat = 0
+        self.last_requeue = 0
+        
+    def heartbeat(self):
+        """ Tells other consumers this one is still alive, though only if the last time
+        it's been done was long enough ago so that it doesn't cost a KVDB call per message.
+        """
+        now = time.time()
+        if now - self.last_heartbeat > BROKER.QUEUE_CONSUMER_HEARTBEAT:
+            self.kvdb.conn.setex(self.alive_key, BROKER.QUEUE_CONSUMER_EXPIRATION, now)
+            self.last_heartbeat = now
+            
+    def keep_alive(self):
+        """ Runs in a background thread and refreshes the heartbeat for as long as the consumer does.
+        """
+        while self.keep_running:
+            try:
+                self.heartbeat()
+            except Exception, e:
+                logger.warn('Could not refresh [{}], e:[{}]'.format(self.alive_key, format_exc(e)))
+            time.sleep(BROKER.QUEUE_CONSUMER_HEARTBEAT / 5.0)
+
+    def ack(self, data):
+        """ Removes a message from the list of ones in flight, we're done with it.
+        """
+        try:
+            self.kvdb.conn.lrem(self.in_flight_key, 1, data)
+        except Exception, e:
+            logger.error('Could not ack message:[{}], e:[{}]'.format(data, format_exc(e)))
+
+    def requeue_orphaned(self):
+        """ Moves messages held by consumers that are not alive anymore back onto the queue.
+        RPOPLPUSH is atomic so no message will be moved twice even if many consumers
+        are doing it at the same time.
+        """
+        now = time.time()
+        if now - self.last_requeue < BROKER.QUEUE_CONSUMER_EXPIRATION:
+            return
+        self.last_requeue = now
+        
+        for name in self.kvdb.conn.smembers(self.consumers_key):
+            if name == self.name or self.kvdb.conn.exists(get_consumer_alive_key(self.queue_key, name)):
+                continue
+            
+            in_flight_key = get_in_flight_key(self.queue_key, name)
+            count = 0
+            while self.kvdb.conn.rpoplpush(in_flight_key, self.queue_key):
+                count += 1
+                
+            self.kvdb.conn.srem(self.consumers_key, name)
+            
+            if count:
+                logger.warn('Requeued [{}] message(s) of consumer [{}] in [{}]'.format(count, name, self.queue_key))
+        
+    def run(self):
+        self.kvdb.init()
+        self.kvdb.conn.sadd(self.consumers_key, self.name)
+        self.heartbeat()
+        self.keep_running = True
+        
+        keep_alive = Thread(target=self.keep_alive)
+        keep_alive.daemon = True
+        keep_alive.start()
+        
+        try:
+            while self.keep_running:
+                self.requeue_orphaned()
+                
+                data = self.kvdb.conn.brpoplpush(self.queue_key, self.in_flight_key, BROKER.QUEUE_POP_TIMEOUT)
+                if data is None:
+                    continue
+                
+                try:
+                    result = self.on_message(data)
+                except Exception, e:
+                    logger.error('Could not handle message:[{}], e:[{}]'.format(data, format_exc(e)))
+                    result = None
+                    
+                # A message handed over to be processed in the background is acked once it's been processed
+                add_done_callback = getattr(result, 'add_done_callback', None)
+                if add_done_callback:
+                    add_done_callback(partial(self.ack, data))
+                else:
+                    self.ack(data)
+                    
+        except KeyboardInterrupt:
+            self.keep_running = False
+        except redis.ConnectionError, e:
+            if e.message != REMOTE_END_CLOSED_SOCKET:
+                raise
+            msg = 'Caught [{}], will quit now'.format(REMOTE_END_CLOSED_SOCKET)
+            logger.info(msg)
+            
+    def close(self):
+        """ Deregisters the consumer, any messages still in flight are moved back onto the queue.
+        """
+        self.keep_running = False
+        while self.kvdb.conn.rpoplpush(self.in_flight_key, self.queue_key):
+            pass
+        
+        with self.kvdb.conn.pipeline() as p:
+            p.srem(self.consumers_key, self.name)
+            p.delete(self.alive_key)
+            p.execute()
+
 class BrokerClient(Thread):
     """ Zato broker client. Starts two background threads, one for publishing
     and one for receiving of the messages.
@@ -88,15 +230,11 @@ class BrokerClient(Thread):
     1) and 2) are straightforward, a message is being published on a topic, 
        off which it is read by broker client(s). 
     
-    3) needs more work - the actual message is added to Redis and what is really
-       being published is a Redis key it's been stored under. The first client
-       to read it will be the one to handle it. 
-       
-       Yup, it means the messages are sent across to all of the clients
-       and the winning one is the one that picked up the Redis message; it's not
-       that bad as it may seem, there will be at most as many clients as there 
-       are servers in the cluster and truth to be told, Zero MQ < 3.x also would
-       do client-side PUB/SUB filtering and it did scale nicely.
+    3) is a queue - the message is pushed onto a Redis list off which each of
+       the parallel servers' clients pops messages with BRPOPLPUSH. Each message
+       is delivered to exactly one client, no matter how many servers there are
+       in the cluster, and is redelivered to another one should the client
+       that picked it up die before handling it, see _QueueClientThread for details.
     """
     def __init__(self, kvdb, client_type, topic_callbacks):
         Thread.__init__(self)
@@ -104,37 +242,77 @@ class BrokerClient(Thread):
         self.decrypt_func = kvdb.decrypt_func
         self.name = '{}-{}'.format(client_type, new_cid())
         self.topic_callbacks = topic_callbacks
+        self.queue_clients = []
         
     def run(self):
         logger.info('Starting broker client, host:[{}], port:[{}], name:[{}], topics:[{}]'.format(
             self.kvdb.config.host, self.kvdb.config.port, self.name, sorted(self.topic_callbacks)))
         
+        # Messages of some types are not published on topics, each of them is consumed off a queue instead
+        topic_callbacks = dict(self.topic_callbacks)
+        for msg_type in QUEUE_MSG_TYPES:
+            callback = topic_callbacks.pop(TOPICS[msg_type], None)
+            if callback:
+                self.queue_clients.append(_QueueClientThread(self.kvdb.copy(), self.name, get_queue_key(msg_type), 
+                    self.on_queue_message(callback)))
+        
         self.pub_client = _ClientThread(self.kvdb.copy(), 'pub', self.name)
-        self.sub_client = _ClientThread(self.kvdb.copy(), 'sub', self.name, self.topic_callbacks, self.on_message)
+        self.sub_client = _ClientThread(self.kvdb.copy(), 'sub', self.name, topic_callbacks, self.on_message)
         
-        self.pub_client.start()
-        self.sub_client.start()
+        for client in [self.pub_client, self.sub_client] + self.queue_clients:
+            client.start()
         
-        for client in(self.pub_client, self.sub_client):
+        for client in [self.pub_client, self.sub_client] + self.queue_clients:
             while client.keep_running == ZATO_NONE:
                 time.sleep(0.01)
         
-    def publish(self, msg, msg_type=MESSAGE_TYPE.TO_PARALLEL_ALL):
+    def publish(self, msg, msg_type=MESSAGE_TYPE.TO_PARALLEL_ALL, topic=None):
+        """ Publishes a message on a topic, the default one of a given message type
+        unless another one is given on input.
+        """
         msg['msg_type'] = msg_type
-        topic = TOPICS[msg_type]
+        topic = topic or TOPICS[msg_type]
         self.pub_client.publish(topic, dumps(msg))
         
+    def subscribe(self, topic, callback):
+        """ Subscribes to an additional topic. Note that it must be called from
+        the subscribing thread itself, i.e. by one of the callbacks.
+        """
+        self.topic_callbacks[topic] = callback
+        self.sub_client.client.subscribe(topic)
+        
+    def unsubscribe(self, topic):
+        """ The reverse of subscribe, with the same requirements as to threads.
+        """
+        self.sub_client.client.unsubscribe(topic)
+        self.topic_callbacks.pop(topic, None)
+        
     def invoke_async(self, msg, msg_type=MESSAGE_TYPE.TO_PARALLEL_ANY, expiration=BROKER.DEFAULT_EXPIRATION):
+        """ Pushes a message onto a queue off which it will be picked up by exactly one of the consumers.
+        It's a single KVDB call and the message will be dropped by the consumer if it's not
+        picked up in 'expiration' seconds.
+        """
         msg['msg_type'] = msg_type
-        msg = dumps(msg)
+        msg['expires_at'] = time.time() + expiration
         
-        topic = TOPICS[msg_type]
-        key = broker_msg = b'zato:broker{}:{}'.format(KEYS[msg_type], new_cid())
+        self.kvdb.conn.lpush(get_queue_key(msg_type), str(dumps(msg)))
         
-        self.kvdb.conn.set(key, str(msg))
-        self.kvdb.conn.expire(key, expiration) # In seconds
+    def on_queue_message(self, callback):
+        """ Returns a function which will be passing messages read off a queue to a given callback.
+        """
+        def _on_queue_message(data):
+            payload = Bunch(loads(data))
+            
+            if payload.get('expires_at', maxint) < time.time():
+                logger.warning('Dropping expired message:[{}]'.format(payload))
+                return
+                
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('Got broker message payload [{}]'.format(payload))
+                
+            return callback(payload)
         
-        self.pub_client.publish(topic, broker_msg)
+        return _on_queue_message
         
     def on_message(self, msg):
         if logger.isEnabledFor(logging.DEBUG):
@@ -142,26 +320,7 @@ class BrokerClient(Thread):
         
         if msg.type == 'message':
     
-            # Replace payload with stuff read off the KVDB in case this is where the actual message happens to reside.
-            if msg.channel in NEEDS_TMP_KEY:
-                tmp_key = '{}.tmp'.format(msg.data)
-                
-                try:
-                    self.kvdb.conn.rename(msg.data, tmp_key)
-                except redis.ResponseError, e:
-                    if e.message != 'ERR no such key': # Doh, I hope Redis guys don't change it out of a sudden :/
-                        raise
-                    else:
-                        payload = None
-                else:
-                    payload = self.kvdb.conn.get(tmp_key)
-                    self.kvdb.conn.delete(tmp_key) # Note that it would've expired anyway
-                    if not payload:
-                        logger.warning('No KVDB payload for key [{}] (already expired?)'.format(tmp_key))
-                    else:
-                        payload = loads(payload)
-            else:
-                payload = loads(msg.data)
+            payload = loads(msg.data)
                 
             if payload:
                 payload = Bunch(payload)
@@ -175,6 +334,9 @@ class BrokerClient(Thread):
                     logger.debug('No payload in msg:[{}]'.format(msg))
 
     def close(self):
-        for client in(self.pub_client, self.sub_client):
+        for client in self.queue_clients:
+            client.close()
+            
+        for client in [self.pub_client, self.sub_client] + self.queue_clients:
             client.keep_running = False
             client.kvdb.close()
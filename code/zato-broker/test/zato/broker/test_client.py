@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from threading import Condition
+from time import sleep, time
+from unittest import TestCase
+
+# nose
+from nose.tools import eq_
+
+# Zato
+from zato.broker.client import get_consumer_alive_key, get_consumers_key, get_in_flight_key, _QueueClientThread
+from zato.common import BROKER
+from zato.common.test import rand_string
+
+class FakeConn(object):
+    """ An in-memory KVDB implementing only the commands queue consumers use. Lists
+    are kept head first, the way LPUSH and RPOPLPUSH see them.
+    """
+    def __init__(self):
+        self.lists = {}
+        self.sets = {}
+        self.expires = {} # Key -> when it expires
+        self.condition = Condition()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignored):
+        pass
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        pass
+
+    def lpush(self, key, value):
+        with self.condition:
+            self.lists.setdefault(key, []).insert(0, value)
+            self.condition.notify_all()
+
+    def lrange(self, key, start, stop):
+        with self.condition:
+            return list(self.lists.get(key, []))
+
+    def rpoplpush(self, src, dst):
+        with self.condition:
+            if self.lists.get(src):
+                value = self.lists[src].pop()
+                self.lists.setdefault(dst, []).insert(0, value)
+                return value
+
+    def brpoplpush(self, src, dst, timeout):
+        with self.condition:
+            if not self.lists.get(src):
+                self.condition.wait(min(timeout, 0.05))
+            return self.rpoplpush(src, dst)
+
+    def lrem(self, key, count, value):
+        with self.condition:
+            if value in self.lists.get(key, []):
+                self.lists[key].remove(value)
+                return 1
+            return 0
+
+    def sadd(self, key, value):
+        self.sets.setdefault(key, set()).add(value)
+
+    def srem(self, key, value):
+        self.sets.get(key, set()).discard(value)
+
+    def smembers(self, key):
+        return set(self.sets.get(key, set()))
+
+    def setex(self, key, expire, value):
+        self.expires[key] = time() + expire
+
+    def exists(self, key):
+        return self.expires.get(key, 0) > time()
+
+    def delete(self, key):
+        self.expires.pop(key, None)
+
+class FakeKVDB(object):
+    def __init__(self, conn):
+        self.conn = conn
+
+    def init(self):
+        pass
+
+class QueueClientTestCase(TestCase):
+
+    def setUp(self):
+        self.conn = FakeConn()
+        self.queue_key = b'zato:broker:queue:{}'.format(rand_string())
+        self.consumers = []
+
+    def tearDown(self):
+        for consumer in self.consumers:
+            consumer.keep_running = False
+            consumer.join()
+
+    def _wait_for(self, predicate, timeout=5.0):
+        for x in range(int(timeout / 0.01)):
+            if predicate():
+                return
+            sleep(0.01)
+        self.fail('Predicate not met in {}s'.format(timeout))
+
+    def get_consumer(self, on_message, name=None, start=True):
+        consumer = _QueueClientThread(FakeKVDB(self.conn), name or rand_string(), self.queue_key, on_message)
+        if start:
+            consumer.start()
+            self.consumers.append(consumer)
+        return consumer
+
+    def test_each_message_to_one_consumer(self):
+        received = {}
+
+        def get_on_message(name):
+            def on_message(data):
+                received.setdefault(name, []).append(data)
+            return on_message
+
+        for name in ('consumer1', 'consumer2', 'consumer3'):
+            self.get_consumer(get_on_message(name), name)
+
+        messages = [rand_string() for x in range(100)]
+        for data in messages:
+            self.conn.lpush(self.queue_key, data)
+
+        self._wait_for(lambda: sum(len(value) for value in received.values()) == len(messages))
+        sleep(0.1) # Nothing is delivered twice even after a while
+
+        all_received = sum(received.values(), [])
+        eq_(sorted(all_received), sorted(messages))
+
+    def test_ack_after_on_message(self):
+        in_flight_during = []
+
+        consumer = self.get_consumer(lambda data: in_flight_during.append(self.conn.lrange(consumer.in_flight_key, 0, -1)))
+        self.conn.lpush(self.queue_key, 'abc')
+
+        self._wait_for(lambda: in_flight_during)
+        self._wait_for(lambda: not self.conn.lrange(consumer.in_flight_key, 0, -1))
+
+        # The message was in flight for as long as it was being handled and was removed only afterwards
+        eq_(in_flight_during, [['abc']])
+        eq_(self.conn.lrange(self.queue_key, 0, -1), [])
+
+    def test_ack_on_task_done(self):
+        tasks = []
+
+        class FakeTask(object):
+            def __init__(self):
+                self.callbacks = []
+
+            def add_done_callback(self, callback):
+                self.callbacks.append(callback)
+
+        def on_message(data):
+            tasks.append(FakeTask())
+            return tasks[-1]
+
+        consumer = self.get_consumer(on_message)
+        self.conn.lpush(self.queue_key, 'abc')
+
+        self._wait_for(lambda: tasks and tasks[0].callbacks)
+        sleep(0.1)
+
+        # Handed over yet still in flight until the task is done
+        eq_(self.conn.lrange(consumer.in_flight_key, 0, -1), ['abc'])
+
+        for callback in tasks[0].callbacks:
+            callback()
+        eq_(self.conn.lrange(consumer.in_flight_key, 0, -1), [])
+
+    def test_ack_on_error(self):
+        def on_message(data):
+            raise Exception('Expected')
+
+        consumer = self.get_consumer(on_message)
+        self.conn.lpush(self.queue_key, 'abc')
+
+        self._wait_for(lambda: not self.conn.lrange(self.queue_key, 0, -1))
+        self._wait_for(lambda: not self.conn.lrange(consumer.in_flight_key, 0, -1))
+
+    def test_requeue_orphaned(self):
+        dead = rand_string()
+        dead_in_flight_key = get_in_flight_key(self.queue_key, dead)
+        consumers_key = get_consumers_key(self.queue_key)
+
+        self.conn.sadd(consumers_key, dead)
+        self.conn.setex(get_consumer_alive_key(self.queue_key, dead), BROKER.QUEUE_CONSUMER_EXPIRATION, 1)
+        self.conn.lpush(dead_in_flight_key, 'abc')
+        self.conn.lpush(dead_in_flight_key, 'def')
+
+        consumer = self.get_consumer(None, start=False)
+        consumer.requeue_orphaned()
+
+        # The other consumer is still alive so its messages stay where they are
+        eq_(self.conn.lrange(dead_in_flight_key, 0, -1), ['def', 'abc'])
+        eq_(self.conn.lrange(self.queue_key, 0, -1), [])
+
+        # Its key expires after QUEUE_CONSUMER_EXPIRATION seconds without a heartbeat
+        self.conn.expires[get_consumer_alive_key(self.queue_key, dead)] = time() - 1
+
+        # Requeueing isn't attempted more often than once in QUEUE_CONSUMER_EXPIRATION seconds
+        consumer.requeue_orphaned()
+        eq_(self.conn.lrange(self.queue_key, 0, -1), [])
+
+        consumer.last_requeue = time() - BROKER.QUEUE_CONSUMER_EXPIRATION
+        consumer.requeue_orphaned()
+
+        # Order is preserved, the oldest message is still the first one to be popped off the queue
+        eq_(self.conn.lrange(dead_in_flight_key, 0, -1), [])
+        eq_(self.conn.lrange(self.queue_key, 0, -1), ['def', 'abc'])
+        eq_(self.conn.smembers(consumers_key), set())
+
+    def test_requeued_redelivered(self):
+        dead = rand_string()
+        self.conn.sadd(get_consumers_key(self.queue_key), dead)
+        self.conn.lpush(get_in_flight_key(self.queue_key, dead), 'abc')
+
+        received = []
+        self.get_consumer(received.append)
+
+        self._wait_for(lambda: received == ['abc'])
+
+    def test_close(self):
+        consumer = self.get_consumer(None, start=False)
+        self.conn.sadd(consumer.consumers_key, consumer.name)
+        self.conn.lpush(consumer.in_flight_key, 'abc')
+
+        consumer.close()
+
+        eq_(self.conn.lrange(self.queue_key, 0, -1), ['abc'])
+        eq_(self.conn.smembers(consumer.consumers_key), set())
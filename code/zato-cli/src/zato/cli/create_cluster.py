@@ -63,7 +63,10 @@ zato_services = {
     'zato.http-soap.create':'zato.server.service.internal.http_soap.Create',
     'zato.http-soap.delete':'zato.server.service.internal.http_soap.Delete',
     'zato.http-soap.edit':'zato.server.service.internal.http_soap.Edit',
+    'zato.http-soap.get-cache-stats':'zato.server.service.internal.http_soap.GetCacheStats',
+    'zato.http-soap.get-circuit-breaker-list':'zato.server.service.internal.http_soap.GetCircuitBreakerList',
     'zato.http-soap.get-list':'zato.server.service.internal.http_soap.GetList',
+    'zato.http-soap.get-pool-stats':'zato.server.service.internal.http_soap.GetPoolStats',
     'zato.http-soap.ping':'zato.server.service.internal.http_soap.Ping',
     
     # Key/value DB
@@ -89,6 +92,7 @@ zato_services = {
     'zato.outgoing.amqp.delete':'zato.server.service.internal.outgoing.amqp.Delete',
     'zato.outgoing.amqp.edit':'zato.server.service.internal.outgoing.amqp.Edit',
     'zato.outgoing.amqp.get-list':'zato.server.service.internal.outgoing.amqp.GetList',
+    'zato.outgoing.amqp.get-stats':'zato.server.service.internal.outgoing.amqp.GetStats',
     
     # Outgoing connections - FTP
     'zato.outgoing.ftp.change-password':'zato.server.service.internal.outgoing.ftp.ChangePassword',
@@ -156,6 +160,7 @@ zato_services = {
     'zato.server.delete':'zato.server.service.internal.server.Delete',
     'zato.server.edit':'zato.server.service.internal.server.Edit',
     'zato.server.get-by-id':'zato.server.service.internal.server.GetByID',
+    'zato.server.get-executor-stats':'zato.server.service.internal.server.GetExecutorStats',
     
     # Services
     'zato.service.configure-request-response':'zato.server.service.internal.service.ConfigureRequestResponse',
@@ -78,6 +78,40 @@ initial_sleep_time=500
 connector_server_keep_alive_job_time=30 # In seconds
 grace_time_multiplier=3
 
+[stats]
+flush_interval=1000 # In milliseconds
+
+[invoker]
+pool_size=100 # How many service invocations delivered by the broker may be running concurrently in each worker
+queue_size=1000 # How many may be waiting for a free thread (ignored under gevent)
+invoke_many_pool_size=10 # How many services a single Service.invoke_many call may invoke concurrently
+
+# How many invocations from a given channel may be running concurrently, no limit if not given
+channel_limit_scheduler=50
+channel_limit_amqp=50
+channel_limit_jms-wmq=50
+channel_limit_zmq=50
+channel_limit_invoke-async=50
+
+# How many invocations from a channel at its limit may be waiting for it, the broker client waits too once there are that many
+channel_queue_size=1000
+
+[http]
+max_body_size=104857600 # In bytes, larger requests are rejected before their body is read, 0 = no limit
+
+[outgoing_http]
+gather_pool_size=10 # How many outgoing HTTP/SOAP calls a single gather or map may run concurrently
+
+[amqp_publisher]
+confirms=False # Whether to wait for the broker to confirm each message has been published
+batch_size=1 # Messages are published one by one if it's 1 and in batches sharing a single confirm wait otherwise
+linger=5 # In milliseconds, how long to wait for a batch to fill up
+confirm_timeout=10 # In seconds
+stats_interval=10 # In seconds, how often publish rate and confirm latency are stored in the KVDB
+
+[json]
+backends=ujson, simplejson, json # The first one that can be imported is used, ujson is used for decoding only
+
 [spring]
 context_class=zato.server.spring_context.ZatoContext
 
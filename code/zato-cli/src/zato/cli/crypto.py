@@ -11,12 +11,10 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 # stdlib
 import os
 
-# anyjson
-import anyjson
-
 # Zato
 from zato.cli import ManageCommand, ZatoCommand
 from zato.common.crypto import CryptoManager
+from zato.common.json import dumps, loads
 from zato.common.util import decrypt, encrypt, get_config
 
 class Encrypt(ZatoCommand):
@@ -83,7 +81,7 @@ class UpdateCrypto(ManageCommand):
         
     def _on_web_admin(self, args):
         def load_secrets(secrets, secret_names, crypto_manager, conf_location, ignored):
-            conf = anyjson.loads(open(conf_location).read())
+            conf = loads(open(conf_location).read())
             for name in secret_names:
                 secrets[name] = crypto_manager.decrypt(conf[name])
                 
@@ -92,7 +90,7 @@ class UpdateCrypto(ManageCommand):
         def store_secrets(secrets, secret_names, crypto_manager, conf_location, conf):
             for name in secret_names:
                 conf[name] = crypto_manager.encrypt(secrets[name])
-            open(conf_location, 'w').write(anyjson.dumps(conf))
+            open(conf_location, 'w').write(dumps(conf))
                 
         self._update_crypto(args, self.copy_web_admin_crypto, True, load_secrets, store_secrets, 'web-admin.conf',
             'web-admin-priv-key.pem', 'web-admin-pub-key.pem', ['DATABASE_PASSWORD', 'TECH_ACCOUNT_PASSWORD'])
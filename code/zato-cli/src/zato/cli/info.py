@@ -10,7 +10,6 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import os
-from anyjson import dumps, loads
 from datetime import datetime
 
 # psutil
@@ -24,6 +23,7 @@ from texttable import Texttable
 
 # Zato
 from zato.cli import ManageCommand, ZATO_INFO_FILE
+from zato.common.json import dumps, loads
 from zato.common.util import current_host
 
 DEFAULT_COLS_WIDTH = '30,90'
@@ -12,9 +12,6 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import os
 from contextlib import closing
 
-# anyjson
-import anyjson
-
 # Bunch
 from bunch import Bunch
 
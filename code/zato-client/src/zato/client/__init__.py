@@ -10,12 +10,8 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import logging
-from datetime import datetime
 from traceback import format_exc
 
-# anyjson
-from anyjson import dumps, loads
-
 # Bunch
 from bunch import bunchify
 
@@ -29,6 +25,7 @@ import requests
 from zato.common import BROKER, soap_doc, soap_body_path, soap_data_path, soap_data_xpath, \
      soap_fault_xpath, ZatoException, zato_data_path, zato_data_xpath, zato_details_xpath, \
      ZATO_NOT_GIVEN, ZATO_OK, zato_result_xpath
+from zato.common.json import default, dumps, loads
 from zato.common.log_message import CID_LENGTH
 
 # Set max_cid_repr to CID_NO_CLIP if it's desired to return the whole of a CID
@@ -311,9 +308,7 @@ class AnyServiceInvoker(_Client):
     to be exposed over HTTP.
     """
     def json_default_handler(self, value):
-        if isinstance(value, datetime):
-            return value.isoformat()
-        raise TypeError('Cannot serialize [{}]'.format(value))
+        return default(value)
         
     def _invoke(self, name=None, payload='', headers=None, channel='invoke', data_format='json', 
             transport=None, async=False, expiration=BROKER.DEFAULT_EXPIRATION, id=None,
@@ -24,6 +24,9 @@ from lxml.objectify import ObjectPath as _ObjectPath
 # Bunch
 from bunch import Bunch
 
+# Zato
+from zato.common.histogram import Histogram
+
 # The namespace for use in all Zato's own services.
 zato_namespace = 'https://zato.io/ns/20130518'
 zato_ns_map = {None: zato_namespace}
@@ -194,13 +197,15 @@ class KVDB:
     
     SERVICE_USAGE = 'zato:stats:service:usage:'
     SERVICE_TIME_BASIC = 'zato:stats:service:time:basic:'
-    SERVICE_TIME_RAW = 'zato:stats:service:time:raw:'
-    SERVICE_TIME_RAW_BY_MINUTE = 'zato:stats:service:time:raw-by-minute:'
+    SERVICE_TIME_RAW = 'zato:stats:service:time:raw-hist:'
+    SERVICE_TIME_RAW_BY_MINUTE = 'zato:stats:service:time:raw-hist-by-minute:'
     SERVICE_TIME_AGGREGATED_BY_MINUTE = 'zato:stats:service:time:aggr-by-minute:'
     SERVICE_TIME_AGGREGATED_BY_HOUR = 'zato:stats:service:time:aggr-by-hour:'
     SERVICE_TIME_AGGREGATED_BY_DAY = 'zato:stats:service:time:aggr-by-day:'
     SERVICE_TIME_AGGREGATED_BY_MONTH = 'zato:stats:service:time:aggr-by-month:'
     SERVICE_TIME_SLOW = 'zato:stats:service:time:slow:'
+    SERVICE_STATS_INDEX = 'zato:stats:service:index:'
+    SERVICE_STATS_INDEX_REBUILT = 'zato:stats:service:index-rebuilt'
     
     SERVICE_SUMMARY_PREFIX_PATTERN = 'zato:stats:service:summary:{}:'
     SERVICE_SUMMARY_BY_DAY = 'zato:stats:service:summary:by-day:'
@@ -209,8 +214,14 @@ class KVDB:
     SERVICE_SUMMARY_BY_YEAR = 'zato:stats:service:summary:by-year:'
     
     REQ_RESP_SAMPLE = 'zato:req-resp:sample:'
+    REQ_RESP_SAMPLE_INDEX = 'zato:req-resp:sample-index'
     RESP_SLOW = 'zato:resp:slow:'
 
+    OUT_AMQP_STATS = 'zato:out:amqp:stats:'
+    OUT_AMQP_STATS_CONFIRM_LATENCY = 'zato:out:amqp:stats:confirm-latency:'
+
+    OUT_HTTP_SOAP_CACHE = 'zato:out:http-soap:cache:'
+
 class SCHEDULER_JOB_TYPE:
     ONE_TIME = 'one_time'
     INTERVAL_BASED = 'interval_based'
@@ -227,6 +238,16 @@ class CHANNEL:
     
 class BROKER:
     DEFAULT_EXPIRATION = 15 # In seconds
+    QUEUE_POP_TIMEOUT = 1 # In seconds, how long to block waiting for a message to arrive on a queue
+    QUEUE_CONSUMER_HEARTBEAT = 5 # In seconds, how often each queue consumer tells others it's alive
+    QUEUE_CONSUMER_EXPIRATION = 30 # In seconds, in-flight messages of a consumer not heard of for that long are redelivered
+    
+class AMQP:
+    class DEFAULT:
+        PREFETCH_COUNT = 0 # No limit
+        ACK_EVERY = 1 # How many messages to acknowledge at once
+        ACK_INTERVAL = 1000 # In milliseconds, how long at most messages may wait for an acknowledgement
+        CONSUMERS = 1 # How many connections to consume messages through
 
 #
 # Version
@@ -324,6 +345,20 @@ class Inactive(ZatoException):
     def __init__(self, name):
         super(Inactive, self).__init__(None, '[{}] is inactive'.format(name))
     
+class TimeoutException(ZatoException):
+    """ Raised when an operation, such as a call to an outgoing connection,
+    did not complete in the time it was allowed to.
+    """
+
+class CircuitOpen(ZatoException):
+    """ Raised instead of invoking an outgoing connection whose circuit breaker
+    is open, i.e. one that has been failing recently and is not called until it recovers.
+    """
+    def __init__(self, name, retry_in=None):
+        super(CircuitOpen, self).__init__(None, 'Circuit of [{}] is open, retry in:[{}]s'.format(name, retry_in))
+        self.name = name
+        self.retry_in = retry_in
+    
 class SourceInfo(object):
     """ A bunch of attributes dealing the service's source code.
     """
@@ -354,6 +389,9 @@ class StatsElem(object):
     mean_trend_int - a list of integers representing mean response times (in ms)
     min_resp_time - minimum service response time (in ms)
     max_resp_time - maximum service response time (in ms)
+    p50 - median response time (in ms, exact up to the precision of a histogram bucket)
+    p95 - 95th percentile of response times (in ms, ditto)
+    p99 - 99th percentile of response times (in ms, ditto)
     all_services_usage - how many times all the services have been invoked
     all_services_time - how much time all the services spent on processing the messages (in ms)
     mean_all_services - an arithmetical average of all the mean response times  of all services (in ms)
@@ -363,6 +401,7 @@ class StatsElem(object):
     temp_rate - a temporary place for keeping request rates, needed to get a weighted mean of uneven execution periods
     temp_mean - just like temp_rate but for mean response times
     temp_mean_count - how many periods containing a mean rate there were
+    temp_hist - a histogram of response times the percentiles are computed out of
     """
     def __init__(self, service_name=None, mean=None):
         self.service_name = service_name
@@ -374,6 +413,9 @@ class StatsElem(object):
         self.mean_trend_int = []
         self.min_resp_time = maxint # Assuming that there sure will be at least one response time lower than that
         self.max_resp_time = 0
+        self.p50 = 0
+        self.p95 = 0
+        self.p99 = 0
         self.all_services_usage = 0
         self.all_services_time = 0
         self.mean_all_services = 0
@@ -383,6 +425,13 @@ class StatsElem(object):
         self.temp_rate = 0
         self.temp_mean = 0
         self.temp_mean_count = 0
+        self.temp_hist = None
+        
+    def set_percentiles(self):
+        """ Sets p50, p95 and p99 out of the element's histogram, if there is any.
+        """
+        if self.temp_hist:
+            self.p50, self.p95, self.p99 = self.temp_hist.percentiles(50, 95, 99)
         
     def get_attrs(self, ignore=[]):
         for attr in dir(self):
@@ -430,6 +479,12 @@ class StatsElem(object):
         self.min_resp_time = min(self.min_resp_time, other.min_resp_time)
         self.usage += other.usage
         
+        if other.temp_hist:
+            if self.temp_hist is None:
+                self.temp_hist = Histogram()
+            self.temp_hist.merge(other.temp_hist)
+            self.set_percentiles()
+        
         return self
     
     def __bool__(self):
@@ -59,6 +59,22 @@ TOPICS = {
 
 KEYS = {k:v.replace('/zato','').replace('/',':') for k,v in TOPICS.items()}
 
+# Each outgoing connection of these types has a topic of its own, made of the prefix and the connection's name,
+# so that messages to be sent through it are received by its connector only. The _ALL topics are still used
+# for messages concerning all the connectors of a given type, such as CLOSE.
+CONNECTOR_TOPIC_PREFIXES = {
+    MESSAGE_TYPE.TO_AMQP_PUBLISHING_CONNECTOR_ALL: b'/zato/connector/amqp/publishing/name/',
+    MESSAGE_TYPE.TO_JMS_WMQ_PUBLISHING_CONNECTOR_ALL: b'/zato/connector/jms-wmq/publishing/name/',
+    MESSAGE_TYPE.TO_ZMQ_PUBLISHING_CONNECTOR_ALL: b'/zato/connector/zmq/publishing/name/',
+}
+
+def get_connector_topic(msg_type, name):
+    """ Returns a topic messages to an outgoing connection of a given name are published on.
+    """
+    if isinstance(name, unicode):
+        name = name.encode('utf-8')
+    return CONNECTOR_TOPIC_PREFIXES[msg_type] + name
+
 SCHEDULER = Bunch()
 SCHEDULER.CREATE = b'10000'
 SCHEDULER.EDIT = b'10001'
@@ -145,6 +161,7 @@ CHANNEL.ZMQ_MESSAGE_RECEIVED = b'10711'
 
 CHANNEL.HTTP_SOAP_CREATE_EDIT = b'10712' # Same for creating and updating
 CHANNEL.HTTP_SOAP_DELETE = b'10713'
+CHANNEL.HTTP_SOAP_CACHE_INVALIDATE = b'10714'
 
 AMQP_CONNECTOR = Bunch()
 AMQP_CONNECTOR.CLOSE = b'10801'
@@ -159,6 +176,7 @@ SERVICE = Bunch()
 SERVICE.EDIT = b'10900'
 SERVICE.DELETE = b'10901'
 SERVICE.PUBLISH = b'10902'
+SERVICE.CONFIGURE_REQUEST_RESPONSE = b'10903'
 
 HOT_DEPLOY = Bunch()
 HOT_DEPLOY.CREATE = '11000'
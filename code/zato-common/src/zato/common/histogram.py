@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from math import ceil
+
+# Values below it each have their own bucket. Above it, each power of two
+# is split into that many linear sub-buckets which means the relative error
+# of any value a histogram returns is never greater than 1/SUB_BUCKETS (~6%).
+SUB_BUCKETS = 16
+SUB_BUCKET_BITS = 4 # log2(SUB_BUCKETS)
+
+# Anything greater is stored in the last bucket, 2 ** 32 ms is more than 49 days.
+MAX_VALUE = 2 ** 32 - 1
+
+# Prefix of hash fields bucket counts are stored under in the KVDB
+BUCKET_FIELD_PREFIX = 'b'
+
+def get_bucket(value):
+    """ Returns the index of a bucket a non-negative integer value belongs to.
+    """
+    value = min(int(value), MAX_VALUE)
+
+    if value < SUB_BUCKETS:
+        return value
+
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return SUB_BUCKETS + shift * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+def get_bucket_range(idx):
+    """ Returns the lowest and highest values a bucket of a given index may hold.
+    """
+    if idx < SUB_BUCKETS:
+        return idx, idx
+
+    shift, sub_bucket = divmod(idx - SUB_BUCKETS, SUB_BUCKETS)
+    low = (SUB_BUCKETS + sub_bucket) << shift
+
+    return low, low + (1 << shift) - 1
+
+class Histogram(object):
+    """ A fixed-size, log-bucketed histogram of response times (in ms). Memory used
+    by each histogram is bounded regardless of how many values it's been given
+    and histograms can be merged by a bucket-wise addition so that per-minute
+    histograms can be rolled up into per-hour, per-day and so on ones without
+    losing any information besides what the buckets themselves already lose.
+
+    count - how many values have been added
+    total - sum of all the values, used for computing an exact mean
+    min - lowest value added (None if there are no values)
+    max - highest value added (None if there are no values)
+    buckets - a dictionary of bucket indexes to how many values each bucket holds
+    """
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.buckets = {}
+
+    def add(self, value, count=1):
+        """ Adds a value, possibly more than once.
+        """
+        if not count:
+            return
+
+        value = int(value)
+        idx = get_bucket(value)
+        self.buckets[idx] = self.buckets.get(idx, 0) + count
+        self.count += count
+        self.total += value * count
+
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """ Adds all the values of another histogram to this one.
+        """
+        if not other.count:
+            return self
+
+        for idx, count in other.buckets.iteritems():
+            self.buckets[idx] = self.buckets.get(idx, 0) + count
+
+        self.count += other.count
+        self.total += other.total
+
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+
+        return self
+
+    __iadd__ = merge
+
+    def __len__(self):
+        return self.count
+
+    def __eq__(self, other):
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<{} at {} count:[{}], total:[{}], min:[{}], max:[{}], buckets:[{}]>'.format(
+            self.__class__.__name__, hex(id(self)), self.count, self.total, self.min, self.max,
+            sorted(self.buckets.items()))
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def percentile(self, percentile):
+        """ Returns a value below which a given percentage of all values falls,
+        the value is exact up to the precision of the bucket it's been found in.
+        """
+        if not self.count:
+            return 0
+
+        rank = max(int(ceil(self.count * percentile / 100.0)), 1)
+        seen = 0
+
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen >= rank:
+                return max(min(get_bucket_range(idx)[1], self.max), self.min)
+
+    def percentiles(self, *percentiles):
+        """ Returns several percentiles at once.
+        """
+        return [self.percentile(elem) for elem in percentiles]
+
+# ##############################################################################
+
+    def to_string(self):
+        """ Serializes the histogram to a compact string, e.g. '12|300|7|51|7:1,19:4,25:7'.
+        """
+        buckets = ','.join('{}:{}'.format(idx, count) for idx, count in sorted(self.buckets.iteritems()))
+        return '{}|{}|{}|{}|{}'.format(self.count, self.total,
+            self.min if self.min is not None else '', self.max if self.max is not None else '', buckets)
+
+    @staticmethod
+    def from_string(value):
+        """ The reverse of to_string.
+        """
+        hist = Histogram()
+        if not value:
+            return hist
+
+        count, total, min_, max_, buckets = value.split('|')
+
+        hist.count = int(count)
+        hist.total = int(total)
+        hist.min = int(min_) if min_ else None
+        hist.max = int(max_) if max_ else None
+
+        if buckets:
+            for elem in buckets.split(','):
+                idx, count = elem.split(':')
+                hist.buckets[int(idx)] = int(count)
+
+        return hist
+
+    def to_kvdb_increments(self):
+        """ Yields hash fields and values by which they should be incremented
+        in order to add this histogram to one stored in the KVDB. The exact min and
+        max values cannot be merged using increments alone so they're computed
+        out of buckets on reading the data back with from_kvdb_hash.
+        """
+        yield 'count', self.count
+        yield 'total', self.total
+
+        for idx, count in self.buckets.iteritems():
+            yield '{}{}'.format(BUCKET_FIELD_PREFIX, idx), count
+
+    @staticmethod
+    def from_kvdb_hash(values):
+        """ Creates a histogram out of a KVDB hash previously updated with
+        values from to_kvdb_increments.
+        """
+        hist = Histogram()
+        for key, value in values.iteritems():
+            if key.startswith(BUCKET_FIELD_PREFIX):
+                hist.buckets[int(key[1:])] = int(value)
+
+        if hist.buckets:
+            hist.count = int(values.get('count', 0))
+            hist.total = int(values.get('total', 0))
+            hist.min = get_bucket_range(min(hist.buckets))[0]
+            hist.max = get_bucket_range(max(hist.buckets))[1]
+
+        return hist
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from importlib import import_module
+
+logger = logging.getLogger(__name__)
+
+# Backends are tried in this order unless told otherwise, the first one that can be imported is used
+DEFAULT_BACKENDS = ('ujson', 'simplejson', 'json')
+
+def default(value):
+    """ Serializes values JSON has no types for. The output is the same no matter which backend is in use.
+    """
+    if isinstance(value, Decimal):
+        return str(value)
+
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+
+    raise TypeError('Cannot serialize [{!r}]'.format(value))
+
+class Backend(object):
+    """ A JSON library with the same API as the json module from stdlib.
+    """
+    can_dumps = True
+
+    def __init__(self, name):
+        self.name = name
+        self.module = import_module(name)
+
+    def dumps(self, value, **kwargs):
+        kwargs.setdefault('default', default)
+        return self.module.dumps(value, **kwargs)
+
+    def loads(self, value, **kwargs):
+        return self.module.loads(value, **kwargs)
+
+class SimpleJSONBackend(Backend):
+    """ simplejson serializes Decimal objects on its own, as numbers, unless told not to.
+    """
+    def dumps(self, value, **kwargs):
+        kwargs.setdefault('default', default)
+        kwargs.setdefault('use_decimal', False)
+        return self.module.dumps(value, **kwargs)
+
+class UltraJSONBackend(Backend):
+    """ ujson can't be told how to serialize objects it doesn't know of and it turns
+    Decimal ones into floats, datetime ones into UNIX timestamps and it clips floats
+    to 15 digits, which is why it's used for decoding only.
+
+    Versions before 2.0 need precise_float to decode floats exactly, later ones
+    always do and reject the keyword so it's passed in only if it's accepted.
+    """
+    can_dumps = False
+
+    def __init__(self, name):
+        super(UltraJSONBackend, self).__init__(name)
+        try:
+            self.module.loads('0.1', precise_float=True)
+        except TypeError:
+            self.has_precise_float = False
+        else:
+            self.has_precise_float = True
+
+    def loads(self, value, **kwargs):
+        if self.has_precise_float:
+            kwargs.setdefault('precise_float', True)
+        return self.module.loads(value, **kwargs)
+
+backend_classes = {
+    'json': Backend,
+    'simplejson': SimpleJSONBackend,
+    'ujson': UltraJSONBackend,
+}
+
+class Codec(object):
+    """ Encodes and decodes JSON with the first of the backends given that can be imported and can do it.
+    The stdlib's json module is always the last resort.
+    """
+    def __init__(self, backends=DEFAULT_BACKENDS):
+        if isinstance(backends, basestring):
+            backends = backends.split(',')
+
+        self.backends = []
+
+        for name in [name.strip() for name in backends] + ['json']:
+            if name not in backend_classes:
+                raise ValueError('Unknown JSON backend:[{}], expected one of:[{}]'.format(name, sorted(backend_classes)))
+            try:
+                self.backends.append(backend_classes[name](name))
+            except ImportError:
+                logger.debug('JSON backend:[%s] could not be imported', name)
+
+        self.dumps_backend = [backend for backend in self.backends if backend.can_dumps][0]
+        self.loads_backend = self.backends[0]
+
+        self.dumps = self.dumps_backend.dumps
+        self.loads = self.loads_backend.loads
+
+    def __repr__(self):
+        return '<{} at {} dumps:[{}], loads:[{}]>'.format(
+            self.__class__.__name__, hex(id(self)), self.dumps_backend.name, self.loads_backend.name)
+
+_codec = Codec()
+
+def get_codec():
+    return _codec
+
+def set_backends(backends=DEFAULT_BACKENDS):
+    """ Makes dumps and loads use the first of the backends given that can be imported.
+    """
+    global _codec
+    _codec = Codec(backends)
+
+    logger.info('JSON codec: %r', _codec)
+
+    return _codec
+
+def dumps(value, **kwargs):
+    """ Serializes a value to JSON, Decimal and datetime objects included.
+    """
+    return _codec.dumps(value, **kwargs)
+
+def loads(value, **kwargs):
+    """ Deserializes a JSON document.
+    """
+    return _codec.loads(value, **kwargs)
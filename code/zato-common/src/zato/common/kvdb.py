@@ -17,6 +17,7 @@ from pyparsing import alphanums, oneOf, OneOrMore, Optional, White, Word
 
 # redis
 from redis import StrictRedis
+from redis.exceptions import ResponseError
 
 # Zato
 from zato.common import KVDB as _KVDB
@@ -35,6 +36,28 @@ command = oneOf(('CONFIG', 'DBSIZE', 'DECR', 'DECRBY', 'DEL', 'DUMP', 'ECHO',
 parameters = (OneOrMore(quot + Word(alphanums + '-' + punctuation) + quot)).setResultsName('parameters')
 redis_grammar = quot + command + Optional(White().suppress() + parameters)
 
+def scan_keys(conn, pattern, count=1000):
+    """ Yields all the keys matching a given pattern. The keyspace is walked with SCAN
+    so that Redis is never blocked for long, which makes it fit for one-time jobs such as
+    rebuilding indexes of existing keys. Redis versions older than 2.8 don't have SCAN
+    and KEYS is used instead.
+    """
+    try:
+        cursor, keys = conn.execute_command('SCAN', 0, 'MATCH', pattern, 'COUNT', count)
+    except ResponseError:
+        for key in conn.keys(pattern):
+            yield key
+        return
+
+    while True:
+        for key in keys:
+            yield key
+
+        if int(cursor) == 0:
+            break
+
+        cursor, keys = conn.execute_command('SCAN', cursor, 'MATCH', pattern, 'COUNT', count)
+
 class KVDB(object):
     """ A wrapper around the Zato's key-value database.
     """
@@ -10,7 +10,6 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 from ftplib import FTP_PORT
-from json import dumps
 
 # SQLAlchemy
 from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Sequence, \
@@ -20,6 +19,7 @@ from sqlalchemy.orm import backref, relationship
 
 # Zato
 from zato.common import SCHEDULER_JOB_TYPE
+from zato.common.json import dumps
 from zato.common.odb import AMQP_DEFAULT_PRIORITY, WMQ_DEFAULT_PRIORITY
 
 Base = declarative_base()
@@ -267,6 +267,41 @@ class HTTPSOAP(Base):
     
     data_format = Column(String(20), nullable=True)
     
+    # Whether services of a channel read the request body themselves, as a stream
+    request_streaming = Column(Boolean(), nullable=True)
+    
+    # Outgoing connections only - how many milliseconds a call may take before it times out
+    timeout = Column(Integer, nullable=True)
+    
+    # Outgoing connections only - a circuit breaker opens after cb_error_threshold consecutive
+    # failed calls or ones slower than cb_latency_threshold milliseconds, stays open for cb_open_period
+    # seconds and closes again after cb_half_open_probes successful calls. No cb_error_threshold
+    # means there is no circuit breaker at all.
+    cb_error_threshold = Column(Integer, nullable=True)
+    cb_latency_threshold = Column(Integer, nullable=True)
+    cb_open_period = Column(Integer, nullable=True)
+    cb_half_open_probes = Column(Integer, nullable=True)
+    
+    # Outgoing connections only - how many per-host connection pools there may be, how many
+    # connections each of them may hold and whether requests wait for a free one instead of opening
+    # a new connection past the limit. Also, whether connections are kept alive at all, how many times
+    # a request is retried on connection errors and for how many seconds host names are cached.
+    pool_size = Column(Integer, nullable=True)
+    pool_max_per_host = Column(Integer, nullable=True)
+    pool_block = Column(Boolean(), nullable=True)
+    keep_alive = Column(Boolean(), nullable=True)
+    max_retries = Column(Integer, nullable=True)
+    dns_cache_ttl = Column(Integer, nullable=True)
+    
+    # For how many seconds responses are cached, if at all, and how many of them each worker keeps.
+    # Outgoing connections only - whether they're also kept in the KVDB for the whole cluster to share.
+    # Channels only - comma-separated names of request headers which, along with the path and query string,
+    # tell responses to GET requests apart.
+    cache_ttl = Column(Integer, nullable=True)
+    cache_size = Column(Integer, nullable=True)
+    cache_kvdb = Column(Boolean(), nullable=True)
+    cache_key_headers = Column(String(200), nullable=True)
+    
     service_id = Column(Integer, ForeignKey('service.id', ondelete='CASCADE'), nullable=True)
     service = relationship('Service', backref=backref('http_soap', order_by=name, cascade='all, delete, delete-orphan'))
     
@@ -280,7 +315,11 @@ class HTTPSOAP(Base):
                  connection=None, transport=None, host=None, url_path=None, method=None, 
                  soap_action=None, soap_version=None, data_format=None, service_id=None, service=None,
                  security=None, cluster_id=None, cluster=None, service_name=None,
-                 security_id=None, security_name=None):
+                 security_id=None, security_name=None, request_streaming=None, timeout=None,
+                 cb_error_threshold=None, cb_latency_threshold=None, cb_open_period=None,
+                 cb_half_open_probes=None, pool_size=None, pool_max_per_host=None, pool_block=None,
+                 keep_alive=None, max_retries=None, dns_cache_ttl=None, cache_ttl=None, cache_size=None,
+                 cache_kvdb=None, cache_key_headers=None):
         self.id = id
         self.name = name
         self.is_active = is_active
@@ -301,6 +340,22 @@ class HTTPSOAP(Base):
         self.service_name = service_name # Not used by the DB
         self.security_id = security_id
         self.security_name = security_name
+        self.request_streaming = request_streaming
+        self.timeout = timeout
+        self.cb_error_threshold = cb_error_threshold
+        self.cb_latency_threshold = cb_latency_threshold
+        self.cb_open_period = cb_open_period
+        self.cb_half_open_probes = cb_half_open_probes
+        self.pool_size = pool_size
+        self.pool_max_per_host = pool_max_per_host
+        self.pool_block = pool_block
+        self.keep_alive = keep_alive
+        self.max_retries = max_retries
+        self.dns_cache_ttl = dns_cache_ttl
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache_kvdb = cache_kvdb
+        self.cache_key_headers = cache_key_headers
 
 ################################################################################
 
@@ -760,6 +815,10 @@ class ChannelAMQP(Base):
     queue = Column(String(200), nullable=False)
     consumer_tag_prefix = Column(String(200), nullable=False)
     data_format = Column(String(20), nullable=True)
+    prefetch_count = Column(Integer, nullable=True)
+    ack_every = Column(Integer, nullable=True)
+    ack_interval = Column(Integer, nullable=True)
+    consumers = Column(Integer, nullable=True)
 
     service_id = Column(Integer, ForeignKey('service.id', ondelete='CASCADE'), nullable=False)
     service = relationship(Service, backref=backref('channels_amqp', order_by=name, cascade='all, delete, delete-orphan'))
@@ -769,7 +828,8 @@ class ChannelAMQP(Base):
 
     def __init__(self, id=None, name=None, is_active=None, queue=None,
                  consumer_tag_prefix=None, def_id=None, def_name=None,
-                 service_name=None, data_format=None):
+                 service_name=None, data_format=None, prefetch_count=None, ack_every=None,
+                 ack_interval=None, consumers=None):
         self.id = id
         self.name = name
         self.is_active = is_active
@@ -779,6 +839,10 @@ class ChannelAMQP(Base):
         self.def_name = def_name # Not used by the DB
         self.service_name = service_name # Not used by the DB
         self.data_format = data_format
+        self.prefetch_count = prefetch_count
+        self.ack_every = ack_every
+        self.ack_interval = ack_interval
+        self.consumers = consumers
 
 class ChannelWMQ(Base):
     """ An incoming WebSphere MQ connection.
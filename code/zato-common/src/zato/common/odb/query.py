@@ -230,7 +230,8 @@ def _channel_amqp(session, cluster_id):
     return session.query(ChannelAMQP.id, ChannelAMQP.name, ChannelAMQP.is_active,
             ChannelAMQP.queue, ChannelAMQP.consumer_tag_prefix,
             ConnDefAMQP.name.label('def_name'), ChannelAMQP.def_id, 
-            ChannelAMQP.data_format,
+            ChannelAMQP.data_format, ChannelAMQP.prefetch_count,
+            ChannelAMQP.ack_every, ChannelAMQP.ack_interval, ChannelAMQP.consumers,
             Service.name.label('service_name'), 
             Service.impl_name.label('service_impl_name')).\
         filter(ChannelAMQP.def_id==ConnDefAMQP.id).\
@@ -331,7 +332,12 @@ def _http_soap(session, cluster_id):
             HTTPSOAP.is_internal, HTTPSOAP.transport, HTTPSOAP.host, 
             HTTPSOAP.url_path, HTTPSOAP.method, HTTPSOAP.soap_action, 
             HTTPSOAP.soap_version, HTTPSOAP.data_format, HTTPSOAP.security_id, 
-            HTTPSOAP.connection,
+            HTTPSOAP.connection, HTTPSOAP.request_streaming, HTTPSOAP.timeout,
+            HTTPSOAP.cb_error_threshold, HTTPSOAP.cb_latency_threshold,
+            HTTPSOAP.cb_open_period, HTTPSOAP.cb_half_open_probes,
+            HTTPSOAP.pool_size, HTTPSOAP.pool_max_per_host, HTTPSOAP.pool_block,
+            HTTPSOAP.keep_alive, HTTPSOAP.max_retries, HTTPSOAP.dns_cache_ttl,
+            HTTPSOAP.cache_ttl, HTTPSOAP.cache_size, HTTPSOAP.cache_kvdb, HTTPSOAP.cache_key_headers,
             SecurityBase.sec_type,
             Service.name.label('service_name'),
             Service.id.label('service_id'),
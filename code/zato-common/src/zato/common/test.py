@@ -13,9 +13,6 @@ from random import choice, randint
 from unittest import TestCase
 from uuid import uuid4
 
-# anyjson
-from anyjson import dumps, loads
-
 # Bunch
 from bunch import Bunch
 
@@ -27,6 +24,7 @@ from nose.tools import eq_
 
 # Zato
 from zato.common import CHANNEL, SIMPLE_IO
+from zato.common.json import dumps, loads
 from zato.common.util import new_cid
 
 def rand_bool():
@@ -35,9 +35,6 @@ except ImportError:
     from distutils2.config import Config
     from distutils2.dist import Distribution
 
-# anyjson
-from anyjson import dumps, loads
-
 # Bunch
 from bunch import Bunch, bunchify
 
@@ -49,6 +46,7 @@ from dateutil.parser import parse
 
 # lxml
 from lxml import objectify
+from lxml.etree import iterparse
 
 # M2Crypto
 from M2Crypto import RSA
@@ -69,6 +67,7 @@ from zato.agent.load_balancer.client import LoadBalancerAgentClient
 from zato.common import DATA_FORMAT, KVDB, NoDistributionFound, SIMPLE_IO, soap_body_path, \
     soap_body_xpath, ZatoException
 from zato.common.crypto import CryptoManager
+from zato.common.json import dumps, loads
 
 logger = logging.getLogger(__name__)
 
@@ -374,8 +373,15 @@ def get_body_payload(body):
 
 def payload_from_request(cid, request, data_format, transport):
     """ Converts a raw request to a payload suitable for usage with SimpleIO.
+    Requests of streaming channels are file-like objects, XML ones are turned
+    into an iterparse stream of events and all the others are returned as-is.
     """
-    if request:
+    if hasattr(request, 'read'):
+        if data_format == DATA_FORMAT.XML:
+            payload = iterparse(request)
+        else:
+            payload = request
+    elif request:
         if data_format == DATA_FORMAT.XML:
             if transport == 'soap':
                 soap = objectify.fromstring(request)
@@ -506,6 +512,12 @@ def pairwise(iterable):
     next(b, None)
     return izip(a, b)
 
+def is_iterator(value):
+    """ Returns True if value is an iterator, such as a generator, as opposed to
+    a container which can be iterated over many times, such as a list or a string.
+    """
+    return hasattr(value, 'next') and hasattr(value, '__iter__')
+
 def from_local_to_utc(dt, tz_name, dayfirst=True):
     """ What is the UTC time given the local time and the timezone's name?
     """
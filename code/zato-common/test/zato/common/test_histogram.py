@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from random import randint
+from unittest import TestCase
+
+# Nose
+from nose.tools import eq_
+
+# Zato
+from zato.common.histogram import get_bucket, get_bucket_range, Histogram, MAX_VALUE, SUB_BUCKETS
+
+class BucketTestCase(TestCase):
+    def test_value_in_bucket_range(self):
+        for value in range(10000) + [randint(10000, MAX_VALUE) for x in range(1000)]:
+            low, high = get_bucket_range(get_bucket(value))
+            self.assertTrue(low <= value <= high, (value, low, high))
+
+    def test_small_values_exact(self):
+        for value in range(SUB_BUCKETS * 2):
+            eq_(get_bucket_range(get_bucket(value)), (value, value))
+
+    def test_relative_error(self):
+        for value in (100, 1000, 12345, 999999):
+            low, high = get_bucket_range(get_bucket(value))
+            self.assertTrue((high - low) / value <= 1.0 / SUB_BUCKETS)
+
+    def test_bounded(self):
+        eq_(get_bucket(MAX_VALUE), get_bucket(MAX_VALUE * 10))
+
+class HistogramTestCase(TestCase):
+
+    def _get_hist(self, values):
+        hist = Histogram()
+        for value in values:
+            hist.add(value)
+        return hist
+
+    def test_add(self):
+        hist = self._get_hist(range(1, 101))
+
+        eq_(hist.count, 100)
+        eq_(hist.total, 5050)
+        eq_(hist.min, 1)
+        eq_(hist.max, 100)
+        eq_(hist.mean, 50.5)
+
+    def test_percentiles(self):
+        hist = self._get_hist(range(1, 101))
+        p50, p95, p99, p100 = hist.percentiles(50, 95, 99, 100)
+
+        for expected, given in ((50, p50), (95, p95), (99, p99), (100, p100)):
+            self.assertTrue(expected <= given <= expected * (1 + 1.0 / SUB_BUCKETS), (expected, given))
+
+        eq_(Histogram().percentile(99), 0)
+
+    def test_merge(self):
+        values1 = [randint(0, 5000) for x in range(500)]
+        values2 = [randint(0, 5000) for x in range(500)]
+
+        merged = self._get_hist(values1)
+        merged.merge(self._get_hist(values2))
+
+        eq_(merged, self._get_hist(values1 + values2))
+
+        # Merging an empty one is a no-op
+        before = merged.to_string()
+        merged += Histogram()
+        eq_(merged.to_string(), before)
+
+    def test_string_round_trip(self):
+        hist = self._get_hist([randint(0, 100000) for x in range(100)])
+        eq_(Histogram.from_string(hist.to_string()), hist)
+        eq_(Histogram.from_string(Histogram().to_string()), Histogram())
+        eq_(Histogram.from_string(None), Histogram())
+
+    def test_kvdb_round_trip(self):
+        hist = self._get_hist([3, 7, 120, 120, 4000])
+        values = {field: str(value) for field, value in hist.to_kvdb_increments()}
+
+        given = Histogram.from_kvdb_hash(values)
+
+        eq_(given.count, hist.count)
+        eq_(given.total, hist.total)
+        eq_(given.buckets, hist.buckets)
+        eq_(given.min, 3)
+        self.assertTrue(given.max >= 4000)
+
+        eq_(Histogram.from_kvdb_hash({}), Histogram())
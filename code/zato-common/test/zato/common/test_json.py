@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from datetime import date, datetime, time
+from decimal import Decimal
+from timeit import timeit
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# mock
+from mock import patch
+
+# nose
+from nose.plugins.attrib import attr
+from nose.tools import eq_
+
+# Zato
+from zato.common.json import backend_classes, Codec, default, DEFAULT_BACKENDS, dumps, loads, UltraJSONBackend
+from zato.common.test import rand_string
+
+logger = logging.getLogger(__name__)
+
+# How many times each of the benchmarked backends is run
+BENCHMARK_ITERATIONS = 200
+
+def get_backends():
+    """ Returns all the backends that can be imported.
+    """
+    backends = []
+    for name in DEFAULT_BACKENDS:
+        try:
+            backends.append(backend_classes[name](name))
+        except ImportError:
+            pass
+
+    return backends
+
+def get_broker_msg():
+    """ A message such as the ones BrokerClient publishes.
+    """
+    return Bunch({
+        'action': '101802', 'service': 'zato.ping', 'cid': rand_string(), 'channel': 'invoke-async',
+        'data_format': 'json', 'transport': None, 'payload': rand_string() * 10, 'is_active': True, 'id': 123,
+    })
+
+def get_sio_payload(rows):
+    """ A SimpleIO list response.
+    """
+    return {'response': [{'id': idx, 'name': 'name-{}'.format(idx), 'is_active': idx % 2 == 0, 'cluster_id': 1,
+        'description': rand_string(), 'ratio': 1.0 / (idx + 3), 'service_name': 'zato.ping', 'sec_type': None}
+            for idx in range(rows)]}
+
+class JSONTestCase(TestCase):
+
+    def test_default(self):
+        eq_(default(Decimal('1.10')), '1.10')
+        eq_(default(datetime(2013, 7, 22, 19, 21, 9, 123)), '2013-07-22T19:21:09.000123')
+        eq_(default(date(2013, 7, 22)), '2013-07-22')
+        eq_(default(time(19, 21)), '19:21:00')
+
+        self.assertRaises(TypeError, default, object())
+        self.assertRaises(TypeError, dumps, object())
+
+    def test_dumps_same_across_backends(self):
+        value = Bunch({'a': Decimal('1.10'), 'b': datetime(2013, 7, 22, 19, 21, 9), 'c': [Bunch(d=1.0 / 3)],
+            'e': 'żółw', 'f': None, 'g': True})
+
+        expected = {'a': '1.10', 'b': '2013-07-22T19:21:09', 'c': [{'d': 1.0 / 3}], 'e': 'żółw', 'f': None, 'g': True}
+
+        for backend in get_backends():
+            if backend.can_dumps:
+                eq_(loads(backend.dumps(value)), expected)
+                eq_(backend.dumps(value, sort_keys=True), dumps(value, sort_keys=True))
+
+        eq_(loads(dumps(value)), expected)
+
+    def test_loads_same_across_backends(self):
+        for value in (get_broker_msg(), get_sio_payload(10), {'a': 'żółw', 'b': [1.1, 12345678901234567890]}):
+            data = dumps(value)
+            for backend in get_backends():
+                eq_(backend.loads(data), value)
+
+    def test_fallback(self):
+
+        # There's always the stdlib's json
+        codec = Codec(['json'])
+        eq_(codec.dumps_backend.name, 'json')
+        eq_(codec.loads_backend.name, 'json')
+
+        # ujson is never used for encoding
+        codec = Codec('ujson')
+        eq_(codec.dumps_backend.name, 'json')
+        self.assertIn(codec.loads_backend.name, ('ujson', 'json'))
+
+        self.assertRaises(ValueError, Codec, ['zzz'])
+
+    def test_ujson_precise_float(self):
+
+        class FakeUltraJSON(object):
+            def __init__(self, has_precise_float):
+                self.has_precise_float = has_precise_float
+                self.kwargs = None
+
+            def loads(self, value, **kwargs):
+                if 'precise_float' in kwargs and not self.has_precise_float:
+                    raise TypeError("'precise_float' is an invalid keyword argument for this function")
+                self.kwargs = kwargs
+                return float(value)
+
+        # ujson < 2.0 is told to decode floats exactly, later ones do it on their own and don't accept the keyword
+        for has_precise_float, expected in ((True, {'precise_float': True}), (False, {})):
+            module = FakeUltraJSON(has_precise_float)
+            with patch('zato.common.json.import_module', lambda name: module):
+                backend = UltraJSONBackend('ujson')
+
+            eq_(backend.has_precise_float, has_precise_float)
+            eq_(backend.loads('1.5'), 1.5)
+            eq_(module.kwargs, expected)
+
+@attr('benchmark')
+class JSONBenchmarkTestCase(TestCase):
+    """ Compares backends on typical broker and SimpleIO payloads.
+    """
+    def test_benchmark(self):
+        for payload_name, value in (('broker', get_broker_msg()), ('sio', get_sio_payload(100))):
+            data = dumps(value)
+
+            for backend in get_backends():
+                times = []
+
+                if backend.can_dumps:
+                    times.append('dumps:[{:.4f}s]'.format(timeit(lambda: backend.dumps(value), number=BENCHMARK_ITERATIONS)))
+                times.append('loads:[{:.4f}s]'.format(timeit(lambda: backend.loads(data), number=BENCHMARK_ITERATIONS)))
+
+                logger.info('payload:[%s], backend:[%s], iterations:[%s], %s', payload_name, backend.name,
+                    BENCHMARK_ITERATIONS, ', '.join(times))
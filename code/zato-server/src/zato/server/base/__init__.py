@@ -36,7 +36,7 @@ class BrokerMessageReceiver(object):
         if the action is '1000' then self.on_config_SCHEDULER_CREATE
         will be invoked (because '1000' happens to be the code for creating
         a new scheduler's job, see zato.common.broker_message for the list
-        of all actions).
+        of all actions). Returns whatever the handler returns.
         """
         try:
             if self.logger.isEnabledFor(logging.DEBUG):
@@ -45,7 +45,7 @@ class BrokerMessageReceiver(object):
             if self.filter(msg):
                 action = code_to_name[msg['action']]
                 handler = 'on_broker_msg_{0}'.format(action)
-                getattr(self, handler)(msg)
+                return getattr(self, handler)(msg)
             else:
                 if self.logger.isEnabledFor(logging.DEBUG):
                     self.logger.debug('Rejecting broker message [{!r}]'.format(msg))
@@ -17,9 +17,6 @@ from time import sleep
 from traceback import format_exc
 from uuid import uuid4
 
-# anyjson
-from anyjson import dumps
-
 # Bunch
 from bunch import Bunch
 
@@ -36,10 +33,12 @@ from retools.lock import Lock
 from zato.broker.client import BrokerClient
 from zato.common import KVDB, SERVER_JOIN_STATUS, SERVER_UP_STATUS, ZATO_ODB_POOL_NAME
 from zato.common.broker_message import AMQP_CONNECTOR, code_to_name, HOT_DEPLOY, JMS_WMQ_CONNECTOR, MESSAGE_TYPE, TOPICS, ZMQ_CONNECTOR
-from zato.common.util import clear_locks, new_cid
+from zato.common.json import dumps
+from zato.common.util import clear_locks, is_iterator, new_cid
 from zato.server.base import BrokerMessageReceiver
 from zato.server.base.worker import WorkerStore
 from zato.server.config import ConfigDict, ConfigStore
+from zato.server.connection import request_response
 from zato.server.connection.amqp.channel import start_connector as amqp_channel_start_connector
 from zato.server.connection.amqp.outgoing import start_connector as amqp_out_start_connector
 from zato.server.connection.jms_wmq.channel import start_connector as jms_wmq_channel_start_connector
@@ -47,7 +46,7 @@ from zato.server.connection.jms_wmq.outgoing import start_connector as jms_wmq_o
 from zato.server.connection.zmq_.channel import start_connector as zmq_channel_start_connector
 from zato.server.connection.zmq_.outgoing import start_connector as zmq_outgoing_start_connector
 from zato.server.pickup import get_pickup
-from zato.server.stats import add_stats_jobs
+from zato.server.stats import add_stats_jobs, rebuild_index
 
 logger = logging.getLogger(__name__)
 
@@ -111,6 +110,11 @@ class ParallelServer(DisposableObject, BrokerMessageReceiver):
         headers = ((k.encode('utf-8'), v.encode('utf-8')) for k, v in wsgi_environ['zato.http.response.headers'].items())
         start_response(wsgi_environ['zato.http.response.status'], headers)
         
+        # Streamed responses have no Content-Length so they're sent out
+        # with chunked transfer encoding, one chunk at a time.
+        if is_iterator(payload):
+            return payload
+        
         return [payload]
     
     def maybe_on_first_worker(self, server, redis_conn, deployment_key):
@@ -161,6 +165,9 @@ class ParallelServer(DisposableObject, BrokerMessageReceiver):
 
                 # .. deploy them back.
                 import_initial_services_jobs()
+
+                # .. index statistics stored before indexes were introduced, if not done already.
+                rebuild_index(redis_conn)
                 
                 # Add the flag to Redis indicating that this server has already
                 # deployed its services. Note that by default the expiration
@@ -345,6 +352,10 @@ class ParallelServer(DisposableObject, BrokerMessageReceiver):
             _info[item.soap_action].data_format = item.data_format
             _info[item.soap_action].transport = item.transport
             _info[item.soap_action].connection = item.connection
+            _info[item.soap_action].request_streaming = item.request_streaming
+            _info[item.soap_action].cache_ttl = item.cache_ttl
+            _info[item.soap_action].cache_size = item.cache_size
+            _info[item.soap_action].cache_key_headers = item.cache_key_headers
             http_soap.add(item.url_path, _info)
             
         self.config.http_soap = http_soap
@@ -355,6 +366,9 @@ class ParallelServer(DisposableObject, BrokerMessageReceiver):
         self.config.simple_io['int_parameter_suffixes'] = self.int_parameter_suffixes
         self.config.simple_io['bool_parameter_prefixes'] = self.bool_parameter_prefixes
         
+        # Sample requests/responses
+        self.config.req_resp_sample = ConfigDict('req_resp_sample', Bunch(request_response.get_freq_config(self.kvdb)))
+        
         self.worker_store.worker_config = self.config
         self.worker_store.broker_client = self.broker_client
         self.worker_store.init()
@@ -488,6 +502,9 @@ class ParallelServer(DisposableObject, BrokerMessageReceiver):
     def destroy(self):
         """ A Spring Python hook for closing down all the resources held.
         """
+        if self.worker_store:
+            self.worker_store.destroy()
+            
         if self.singleton_server:
             
             # Close all the connector subprocesses this server has possibly started
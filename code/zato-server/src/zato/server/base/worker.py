@@ -36,14 +36,20 @@ from paste.util.multidict import MultiDict
 # Zato
 from zato.common import CHANNEL, SIMPLE_IO, ZATO_ODB_POOL_NAME
 from zato.common.broker_message import code_to_name, MESSAGE_TYPE, STATS
-from zato.common.util import new_cid, pairwise, payload_from_request, security_def_type, TRACE1
+from zato.common.util import is_iterator, new_cid, pairwise, payload_from_request, security_def_type, TRACE1
 from zato.server.base import BrokerMessageReceiver
+from zato.server.connection.amqp.outgoing import PublisherFacade
 from zato.server.connection.ftp import FTPStore
 from zato.server.connection.http_soap.channel import PlainHTTPHandler, RequestDispatcher, SOAPHandler
-from zato.server.connection.http_soap.outgoing import HTTPSOAPWrapper
+from zato.server.connection.http_soap.outgoing import HTTPSOAPStore, HTTPSOAPWrapper
 from zato.server.connection.http_soap.security import Security as ConnectionHTTPSOAPSecurity
+from zato.server.connection.jms_wmq.outgoing import WMQFacade
+from zato.server.connection.response_writer import ResponseWriter
 from zato.server.connection.sql import PoolStore, SessionWrapper
-from zato.server.stats import MaintenanceTool
+from zato.server.connection.zmq_.outgoing import ZMQFacade
+from zato.server.executor import Executor
+from zato.server.service import Outgoing
+from zato.server.stats import MaintenanceTool, StatsAccumulator
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +82,9 @@ class WorkerStore(BrokerMessageReceiver):
         self.update_lock = RLock()
         self.kvdb = server.kvdb
         self.broker_client = None
+        self.outgoing = None
+        self.stats_accumulator = None
+        self.response_writer = None
         
     def init(self):
         plain_http_config = MultiDict()
@@ -94,22 +103,75 @@ class WorkerStore(BrokerMessageReceiver):
                             config = soap_config.setdefault(url_path, Bunch())
                             config[soap_action] = deepcopy(channel_info)
                 
-        self.request_dispatcher = RequestDispatcher(simple_io_config=self.worker_config.simple_io)
+        self.request_dispatcher = RequestDispatcher(simple_io_config=self.worker_config.simple_io,
+            max_body_size=int(self.server.fs_server_config.get('http', {}).get('max_body_size', 0)))
         self.request_dispatcher.soap_handler = SOAPHandler(soap_config, self.server)
         self.request_dispatcher.plain_http_handler = PlainHTTPHandler(plain_http_config, self.server)
         
         # Statistics maintenance
         self.stats_maint = MaintenanceTool(self.kvdb.conn)
+        
+        # Statistics are collected in memory and flushed to the KVDB in the background
+        stats_config = self.server.fs_server_config.get('stats', {})
+        self.stats_accumulator = StatsAccumulator(self.kvdb.conn, int(stats_config.get('flush_interval', 1000)))
+        self.stats_accumulator.start()
+        
+        # So are sample and slow responses
+        self.response_writer = ResponseWriter(self.kvdb.conn, int(stats_config.get('flush_interval', 1000)))
+        self.response_writer.start()
+        
+        # Service invocations delivered by the broker are run concurrently
+        self.executor = self._get_executor()
+        self.executor.start()
 
         self.request_dispatcher.security = ConnectionHTTPSOAPSecurity(
             self.server.odb.get_url_security(self.server.cluster_id, 'channel')[0],
             self.worker_config.basic_auth, self.worker_config.tech_acc, self.worker_config.wss)
         
+        # Compiled URL path + SOAP action -> channel mapping
+        self.request_dispatcher.build_routing_table()
+        
         # Create all the expected connections
         self.init_sql()
         self.init_ftp()
         self.init_http_soap()
         
+        # Services share the one container of outgoing connections
+        self.init_outgoing()
+        
+    def destroy(self):
+        """ Writes out whatever statistics and responses the worker still keeps in memory,
+        called when the worker is going down.
+        """
+        if self.stats_accumulator:
+            try:
+                self.stats_accumulator.stop()
+            except Exception, e:
+                self.logger.warn('Could not flush statistics, e:[{}]'.format(format_exc(e)))
+                
+        if self.response_writer:
+            try:
+                self.response_writer.stop()
+            except Exception, e:
+                self.logger.warn('Could not store responses, e:[{}]'.format(format_exc(e)))
+        
+    def _get_executor(self):
+        """ Returns an executor configured in the [invoker] section of server.conf.
+        Each of the channel_limit_* keys is a limit of invocations of a given channel,
+        e.g. channel_limit_scheduler=10, and channel_queue_size is how many invocations
+        of a channel may be waiting for it to be below its limit.
+        """
+        config = self.server.fs_server_config.get('invoker', {})
+        prefix = 'channel_limit_'
+        
+        channel_limits = {}
+        for key, value in config.items():
+            if key.startswith(prefix):
+                channel_limits[key.replace(prefix, '', 1)] = int(value)
+        
+        return Executor(bool(self.server.has_gevent), int(config.get('pool_size', 100)), 
+            int(config.get('queue_size', 1000)), channel_limits, int(config.get('channel_queue_size', 1000)))
+        
     def filter(self, msg):
         # TODO: Fix it, worker doesn't need to accept all the messages
         return True
@@ -150,8 +212,14 @@ class WorkerStore(BrokerMessageReceiver):
             'name':config.name, 'transport':config.transport, 
             'address':config.host + config.url_path, 
             'soap_action':config.soap_action, 'soap_version':config.soap_version}
+
+        for name in('timeout', 'cb_error_threshold', 'cb_latency_threshold', 'cb_open_period', 'cb_half_open_probes',
+            'pool_size', 'pool_max_per_host', 'pool_block', 'keep_alive', 'max_retries', 'dns_cache_ttl',
+            'cache_ttl', 'cache_size', 'cache_kvdb'):
+            wrapper_config[name] = config.get(name)
+
         wrapper_config.update(sec_config)
-        return HTTPSOAPWrapper(wrapper_config)
+        return HTTPSOAPWrapper(wrapper_config, self.kvdb.conn)
     
     def init_sql(self):
         """ Initializes SQL connections, first to ODB and then any user-defined ones.
@@ -180,8 +248,14 @@ class WorkerStore(BrokerMessageReceiver):
     def init_http_soap(self):
         """ Initializes plain HTTP/SOAP connections.
         """
+        pool_size = int(self.server.fs_server_config.get('outgoing_http', {}).get('gather_pool_size', 10))
+        
         for transport in('soap', 'plain_http'):
-            config_dict = getattr(self.worker_config, 'out_' + transport)
+            
+            # Services can invoke many of the connections concurrently through the store
+            config_dict = HTTPSOAPStore.from_config_dict(getattr(self.worker_config, 'out_' + transport), pool_size)
+            setattr(self.worker_config, 'out_' + transport, config_dict)
+            
             for name in config_dict:
                 config = config_dict[name].config
                 
@@ -191,6 +265,15 @@ class WorkerStore(BrokerMessageReceiver):
                 # To make the API consistent with that of SQL connection pools
                 config_dict[name].ping = wrapper.ping
             
+    def init_outgoing(self):
+        """ Builds the container of outgoing connections all the services of this worker use.
+        Connection stores are updated in place so it only needs to be built once.
+        """
+        out_ftp, out_plain_http, out_soap = self.worker_config.outgoing_connections()
+        
+        self.outgoing = Outgoing(out_ftp, PublisherFacade(self.broker_client), ZMQFacade(self.broker_client), 
+            WMQFacade(self.broker_client), self.sql_pool_store, out_plain_http, out_soap)
+            
     def _update_auth(self, msg, action_name, sec_type, visit_wrapper, keys=None):
         """ A common method for updating auth-related configuration.
         """ 
@@ -211,6 +294,9 @@ class WorkerStore(BrokerMessageReceiver):
                             visit_wrapper(wrapper, msg, keys)
                         else:
                             visit_wrapper(wrapper, msg)
+
+            # Channels may have been using the definition
+            self.request_dispatcher.build_routing_table()
                         
     def _visit_wrapper_edit(self, wrapper, msg, keys):
         """ Updates a given wrapper's security configuration.
@@ -288,16 +374,19 @@ class WorkerStore(BrokerMessageReceiver):
         """ Updates an existing technical account.
         """
         self.request_dispatcher.security.on_broker_msg_SECURITY_TECH_ACC_EDIT(msg, *args)
+        self.request_dispatcher.build_routing_table()
         
     def on_broker_msg_SECURITY_TECH_ACC_DELETE(self, msg, *args):
         """ Deletes a technical account.
         """
         self.request_dispatcher.security.on_broker_msg_SECURITY_TECH_ACC_DELETE(msg, *args)
+        self.request_dispatcher.build_routing_table()
         
     def on_broker_msg_SECURITY_TECH_ACC_CHANGE_PASSWORD(self, msg, *args):
         """ Changes the password of a technical account.
         """
         self.request_dispatcher.security.on_broker_msg_SECURITY_TECH_ACC_CHANGE_PASSWORD(msg, *args)
+        self.request_dispatcher.build_routing_table()
             
 # ##############################################################################
 
@@ -334,12 +423,21 @@ class WorkerStore(BrokerMessageReceiver):
 # ##############################################################################
 
     def _set_service_response_data(self, service, **ignored):
-        if not isinstance(service.response.payload, basestring):
-            service.response.payload = service.response.payload.getvalue()
+        if is_iterator(service.response.payload):
+            service.response.payload = b''.join(service.response.payload)
+        elif not isinstance(service.response.payload, basestring):
+            service.response.payload = service.response.get_serialized_payload()
 
     def _on_message_invoke_service(self, msg, channel, action, args=None):
         """ Triggered by external processes, such as AMQP or the singleton's scheduler,
-        creates a new service instance and invokes it.
+        hands the message over to the executor so that the broker client can
+        carry on with receiving other messages. Returns the executor's task which tells
+        the broker client when the message has been processed.
+        """
+        return self.executor.submit(channel, self._invoke_service, msg, channel)
+        
+    def _invoke_service(self, msg, channel):
+        """ Creates a new service instance and invokes it.
         """
         service = self.server.service_store.new_instance_by_name(msg.service)
         service.update_handle(self._set_service_response_data, service, msg.payload,
@@ -396,6 +494,12 @@ class WorkerStore(BrokerMessageReceiver):
         handler = getattr(self.request_dispatcher, msg.transport + '_handler')
         handler.on_broker_msg_CHANNEL_HTTP_SOAP_CREATE_EDIT(msg, *args)
         
+        # Replace the routing table now that both parts of the configuration are updated
+        self.request_dispatcher.build_routing_table()
+        
+        # Cached responses may have been produced by a service or under a cache policy which no longer apply
+        self.request_dispatcher.response_cache.invalidate(msg.get('old_name') or msg.name)
+        
     def on_broker_msg_CHANNEL_HTTP_SOAP_DELETE(self, msg, *args):
         """ Deletes an HTTP/SOAP channel.
         """
@@ -405,6 +509,16 @@ class WorkerStore(BrokerMessageReceiver):
         # A mapping between a URL and a service
         handler = getattr(self.request_dispatcher, msg.transport + '_handler')
         handler.on_broker_msg_CHANNEL_HTTP_SOAP_DELETE(msg, *args)
+        
+        # Replace the routing table now that both parts of the configuration are updated
+        self.request_dispatcher.build_routing_table()
+        
+        self.request_dispatcher.response_cache.invalidate(msg.name)
+        
+    def on_broker_msg_CHANNEL_HTTP_SOAP_CACHE_INVALIDATE(self, msg, *args):
+        """ Deletes cached responses of an HTTP/SOAP channel, all of them or only those of a given path.
+        """
+        self.request_dispatcher.response_cache.invalidate(msg.name, msg.get('path'), msg.get('query_string'))
 
 # ##############################################################################
 
@@ -474,6 +588,9 @@ class WorkerStore(BrokerMessageReceiver):
     def on_broker_msg_SERVICE_EDIT(self, msg, *args):
         for name in('is_active', 'slow_threshold'):
             self.server.service_store.services[msg.impl_name][name] = msg[name]
+            
+    def on_broker_msg_SERVICE_CONFIGURE_REQUEST_RESPONSE(self, msg, *args):
+        self.worker_config.req_resp_sample[msg.name] = int(msg.sample_req_resp_freq)
 
 # ##############################################################################
 
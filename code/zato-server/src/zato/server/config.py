@@ -137,7 +137,7 @@ class ConfigStore(object):
     def __init__(self, out_ftp=ZATO_NONE, out_plain_http=ZATO_NONE, out_soap=ZATO_NONE, 
                  out_sql=ZATO_NONE, repo_location=ZATO_NONE, basic_auth=ZATO_NONE, wss=ZATO_NONE, tech_acc=ZATO_NONE,
                  url_sec=ZATO_NONE, http_soap=ZATO_NONE, broker_config=ZATO_NONE, odb_data=ZATO_NONE,
-                 simple_io=ZATO_NONE):
+                 simple_io=ZATO_NONE, req_resp_sample=ZATO_NONE):
         
         # Outgoing connections
         self.out_ftp = out_ftp
@@ -168,6 +168,9 @@ class ConfigStore(object):
         # SimpleIO
         self.simple_io = simple_io
         
+        # How often to store sample requests/responses of each service
+        self.req_resp_sample = req_resp_sample
+        
     def outgoing_connections(self):
         """ Returns all the outgoing connections.
         """
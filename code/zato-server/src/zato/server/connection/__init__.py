@@ -138,6 +138,7 @@ class BaseConnector(BrokerMessageReceiver):
         self.odb = None
         self.odb_config = None
         self.sql_pool_store = None
+        self.fs_server_config = None
         
     def _close(self):
         """ Close the process, don't forget about the ODB connection if it exists.
@@ -158,6 +159,7 @@ class BaseConnector(BrokerMessageReceiver):
         to the Zato broker.
         """
         fs_server_config = get_config(self.repo_location, 'server.conf')
+        self.fs_server_config = fs_server_config
         app_context = get_app_context(fs_server_config)
         crypto_manager = get_crypto_manager(self.repo_location, app_context, fs_server_config)
         
@@ -172,10 +174,6 @@ class BaseConnector(BrokerMessageReceiver):
         self.kvdb.decrypt_func = self.odb.crypto_manager.decrypt
         self.kvdb.init()
         
-        # Broker client
-        self.broker_client = BrokerClient(self.kvdb, self.broker_client_id, self.broker_callbacks)
-        self.broker_client.start()
-        
         # ODB
         self.odb_config = Bunch()
         self.odb_config.db_name = config_odb.db_name
@@ -194,6 +192,11 @@ class BaseConnector(BrokerMessageReceiver):
         
         self._setup_odb()
         
+        # Broker client - started last because subclasses may need the ODB configuration
+        # in order to know what topics to subscribe to.
+        self.broker_client = BrokerClient(self.kvdb, self.broker_client_id, self.broker_callbacks)
+        self.broker_client.start()
+        
 def setup_logging():
     logging.addLevelName('TRACE1', TRACE1)
     from logging import config
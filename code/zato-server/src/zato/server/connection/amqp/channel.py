@@ -19,6 +19,7 @@ from threading import Thread
 from bunch import Bunch
 
 # Zato
+from zato.common import AMQP
 from zato.common.broker_message import CHANNEL, MESSAGE_TYPE, TOPICS
 from zato.common.util import new_cid, TRACE1
 from zato.server.connection.amqp import BaseAMQPConnection, BaseAMQPConnector
@@ -28,25 +29,72 @@ ENV_ITEM_NAME = 'ZATO_CONNECTOR_AMQP_CHANNEL_ID'
 
 class ConsumingConnection(BaseAMQPConnection):
     """ A connection for consuming the AMQP messages.
+    
+    The broker sends at most prefetch_count messages (0 means no limit) which haven't
+    been acknowledged yet. Messages are acknowledged in batches, with a single basic.ack,
+    once ack_every of them have been received or ack_interval milliseconds
+    after the first one of a batch has been received, whichever comes first.
     """
-    def __init__(self, conn_params, channel_name, queue, consumer_tag_prefix, callback):
+    def __init__(self, conn_params, channel_name, queue, consumer_tag_prefix, callback,
+            prefetch_count=AMQP.DEFAULT.PREFETCH_COUNT, ack_every=AMQP.DEFAULT.ACK_EVERY, 
+            ack_interval=AMQP.DEFAULT.ACK_INTERVAL):
         super(ConsumingConnection, self).__init__(conn_params, channel_name)
         self.logger = logging.getLogger(self.__class__.__name__)
         self.queue = queue
         self.consumer_tag_prefix = consumer_tag_prefix
         self.callback = callback
+        self.prefetch_count = prefetch_count
+        
+        # The broker would stop sending messages before a batch could fill up otherwise
+        self.ack_every = max(min(ack_every, prefetch_count) if prefetch_count else ack_every, 1)
+        
+        self.ack_interval = ack_interval / 1000.0
+        self.ack_timeout = None
+        self.unacked = 0
+        self.last_delivery_tag = None
         
     def _on_channel_open(self, channel):
         """ We've opened a channel to the broker.
         """
         super(ConsumingConnection, self)._on_channel_open(channel)
+        if self.prefetch_count:
+            channel.basic_qos(self._on_qos_ok, prefetch_count=self.prefetch_count)
+        else:
+            self.consume()
+            
+    def _on_qos_ok(self, frame):
+        """ The broker has accepted our prefetch count.
+        """
         self.consume()
         
     def _on_basic_consume(self, channel, method_frame, header_frame, body):
         """ We've got a message to handle.
         """
         self.callback(method_frame, header_frame, body)
-        channel.basic_ack(delivery_tag=method_frame.delivery_tag)
+        
+        self.unacked += 1
+        self.last_delivery_tag = method_frame.delivery_tag
+        
+        if self.unacked >= self.ack_every:
+            self._ack()
+            
+        elif not self.ack_timeout:
+            self.ack_timeout = self.conn.add_timeout(self.ack_interval, self._on_ack_timeout)
+            
+    def _on_ack_timeout(self):
+        self.ack_timeout = None
+        self._ack()
+            
+    def _ack(self):
+        """ Acknowledges all the messages received since the last acknowledgement.
+        """
+        if self.ack_timeout:
+            self.conn.remove_timeout(self.ack_timeout)
+            self.ack_timeout = None
+            
+        if self.unacked:
+            self.channel.basic_ack(delivery_tag=self.last_delivery_tag, multiple=self.unacked > 1)
+            self.unacked = 0
         
     def consume(self, queue=None, consumer_tag_prefix=None):
         """ Starts consuming messages from the broker.
@@ -95,6 +143,10 @@ class ConsumingConnector(BaseAMQPConnector):
         self.channel_amqp.consumer_tag_prefix = item.consumer_tag_prefix
         self.channel_amqp.service = item.service_name
         self.channel_amqp.data_format = item.data_format
+        self.channel_amqp.prefetch_count = item.prefetch_count
+        self.channel_amqp.ack_every = item.ack_every
+        self.channel_amqp.ack_interval = item.ack_interval
+        self.channel_amqp.consumers = item.consumers
         
     def _setup_amqp(self):
         """ Sets up the AMQP listener on startup.
@@ -120,11 +172,18 @@ class ConsumingConnector(BaseAMQPConnector):
             return False
         
     def _stop_amqp_connection(self):
-        """ Stops the given AMQP consumer. The method must be called from a method 
+        """ Stops the given AMQP consumers. The method must be called from a method 
         that holds onto all AMQP-related RLocks.
         """
-        if self.channel_amqp.get('consumer'):
-            self.channel_amqp.consumer.close()
+        for consumer in self.channel_amqp.get('consumer_list') or []:
+            consumer.close()
+            
+    def _get_int(self, name, default):
+        """ Returns an integer configuration value of the channel, which may not
+        have been set for channels created before it was introduced.
+        """
+        value = self.channel_amqp.get(name)
+        return int(value) if value not in (None, '') else default
                             
     def _recreate_consumer(self):
         """ (Re-)creates an AMQP consumer and updates the related attributes so 
@@ -133,15 +192,17 @@ class ConsumingConnector(BaseAMQPConnector):
         """
         self._stop_amqp_connection()
         
-        # An actual AMQP consumer
+        # Actual AMQP consumers, each with a connection of its own
         if self.channel_amqp.is_active:
-            consumer = self._amqp_consumer()
-            self.channel_amqp.consumer = consumer
+            self.channel_amqp.consumer_list = [self._amqp_consumer() for x in range(
+                max(self._get_int('consumers', AMQP.DEFAULT.CONSUMERS), 1))]
             
     def _amqp_consumer(self):
         consumer = ConsumingConnection(self._amqp_conn_params(), self.channel_amqp.name,
             self.channel_amqp.queue, self.channel_amqp.consumer_tag_prefix,
-            self._on_message)
+            self._on_message, self._get_int('prefetch_count', AMQP.DEFAULT.PREFETCH_COUNT),
+            self._get_int('ack_every', AMQP.DEFAULT.ACK_EVERY), 
+            self._get_int('ack_interval', AMQP.DEFAULT.ACK_INTERVAL))
         t = Thread(target=consumer._run)
         t.start()
         
@@ -153,19 +214,14 @@ class ConsumingConnector(BaseAMQPConnector):
         """ 
         with self.def_amqp_lock:
             with self.channel_amqp_lock:
-                consumer = self.channel_amqp.get('consumer')
+                consumer_list = self.channel_amqp.get('consumer_list')
                 self.channel_amqp = msg
-                self.channel_amqp.consumer = consumer
+                self.channel_amqp.consumer_list = consumer_list
                 self._recreate_consumer()
                 
-    def _stop_amqp_connection(self):
-        """ Stops the AMQP connection.
-        """
-        if self.channel_amqp.get('consumer'):
-            self.channel_amqp.consumer.close()
-                
     def _on_message(self, method_frame, header_frame, body):
         """ A callback to be invoked by ConsumingConnection on each new AMQP message.
+        Each of the consumers invokes it from its own thread.
         """
         with self.def_amqp_lock:
             with self.channel_amqp_lock:
@@ -173,10 +229,11 @@ class ConsumingConnector(BaseAMQPConnector):
                 params['action'] = CHANNEL.AMQP_MESSAGE_RECEIVED
                 params['service'] = self.channel_amqp.service
                 params['data_format'] = self.channel_amqp.data_format
-                params['cid'] = new_cid()
-                params['payload'] = body
                 
-                self.broker_client.invoke_async(params)
+        params['cid'] = new_cid()
+        params['payload'] = body
+        
+        self.broker_client.invoke_async(params)
 
     def on_broker_msg_CHANNEL_AMQP_CREATE(self, msg, *args):
         """ Creates a new outgoing AMQP connection. Note that the implementation
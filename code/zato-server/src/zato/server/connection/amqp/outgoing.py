@@ -11,19 +11,26 @@ from __future__ import absolute_import, division, print_function
 # stdlib
 import logging, os
 from datetime import datetime
-from threading import currentThread, Thread
+from Queue import Empty, Queue
+from socket import timeout as SocketTimeout
+from threading import currentThread, RLock, Thread
+from time import sleep, time
+from traceback import format_exc
 
 # Bunch
 from bunch import Bunch
 
 # Kombu
-from kombu import Connection, Exchange
-from kombu.pools import producers, reset as reset_pools
+from kombu import Connection, Exchange, Producer
 from kombu.transport.pyamqp import Transport
 
+# Paste
+from paste.util.converters import asbool
+
 # Zato
-from zato.common import ConnectionException
-from zato.common.broker_message import MESSAGE_TYPE, OUTGOING, TOPICS
+from zato.common import ConnectionException, KVDB
+from zato.common.histogram import Histogram
+from zato.common.broker_message import get_connector_topic, MESSAGE_TYPE, OUTGOING, TOPICS
 from zato.common.util import get_component_name, TRACE1
 from zato.server.connection.amqp import BaseAMQPConnection, BaseAMQPConnector
 from zato.server.connection import setup_logging, start_connector as _start_connector
@@ -66,6 +73,251 @@ class _Connection(Connection):
     def get_transport_cls(self):
         return _Transport
 
+class PublisherStats(object):
+    """ Publish rate and confirm latency of an outgoing connection. Collected in memory
+    and periodically stored in the KVDB off which zato.outgoing.amqp.get-stats reads them.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.lock = RLock()
+        self.last_flush = time()
+        self._reset()
+        
+    def _reset(self):
+        self.published = 0
+        self.failed = 0
+        self.confirm_latency = Histogram()
+        
+    def add(self, published=0, failed=0, confirm_latency=None):
+        """ Records how many messages have been published, how many have not been
+        and, if publisher confirms are used, how long in milliseconds it took the broker
+        to confirm them.
+        """
+        with self.lock:
+            self.published += published
+            self.failed += failed
+            if confirm_latency is not None:
+                self.confirm_latency.add(confirm_latency, published + failed)
+                
+    def flush(self, conn):
+        """ Stores everything collected since the last flush in the KVDB.
+        """
+        with self.lock:
+            now = time()
+            elapsed = now - self.last_flush
+            published, failed, confirm_latency = self.published, self.failed, self.confirm_latency
+            self.last_flush = now
+            self._reset()
+            
+        key = '{}{}'.format(KVDB.OUT_AMQP_STATS, self.name)
+        latency_key = '{}{}'.format(KVDB.OUT_AMQP_STATS_CONFIRM_LATENCY, self.name)
+            
+        with conn.pipeline() as p:
+            p.hincrby(key, 'published', published)
+            p.hincrby(key, 'failed', failed)
+            p.hset(key, 'rate', round(published / elapsed, 2) if elapsed else 0)
+            p.hset(key, 'last_updated', datetime.utcnow().isoformat())
+            
+            for field, value in confirm_latency.to_kvdb_increments():
+                p.hincrby(latency_key, field, value)
+                
+            p.execute()
+
+class Publisher(object):
+    """ Publishes messages over a long-lived connection and channel, established
+    on first use and then re-established only after a connection error.
+    
+    If batch_size is greater than 1, messages are published by a background thread
+    in batches, each of which is waited for at most linger milliseconds to fill up.
+    With confirms on, the broker acknowledges each message and all the messages
+    of a batch are confirmed in one go before the next batch is published.
+    
+    The connection has AMQP heartbeats off because nothing would be sending them while
+    it's idle. Instead, a batch which fails because of a connection error, e.g. one that
+    the broker closed in the meantime, is published once more over a new connection.
+    """
+    def __init__(self, name, conn_url, stats, confirms=False, batch_size=1, linger=5, confirm_timeout=10):
+        self.name = name
+        self.conn_url = conn_url
+        self.stats = stats
+        self.confirms = confirms
+        self.batch_size = batch_size
+        self.linger = linger / 1000.0
+        self.confirm_timeout = confirm_timeout
+        self.lock = RLock()
+        self.conn = None
+        self.channel = None
+        self.producer = None
+        
+        # Delivery tags of messages the broker hasn't confirmed yet
+        self.pending = set()
+        self.next_tag = 1
+        self.nacked = 0
+        
+        self.queue = None
+        self.thread = None
+        
+        if self.batch_size > 1:
+            self.queue = Queue()
+            self.thread = Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+            
+    def _connect(self):
+        self.conn = _Connection(self.conn_url, heartbeat=0)
+        self.channel = self.conn.channel()
+        
+        if self.confirms:
+            self.channel.confirm_select()
+            self.channel.events['basic_ack'].add(self._on_ack)
+            self.channel.events['basic_nack'].add(self._on_nack)
+            self.pending.clear()
+            self.next_tag = 1
+            
+        self.producer = Producer(self.channel)
+        
+    def _disconnect(self):
+        if self.conn:
+            try:
+                self.conn.release()
+            except Exception, e:
+                logger.warn('Could not close the connection of [{}], e:[{}]'.format(self.name, format_exc(e)))
+                
+        self.conn = self.channel = self.producer = None
+        
+    def _confirm(self, delivery_tag, multiple):
+        """ Marks messages up to and including delivery_tag, or only the one if multiple
+        is False, as confirmed. Returns how many of them were still waiting for a confirm.
+        """
+        if multiple:
+            confirmed = [tag for tag in self.pending if tag <= delivery_tag]
+        else:
+            confirmed = [delivery_tag] if delivery_tag in self.pending else []
+            
+        self.pending.difference_update(confirmed)
+        return len(confirmed)
+        
+    def _on_ack(self, delivery_tag, multiple):
+        self._confirm(delivery_tag, multiple)
+        
+    def _on_nack(self, delivery_tag, multiple):
+        self.nacked += self._confirm(delivery_tag, multiple)
+        
+    def _wait_for_confirms(self):
+        """ Waits until the broker confirms all the messages published so far. Returns
+        how many of them were either rejected or not confirmed within confirm_timeout seconds.
+        """
+        deadline = time() + self.confirm_timeout
+        
+        while self.pending:
+            remaining = deadline - time()
+            if remaining <= 0:
+                break
+            try:
+                self.conn.drain_events(timeout=remaining)
+            except SocketTimeout:
+                break
+            
+        if self.pending:
+            logger.warn('[{}] message(s) not confirmed within [{}]s by [{}]'.format(
+                len(self.pending), self.confirm_timeout, self.name))
+            
+        failed = self.nacked + len(self.pending)
+        self.pending.clear()
+        self.nacked = 0
+        
+        return failed
+        
+    def _publish(self, batch):
+        if not self.conn:
+            self._connect()
+            
+        start = time()
+        
+        for body, exchange, routing_key, headers, properties in batch:
+            self.producer.publish(body, routing_key=routing_key, exchange=exchange, headers=headers, **properties)
+            if self.confirms:
+                self.pending.add(self.next_tag)
+                self.next_tag += 1
+                
+        if self.confirms:
+            failed = self._wait_for_confirms()
+            self.stats.add(len(batch) - failed, failed, (time() - start) * 1000)
+        else:
+            self.stats.add(len(batch))
+            
+    def _publish_batch(self, batch):
+        """ Publishes a batch of messages, retrying it once over a new connection
+        if the current one turns out to be broken.
+        """
+        with self.lock:
+            for is_retry in (False, True):
+                try:
+                    self._publish(batch)
+                    return
+                except Exception, e:
+                    connection_errors = self.conn.connection_errors if self.conn else ()
+                    
+                    # Will reconnect on the next attempt or batch
+                    self._disconnect()
+                    
+                    if not is_retry and isinstance(e, connection_errors):
+                        logger.warn('Reconnecting [{}] and retrying [{}] message(s), e:[{}]'.format(
+                            self.name, len(batch), format_exc(e)))
+                        continue
+                    
+                    logger.error('Could not publish [{}] message(s) through [{}], e:[{}]'.format(
+                        len(batch), self.name, format_exc(e)))
+                    self.stats.add(failed=len(batch))
+                    return
+                
+    def _run(self):
+        """ Publishes messages in batches for as long as close isn't called.
+        """
+        keep_running = True
+        
+        while keep_running:
+            item = self.queue.get()
+            if item is None:
+                break
+            
+            batch = [item]
+            deadline = time() + self.linger
+            
+            while len(batch) < self.batch_size:
+                remaining = deadline - time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except Empty:
+                    break
+                
+                if item is None:
+                    keep_running = False
+                    break
+                
+                batch.append(item)
+                
+            self._publish_batch(batch)
+            
+    def publish(self, body, exchange, routing_key, headers, properties):
+        item = (body, exchange, routing_key, headers, properties)
+        if self.queue:
+            self.queue.put(item)
+        else:
+            self._publish_batch([item])
+            
+    def close(self):
+        """ Publishes all the messages still waiting in a batch and closes the connection.
+        """
+        if self.thread:
+            self.queue.put(None)
+            self.thread.join(self.linger + self.confirm_timeout + 1)
+            
+        with self.lock:
+            self._disconnect()
+
 class PublisherFacade(object):
     """ An AMQP facade for services so they aren't aware that publishing AMQP
     messages actually requires us to use the Zato broker underneath.
@@ -88,7 +340,8 @@ class PublisherFacade(object):
         params['args'] = args
         params['kwargs'] = kwargs
         
-        self.broker_client.publish(params, msg_type=MESSAGE_TYPE.TO_AMQP_PUBLISHING_CONNECTOR_ALL)
+        self.broker_client.publish(params, msg_type=MESSAGE_TYPE.TO_AMQP_PUBLISHING_CONNECTOR_ALL, 
+            topic=get_connector_topic(MESSAGE_TYPE.TO_AMQP_PUBLISHING_CONNECTOR_ALL, out_name))
         
     def conn(self):
         """ Returns self. Added to make the facade look like other outgoing
@@ -111,9 +364,17 @@ class OutgoingConnector(BaseAMQPConnector):
         }
         self.broker_messages = self.broker_callbacks.keys()
         self.component_name = get_component_name('out-amqp')
+        self.publisher = None
+        self.stats = None
         
         if init:
             self._init()
+            self.stats = PublisherStats(self.out_amqp.name)
+            self._recreate_sender()
+            
+            stats_flusher = Thread(target=self._flush_stats)
+            stats_flusher.daemon = True
+            stats_flusher.start()
         
         self.logger.info('Started an AMQP publisher for [{}]'.format(self._conn_info()))
             
@@ -134,11 +395,15 @@ class OutgoingConnector(BaseAMQPConnector):
         self.out_amqp.app_id = item.app_id
         self.out_amqp.def_name = item.def_name
         self.out_amqp.def_id = item.def_id
+        
+        # Messages to publish arrive on a topic of this connection only
+        self.broker_callbacks[get_connector_topic(
+            MESSAGE_TYPE.TO_AMQP_PUBLISHING_CONNECTOR_ALL, self.out_amqp.name)] = self.on_broker_msg
                 
     def filter(self, msg):
         """ Finds out whether the incoming message actually belongs to the 
-        listener. All the listeners receive each of the incoming PUB messages 
-        and filtering out is being performed here, on the client side, not in the broker.
+        listener. Messages to publish are received on a topic of this connection only
+        but all the listeners receive messages published on the _ALL topics.
         """
         if super(OutgoingConnector, self).filter(msg):
             return True
@@ -165,6 +430,12 @@ class OutgoingConnector(BaseAMQPConnector):
         """ 
         with self.def_amqp_lock:
             with self.out_amqp_lock:
+                if self.out_amqp.get('name') and msg.name != self.out_amqp.name:
+                    self.broker_client.unsubscribe(get_connector_topic(
+                        MESSAGE_TYPE.TO_AMQP_PUBLISHING_CONNECTOR_ALL, self.out_amqp.name))
+                    self.broker_client.subscribe(get_connector_topic(
+                        MESSAGE_TYPE.TO_AMQP_PUBLISHING_CONNECTOR_ALL, msg.name), self.on_broker_msg)
+                    
                 self.out_amqp = msg
                 self._recreate_sender()
 
@@ -215,18 +486,39 @@ class OutgoingConnector(BaseAMQPConnector):
         if not 'X-Zato-Msg-TS' in headers:
             headers['X-Zato-Msg-TS'] = datetime.utcnow().isoformat()
         
-        conn = _Connection(CONN_TEMPLATE.format(**self.def_amqp), heartbeat=self.def_amqp.heartbeat)
-        
-        with producers[conn].acquire(block=True) as producer:
-            producer.publish(msg.body, exchange=msg.exchange, headers=headers, **properties)
+        self.publisher.publish(msg.body, msg.exchange, msg.routing_key, headers, properties)
         
     def _stop_amqp_connection(self):
         """ Stops any underlying connections.
         """
-        reset_pools()
+        if self.publisher:
+            self.publisher.close()
+            self.publisher = None
         
     def _recreate_sender(self):
-        return self._stop_amqp_connection()
+        """ Closes the current publisher, if any, and creates a new one using
+        the current configuration of the definition and outgoing connection.
+        """
+        self._stop_amqp_connection()
+        
+        config = self.fs_server_config.get('amqp_publisher', {})
+        self.stats.name = self.out_amqp.name
+        
+        self.publisher = Publisher(self.out_amqp.name, CONN_TEMPLATE.format(**self.def_amqp), self.stats,
+            asbool(config.get('confirms', False)), int(config.get('batch_size', 1)), 
+            int(config.get('linger', 5)), int(config.get('confirm_timeout', 10)))
+            
+    def _flush_stats(self):
+        """ Periodically stores publish rate and confirm latency in the KVDB.
+        """
+        interval = int(self.fs_server_config.get('amqp_publisher', {}).get('stats_interval', 10))
+        
+        while True:
+            sleep(interval)
+            try:
+                self.stats.flush(self.kvdb.conn)
+            except Exception, e:
+                self.logger.warn('Could not store stats of [{}], e:[{}]'.format(self.stats.name, format_exc(e)))
 
 def run_connector():
     """ Invoked on the process startup.
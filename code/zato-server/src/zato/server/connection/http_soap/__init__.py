@@ -9,7 +9,7 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
-from httplib import BAD_REQUEST, FORBIDDEN, NOT_FOUND, UNAUTHORIZED
+from httplib import BAD_REQUEST, FORBIDDEN, NOT_FOUND, REQUEST_ENTITY_TOO_LARGE, UNAUTHORIZED
 
 # Zato
 from zato.common import HTTPException
@@ -30,6 +30,10 @@ class NotFound(ClientHTTPError):
     def __init__(self, cid, msg):
         super(NotFound, self).__init__(cid, msg, NOT_FOUND)
         
+class RequestEntityTooLarge(ClientHTTPError):
+    def __init__(self, cid, msg):
+        super(RequestEntityTooLarge, self).__init__(cid, msg, REQUEST_ENTITY_TOO_LARGE)
+        
 class Unauthorized(ClientHTTPError):
     def __init__(self, cid, msg, challenge):
         super(Unauthorized, self).__init__(cid, msg, UNAUTHORIZED)
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+from hashlib import sha1
+from threading import RLock
+from time import time
+from traceback import format_exc
+from urllib import urlencode
+
+# Requests
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+# Zato
+from zato.common import KVDB
+from zato.common.json import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+def _to_bytes(value):
+    return value.encode('utf-8') if isinstance(value, unicode) else value
+
+def encode_request_data(value):
+    """ Returns query string parameters or a body as a string, form-encoding dictionaries,
+    with their keys sorted, and lists of pairs the way requests does it. None is returned
+    for anything else, e.g. a file-like object, which means there's no key for the request.
+    """
+    if not value:
+        return b''
+
+    if isinstance(value, basestring):
+        return _to_bytes(value)
+
+    if isinstance(value, dict):
+        value = sorted(value.items())
+    elif not isinstance(value, (list, tuple)):
+        return None
+
+    try:
+        return urlencode([(_to_bytes(name), [_to_bytes(elem) for elem in elem_value]
+            if isinstance(elem_value, (list, tuple)) else _to_bytes(elem_value)) for name, elem_value in value], True)
+    except (TypeError, ValueError), e:
+        logger.debug('Could not encode [%r], e:[%s]', value, e)
+        return None
+
+def parse_cache_control(value):
+    """ Turns a Cache-Control header into a dictionary of its directives, e.g.
+    'no-cache, max-age=60' into {'no-cache':None, 'max-age':'60'}.
+    """
+    directives = {}
+    for item in (value or '').split(','):
+        name, _, arg = item.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+
+    return directives
+
+def get_ttl(cache_control, default):
+    """ Returns the max-age of a parsed Cache-Control header or the default value if there isn't any.
+    """
+    try:
+        return int(cache_control['max-age'])
+    except (KeyError, TypeError, ValueError):
+        return default
+
+class CacheEntry(object):
+    """ A response kept in a ResponseCache along with what is needed to tell whether it's
+    still fresh and to revalidate it once it's not.
+    """
+    __slots__ = ('status_code', 'headers', 'content', 'encoding', 'url', 'expires_at', 'etag', 'last_modified',
+        'must_revalidate')
+
+    def __init__(self, status_code=None, headers=None, content=None, encoding=None, url=None, expires_at=None,
+            etag=None, last_modified=None, must_revalidate=False):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+        self.encoding = encoding
+        self.url = url
+        self.expires_at = expires_at
+        self.etag = etag
+        self.last_modified = last_modified
+        self.must_revalidate = must_revalidate
+
+    @staticmethod
+    def from_response(response, ttl):
+        """ Returns an entry for a response, or None if the response can't be cached.
+        A Cache-Control max-age of the response wins over the ttl given on input.
+        """
+        if response.status_code != 200:
+            return None
+
+        cache_control = parse_cache_control(response.headers.get('Cache-Control'))
+        if 'no-store' in cache_control:
+            return None
+
+        return CacheEntry(response.status_code, dict(response.headers), response.content, response.encoding,
+            response.url, time() + get_ttl(cache_control, ttl), response.headers.get('ETag'),
+            response.headers.get('Last-Modified'), 'no-cache' in cache_control)
+
+    def is_fresh(self):
+        return not self.must_revalidate and self.expires_at > time()
+
+    def get_validators(self):
+        """ Returns headers making a request conditional, i.e. ones the other end may reply to
+        with a 304 Not Modified if the response hasn't changed since the entry was stored.
+        """
+        validators = {}
+        if self.etag:
+            validators['If-None-Match'] = self.etag
+        if self.last_modified:
+            validators['If-Modified-Since'] = self.last_modified
+
+        return validators
+
+    def to_response(self):
+        """ Returns a new requests' Response out of the entry.
+        """
+        response = Response()
+        response.status_code = self.status_code
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.content
+        response._content_consumed = True
+        response.encoding = self.encoding
+        response.url = self.url
+
+        return response
+
+    def to_json(self):
+        data = dict((name, getattr(self, name)) for name in self.__slots__)
+        data['content'] = b64encode(self.content)
+        return dumps(data)
+
+    @staticmethod
+    def from_json(value):
+        data = loads(value)
+        data['content'] = b64decode(data['content'])
+        return CacheEntry(**dict((str(key), value) for key, value in data.items()))
+
+class ResponseCache(object):
+    """ Responses of an outgoing HTTP/SOAP connection, kept in-process in a least-recently-used
+    dictionary of up to max_size entries and, if a KVDB connection is given, also in the KVDB,
+    which lets all the workers of a cluster share them. Entries are fresh for ttl seconds unless
+    responses say otherwise in their Cache-Control. Stale entries with an ETag or a Last-Modified
+    header are kept so that they can be revalidated with a conditional request.
+    """
+    def __init__(self, name, ttl, max_size=1000, kvdb=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.kvdb = kvdb
+        self.kvdb_prefix = '{}{}:'.format(KVDB.OUT_HTTP_SOAP_CACHE, name)
+        self.lock = RLock()
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def get_key(self, method, address, params=None, data=None):
+        """ Returns a key of a request, made of its method, address, query string parameters
+        and a hash of its body, or None if either the parameters or the body can't be encoded
+        in which case the request isn't cached.
+        """
+        params = encode_request_data(params)
+        data = encode_request_data(data)
+
+        if params is None or data is None:
+            return None
+
+        return sha1(b'\n'.join((_to_bytes(method), _to_bytes(address), params, sha1(data).hexdigest()))).hexdigest()
+
+    def _incr(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def invoke(self, key, headers, func):
+        """ Returns a response to a request, out of the cache if there is a fresh entry for it.
+        Otherwise, func(headers) is called to invoke the other end and what it returns is cached,
+        if it can be. If there is a stale entry, the headers make the request conditional and a 304
+        Not Modified response means the entry is fresh again. A request's own Cache-Control no-cache
+        means the cache is not looked up at all and neither is it if there's no key.
+        """
+        if key is None:
+            return func(headers)
+
+        if 'no-cache' in parse_cache_control(headers.get('Cache-Control')):
+            entry = None
+        else:
+            entry = self.get(key)
+
+        if entry and entry.is_fresh():
+            self._incr('hits')
+            return entry.to_response()
+
+        if entry:
+            headers.update(entry.get_validators())
+
+        response = func(headers)
+
+        if entry and response.status_code == 304:
+            self._incr('revalidated')
+
+            # A 304 may update the Cache-Control of the entry but if it doesn't, the entry's own one still applies
+            cache_control = parse_cache_control(response.headers.get('Cache-Control') or 
+                CaseInsensitiveDict(entry.headers).get('Cache-Control'))
+            entry.expires_at = time() + get_ttl(cache_control, self.ttl)
+            entry.etag = response.headers.get('ETag') or entry.etag
+            self.set(key, entry)
+
+            return entry.to_response()
+
+        self._incr('misses')
+
+        new_entry = CacheEntry.from_response(response, self.ttl)
+        if new_entry:
+            self.set(key, new_entry)
+        elif entry:
+            self.delete(key)
+
+        return response
+
+    def get(self, key):
+        """ Returns an entry, fresh or stale, or None if there is no entry under that key.
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry:
+                self.entries[key] = entry # Most recently used ones go to the end
+                return entry
+
+        if self.kvdb:
+            try:
+                value = self.kvdb.get(self.kvdb_prefix + key)
+            except Exception, e:
+                logger.warn('Could not get [{}] from the KVDB, e:[{}]'.format(key, format_exc(e)))
+            else:
+                if value:
+                    entry = CacheEntry.from_json(value)
+                    self._set_local(key, entry)
+                    return entry
+
+    def _set_local(self, key, entry):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = entry
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def set(self, key, entry):
+        """ Stores an entry in-process and in the KVDB, if there is one.
+        """
+        self._set_local(key, entry)
+
+        if self.kvdb:
+
+            # Entries that can be revalidated are kept in the KVDB for as long again after they go stale
+            expire = max(int(entry.expires_at - time()), 1)
+            if entry.etag or entry.last_modified:
+                expire += max(self.ttl, expire)
+
+            try:
+                self.kvdb.setex(self.kvdb_prefix + key, expire, entry.to_json())
+            except Exception, e:
+                logger.warn('Could not store [{}] in the KVDB, e:[{}]'.format(key, format_exc(e)))
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+        if self.kvdb:
+            self.kvdb.delete(self.kvdb_prefix + key)
+
+    def get_info(self):
+        """ Returns a dictionary of the counters and of how many entries there are in-process.
+        """
+        with self.lock:
+            return {'name':self.name, 'hits':self.hits, 'misses':self.misses, 'revalidated':self.revalidated,
+                'size':len(self.entries), 'max_size':self.max_size}
+
+# ##############################################################################
+
+class ChannelCacheEntry(object):
+    """ A response of an HTTP channel's service kept in a ChannelResponseCache.
+    """
+    __slots__ = ('status_code', 'content_type', 'headers', 'payload', 'etag', 'expires_at', 'path', 'query_string')
+
+    def __init__(self, status_code=None, content_type=None, headers=None, payload=None, etag=None, expires_at=None,
+            path=None, query_string=None):
+        self.status_code = status_code
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.payload = payload
+        self.etag = etag
+        self.expires_at = expires_at
+        self.path = path
+        self.query_string = query_string
+
+    @staticmethod
+    def from_response(response, ttl, wsgi_environ):
+        """ Returns an entry for a service's response, with an ETag made of a hash of its payload.
+        """
+        payload = response.payload.encode('utf-8') if isinstance(response.payload, unicode) else response.payload
+
+        return ChannelCacheEntry(response.status_code, response.content_type, dict(response.headers), payload,
+            '"{}"'.format(sha1(payload).hexdigest()), time() + ttl, wsgi_environ['PATH_INFO'],
+            wsgi_environ.get('QUERY_STRING', ''))
+
+    def is_fresh(self):
+        return self.expires_at > time()
+
+    def matches(self, if_none_match):
+        """ Whether an If-None-Match header names the entry's ETag, or any ETag at all.
+        """
+        etags = [etag.strip() for etag in (if_none_match or '').split(',')]
+        return self.etag in etags or '*' in etags
+
+class ChannelResponseCache(object):
+    """ Responses to GET requests of HTTP channels, kept in-process in a least-recently-used
+    dictionary per channel. A request's key is made of its path, query string and the values
+    of any headers a channel is configured to tell requests apart by. Stale entries are simply
+    dropped because the service can always produce a response anew.
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self.channels = {} # Channel name -> OrderedDict of its entries
+
+    def get_key(self, wsgi_environ, key_headers=None):
+        """ Returns a key of a request out of its WSGI environment and an optional comma-separated
+        list of names of headers whose values matter as well.
+        """
+        headers = []
+        for name in (key_headers or '').split(','):
+            name = name.strip()
+            if name:
+                name = 'HTTP_{}'.format(name.upper().replace('-', '_'))
+                headers.append('{}={}'.format(name, wsgi_environ.get(name, '')))
+
+        key = '{}?{}:{}'.format(wsgi_environ['PATH_INFO'], wsgi_environ.get('QUERY_STRING', ''), ':'.join(sorted(headers)))
+        return sha1(key.encode('utf-8')).hexdigest()
+
+    def get(self, name, key):
+        """ Returns a fresh entry or None if there isn't any under that key.
+        """
+        with self.lock:
+            entries = self.channels.get(name)
+            entry = entries.pop(key, None) if entries else None
+            if entry and entry.is_fresh():
+                entries[key] = entry # Most recently used ones go to the end
+                return entry
+
+    def set(self, name, key, entry, max_size):
+        with self.lock:
+            entries = self.channels.setdefault(name, OrderedDict())
+            entries.pop(key, None)
+            entries[key] = entry
+            while len(entries) > max_size:
+                entries.popitem(last=False)
+
+    def invalidate(self, name, path=None, query_string=None):
+        """ Deletes entries of a channel - all of them or only those of a given path and,
+        optionally, a query string. Returns the number of entries deleted.
+        """
+        with self.lock:
+            entries = self.channels.get(name)
+            if not entries:
+                return 0
+
+            if path is None:
+                del self.channels[name]
+                return len(entries)
+
+            keys = [key for key, entry in entries.items() if entry.path == path and
+                (query_string is None or entry.query_string == query_string)]
+            for key in keys:
+                del entries[key]
+
+            return len(keys)
@@ -11,31 +11,38 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 # stdlib
 import logging
 from cStringIO import StringIO
-from httplib import INTERNAL_SERVER_ERROR, NOT_FOUND, responses, UNAUTHORIZED
+from httplib import INTERNAL_SERVER_ERROR, NOT_FOUND, NOT_MODIFIED, OK, REQUEST_ENTITY_TOO_LARGE, responses, UNAUTHORIZED
 from pprint import pprint
+from itertools import chain
+from time import time
 from traceback import format_exc
 
-# anyjson
-from anyjson import dumps
-
 # Bunch
 from bunch import Bunch
 
 # Zato
 from zato.common import CHANNEL, SIMPLE_IO, URL_TYPE, zato_namespace, ZATO_ERROR, ZATO_NONE, ZATO_OK
-from zato.common.util import payload_from_request, security_def_type, TRACE1
+from zato.common.json import dumps
+from zato.common.util import is_iterator, payload_from_request, security_def_type, TRACE1
 from zato.server.connection.http_soap import BadRequest, ClientHTTPError, \
-     NotFound, Unauthorized
+     NotFound, RequestEntityTooLarge, Unauthorized
+from zato.server.connection.http_soap.cache import ChannelCacheEntry, ChannelResponseCache, parse_cache_control
+from zato.server.connection.http_soap.routing import RoutingTable
+from zato.server.connection.http_soap.stream import read_body
 from zato.server.service.internal import AdminService
 
 logger = logging.getLogger(__name__)
 
 _status_internal_server_error = b'{} {}'.format(INTERNAL_SERVER_ERROR, responses[INTERNAL_SERVER_ERROR])
 _status_not_found = b'{} {}'.format(NOT_FOUND, responses[NOT_FOUND])
+_status_request_entity_too_large = b'{} {}'.format(REQUEST_ENTITY_TOO_LARGE, responses[REQUEST_ENTITY_TOO_LARGE])
 _status_unauthorized = b'{} {}'.format(UNAUTHORIZED, responses[UNAUTHORIZED])
 
 soap_doc = b"""<?xml version='1.0' encoding='UTF-8'?><soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns="https://zato.io/ns/20130518"><soap:Body>{body}</soap:Body></soap:Envelope>"""
 
+# What goes before and after the body of a streamed SOAP response
+soap_doc_head, soap_doc_tail = soap_doc.split(b'{body}')
+
 zato_message_soap = b"""<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/" xmlns="https://zato.io/ns/20130518">
   <soap:Body>{data}</soap:Body>
 </soap:Envelope>"""
@@ -85,11 +92,22 @@ class RequestDispatcher(object):
     """ Dispatches all the incoming HTTP/SOAP requests to appropriate handlers.
     """
     def __init__(self, security=None, soap_handler=None, plain_http_handler=None,
-                 simple_io_config=None):
+                 simple_io_config=None, max_body_size=0):
         self.security = security
         self.soap_handler = soap_handler
         self.plain_http_handler = plain_http_handler
         self.simple_io_config = simple_io_config
+        self.max_body_size = max_body_size # In bytes, 0 means no limit
+        self.routing_table = RoutingTable()
+        self.response_cache = ChannelResponseCache()
+        
+    def build_routing_table(self):
+        """ Compiles URL security and channel configuration into a new routing table.
+        Must be called each time either of them changes.
+        """
+        with self.security.url_sec_lock:
+            self.routing_table.build(self.security.url_sec, self.soap_handler.http_soap,
+                self.plain_http_handler.http_soap)
         
     def wrap_error_message(self, cid, url_type, msg):
         """ Wraps an error message in a transport-specific envelope.
@@ -101,6 +119,51 @@ class RequestDispatcher(object):
         # to use.
         return msg        
     
+    def set_response_headers(self, wsgi_environ, status_code, content_type, headers):
+        """ Sets the status line and headers of a response.
+        """
+        wsgi_environ['zato.http.response.headers']['Content-Type'] = content_type
+        wsgi_environ['zato.http.response.headers'].update(headers)
+        wsgi_environ['zato.http.response.status'] = b'{} {}'.format(status_code, responses[status_code])
+
+    def dispatch_cached(self, cid, wsgi_environ, payload, transport, worker_store, data_format, path_info, handler,
+            channel_info):
+        """ Returns a response to a GET request out of the channel's cache and invokes the service
+        only if there is no fresh entry for the request yet. Cached responses are sent with an ETag
+        and conditional requests whose If-None-Match matches it get a 304 Not Modified with no body.
+        A request's own Cache-Control no-cache means the cache is not looked up, though the response
+        is still stored in it.
+        """
+        key = self.response_cache.get_key(wsgi_environ, channel_info.get('cache_key_headers'))
+
+        if 'no-cache' in parse_cache_control(wsgi_environ.get('HTTP_CACHE_CONTROL')):
+            entry = None
+        else:
+            entry = self.response_cache.get(channel_info.name, key)
+
+        if not entry:
+            service_info, response = handler.handle(cid, wsgi_environ, payload, transport, worker_store,
+                self.simple_io_config, data_format, path_info, channel_info)
+
+            # Only successful responses are cached, streamed ones are sent out as they're being produced
+            if response.status_code != OK or is_iterator(response.payload):
+                self.set_response_headers(wsgi_environ, response.status_code, response.content_type, response.headers)
+                return response.payload
+
+            entry = ChannelCacheEntry.from_response(response, channel_info.cache_ttl, wsgi_environ)
+            self.response_cache.set(channel_info.name, key, entry, channel_info.get('cache_size') or 1000)
+
+        headers = dict(entry.headers)
+        headers['ETag'] = entry.etag
+        headers['Cache-Control'] = 'max-age={}'.format(max(int(entry.expires_at - time()), 0))
+
+        if entry.matches(wsgi_environ.get('HTTP_IF_NONE_MATCH')):
+            self.set_response_headers(wsgi_environ, NOT_MODIFIED, entry.content_type, headers)
+            return b''
+
+        self.set_response_headers(wsgi_environ, entry.status_code, entry.content_type, headers)
+        return entry.payload
+
     def dispatch(self, cid, req_timestamp, wsgi_environ, worker_store):
         """ Base method for dispatching incoming HTTP/SOAP messages. If the security
         configuration is one of the technical account or HTTP basic auth, 
@@ -109,17 +172,24 @@ class RequestDispatcher(object):
         """
         path_info = wsgi_environ['PATH_INFO']
         soap_action = wsgi_environ.get('HTTP_SOAPACTION', '')
-        url_data = self.security.url_sec_get(path_info, soap_action)
-        payload = wsgi_environ['wsgi.input'].read()
-        
-        if logger.isEnabledFor(logging.DEBUG):
-            msg = 'cid:[{}], payload:[{}], wsgi_environ:[{}]'.format(cid, payload, wsgi_environ)
-            logger.debug(msg)
+        url_data = self.routing_table.get(path_info, soap_action)
 
         if url_data:
             transport = url_data['transport']
             data_format = url_data['data_format']
             try:
+                # Services of streaming channels read the body themselves, except when
+                # WS-Security is used because it needs the whole of the message upfront.
+                streaming = bool(url_data.channel_info and url_data.channel_info.get('request_streaming'))
+                if streaming and url_data.sec_def != ZATO_NONE and url_data.sec_def.sec_type == security_def_type.wss:
+                    streaming = False
+                    
+                payload = read_body(cid, wsgi_environ, self.max_body_size, streaming)
+                
+                if logger.isEnabledFor(logging.DEBUG):
+                    msg = 'cid:[{}], payload:[{}], wsgi_environ:[{}]'.format(cid, payload, wsgi_environ)
+                    logger.debug(msg)
+                    
                 if not url_data.is_active:
                     msg = 'url_data:[{}] is not active, raising NotFound'.format(sorted(url_data.items()))
                     logger.warn(msg)
@@ -137,12 +207,16 @@ class RequestDispatcher(object):
                     logger.debug(log_msg)
                 
                 handler = getattr(self, '{0}_handler'.format(transport))
+                channel_info = url_data.channel_info
+
+                # Channels with a cache policy serve GET requests out of the cache, if they can
+                if channel_info and channel_info.get('cache_ttl') and wsgi_environ['REQUEST_METHOD'] == 'GET':
+                    return self.dispatch_cached(cid, wsgi_environ, payload, transport, worker_store, data_format,
+                        path_info, handler, channel_info)
 
                 service_info, response = handler.handle(cid, wsgi_environ, payload, transport, worker_store, 
-                    self.simple_io_config, data_format, path_info)
-                wsgi_environ['zato.http.response.headers']['Content-Type'] = response.content_type
-                wsgi_environ['zato.http.response.headers'].update(response.headers)
-                wsgi_environ['zato.http.response.status'] = b'{} {}'.format(response.status_code, responses[response.status_code])
+                    self.simple_io_config, data_format, path_info, channel_info)
+                self.set_response_headers(wsgi_environ, response.status_code, response.content_type, response.headers)
 
                 return response.payload
 
@@ -158,6 +232,8 @@ class RequestDispatcher(object):
                         wsgi_environ['zato.http.response.headers']['WWW-Authenticate'] = e.challenge
                     elif isinstance(e, NotFound):
                         status = _status_not_found
+                    elif isinstance(e, RequestEntityTooLarge):
+                        status = _status_request_entity_too_large
                 else:
                     status_code = INTERNAL_SERVER_ERROR
                     response = _format_exc
@@ -195,7 +271,7 @@ class _BaseMessageHandler(object):
         self.http_soap = http_soap
         self.server = server # A ParallelServer instance
     
-    def init(self, cid, path_info, request, headers, transport, data_format):
+    def init(self, cid, path_info, request, headers, transport, data_format, service_info):
 
         if transport == 'soap':
             # HTTP headers are all uppercased at this point.
@@ -213,16 +289,8 @@ class _BaseMessageHandler(object):
         else:
             soap_action = ''
 
-        _soap_actions = self.http_soap.getall(path_info)
-        
-        for _soap_action_info in _soap_actions:
-            
-            # TODO: Remove the call to .keys() when this pull request is merged in
-            #       https://github.com/dsc/bunch/pull/4
-            if soap_action in _soap_action_info.keys():
-                service_info = _soap_action_info[soap_action]
-                break
-        else:
+        # Channel configuration has been already looked up by the dispatcher
+        if not service_info:
             msg = '[{0}] Could not find the service config for URL:[{1}], SOAP action:[{2}]'.format(
                 cid, path_info, soap_action)
             logger.warn(msg)
@@ -252,9 +320,10 @@ class _BaseMessageHandler(object):
         
         return service.response
     
-    def handle(self, cid, wsgi_environ, raw_request, transport, worker_store, simple_io_config, data_format, path_info):
+    def handle(self, cid, wsgi_environ, raw_request, transport, worker_store, simple_io_config, data_format, path_info,
+               service_info):
     
-        service_info = self.init(cid, path_info, raw_request, wsgi_environ, transport, data_format)
+        service_info = self.init(cid, path_info, raw_request, wsgi_environ, transport, data_format, service_info)
         service = self.server.service_store.new_instance(service_info.impl_name)
         
         response = service.update_handle(self._set_response_data, service, raw_request,
@@ -268,7 +337,7 @@ class _BaseMessageHandler(object):
     def _get_xml_admin_payload(self, service_instance, zato_message_template, payload):
         
         if payload:
-            data=payload.getvalue()
+            data=payload if isinstance(payload, basestring) else payload.getvalue()
         else:
             data=b"""<{response_elem} xmlns="{namespace}">
                 <zato_env>
@@ -306,16 +375,24 @@ class _BaseMessageHandler(object):
                     
                 if response.payload:
                     if not isinstance(response.payload, basestring):
-                        response.payload = self._get_xml_admin_payload(service_instance, zato_message_template, response.payload)
+                        response.payload = self._get_xml_admin_payload(
+                            service_instance, zato_message_template, response.get_serialized_payload())
                 else:
                     response.payload = self._get_xml_admin_payload(service_instance, zato_message_template, None)
         else:
-            if not isinstance(response.payload, basestring):
-                response.payload = response.payload.getvalue() if response.payload else ''
+            # Streamed responses are produced only as they're being sent out
+            if response.is_streamed:
+                if not is_iterator(response.payload):
+                    response.payload = response.payload.itervalue()
+            elif not isinstance(response.payload, basestring):
+                response.payload = response.get_serialized_payload() if response.payload else ''
 
         if transport == URL_TYPE.SOAP:
             if not isinstance(service_instance, AdminService):
-                response.payload = soap_doc.format(body=response.payload)
+                if is_iterator(response.payload):
+                    response.payload = chain((soap_doc_head,), response.payload, (soap_doc_tail,))
+                else:
+                    response.payload = soap_doc.format(body=response.payload)
     
     def set_content_type(self, response, data_format, transport, service_info):
         """ Sets a response's content type if one hasn't been supplied by the user.
@@ -375,6 +452,11 @@ class _BaseMessageHandler(object):
                     'service_id', 'service_name', 'soap_version', 'url_path'):
             soap_action_bunch[name] = msg[name]
             
+        soap_action_bunch.request_streaming = msg.get('request_streaming', False)
+        soap_action_bunch.cache_ttl = msg.get('cache_ttl')
+        soap_action_bunch.cache_size = msg.get('cache_size')
+        soap_action_bunch.cache_key_headers = msg.get('cache_key_headers')
+            
     def on_broker_msg_CHANNEL_HTTP_SOAP_DELETE(self, msg, *args):
         """ Deletes an HTTP/SOAP channel.
         """
@@ -10,30 +10,295 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import logging
+import socket
 from copy import deepcopy
 from cStringIO import StringIO
 from datetime import datetime
+from Queue import Empty, Queue
+from threading import Event, RLock, Thread
+from time import time
 
 # Requests
 import requests
+from requests.packages.urllib3.poolmanager import PoolManager
 
 # Zato
-from zato.common import Inactive
+from zato.common import CircuitOpen, Inactive, TimeoutException
 from zato.common.util import get_component_name, security_def_type
+from zato.server.config import ConfigDict
+from zato.server.connection.http_soap.cache import ResponseCache
 
 logger = logging.getLogger(__name__)
 
+# How many seconds past a deadline of HTTPSOAPStore.gather calls that have no timeout of their own may still run
+GATHER_DEADLINE_GRACE = 1
+
+class CIRCUIT_STATE:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+class CircuitBreaker(object):
+    """ Stops calls to a connection that keeps failing so that services fail fast instead
+    of waiting for it. The circuit is closed to begin with and opens after error_threshold
+    consecutive failed calls, a call fails if it raises an exception, returns a 5xx response
+    or takes longer than latency_threshold milliseconds. An open circuit rejects all calls
+    with CircuitOpen for open_period seconds and then turns half-open, letting through
+    up to half_open_probes calls at a time. The circuit closes once half_open_probes
+    of them succeed and opens again as soon as any one of them fails.
+    """
+    def __init__(self, name, error_threshold, latency_threshold=None, open_period=30, half_open_probes=1):
+        self.name = name
+        self.error_threshold = error_threshold
+        self.latency_threshold = latency_threshold / 1000.0 if latency_threshold else None # In milliseconds on input
+        self.open_period = open_period
+        self.half_open_probes = half_open_probes
+        self.lock = RLock()
+
+        self.state = CIRCUIT_STATE.CLOSED
+        self.error_count = 0
+        self.times_opened = 0
+        self.opened_at = None
+        self.last_error = None
+        self.probes_running = 0
+        self.probes_succeeded = 0
+
+    def _open(self):
+        self.state = CIRCUIT_STATE.OPEN
+        self.opened_at = time()
+        self.times_opened += 1
+        self.probes_running = 0
+        self.probes_succeeded = 0
+
+        logger.warn('Circuit of [{}] opened, error_count:[{}], last_error:[{}]'.format(
+            self.name, self.error_count, self.last_error))
+
+    def _close(self):
+        self.state = CIRCUIT_STATE.CLOSED
+        self.error_count = 0
+        self.opened_at = None
+
+        logger.info('Circuit of [{}] closed'.format(self.name))
+
+    def before_call(self):
+        """ Raises CircuitOpen if a call must not be made at all.
+        """
+        with self.lock:
+            if self.state == CIRCUIT_STATE.OPEN:
+                retry_in = self.opened_at + self.open_period - time()
+                if retry_in > 0:
+                    raise CircuitOpen(self.name, round(retry_in, 3))
+
+                self.state = CIRCUIT_STATE.HALF_OPEN
+
+            if self.state == CIRCUIT_STATE.HALF_OPEN:
+                if self.probes_running >= self.half_open_probes:
+                    raise CircuitOpen(self.name)
+                self.probes_running += 1
+
+    def after_call(self, ok, elapsed, error=None):
+        """ Records the outcome of a call before_call let through, elapsed is in seconds.
+        """
+        if ok and self.latency_threshold and elapsed > self.latency_threshold:
+            ok = False
+            error = 'Call took [{:.3f}]s, latency threshold:[{}]s'.format(elapsed, self.latency_threshold)
+
+        with self.lock:
+            is_probe = self.state == CIRCUIT_STATE.HALF_OPEN
+            if is_probe:
+                self.probes_running = max(self.probes_running - 1, 0)
+
+            if ok:
+                if is_probe:
+                    self.probes_succeeded += 1
+                    if self.probes_succeeded >= self.half_open_probes:
+                        self._close()
+                else:
+                    self.error_count = 0
+            else:
+                self.error_count += 1
+                self.last_error = error
+
+                if is_probe or (self.state == CIRCUIT_STATE.CLOSED and self.error_count >= self.error_threshold):
+                    self._open()
+
+    def get_info(self):
+        """ Returns a dictionary describing the current state of the circuit.
+        """
+        with self.lock:
+            retry_in = None
+            if self.state == CIRCUIT_STATE.OPEN:
+                retry_in = max(round(self.opened_at + self.open_period - time(), 3), 0)
+
+            return {'name':self.name, 'state':self.state, 'error_count':self.error_count, 
+                'times_opened':self.times_opened, 'retry_in':retry_in, 'last_error':self.last_error,
+                'opened_at':datetime.utcfromtimestamp(self.opened_at).isoformat() if self.opened_at else None}
+
+class DNSCache(object):
+    """ Resolves host names to IP addresses, remembering each address for ttl seconds.
+    """
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = RLock()
+        self.addresses = {}
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, host, port):
+        now = time()
+
+        with self.lock:
+            address, expires_at = self.addresses.get((host, port), (None, 0))
+            if address and expires_at > now:
+                self.hits += 1
+                return address
+            self.misses += 1
+
+        address = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)[0][4][0]
+
+        with self.lock:
+            self.addresses[(host, port)] = (address, now + self.ttl)
+
+        return address
+
+    def forget(self, host, port):
+        """ Drops the address of a host, e.g. because it could not be connected to.
+        """
+        with self.lock:
+            self.addresses.pop((host, port), None)
+
+class ConnectionPoolStats(object):
+    """ Counters of how the connection pool of an outgoing connection is used - how many
+    requests there were, how many of them reused a pooled connection and how many had to open
+    a new one, and how long, in total and at most, they waited for a connection from the pool.
+    """
+    def __init__(self):
+        self.lock = RLock()
+        self.requests = 0
+        self.pool_hits = 0
+        self.new_connections = 0
+        self.wait_time = 0.0
+        self.wait_time_max = 0.0
+
+    def on_get_conn(self, wait_time, is_new):
+        """ Records a connection taken out of the pool, wait_time is in seconds.
+        """
+        with self.lock:
+            self.requests += 1
+            if is_new:
+                self.new_connections += 1
+            else:
+                self.pool_hits += 1
+            self.wait_time += wait_time
+            self.wait_time_max = max(self.wait_time_max, wait_time)
+
+    def get_info(self):
+        """ Returns a dictionary of the counters, wait times are in milliseconds.
+        """
+        with self.lock:
+            return {'requests':self.requests, 'pool_hits':self.pool_hits, 'new_connections':self.new_connections,
+                'wait_time':round(self.wait_time * 1000, 3), 'wait_time_max':round(self.wait_time_max * 1000, 3)}
+
+class PoolManagerWithStats(PoolManager):
+    """ A urllib3 PoolManager whose pools report how they are used to a ConnectionPoolStats
+    object and, if given a DNSCache, open plain HTTP connections to the addresses it resolves.
+    HTTPS connections always resolve host names themselves because their certificates
+    are matched against the host name they connect to.
+    """
+    def __init__(self, stats, dns_cache=None, num_pools=10, **connection_pool_kw):
+        super(PoolManagerWithStats, self).__init__(num_pools, **connection_pool_kw)
+        self.stats = stats
+        self.dns_cache = dns_cache
+        self.lock = RLock()
+
+    def connection_from_host(self, host, port=None, scheme='http'):
+
+        # urllib3 doesn't lock it so threads asking for a new host at the same time could each create a pool,
+        # the last one replacing and closing the others. With block=True, threads waiting for a connection
+        # from a pool that has been closed would be waiting forever.
+        with self.lock:
+            pool = super(PoolManagerWithStats, self).connection_from_host(host, port, scheme)
+            if not getattr(pool, '_zato_stats', None):
+                self._instrument(pool, scheme)
+
+        return pool
+
+    def _instrument(self, pool, scheme):
+        pool._zato_stats = self.stats
+        get_conn, new_conn = pool._get_conn, pool._new_conn
+
+        def _get_conn(timeout=None):
+            start = time()
+            conn = get_conn(timeout)
+
+            # A connection without a socket, either a new one or one dropped by the other side
+            # after it had been pooled, will have to connect before it can be used.
+            self.stats.on_get_conn(time() - start, conn.sock is None)
+
+            return conn
+
+        def _new_conn():
+            conn = new_conn()
+            connect = conn.connect
+
+            def _connect():
+                host = conn.host
+                conn.host = self.dns_cache.resolve(host, conn.port)
+                try:
+                    connect()
+                except Exception:
+                    self.dns_cache.forget(host, conn.port)
+                    raise
+                finally:
+                    conn.host = host
+
+            conn.connect = _connect
+            return conn
+
+        pool._get_conn = _get_conn
+        if self.dns_cache and scheme == 'http':
+            pool._new_conn = _new_conn
+
 class HTTPSOAPWrapper(object):
     """ A thin wrapper around the API exposed by the 'requests' package.
     """
-    def __init__(self, config):
+    def __init__(self, config, kvdb=None):
         self.config = config
         self.config_no_sensitive = deepcopy(self.config)
         self.config_no_sensitive['password'] = '***'
         self.requests_module = requests
-        self.session = self.requests_module.session()
+
+        self.keep_alive = self.config.get('keep_alive') is not False
+        self.pool_stats = ConnectionPoolStats()
+        self.dns_cache = DNSCache(self.config['dns_cache_ttl']) if self.config.get('dns_cache_ttl') else None
+
+        pool_size = self.config.get('pool_size') or 10
+        pool_max_per_host = self.config.get('pool_max_per_host') or 10
+
+        self.session = self.requests_module.session(config={'pool_connections':pool_size,
+            'pool_maxsize':pool_max_per_host, 'keep_alive':self.keep_alive,
+            'max_retries':self.config.get('max_retries') or 0})
+        self.session.poolmanager = PoolManagerWithStats(self.pool_stats, self.dns_cache, pool_size,
+            maxsize=pool_max_per_host, block=bool(self.config.get('pool_block')))
+
+        # Responses are cached only if there's a TTL, in the KVDB too if there is one and it's been asked for
+        if self.config.get('cache_ttl'):
+            self.cache = ResponseCache(self.config['name'], self.config['cache_ttl'], self.config.get('cache_size') or 1000,
+                kvdb if self.config.get('cache_kvdb') else None)
+        else:
+            self.cache = None
         
         self._component_name = get_component_name()
+
+        # In milliseconds in config, requests wants seconds
+        self.timeout = self.config.get('timeout') / 1000.0 if self.config.get('timeout') else None
+
+        if self.config.get('cb_error_threshold'):
+            self.circuit_breaker = CircuitBreaker(self.config['name'], self.config['cb_error_threshold'], 
+                self.config.get('cb_latency_threshold'), self.config.get('cb_open_period') or 30,
+                self.config.get('cb_half_open_probes') or 1)
+        else:
+            self.circuit_breaker = None
         
         self.soap = {}
         self.soap['1.1'] = {}
@@ -120,6 +385,50 @@ class HTTPSOAPWrapper(object):
         if not self.config['is_active']:
             raise Inactive(self.config['name'])
     
+    def _invoke(self, func, *args, **kwargs):
+        """ Invokes a requests' function with the connection's default timeout
+        and through the circuit breaker, if there is one.
+        """
+        if self.timeout:
+            kwargs.setdefault('timeout', self.timeout)
+
+        # Without keep-alive requests doesn't use the pool at all and each call opens a new connection
+        if not self.keep_alive:
+            self.pool_stats.on_get_conn(0, True)
+
+        if not self.circuit_breaker:
+            return func(*args, **kwargs)
+
+        self.circuit_breaker.before_call()
+
+        ok, error = False, None
+        start = time()
+
+        try:
+            response = func(*args, **kwargs)
+            ok = response.status_code < 500
+            if not ok:
+                error = 'Status code:[{}]'.format(response.status_code)
+
+            return response
+
+        except Exception, e:
+            error = repr(e)
+            raise
+
+        finally:
+            self.circuit_breaker.after_call(ok, time() - start, error)
+
+    def get_pool_info(self):
+        """ Returns the counters of the connection pool and of the DNS cache, if there is one.
+        """
+        info = self.pool_stats.get_info()
+        info['name'] = self.config['name']
+        info['dns_cache_hits'] = self.dns_cache.hits if self.dns_cache else None
+        info['dns_cache_misses'] = self.dns_cache.misses if self.dns_cache else None
+
+        return info
+
     def ping(self, cid):
         """ Pings a given HTTP/SOAP resource
         """
@@ -134,7 +443,7 @@ class HTTPSOAPWrapper(object):
         
         # .. invoke the other end ..
         r = self.session.head(self.config['address'], auth=self.requests_auth, prefetch=True,
-                config={'verbose':verbose}, headers=self._create_headers(cid, {}))
+                config={'verbose':verbose}, headers=self._create_headers(cid, {}), timeout=self.timeout)
         
         # .. store additional info, get and close the stream.
         verbose.write('Code: {}'.format(r.status_code))
@@ -150,8 +459,16 @@ class HTTPSOAPWrapper(object):
         self._enforce_is_active()
         
         headers = self._create_headers(cid, kwargs.pop('headers', {}))
-        return self.session.get(self.config['address'], params=params or {}, 
-            prefetch=prefetch, auth=self.requests_auth, headers=headers, *args, **kwargs)
+
+        def invoke(headers):
+            return self._invoke(self.session.get, self.config['address'], params=params or {}, 
+                prefetch=prefetch, auth=self.requests_auth, headers=headers, *args, **kwargs)
+
+        # Responses not prefetched are streamed to the caller and never cached
+        if self.cache and prefetch:
+            return self.cache.invoke(self.cache.get_key('GET', self.config['address'], params), headers, invoke)
+
+        return invoke(headers)
     
     def _soap_data(self, data, headers):
         """ Wraps the data in a SOAP-specific messages and adds the headers required.
@@ -180,7 +497,120 @@ class HTTPSOAPWrapper(object):
         if self.config['transport'] == 'soap':
             data, headers = self._soap_data(data, headers)
 
-        return self.session.post(self.config['address'], data=data, 
-            prefetch=prefetch, auth=self.requests_auth, headers=headers, *args, **kwargs)
+        def invoke(headers):
+            return self._invoke(self.session.post, self.config['address'], data=data, 
+                prefetch=prefetch, auth=self.requests_auth, headers=headers, *args, **kwargs)
+
+        if self.cache and prefetch:
+            return self.cache.invoke(self.cache.get_key('POST', self.config['address'], data=data), headers, invoke)
+
+        return invoke(headers)
     
     send = post
+
+class CallResult(object):
+    """ The outcome of one of the calls made by HTTPSOAPStore.gather - either a response
+    or an exception the call raised.
+    """
+    __slots__ = ('name', 'response', 'exception')
+
+    def __init__(self, name, response=None, exception=None):
+        self.name = name
+        self.response = response
+        self.exception = exception
+
+    @property
+    def ok(self):
+        return self.exception is None
+
+    def __repr__(self):
+        return '<{} at {}, name:[{}], ok:[{}], response:[{}], exception:[{!r}]>'.format(
+            self.__class__.__name__, hex(id(self)), self.name, self.ok, self.response, self.exception)
+
+class HTTPSOAPStore(ConfigDict):
+    """ Outgoing plain HTTP or SOAP connections, each kept under its name along with its
+    config and a wrapper to invoke it through, and a way to invoke many of them concurrently.
+    """
+    def __init__(self, name, _bunch=None, pool_size=10):
+        super(HTTPSOAPStore, self).__init__(name, _bunch)
+        self.pool_size = pool_size
+
+    @staticmethod
+    def from_config_dict(config_dict, pool_size=10):
+        """ Returns a new store with the same connections a given ConfigDict has.
+        """
+        return HTTPSOAPStore(config_dict.name, config_dict._bunch, pool_size)
+
+    def _call(self, cid, name, method, kwargs):
+        return getattr(self[name].conn, method)(cid, **kwargs)
+
+    def gather(self, cid, calls, timeout=None, deadline=None):
+        """ Invokes many connections concurrently, each call in a thread of its own (a greenlet under gevent),
+        with at most self.pool_size of them running at a time. Each call is a (name, method) or
+        a (name, method, kwargs) tuple, e.g. ('crm', 'get', {'params': {'id': 1}}), and a list of CallResult
+        objects is returned, in the same order the calls were given in. A call that fails doesn't affect the others.
+
+        timeout is how many seconds each of the calls may take and deadline is how many seconds all of them
+        may take together. Calls which haven't completed by the deadline are given a TimeoutException
+        and the ones that haven't started yet are not made at all.
+        """
+        if not calls:
+            return []
+
+        # Without a timeout of their own, calls still time out a moment after the deadline so that
+        # the threads they run in are released but it's the deadline that decides what the caller gets.
+        call_timeout = timeout or (deadline + GATHER_DEADLINE_GRACE if deadline else None)
+        results = [None] * len(calls)
+        pending = Queue()
+        completed = Queue()
+        is_late = Event()
+
+        for idx, call in enumerate(calls):
+            name, method = call[:2]
+            kwargs = dict(call[2]) if len(call) > 2 else {}
+            if call_timeout:
+                kwargs.setdefault('timeout', call_timeout)
+            pending.put((idx, name, method, kwargs))
+
+        def _run():
+            while not is_late.is_set():
+                try:
+                    idx, name, method, kwargs = pending.get_nowait()
+                except Empty:
+                    return
+                try:
+                    result = CallResult(name, self._call(cid, name, method, kwargs))
+                except Exception, e:
+                    result = CallResult(name, exception=e)
+                completed.put((idx, result))
+
+        for x in range(min(self.pool_size, len(calls))):
+            thread = Thread(target=_run)
+            thread.daemon = True
+            thread.start()
+
+        end = time() + deadline if deadline else None
+
+        for x in range(len(calls)):
+            try:
+                idx, result = completed.get(timeout=max(end - time(), 0) if end else None)
+            except Empty:
+                break
+            else:
+                results[idx] = result
+
+        # Whatever hasn't completed by now never will, as far as the caller is concerned
+        is_late.set()
+
+        for idx, result in enumerate(results):
+            if result is None:
+                results[idx] = CallResult(calls[idx][0], exception=TimeoutException(
+                    cid, 'Call not completed within the deadline of [{}]s'.format(deadline)))
+
+        return results
+
+    def map(self, cid, name, method, kwargs_list, timeout=None, deadline=None):
+        """ Invokes a connection many times concurrently, once for each of the kwargs given, e.g.
+        map(cid, 'crm', 'get', [{'params': {'id': 1}}, {'params': {'id': 2}}]). See .gather for details.
+        """
+        return self.gather(cid, [(name, method, kwargs) for kwargs in kwargs_list], timeout, deadline)
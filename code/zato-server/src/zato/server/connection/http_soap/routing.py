@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+
+# Bunch
+from bunch import Bunch
+
+# Zato
+from zato.common.util import TRACE1
+
+logger = logging.getLogger(__name__)
+
+class RoutingTable(object):
+    """ A compiled mapping of (url_path, soap_action) to everything that is needed
+    to dispatch an HTTP/SOAP request - the security definition, whether a channel
+    is active, its transport, data format and the channel's own configuration,
+    including the service's impl_name.
+
+    The underlying dictionary is never modified in place. Each configuration change
+    results in a new dictionary being built and swapped in with a single assignment
+    so that worker threads can look up entries without taking any locks.
+    """
+    def __init__(self):
+        self._table = {}
+
+    def __len__(self):
+        return len(self._table)
+
+    def get(self, url_path, soap_action):
+        """ Returns the routing information for the given URL path and SOAP action
+        or None if there isn't any.
+        """
+        return self._table.get((url_path, soap_action))
+
+    def _get_channel_info(self, channel_config, url_path, soap_action):
+        """ Returns a channel's configuration or None if it cannot be found.
+        """
+        for soap_actions in channel_config.getall(url_path):
+            if soap_action in soap_actions:
+                return soap_actions[soap_action]
+
+    def build(self, url_sec, soap_config, plain_http_config):
+        """ Creates a new routing dictionary out of URL security definitions
+        and per-transport channel configuration (all of them being MultiDicts
+        of Bunches keyed by URL paths) and replaces the current one.
+        """
+        table = {}
+        channel_config = {'soap':soap_config, 'plain_http':plain_http_config}
+
+        for url_path, soap_actions in url_sec.items():
+            for soap_action, sec_info in soap_actions.items():
+
+                entry = Bunch()
+                entry.sec_def = sec_info.sec_def
+                entry.is_active = sec_info.is_active
+                entry.transport = sec_info.transport
+                entry.data_format = sec_info.data_format
+                entry.channel_info = self._get_channel_info(
+                    channel_config[sec_info.transport], url_path, soap_action)
+
+                table[(url_path, soap_action)] = entry
+
+        if logger.isEnabledFor(TRACE1):
+            logger.log(TRACE1, 'New routing table:[{}]'.format(sorted(table.items())))
+
+        # There's no lock, this is an atomic operation
+        self._table = table
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from functools import partial
+
+# Zato
+from zato.server.connection.http_soap import RequestEntityTooLarge
+
+# How much to read off the underlying input at a time when no size is given
+CHUNK_SIZE = 64 * 1024
+
+def get_content_length(wsgi_environ):
+    """ Returns the value of the Content-Length header as an integer or None if there isn't any.
+    """
+    value = wsgi_environ.get('CONTENT_LENGTH')
+    return int(value) if value else None
+
+class RequestBodyReader(object):
+    """ A file-like object through which services of streaming channels read
+    the body of a request from wsgi.input. Memory used by each request is bounded
+    by how much a service reads at a time rather than by the size of the body.
+
+    Never reads past Content-Length, if there is one, and raises RequestEntityTooLarge
+    as soon as more than max_size bytes have been read (0 means no limit).
+    """
+    def __init__(self, cid, wsgi_input, content_length=None, max_size=0):
+        self.cid = cid
+        self.wsgi_input = wsgi_input
+        self.remaining = content_length
+        self.max_size = max_size
+        self.bytes_read = 0
+
+    def __repr__(self):
+        return '<{} at {} cid:[{}], bytes_read:[{}], remaining:[{}]>'.format(
+            self.__class__.__name__, hex(id(self)), self.cid, self.bytes_read, self.remaining)
+
+    def _get_size(self, size):
+        if self.remaining is not None:
+            return min(size, self.remaining)
+        return size
+
+    def _consumed(self, data):
+        self.bytes_read += len(data)
+
+        if self.remaining is not None:
+            self.remaining -= len(data)
+
+        if self.max_size and self.bytes_read > self.max_size:
+            raise RequestEntityTooLarge(self.cid, 'Request body exceeds [{}] bytes'.format(self.max_size))
+
+        return data
+
+    def read(self, size=-1):
+        """ Reads at most size bytes or, if size isn't given, everything that is left.
+        """
+        if size is None or size < 0:
+            return b''.join(iter(partial(self.read, CHUNK_SIZE), b''))
+
+        size = self._get_size(size)
+        if not size:
+            return b''
+
+        return self._consumed(self.wsgi_input.read(size))
+
+    def readline(self, size=-1):
+        """ Reads a line, though never more than size bytes if it's given.
+        """
+        size = self._get_size(CHUNK_SIZE if size is None or size < 0 else size)
+        if not size:
+            return b''
+
+        return self._consumed(self.wsgi_input.readline(size))
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+def read_body(cid, wsgi_environ, max_size=0, streaming=False):
+    """ Returns a request's body - as a string or, if streaming is True, as a RequestBodyReader.
+    A body whose Content-Length is greater than max_size is rejected before anything is read.
+    """
+    content_length = get_content_length(wsgi_environ)
+
+    if max_size and content_length and content_length > max_size:
+        raise RequestEntityTooLarge(cid, 'Content-Length [{}] exceeds [{}] bytes'.format(content_length, max_size))
+
+    reader = RequestBodyReader(cid, wsgi_environ['wsgi.input'], content_length, max_size)
+
+    return reader if streaming else reader.read()
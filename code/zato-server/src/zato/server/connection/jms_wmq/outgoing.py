@@ -20,7 +20,7 @@ from bunch import Bunch
 from springpython.jms.core import JmsTemplate, TextMessage
 
 # Zato
-from zato.common.broker_message import MESSAGE_TYPE, OUTGOING, TOPICS
+from zato.common.broker_message import get_connector_topic, MESSAGE_TYPE, OUTGOING, TOPICS
 from zato.common.util import TRACE1
 from zato.server.connection import setup_logging, start_connector as _start_connector
 from zato.server.connection.jms_wmq import BaseJMSWMQConnection, BaseJMSWMQConnector
@@ -50,7 +50,8 @@ class WMQFacade(object):
         params['args'] = args
         params['kwargs'] = kwargs
         
-        self.broker_client.publish(params, msg_type=MESSAGE_TYPE.TO_JMS_WMQ_PUBLISHING_CONNECTOR_ALL)
+        self.broker_client.publish(params, msg_type=MESSAGE_TYPE.TO_JMS_WMQ_PUBLISHING_CONNECTOR_ALL, 
+            topic=get_connector_topic(MESSAGE_TYPE.TO_JMS_WMQ_PUBLISHING_CONNECTOR_ALL, out_name))
         
     def conn(self):
         """ Returns self. Added to make the facade look like other outgoing
@@ -156,6 +157,10 @@ class OutgoingConnector(BaseJMSWMQConnector):
         self.out.expiration = item.expiration
         self.out.sender = None
         
+        # Messages to send arrive on a topic of this connection only
+        self.broker_callbacks[get_connector_topic(
+            MESSAGE_TYPE.TO_JMS_WMQ_PUBLISHING_CONNECTOR_ALL, self.out.name)] = self.on_broker_msg
+        
     def filter(self, msg):
         """ Can we handle the incoming message?
         """
@@ -241,6 +246,12 @@ class OutgoingConnector(BaseJMSWMQConnector):
     def on_broker_msg_OUTGOING_JMS_WMQ_EDIT(self, msg, args=None):
         with self.def_lock:
             with self.out_lock:
+                if msg.name != self.out.name:
+                    self.broker_client.unsubscribe(get_connector_topic(
+                        MESSAGE_TYPE.TO_JMS_WMQ_PUBLISHING_CONNECTOR_ALL, self.out.name))
+                    self.broker_client.subscribe(get_connector_topic(
+                        MESSAGE_TYPE.TO_JMS_WMQ_PUBLISHING_CONNECTOR_ALL, msg.name), self.on_broker_msg)
+                    
                 sender = self.out.get('sender')
                 self.out = msg
                 self.out.sender = sender
@@ -11,26 +11,48 @@ import logging
 
 # Zato
 from zato.common import KVDB
+from zato.common.kvdb import scan_keys
 from zato.common.util import TRACE1 # TODO: TRACE1 should be moved over to zato.common
 
 logger = logging.getLogger(__name__)
 
-def should_store(kvdb, service_usage, service_name):
+def get_freq_config(kvdb):
+    """ Returns the sampling frequency of each service that has it configured, keyed by service name.
+    Read from the KVDB once, when a server's starting, and kept up to date through broker messages.
+    Only services in the KVDB.REQ_RESP_SAMPLE_INDEX set are looked up so there's no need to scan all the keys,
+    unless the index doesn't exist yet, in which case it's backfilled from keys found with SCAN.
+    """
+    config = {}
+    names = kvdb.conn.smembers(KVDB.REQ_RESP_SAMPLE_INDEX)
+
+    # Frequencies configured before the index was introduced
+    needs_backfill = not names
+    if needs_backfill:
+        names = [key[len(KVDB.REQ_RESP_SAMPLE):] for key in scan_keys(kvdb.conn, '{}*'.format(KVDB.REQ_RESP_SAMPLE))]
+
+    for name in names:
+        freq = int(kvdb.conn.hget('{}{}'.format(KVDB.REQ_RESP_SAMPLE, name), 'freq') or 0)
+        if freq:
+            config[name] = freq
+
+    if needs_backfill and config:
+        kvdb.conn.sadd(KVDB.REQ_RESP_SAMPLE_INDEX, *config)
+            
+    return config
+
+def should_store(freq, service_usage, service_name):
     """ Decides whether a service's request/response pair should be kept in the DB.
     """
-    key = '{}{}'.format(KVDB.REQ_RESP_SAMPLE, service_name)
-    freq = int(kvdb.conn.hget(key, 'freq') or 0)
-    
     if freq and service_usage % freq == 0:
-        return key, freq
+        return '{}{}'.format(KVDB.REQ_RESP_SAMPLE, service_name), freq
     
     return None, None
 
-def store(kvdb, key, usage, freq, **data):
-    """ Stores a service's request/response pair.
+def store(conn, key, usage, freq, **data):
+    """ Stores a service's request/response pair. conn is a KVDB connection or pipeline.
     """
     if logger.isEnabledFor(TRACE1):
         msg = 'key:[{}], usage:[{}], freq:[{}], data:[{}]'.format(key, usage, freq, data)
         logger.log(TRACE1, msg)
         
-    kvdb.conn.hmset(key, data)
+    conn.hmset(key, data)
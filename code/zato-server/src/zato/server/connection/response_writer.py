@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from collections import deque
+from threading import Thread
+from time import sleep
+from traceback import format_exc
+
+# Zato
+from zato.common.util import TRACE1
+
+logger = logging.getLogger(__name__)
+
+class ResponseWriter(object):
+    """ Stores sample and slow responses in the KVDB in the background so that services
+    never wait for Redis because of them. Each write is a call to a store function,
+    such as request_response.store or slow_response.store, queued along with its arguments
+    and run later on against a pipeline instead of a connection. If the KVDB can't keep up,
+    the oldest writes are dropped once there are queue_size of them waiting.
+    """
+    def __init__(self, conn, flush_interval=1000, queue_size=1000):
+        self.conn = conn
+        self.flush_interval = flush_interval / 1000.0 # In milliseconds on input
+        self.queue = deque(maxlen=queue_size)
+        self.keep_running = True
+
+    def add(self, func, *args, **kwargs):
+        """ Queues a call to func(pipeline, *args, **kwargs).
+        """
+        self.queue.append((func, args, kwargs))
+
+    def flush(self):
+        """ Runs all the writes queued so far in one pipelined batch.
+        """
+        if not self.queue:
+            return
+
+        count = 0
+
+        with self.conn.pipeline() as p:
+            while True:
+                try:
+                    func, args, kwargs = self.queue.popleft()
+                except IndexError:
+                    break
+                else:
+                    func(p, *args, **kwargs)
+                    count += 1
+
+            p.execute()
+
+        if logger.isEnabledFor(TRACE1):
+            logger.log(TRACE1, 'Flushed [{}] response(s)'.format(count))
+
+    def _run(self):
+        while self.keep_running:
+            sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception, e:
+                logger.warn('Could not store responses, e:[{}]'.format(format_exc(e)))
+
+    def start(self):
+        """ Starts a background thread (a greenlet under gevent) storing the responses.
+        """
+        t = Thread(target=self._run)
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        """ Stops the background thread and stores anything that's still queued.
+        """
+        self.keep_running = False
+        self.flush()
@@ -16,7 +16,7 @@ from threading import RLock, Thread
 from bunch import Bunch
 
 # Zato
-from zato.common.broker_message import MESSAGE_TYPE, OUTGOING, TOPICS
+from zato.common.broker_message import get_connector_topic, MESSAGE_TYPE, OUTGOING, TOPICS
 from zato.common.util import TRACE1
 from zato.server.connection import setup_logging, start_connector as _start_connector
 from zato.server.connection.zmq_ import BaseZMQConnection, BaseZMQConnector
@@ -40,7 +40,8 @@ class ZMQFacade(object):
         params['args'] = args
         params['kwargs'] = kwargs
         
-        self.broker_client.publish(params, msg_type=MESSAGE_TYPE.TO_ZMQ_PUBLISHING_CONNECTOR_ALL)
+        self.broker_client.publish(params, msg_type=MESSAGE_TYPE.TO_ZMQ_PUBLISHING_CONNECTOR_ALL, 
+            topic=get_connector_topic(MESSAGE_TYPE.TO_ZMQ_PUBLISHING_CONNECTOR_ALL, out_name))
         
     def conn(self):
         """ Returns self. Added to make the facade look like other outgoing
@@ -96,15 +97,22 @@ class OutgoingConnector(BaseZMQConnector):
         self.out.socket_type = self.socket_type = item.socket_type
         self.out.sender = None
         
+        # Messages to send arrive on a topic of this connection only
+        self.broker_callbacks[get_connector_topic(
+            MESSAGE_TYPE.TO_ZMQ_PUBLISHING_CONNECTOR_ALL, self.out.name)] = self.on_broker_msg
+        
     def filter(self, msg):
         """ Can we handle the incoming message?
         """
         if super(OutgoingConnector, self).filter(msg):
             return True
 
-        elif msg.action in(OUTGOING.ZMQ_SEND, OUTGOING.ZMQ_DELETE, OUTGOING.ZMQ_EDIT):
+        elif msg.action in(OUTGOING.ZMQ_SEND, OUTGOING.ZMQ_DELETE):
             return self.out.name == msg['name']
         
+        elif msg.action == OUTGOING.ZMQ_EDIT:
+            return self.out.name == msg['old_name']
+        
     def _stop_connection(self):
         """ Stops the given outgoing connection's sender. The method must 
         be called from a method that holds onto all related RLocks.
@@ -164,6 +172,12 @@ class OutgoingConnector(BaseZMQConnector):
         
     def on_broker_msg_OUTGOING_ZMQ_EDIT(self, msg, args=None):
         with self.out_lock:
+            if msg.name != self.out.name:
+                self.broker_client.unsubscribe(get_connector_topic(
+                    MESSAGE_TYPE.TO_ZMQ_PUBLISHING_CONNECTOR_ALL, self.out.name))
+                self.broker_client.subscribe(get_connector_topic(
+                    MESSAGE_TYPE.TO_ZMQ_PUBLISHING_CONNECTOR_ALL, msg.name), self.on_broker_msg)
+                
             sender = self.out.get('sender')
             self.out = msg
             self.out.sender = sender
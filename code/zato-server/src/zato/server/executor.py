@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from collections import deque
+from Queue import Queue
+from threading import Condition, RLock, Thread
+from traceback import format_exc
+
+logger = logging.getLogger(__name__)
+
+class Task(object):
+    """ A callable submitted to an Executor. Callbacks added to a task are called
+    once its callable has completed, successfully or not.
+    """
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.is_done = False
+        self.callbacks = []
+        self.lock = RLock()
+
+    def add_done_callback(self, callback):
+        """ Adds a callback to be called with no arguments once the task is done,
+        or calls it right away if the task is done already.
+        """
+        with self.lock:
+            if not self.is_done:
+                self.callbacks.append(callback)
+                return
+
+        callback()
+
+    def set_done(self):
+        with self.lock:
+            self.is_done = True
+            callbacks, self.callbacks = self.callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception, e:
+                logger.error('Could not run callback:[{}] of func:[{}], e:[{}]'.format(callback, self.func, format_exc(e)))
+
+class Executor(object):
+    """ Runs callables concurrently in a bounded pool - of greenlets under the gevent
+    worker and of threads otherwise. Each channel may have a limit of how many of its
+    callables may be running at a time, the ones over the limit wait in a per-channel queue
+    without taking up a slot in the pool so that one busy channel, say, a slow scheduler job,
+    cannot hold up the others.
+
+    Under the gevent worker, submitting a callable blocks when all the greenlets
+    are busy while under the sync one it blocks when there are queue_size callables
+    waiting for a thread already. Either way, it also blocks when the callable's channel
+    is at its limit and there are channel_queue_size callables of that channel waiting.
+    """
+    def __init__(self, has_gevent=False, pool_size=100, queue_size=1000, channel_limits=None, channel_queue_size=1000):
+        self.has_gevent = has_gevent
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.channel_limits = channel_limits or {}
+        self.channel_queue_size = channel_queue_size
+        self.lock = RLock()
+        self.has_room = Condition(self.lock) # Notified each time a waiting callable is started
+        self.pool = None
+        self.queue = None
+
+        # Channel -> a per-channel counter
+        self.running = {}
+        self.submitted = {}
+        self.completed = {}
+        self.failed = {}
+
+        # Channel -> callables waiting for their channel to be below its limit
+        self.waiting = {}
+
+    def start(self):
+        if self.has_gevent:
+
+            # So it's not a hard dependency
+            from gevent.pool import Pool
+            self.pool = Pool(self.pool_size)
+
+        else:
+            self.queue = Queue(self.queue_size)
+            for x in range(self.pool_size):
+                thread = Thread(target=self._run_queue)
+                thread.daemon = True
+                thread.start()
+
+    def _incr(self, counter, channel):
+        counter[channel] = counter.get(channel, 0) + 1
+
+    def submit(self, channel, func, *args, **kwargs):
+        """ Runs a callable in the pool as soon as there is a free slot in it
+        and its channel is below its limit. Returns a Task the caller may add
+        callbacks to, to learn when the callable has completed.
+        """
+        task = Task(func, args, kwargs)
+
+        with self.lock:
+            limit = self.channel_limits.get(channel)
+            if limit:
+                while self.running.get(channel, 0) >= limit and \
+                      len(self.waiting.get(channel, ())) >= self.channel_queue_size:
+                    self.has_room.wait()
+
+            self._incr(self.submitted, channel)
+
+            if limit and self.running.get(channel, 0) >= limit:
+                self.waiting.setdefault(channel, deque()).append(task)
+                return task
+
+            self._incr(self.running, channel)
+
+        if self.pool is not None:
+            self.pool.spawn(self._run, channel, task)
+        else:
+            self.queue.put((channel, task))
+
+        return task
+
+    def _run(self, channel, task):
+        """ Runs a task and then, for as long as there are any, all the tasks
+        that were waiting for their channel to be below its limit.
+        """
+        while True:
+            try:
+                task.func(*task.args, **task.kwargs)
+            except Exception, e:
+                logger.error('Could not run func:[{}] in channel:[{}], e:[{}]'.format(task.func, channel, format_exc(e)))
+                with self.lock:
+                    self._incr(self.failed, channel)
+
+            task.set_done()
+
+            with self.lock:
+                self._incr(self.completed, channel)
+
+                waiting = self.waiting.get(channel)
+                if waiting:
+                    task = waiting.popleft()
+                    self.has_room.notify_all()
+                else:
+                    self.running[channel] -= 1
+                    return
+
+    def _run_queue(self):
+        while True:
+            self._run(*self.queue.get())
+
+    def get_stats(self):
+        """ Returns a list of dictionaries, one for each channel the executor has seen,
+        describing how busy it is.
+        """
+        with self.lock:
+            if self.pool is not None:
+                pool_free = self.pool.free_count()
+                queue_depth = 0
+            else:
+                pool_free = None
+                queue_depth = self.queue.qsize() if self.queue else 0
+
+            stats = []
+            for channel in sorted(self.submitted):
+                stats.append({
+                    'channel': channel,
+                    'limit': self.channel_limits.get(channel, 0),
+                    'running': self.running.get(channel, 0),
+                    'waiting': len(self.waiting.get(channel, ())),
+                    'submitted': self.submitted.get(channel, 0),
+                    'completed': self.completed.get(channel, 0),
+                    'failed': self.failed.get(channel, 0),
+                    'pool_size': self.pool_size,
+                    'pool_free': pool_free,
+                    'queue_depth': queue_depth,
+                })
+
+            return stats
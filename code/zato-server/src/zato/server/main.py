@@ -28,6 +28,7 @@ import psycopg2
 
 # Zato
 from zato.common import KVDB
+from zato.common.json import DEFAULT_BACKENDS, set_backends
 from zato.common.repo import RepoManager
 from zato.common.util import clear_locks, get_app_context, get_config, get_crypto_manager, TRACE1
 from zato.server.pickup import get_pickup
@@ -87,6 +88,10 @@ def run(base_dir):
     logging.config.fileConfig(os.path.join(repo_location, 'logging.conf'))
 
     config = get_config(repo_location, 'server.conf')
+    
+    # Workers inherit the JSON codec once they have been forked
+    set_backends(config.get('json', {}).get('backends', DEFAULT_BACKENDS))
+    
     app_context = get_app_context(config)
 
     crypto_manager = get_crypto_manager(repo_location, app_context, config)
@@ -9,22 +9,22 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
-import logging
+import logging, re
 from datetime import datetime
 from httplib import OK
-from itertools import chain
-from sys import maxint
+from itertools import chain, islice
+from operator import methodcaller
+from Queue import Empty, Queue
+from sys import exc_info, maxint
+from threading import Thread
 from traceback import format_exc
 
-# anyjson
-from anyjson import dumps
-
 # Bunch
 from bunch import Bunch, bunchify
 
 # lxml
 from lxml import etree
-from lxml.objectify import deannotate, Element, ElementMaker
+from lxml.objectify import deannotate, Element, ElementMaker, ObjectPath
 
 # Paste
 from paste.util.converters import asbool
@@ -33,23 +33,30 @@ from paste.util.converters import asbool
 from sqlalchemy.util import NamedTuple
 
 # Zato
-from zato.common import BROKER, CHANNEL, KVDB, ParsingException, path, SCHEDULER_JOB_TYPE, \
+from zato.common import BROKER, CHANNEL, ParsingException, path, SCHEDULER_JOB_TYPE, \
      SIMPLE_IO, ZatoException, zato_namespace, ZATO_NONE, ZATO_OK, zato_path
-from zato.common.broker_message import SERVICE
+from zato.common.broker_message import CHANNEL as BROKER_CHANNEL, SERVICE
+from zato.common.json import dumps
 from zato.common.odb.model import Base
-from zato.common.util import uncamelify, new_cid, payload_from_request, service_name_from_impl, TRACE1
+from zato.common.util import is_iterator, uncamelify, new_cid, payload_from_request, service_name_from_impl, TRACE1
 from zato.server.connection import request_response, slow_response
-from zato.server.connection.amqp.outgoing import PublisherFacade
-from zato.server.connection.jms_wmq.outgoing import WMQFacade
-from zato.server.connection.zmq_.outgoing import ZMQFacade
 
-__all__ = ['Service', 'Request', 'Response', 'Outgoing', 'SimpleIOPayload']
+__all__ = ['Service', 'Request', 'Response', 'Outgoing', 'SimpleIOPayload', 'InputParser', 'OutputSerializer']
 
 # Need to use such a constant because we can sometimes be interested in setting
 # default values which evaluate to boolean False.
 # TODO: Move it to zato.common.
 ZATO_NO_DEFAULT_VALUE = 'ZATO_NO_DEFAULT_VALUE'
 
+# How many output items to serialize at a time when a response is streamed
+STREAM_BATCH_SIZE = 1000
+
+# Services can hook into each of these stages of handling a request
+HOOK_PREFIXES = ('before', 'after', 'finalize')
+
+# Job types that may have hooks of their own
+HOOK_JOB_TYPES = (SCHEDULER_JOB_TYPE.ONE_TIME, SCHEDULER_JOB_TYPE.INTERVAL_BASED, SCHEDULER_JOB_TYPE.CRON_STYLE)
+
 logger = logging.getLogger(__name__)
 
 class ValueConverter(object):
@@ -138,6 +145,361 @@ class Outgoing(object):
         self.plain_http = plain_http
         self.soap = soap
 
+def get_converter(param, name, simple_io_config, has_simple_io_config=True):
+    """ Returns a function converting values of a SimpleIO element the way
+    ValueConverter.convert would or None if there's nothing to convert.
+    """
+    if isinstance(param, AsIs):
+        return None
+
+    is_int = has_simple_io_config and not isinstance(param, (Boolean, Integer, Unicode, UTC)) and (
+        name in simple_io_config.get('int_parameters', []) or \
+        any(name.endswith(suffix) for suffix in simple_io_config.get('int_parameter_suffixes', [])))
+
+    if isinstance(param, Boolean):
+        convert = lambda value: asbool(value or None) # value can be an empty string and asbool chokes on that
+
+    elif any(name.startswith(prefix) for prefix in simple_io_config.get('bool_parameter_prefixes', [])):
+        func = int if isinstance(param, Integer) or is_int else unicode if isinstance(param, Unicode) else \
+            (lambda value: value.replace('+00:00', '')) if isinstance(param, UTC) else None
+
+        def convert(value):
+            value = asbool(value or None)
+            return func(value) if value and func else value
+
+    elif isinstance(param, Integer):
+        convert = lambda value: int(value) if value else value
+    elif isinstance(param, Unicode):
+        convert = lambda value: unicode(value) if value else value
+    elif isinstance(param, UTC):
+        convert = lambda value: value.replace('+00:00', '') if value else value
+    elif is_int:
+        convert = lambda value: int(value) if value and value != ZATO_NONE else value
+    else:
+        convert = None
+
+    return convert
+
+class InputParser(object):
+    """ A SimpleIO input parser compiled once per service class, at deployment time.
+    Each of the input parameters is turned into a (name, extractor, converter, is_required)
+    tuple so that parsing a request is a matter of running through these tuples
+    without any string formatting, prefix scanning or getattr calls - it's all
+    been done beforehand. Gives the very same results that Request.get_params does.
+    """
+    def __init__(self, io, simple_io_config):
+        self.io = io
+        self.has_simple_io_config = bool(simple_io_config)
+        self.default_value = getattr(io, 'default_value', None)
+        self.has_default_value = self.default_value != ZATO_NO_DEFAULT_VALUE
+
+        path_prefix = getattr(io, 'request_elem', 'request')
+        self.params = []
+
+        for is_required, param_list in ((True, getattr(io, 'input_required', [])), (False, getattr(io, 'input_optional', []))):
+            for param in param_list:
+                name = param.name if isinstance(param, ForceType) else param
+                extractor = ObjectPath('{}.{}'.format(path_prefix, name))
+                converter = get_converter(param, name, simple_io_config, self.has_simple_io_config)
+                self.params.append((name, extractor, converter, is_required))
+
+        self.params = tuple(self.params)
+
+    @staticmethod
+    def is_supported(io):
+        """ Returns True if input of a given SimpleIO definition can be parsed
+        by a compiled parser. Services that ask for the elements themselves,
+        rather than for their text, go through Request.get_params.
+        """
+        return getattr(io, 'use_text', True)
+
+    def parse(self, cid, payload, is_xml, logger):
+        """ Returns a dictionary of input parameters out of an already deserialized payload.
+        """
+        params = {}
+
+        if isinstance(payload, basestring):
+            if logger.isEnabledFor(TRACE1):
+                msg = 'payload repr=[{}], type=[{}]'.format(repr(payload), type(payload))
+                logger.log(TRACE1, msg)
+            return params
+
+        for name, extractor, converter, is_required in self.params:
+
+            if is_xml:
+                try:
+                    value = extractor(payload).text
+                except(ValueError, AttributeError), e:
+                    if is_required:
+                        msg = 'Caught an exception while parsing, payload:[<![CDATA[{}]]>], e:[{}]'.format(
+                            etree.tostring(payload), format_exc(e))
+                        raise ParsingException(cid, msg)
+                    value = self.default_value
+            else:
+                value = payload.get(name)
+
+            # Use a default value if an element is empty and we're allowed to
+            # substitute its (empty) value with the default one.
+            if self.has_default_value and not value:
+                value = self.default_value
+            elif value is not None:
+                value = unicode(value)
+
+            try:
+                params[name] = converter(value) if converter else value
+            except Exception, e:
+                msg = 'Caught an exception, param_name:[{}], value:[{}], has_simple_io_config:[{}], e:[{}]'.format(
+                    name, value, self.has_simple_io_config, format_exc(e))
+                logger.error(msg)
+                raise Exception(msg)
+
+        return params
+
+# Characters that need escaping and ones lxml refuses to serialize at all - values with
+# the latter are left to objectify so users get the very same exception they would've otherwise.
+_xml_special_chars = re.compile('[&<>\r\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+_xml_invalid_chars = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+_xsi_nsmap = ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+
+def get_xml_envelope(payload):
+    """ Returns the beginning of an XML response, up to where output items go, and its closing tag.
+    """
+    em = ElementMaker(annotate=False, namespace=payload.namespace, nsmap={None:payload.namespace})
+    zato_env = em.zato_env(em.cid(payload.zato_cid), em.result(ZATO_OK))
+    top = getattr(em, payload.response_elem)(zato_env)
+    deannotate(top, cleanup_namespaces=True)
+    top = etree.tostring(top)
+
+    end_tag = '</{}>'.format(payload.response_elem).encode('utf-8')
+
+    return top[:-len(end_tag)], end_tag
+
+class UnsupportedOutputValue(Exception):
+    """ Raised by OutputSerializer when it comes across anything it can't serialize
+    exactly the way SimpleIOPayload.getvalue would, e.g. a list which objectify turns
+    into repeated elements, or when there's an error to be reported - in either case
+    SimpleIOPayload.getvalue takes over.
+    """
+
+class OutputSerializer(object):
+    """ A SimpleIO output serializer compiled once per service class, at deployment time,
+    similarly to InputParser. Each of the output elements is turned into a tuple
+    of its name, converter and the XML tags it's written out with, and the output
+    is processed a column at a time rather than an element at a time, so that
+    serializing a response doesn't need any isinstance checks nor prefix scanning
+    for each of the values. XML is written out directly rather than built with objectify,
+    deannotated and only then serialized.
+
+    The output is byte-for-byte the same SimpleIOPayload.getvalue produces.
+    """
+    def __init__(self, io, simple_io_config):
+        self.io = io
+        self.is_xml_supported = True
+        self.names = []
+        self.elems = []
+
+        for is_required, elem_list in ((True, getattr(io, 'output_required', [])), (False, getattr(io, 'output_optional', []))):
+            for elem in elem_list:
+                name = elem.name if isinstance(elem, ForceType) else elem
+                converter = get_converter(elem, name, simple_io_config)
+
+                # Names that aren't valid tags are left to objectify which will reject them
+                try:
+                    etree.Element(name)
+                except ValueError:
+                    self.is_xml_supported = False
+
+                self.names.append(name)
+                self.elems.append((name, converter, is_required,
+                    '<{}>'.format(name), '</{}>'.format(name), '<{} xsi:nil="true"/>'.format(name)))
+
+        self.names = tuple(self.names)
+        self.elems = tuple(self.elems)
+
+    @staticmethod
+    def is_supported(io):
+        """ Returns True if a given SimpleIO definition has any output to serialize.
+        """
+        return bool(getattr(io, 'output_required', None) or getattr(io, 'output_optional', None))
+
+    def _get_column(self, payload, output, name, converter, is_required, use_getattr, is_sa_namedtuple):
+        """ Returns values of a given element across all of the output items, converted
+        the way SimpleIOPayload._getvalue does it.
+        """
+        if use_getattr:
+            column = [getattr(item, name, '') for item in output]
+        else:
+            column = map(methodcaller('get', name, ''), output)
+
+        # Missing required values are errors SimpleIOPayload.getvalue reports,
+        # missing optional ones are logged the same way it logs them, if TRACE1 is enabled.
+        if '' in column:
+            if is_required:
+                raise UnsupportedOutputValue()
+
+            if payload.zato_logger.isEnabledFor(TRACE1):
+                for item, value in zip(output, column):
+                    if isinstance(value, basestring) and not value:
+                        payload.zato_logger.log(TRACE1, payload._missing_value_log_msg(name, item, is_sa_namedtuple, False))
+
+        try:
+            if converter:
+                column = map(converter, column)
+
+            types = set(map(type, column))
+
+            # Decoding unicode objects is a no-op unless they're not ASCII-only,
+            # in which case it raises an exception, so they can be checked all at once ..
+            if unicode in types:
+                ''.join(column if len(types) == 1 else [value for value in column if value.__class__ is unicode]).encode('ascii')
+
+            # .. while all the other strings need to be decoded one by one.
+            if any(issubclass(type_, basestring) and type_ is not unicode for type_ in types):
+                column = [value.decode('utf-8') if value.__class__ is not unicode and isinstance(value, basestring) else value
+                    for value in column]
+
+            return column
+
+        except Exception, e:
+            raise UnsupportedOutputValue(format_exc(e))
+
+    def _get_columns(self, payload, output, is_sa_namedtuple):
+
+        # SimpleIOPayload._getvalue checks each item separately
+        if len(set(map(type, output))) != 1:
+            raise UnsupportedOutputValue()
+
+        use_getattr = is_sa_namedtuple or isinstance(output[0], Base)
+        return [self._get_column(payload, output, name, converter, is_required, use_getattr, is_sa_namedtuple)
+            for name, converter, is_required, _, _, _ in self.elems]
+
+    def _get_xml_text(self, value):
+        """ Returns text of an element the way objectify would've set it.
+        """
+        if value.__class__ is unicode:
+            text = value
+        elif value is None:
+            return None
+        elif value is True:
+            return 'true'
+        elif value is False:
+            return 'false'
+        elif value.__class__ is int or value.__class__ is long:
+            return unicode(value)
+        elif isinstance(value, (list, tuple, etree._Element)):
+            raise UnsupportedOutputValue(value)
+        else:
+            elem = Element('item')
+            elem.value = value
+            text = elem.value.text
+
+            if text is None:
+                raise UnsupportedOutputValue(value)
+
+        if _xml_special_chars.search(text):
+            if _xml_invalid_chars.search(text):
+                raise UnsupportedOutputValue(value)
+            text = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('\r', '&#13;')
+
+        return text
+
+    def _get_xml_column(self, column, start_tag, end_tag, nil_tag):
+        """ Returns XML of a given element across all of the output items
+        and a flag indicating whether any of them was nil.
+        """
+        out = []
+        append = out.append
+        search = _xml_special_chars.search
+        get_xml_text = self._get_xml_text
+
+        for value in column:
+
+            # By far the most common case
+            if value.__class__ is not unicode or search(value):
+                value = get_xml_text(value)
+                if value is None:
+                    append(nil_tag)
+                    continue
+
+            append(start_tag + value + end_tag)
+
+        return out, nil_tag in out
+
+    def _get_xml_items(self, payload, output, is_sa_namedtuple):
+        """ Returns XML of all the output items and a flag indicating whether any of their elements was nil.
+        """
+        columns = []
+        needs_xsi = False
+
+        for (_, _, _, start_tag, end_tag, nil_tag), column in zip(self.elems, self._get_columns(payload, output, is_sa_namedtuple)):
+            column, has_nil = self._get_xml_column(column, start_tag, end_tag, nil_tag)
+            columns.append(column)
+            needs_xsi = needs_xsi or has_nil
+
+        return ''.join('<item>{}</item>'.format(''.join(row)) for row in zip(*columns)), needs_xsi
+
+    def _get_xml(self, payload, output, is_sa_namedtuple):
+        if output:
+            items, needs_xsi = self._get_xml_items(payload, output, is_sa_namedtuple)
+
+            if payload.zato_is_repeated:
+                value = '<item_list{}>{}</item_list>'.format(_xsi_nsmap if needs_xsi else '', items)
+            else:
+                value = '<item{}>{}'.format(_xsi_nsmap if needs_xsi else '', items[len('<item>'):])
+        else:
+            value = '<item_list/>'
+
+        head, end_tag = get_xml_envelope(payload)
+
+        return b''.join((head, value.encode('ascii', 'xmlcharrefreplace'), end_tag))
+
+    def _get_json(self, payload, output, is_sa_namedtuple, serialize):
+        if output:
+            names = self.names
+            value = [dict(zip(names, row)) for row in zip(*self._get_columns(payload, output, is_sa_namedtuple))]
+        else:
+            value = []
+
+        top = {payload.response_elem: value if payload.zato_is_repeated else value[0]}
+
+        return dumps(top) if serialize else top
+
+    def serialize(self, payload, serialize=True):
+        """ Returns a SimpleIOPayload's value as a string or, if serialize is False, as a dictionary.
+        Only JSON can be returned unserialized, XML always needs to be serialized.
+        """
+        if payload.zato_is_xml and not (serialize and self.is_xml_supported):
+            raise UnsupportedOutputValue()
+
+        if payload.zato_is_repeated:
+            output = payload.zato_output
+        else:
+            output = [dict((name, getattr(payload, name, '')) for name in payload.zato_all_attrs)]
+
+        # All elements must be of the same type so it's OK to do it
+        is_sa_namedtuple = isinstance(output[0], NamedTuple) if output else False
+
+        if payload.zato_is_xml:
+            return self._get_xml(payload, output, is_sa_namedtuple)
+        else:
+            return self._get_json(payload, output, is_sa_namedtuple, serialize)
+
+    def serialize_items(self, payload, output):
+        """ Returns a chunk of a streamed response - output items serialized to XML
+        or JSON without anything that would enclose them.
+        """
+        if payload.zato_is_xml and not self.is_xml_supported:
+            raise UnsupportedOutputValue()
+
+        is_sa_namedtuple = isinstance(output[0], NamedTuple)
+
+        if payload.zato_is_xml:
+            return self._get_xml_items(payload, output, is_sa_namedtuple)[0].encode('ascii', 'xmlcharrefreplace')
+        else:
+            names = self.names
+            return dumps([dict(zip(names, row)) for row in zip(*self._get_columns(payload, output, is_sa_namedtuple))])[1:-1]
+
 class Request(ValueConverter):
     """ Wraps a service request and adds some useful meta-data.
     """
@@ -159,16 +521,11 @@ class Request(ValueConverter):
         self.is_xml = None
         self.data_format = data_format
 
-    def init(self, cid, io, data_format):
+    def init(self, cid, io, data_format, input_parser=None):
         """ Initializes the object with an invocation-specific data.
         """
         self.is_xml = data_format == SIMPLE_IO.FORMAT.XML
         self.data_format = data_format
-        path_prefix = getattr(io, 'request_elem', 'request')
-        required_list = getattr(io, 'input_required', [])
-        optional_list = getattr(io, 'input_optional', [])
-        default_value = getattr(io, 'default_value', None)
-        use_text = getattr(io, 'use_text', True)
         
         if self.simple_io_config:
             self.has_simple_io_config = True
@@ -178,6 +535,21 @@ class Request(ValueConverter):
         else:
             self.payload = self.raw_request
             
+        # Streamed requests are read by services themselves, there's nothing SimpleIO could parse
+        if hasattr(self.raw_request, 'read'):
+            return
+            
+        # A parser compiled when the service was deployed, if there is one, does it all
+        if input_parser and input_parser.has_simple_io_config == self.has_simple_io_config:
+            self.input.update(input_parser.parse(cid, self.payload, self.is_xml, self.logger))
+            return
+            
+        path_prefix = getattr(io, 'request_elem', 'request')
+        required_list = getattr(io, 'input_required', [])
+        optional_list = getattr(io, 'input_optional', [])
+        default_value = getattr(io, 'default_value', None)
+        use_text = getattr(io, 'use_text', True)
+            
         if required_list:
             params = self.get_params(required_list, path_prefix, default_value, use_text)
             self.input.update(params)
@@ -246,7 +618,8 @@ class Response(object):
     """
     __slots__ = ('logger', 'result', 'result_details', '_payload', 'payload', 
         '_content_type', 'content_type', 'content_type_changed', 'content_encoding', 
-        'headers', 'status_code', 'data_format', 'simple_io_config', 'outgoing_declared')
+        'headers', 'status_code', 'data_format', 'simple_io_config', 'outgoing_declared',
+        'serialized_payload', 'serialized_state')
 
     def __init__(self, logger, result=ZATO_OK, result_details='', payload='', 
             _content_type='text/plain', content_encoding=None, data_format=None, headers=None, 
@@ -266,6 +639,8 @@ class Response(object):
         
         self.simple_io_config = simple_io_config
         self.outgoing_declared = False
+        self.serialized_payload = None
+        self.serialized_state = None
 
     def __len__(self):
         return len(self._payload)
@@ -283,7 +658,12 @@ class Response(object):
         return self._payload
 
     def _set_payload(self, value):
-        if isinstance(value, basestring):
+        """ Strings and iterators, e.g. generators producing chunks of a body to be streamed,
+        are used as-is, anything else is set as attributes of the SimpleIO output.
+        """
+        self.serialized_payload = None
+        
+        if isinstance(value, basestring) or is_iterator(value):
             self._payload = value
         else:
             if not self.outgoing_declared:
@@ -292,7 +672,45 @@ class Response(object):
 
     payload = property(_get_payload, _set_payload)
 
-    def init(self, cid, io, data_format):
+    def get_serialized_payload(self):
+        """ Returns the payload as a string. SimpleIO output is serialized only the first time,
+        the result is kept in self.serialized_payload until another payload is set or the output
+        is changed, e.g. an attribute is assigned or an element is appended.
+        """
+        if isinstance(self._payload, basestring):
+            return self._payload
+        
+        state = self._payload.zato_get_state()
+        
+        if self.serialized_payload is None or not self._is_same_state(state, self.serialized_state):
+            self.serialized_payload = self._payload.getvalue()
+            self.serialized_state = state
+            
+        return self.serialized_payload
+
+    def _is_same_state(self, state, serialized_state):
+        """ Whether the output is the same as it was when serialized - it's the same payload,
+        nothing has been assigned or appended since then and the attributes still point to the same values.
+        """
+        payload, revision, values = state
+        serialized_payload, serialized_revision, serialized_values = serialized_state
+        
+        if payload is not serialized_payload or revision != serialized_revision:
+            return False
+        
+        for value, serialized_value in zip(values, serialized_values):
+            if value is not serialized_value:
+                return False
+            
+        return True
+
+    @property
+    def is_streamed(self):
+        """ Whether the payload is an iterable body or SimpleIO output to be streamed rather than a whole document.
+        """
+        return is_iterator(self._payload) or getattr(self._payload, 'zato_is_streamed', False)
+
+    def init(self, cid, io, data_format, output_serializer=None):
         self.data_format = data_format
         required_list = getattr(io, 'output_required', [])
         optional_list = getattr(io, 'output_optional', [])
@@ -302,21 +720,28 @@ class Response(object):
         
         if required_list or optional_list:
             self._payload = SimpleIOPayload(cid, self.logger, data_format, required_list, optional_list, self.simple_io_config, 
-                                              response_elem, namespace)
+                                              response_elem, namespace, output_serializer)
             
 class SimpleIOPayload(ValueConverter):
     """ Produces the actual response - XML or JSON - out of the user-provided
     SimpleIO abstract data. All of the attributes are prefixed with zato_ so that
     they don't conflict with user-provided data.
     """
-    def __init__(self, zato_cid, logger, data_format, required_list, optional_list, simple_io_config, response_elem, namespace):
+    # Bumped each time elements are assigned or appended or attributes are set in bulk,
+    # see zato_get_state for how Response knows whether what it serialized before is still current.
+    zato_revision = 0
+
+    def __init__(self, zato_cid, logger, data_format, required_list, optional_list, simple_io_config, response_elem, namespace,
+                 output_serializer=None):
         self.zato_cid = zato_cid
+        self.zato_output_serializer = output_serializer
         self.zato_logger = logger
         self.zato_is_xml = data_format == SIMPLE_IO.FORMAT.XML
         self.zato_output = []
         self.zato_required = [(True, name) for name in required_list]
         self.zato_optional = [(False, name) for name in optional_list]
         self.zato_is_repeated = False
+        self.zato_is_streamed = False
         self.bool_parameter_prefixes = simple_io_config.get('bool_parameter_prefixes', [])
         self.int_parameters = simple_io_config.get('int_parameters', [])
         self.int_parameter_suffixes = simple_io_config.get('int_parameter_suffixes', [])
@@ -336,9 +761,25 @@ class SimpleIOPayload(ValueConverter):
         """ Assigns a list of output elements to self.zato_output, so that they
         don't have to be each individually appended. Also sets a flag indicating
         that the payload is actually a list of repeated elements.
+
+        An iterator, such as a generator, is not consumed here - it will be
+        serialized in chunks as the response is being sent out instead.
         """
-        self.zato_output[i:j] = seq
+        if is_iterator(seq) and not self.zato_output:
+            self.zato_output = seq
+            self.zato_is_streamed = True
+        else:
+            self._consume_stream()
+            self.zato_output[i:j] = seq
         self.zato_is_repeated = True
+        self.zato_revision += 1
+
+    def _consume_stream(self):
+        """ Turns output items of a streamed payload into a list, if they're an iterator.
+        """
+        if self.zato_is_streamed:
+            self.zato_output = list(self.zato_output)
+            self.zato_is_streamed = False
 
     def set_expected_attrs(self, required_list, optional_list):
         """ Dynamically assigns all the expected attributes to self. Setting a value
@@ -367,10 +808,27 @@ class SimpleIOPayload(ValueConverter):
         else:
             for name in names:
                 setattr(self, name, getattr(attrs, name))
+                
+        self.zato_revision += 1
 
     def append(self, item):
+        self._consume_stream()
         self.zato_output.append(item)
         self.zato_is_repeated = True
+        self.zato_revision += 1
+
+    def zato_get_state(self):
+        """ Returns what Response compares to find out whether the output has changed since it was serialized.
+        Services assign expected attributes directly so their current values are returned along with the revision.
+        Changes made in place to values or elements already appended are not noticed.
+        """
+        return self, self.zato_revision, [self.__dict__.get(name) for name in self.zato_all_attrs]
+
+    def get(self, name, default=None):
+        """ Returns the value of an output attribute, which lets the payload be used as input
+        to another service invoked in-process.
+        """
+        return getattr(self, name, default) if name in self.zato_all_attrs else default
 
     def _getvalue(self, name, item, is_sa_namedtuple, is_required, leave_as_is):
         """ Returns an element's value if any has been provided while taking
@@ -408,10 +866,43 @@ class SimpleIOPayload(ValueConverter):
         return '{} elem:[{}] not found in item:[{}]'.format(
             'Expected' if is_required else 'Optional', name, msg_item)
 
+    def _get_item(self, item, is_sa_namedtuple):
+        """ Returns an output item as an objectify element or a dictionary, depending on the data format.
+        """
+        if self.zato_is_xml:
+            out_item = Element('item')
+        else:
+            out_item = {}
+        for is_required, name in chain(self.zato_required, self.zato_optional):
+            leave_as_is = isinstance(name, AsIs)
+            elem_value = self._getvalue(name, item, is_sa_namedtuple, is_required, leave_as_is)
+            
+            if isinstance(name, ForceType):
+                name = name.name
+                
+            if isinstance(elem_value, basestring):
+                elem_value = elem_value.decode('utf-8')
+            
+            if self.zato_is_xml:
+                setattr(out_item, name, elem_value)
+            else:
+                out_item[name] = elem_value
+
+        return out_item
+
     def getvalue(self, serialize=True):
         """ Gets the actual payload's value converted to a string representing
         either XML or JSON.
         """
+        # Output items will be needed as a whole
+        self._consume_stream()
+
+        if self.zato_output_serializer:
+            try:
+                return self.zato_output_serializer.serialize(self, serialize)
+            except UnsupportedOutputValue:
+                pass # Let objectify deal with it
+                
         if self.zato_is_xml:
             if self.zato_is_repeated:
                 value = Element('item_list')
@@ -435,24 +926,7 @@ class SimpleIOPayload(ValueConverter):
             is_sa_namedtuple = isinstance(output[0], NamedTuple)
             
             for item in output:
-                if self.zato_is_xml:
-                    out_item = Element('item')
-                else:
-                    out_item = {}
-                for is_required, name in chain(self.zato_required, self.zato_optional):
-                    leave_as_is = isinstance(name, AsIs)
-                    elem_value = self._getvalue(name, item, is_sa_namedtuple, is_required, leave_as_is)
-                    
-                    if isinstance(name, ForceType):
-                        name = name.name
-                        
-                    if isinstance(elem_value, basestring):
-                        elem_value = elem_value.decode('utf-8')
-                    
-                    if self.zato_is_xml:
-                        setattr(out_item, name, elem_value)
-                    else:
-                        out_item[name] = elem_value
+                out_item = self._get_item(item, is_sa_namedtuple)
     
                 if self.zato_is_repeated:
                     value.append(out_item)
@@ -476,11 +950,81 @@ class SimpleIOPayload(ValueConverter):
         else:
             return top
 
+    def _get_chunk(self, output):
+        """ Returns a chunk of a streamed response out of a batch of output items.
+        """
+        if self.zato_output_serializer:
+            try:
+                return self.zato_output_serializer.serialize_items(self, output)
+            except UnsupportedOutputValue:
+                pass # Let objectify deal with it
+
+        # All elements must be of the same type so it's OK to do it
+        is_sa_namedtuple = isinstance(output[0], NamedTuple)
+
+        if self.zato_is_xml:
+
+            # Items are serialized as children of an item_list element so that they
+            # don't redeclare the xsi namespace, which only item_list itself does.
+            value = Element('item_list')
+            for item in output:
+                value.append(self._get_item(item, is_sa_namedtuple))
+
+            deannotate(value, cleanup_namespaces=True)
+            value = etree.tostring(value)
+
+            return value[value.index(b'>') + 1:-len(b'</item_list>')]
+        else:
+            return dumps([self._get_item(item, is_sa_namedtuple) for item in output])[1:-1]
+
+    def itervalue(self, batch_size=STREAM_BATCH_SIZE):
+        """ Returns a generator of the payload's value, XML or JSON, in chunks - the beginning
+        of the document, one chunk for each batch_size of output items and the end of the document.
+        Output items are taken off self.zato_output only as chunks are being asked for so a response
+        of any size can be sent out without ever having all of it in memory.
+
+        XML elements always declare the xsi namespace since it's not known upfront
+        whether any of them will be nil. Otherwise the value is the same getvalue returns.
+        """
+        output = iter(self.zato_output)
+
+        try:
+            if self.zato_is_xml:
+                head, end_tag = get_xml_envelope(self)
+                start, sep, end = b'<item_list{}>'.format(_xsi_nsmap), b'', b'</item_list>' + end_tag
+            else:
+                head, end_tag = b'{{{}: '.format(dumps(self.response_elem)), b'}'
+                start, sep, end = b'[', b', ', b']' + end_tag
+
+            yield head
+
+            batch = list(islice(output, batch_size))
+            if not batch:
+                yield b'<item_list/>' + end_tag if self.zato_is_xml else start + end
+                return
+
+            yield start + self._get_chunk(batch)
+
+            for batch in iter(lambda: list(islice(output, batch_size)), []):
+                yield sep + self._get_chunk(batch)
+
+            yield end
+
+        except Exception, e:
+            self.zato_logger.error('Could not stream the response, cid:[{}], e:[{}]'.format(self.zato_cid, format_exc(e)))
+            raise
+
 class Service(object):
     """ A base class for all services deployed on Zato servers, no matter 
     the transport and protocol, be it plain HTTP, SOAP, WebSphere MQ or any other,
     regardless whether they're built-in or user-defined ones.
     """
+    # How many instances to keep for reuse once they've handled a request, 0 means
+    # a new instance is created for each invocation. Only the per-request state
+    # is reset before an instance is reused so pooled services must not keep
+    # any state of their own in between invocations.
+    instance_pool_size = 0
+    
     def __init__(self, *ignored_args, **ignored_kwargs):
         self.logger = logging.getLogger(self.get_name())
         self.server = None
@@ -506,6 +1050,18 @@ class Service(object):
         self.name = self.__class__.get_name()
         self.impl_name = self.__class__.get_impl_name()
         
+    def _reset(self):
+        """ Resets the per-request state of an instance that is about to be put back into
+        its service's pool. Request and response are new objects rather than cleared ones
+        because the caller may still be holding a reference to the response.
+        """
+        self.request = Request(self.logger)
+        self.response = Response(self.logger)
+        self.cid = None
+        self.environ = {}
+        self.wsgi_environ = None
+        self.job_type = None
+        
     @classmethod
     def get_name(class_):
         """ Returns a service's name, settings its .name attribute along. This will
@@ -527,6 +1083,42 @@ class Service(object):
             class_.__impl_name = '{}.{}'.format(class_.__module__, class_.__name__)
         return class_.__impl_name
     
+    @classmethod
+    def get_hooks(class_):
+        """ Returns the hooks a service overrides, keyed by prefix. Prefixes without
+        any hooks are left out so a service that overrides nothing gets an empty dict.
+        This will be called once while the service is being deployed, the result is
+        kept in the class and looked up on each invocation.
+        """
+        hooks = class_.__dict__.get('_zato_hooks')
+        if hooks is None:
+            hooks = {}
+            for prefix in HOOK_PREFIXES:
+                handle = class_._get_hook_name('{}_handle'.format(prefix))
+                job = class_._get_hook_name('{}_job'.format(prefix))
+                job_types = {}
+                
+                for job_type in HOOK_JOB_TYPES:
+                    name = class_._get_hook_name('{}_{}_job'.format(prefix, job_type))
+                    if name:
+                        job_types[job_type] = name
+                        
+                if handle or job or job_types:
+                    hooks[prefix] = Bunch(handle=handle, job=job, job_types=job_types)
+                    
+            class_._zato_hooks = hooks
+            
+        return hooks
+    
+    @classmethod
+    def _get_hook_name(class_, name):
+        """ Returns a hook's name if the class has overridden the hook, None otherwise.
+        """
+        hook = getattr(class_, name, None)
+        if hook is not None:
+            if getattr(hook, 'im_func', hook) is not getattr(getattr(Service, name, None), 'im_func', None):
+                return name
+        
     @staticmethod
     def convert_impl_name(name):
         # TODO: Move the replace functionality over to uncamelify, possibly modifying its regexp
@@ -546,24 +1138,33 @@ class Service(object):
         self.odb = self.worker_store.odb
         self.kvdb = self.worker_store.kvdb
         
-        self.slow_threshold = self.server.service_store.services[self.impl_name]['slow_threshold']
+        service_info = self.server.service_store.services[self.impl_name]
+        self.slow_threshold = service_info['slow_threshold']
         
-        out_amqp = PublisherFacade(self.broker_client)
-        out_jms_wmq = WMQFacade(self.broker_client)
-        out_zmq = ZMQFacade(self.broker_client)
-        out_sql = self.worker_store.sql_pool_store
-
-        out_ftp, out_plain_http, out_soap = self.worker_store.worker_config.outgoing_connections()
-        self.outgoing = Outgoing(out_ftp, out_amqp, out_zmq, out_jms_wmq, out_sql, out_plain_http, out_soap)
+        # Built once per worker
+        self.outgoing = self.worker_store.outgoing
         
         if hasattr(self, 'SimpleIO'):
-            self.request.init(self.cid, self.SimpleIO, self.data_format)
-            self.response.init(self.cid, self.SimpleIO, self.data_format)
+            self.request.init(self.cid, self.SimpleIO, self.data_format, service_info.get('input_parser'))
+            self.response.init(self.cid, self.SimpleIO, self.data_format, service_info.get('output_serializer'))
             
     def set_response_data(self, service, **kwargs):
         response = service.response.payload
-        if not isinstance(response, basestring):
-            response = response.getvalue(serialize=kwargs['serialize'])
+        
+        # Direct invocations get Python objects as they are, nothing is serialized or converted
+        if kwargs.get('direct'):
+            if isinstance(response, SimpleIOPayload) and response.zato_is_repeated:
+                return response.zato_output
+            return response
+        
+        if is_iterator(response):
+            response = b''.join(response)
+            service.response.payload = response
+        elif not isinstance(response, basestring):
+            if kwargs['serialize']:
+                response = service.response.get_serialized_payload()
+            else:
+                response = response.getvalue(serialize=False)
             if kwargs['as_bunch']:
                 response = bunchify(response)
             service.response.payload = response
@@ -580,18 +1181,39 @@ class Service(object):
             simple_io_config, data_format, kwargs.get('wsgi_environ', {}), 
             job_type=kwargs.get('job_type'))
             
+        # Most services don't override any hooks
+        hooks = service.get_hooks()
+            
         service.pre_handle()
-        service.call_hooks('before')
+        if hooks:
+            service.call_hooks('before')
         service.handle()
-        service.call_hooks('after')
-        service.post_handle()
-        service.call_hooks('finalize')
+        if hooks:
+            service.call_hooks('after')
+        service.post_handle(not kwargs.get('direct'))
+        if 'finalize' in hooks:
+            service.call_hooks('finalize')
+            
+            # The hooks may have changed the payload after post_handle serialized it
+            service.response.serialized_payload = None
         
-        return set_response_func(service, data_format=data_format, transport=transport, **kwargs)
+        response = set_response_func(service, data_format=data_format, transport=transport, **kwargs)
+        
+        # Streamed responses may still need the instance while they're being sent out
+        if service.instance_pool_size and not service.response.is_streamed:
+            server.service_store.release_instance(service)
+        
+        return response
             
     def invoke_by_impl_name(self, impl_name, payload='', channel=CHANNEL.INVOKE, data_format=None,
-            transport=None, serialize=False, as_bunch=False):
-            
+            transport=None, serialize=False, as_bunch=False, direct=False):
+        """ Invokes a service in the same process and returns its response. If direct is True,
+        the payload is handed over to the service as is, e.g. a dict, a Bunch or another service's
+        SimpleIO response, and the response is returned without being serialized or converted -
+        a SimpleIO payload object whose attributes are the output parameters or, if the service
+        produces a list, the items as the service has set them. Only the processing time is recorded
+        for direct invocations, their requests and responses are never stored as samples or slow ones.
+        """
         if self.impl_name == impl_name:
             msg = 'A service cannot invoke itself, name:[{}]'.format(self.name)
             self.logger.error(msg)
@@ -600,11 +1222,53 @@ class Service(object):
         service = self.server.service_store.new_instance(impl_name)
         return self.update_handle(self.set_response_data, service, payload, channel, 
             data_format, transport, self.server, self.broker_client, self.worker_store,
-            self.cid, self.request.simple_io_config, serialize=serialize, as_bunch=as_bunch)
+            self.cid, self.request.simple_io_config, serialize=serialize, as_bunch=as_bunch, direct=direct)
         
     def invoke(self, name, *args, **kwargs):
         return self.invoke_by_impl_name(self.server.service_store.name_to_impl_name[name], *args, **kwargs)
         
+    def invoke_many(self, invocations, **kwargs):
+        """ Invokes several services concurrently, each in a thread of its own (a greenlet under gevent),
+        with at most as many of them running at a time as invoke_many_pool_size in the [invoker] section
+        of server.conf says, and returns their responses in the same order the invocations were given in.
+        Each invocation is either a service name or a (name, payload) pair, kwargs are passed on to each of them,
+        e.g. direct=True. If any of the services raises an exception, the first one is re-raised, along with
+        its traceback, once all of them have completed.
+        """
+        invocations = [(item, '') if isinstance(item, basestring) else item for item in invocations]
+        responses = [None] * len(invocations)
+        errors = [None] * len(invocations)
+        pool_size = int(self.server.fs_server_config.get('invoker', {}).get('invoke_many_pool_size', 10))
+        
+        pending = Queue()
+        for idx, (name, payload) in enumerate(invocations):
+            pending.put((idx, name, payload))
+        
+        def _run():
+            while True:
+                try:
+                    idx, name, payload = pending.get_nowait()
+                except Empty:
+                    return
+                try:
+                    responses[idx] = self.invoke(name, payload, **kwargs)
+                except Exception, e:
+                    self.logger.warn('Could not invoke [{}], cid:[{}], e:[{}]'.format(name, self.cid, format_exc(e)))
+                    errors[idx] = exc_info()
+                
+        threads = [Thread(target=_run) for x in range(min(pool_size, len(invocations)))]
+        for thread in threads:
+            thread.start()
+            
+        for thread in threads:
+            thread.join()
+            
+        for error in errors:
+            if error is not None:
+                raise error[0], error[1], error[2]
+            
+        return responses
+        
     def invoke_by_id(self, service_id, *args, **kwargs):
         return self.invoke_by_impl_name(self.server.service_store.id_to_impl_name[service_id], *args, **kwargs)
         
@@ -625,21 +1289,33 @@ class Service(object):
         msg['data_format'] = data_format
         msg['transport'] = transport
         
-        self.broker_client.invoke_async(msg, expiration)
+        self.broker_client.invoke_async(msg, expiration=expiration)
         
         return cid
+
+    def invalidate_channel_cache(self, name, path=None, query_string=None):
+        """ Tells all the workers of a cluster to delete responses cached by an HTTP channel,
+        either all of them or only those of a given path and, optionally, a query string.
+        """
+        msg = {}
+        msg['action'] = BROKER_CHANNEL.HTTP_SOAP_CACHE_INVALIDATE
+        msg['name'] = name
+        msg['path'] = path
+        msg['query_string'] = query_string
+        
+        self.broker_client.publish(msg)
             
     def pre_handle(self):
         """ An internal method run just before the service sets to process the payload.
         Used for incrementing the service's usage count and storing the service invocation time.
         """
-        self.usage = self.kvdb.conn.incr('{}{}'.format(KVDB.SERVICE_USAGE, self.name))
+        self.usage = self.worker_store.stats_accumulator.incr_usage(self.name)
         self.invocation_time = datetime.utcnow()
         
-    def post_handle(self):
+    def post_handle(self, store_responses=True):
         """ An internal method executed after the service has completed and has
         a response ready to return. Updates its statistics and, optionally, stores
-        a sample request/response pair.
+        a sample request/response pair or a slow response, unless store_responses is False.
         """
         
         #
@@ -654,56 +1330,65 @@ class Service(object):
         
         self.processing_time = int(round(proc_time))
 
-        self.kvdb.conn.hset('{}{}'.format(KVDB.SERVICE_TIME_BASIC, self.name), 'last', self.processing_time)
-        self.kvdb.conn.rpush('{}{}'.format(KVDB.SERVICE_TIME_RAW, self.name), self.processing_time)
-
-        key = '{}{}:{}'.format(KVDB.SERVICE_TIME_RAW_BY_MINUTE, 
-            self.name, self.handle_return_time.strftime('%Y:%m:%d:%H:%M'))
-        self.kvdb.conn.rpush(key, self.processing_time)
+        # Kept in memory until the accumulator flushes it out to the KVDB
+        self.worker_store.stats_accumulator.add_time(
+            self.name, self.processing_time, self.handle_return_time.strftime('%Y:%m:%d:%H:%M'))
+        
+        if not store_responses:
+            return
+        
+        # Streamed requests have been already consumed by the service
+        raw_request = '' if hasattr(self.request.raw_request, 'read') else self.request.raw_request
+        
+        key, freq = request_response.should_store(
+            self.worker_store.worker_config.req_resp_sample.get(self.name), self.usage, self.name)
+        is_slow = self.processing_time > self.slow_threshold
         
-        # .. we'll have 5 minutes (5 * 60 seconds = 300 seconds) 
-        # to aggregate processing times for a given minute and then it will expire
+        if not(freq or is_slow):
+            return
         
-        # Note that we need Redis 2.1.3+ otherwise the key has just been overwritten
-        self.kvdb.conn.expire(key, 300)
+        # The response is serialized once, the result will be reused when it's being returned,
+        # and the KVDB is written to in the background.
+        resp = self._get_stored_response()
+        req_ts = self.invocation_time.isoformat()
+        resp_ts = self.handle_return_time.isoformat()
         
         # 
         # Sample requests/responses
         #
-        key, freq = request_response.should_store(self.kvdb, self.usage, self.name)
         if freq:
-
-            # TODO: Don't parse it here and a moment later below
-            resp = (self.response.payload.getvalue() if hasattr(self.response.payload, 'getvalue') else self.response.payload) or ''            
-            
             data = {
                 'cid': self.cid,
-                'req_ts': self.invocation_time.isoformat(),
-                'resp_ts': self.handle_return_time.isoformat(),
-                'req': self.request.raw_request or '',
+                'req_ts': req_ts,
+                'resp_ts': resp_ts,
+                'req': raw_request or '',
                 'resp':resp,
             }
-            request_response.store(self.kvdb, key, self.usage, freq, **data)
+            self.worker_store.response_writer.add(request_response.store, key, self.usage, freq, **data)
             
         #
         # Slow responses
         #
-        if self.processing_time > self.slow_threshold:
-
-            # TODO: Don't parse it here and a moment earlier above
-            resp = (self.response.payload.getvalue() if hasattr(self.response.payload, 'getvalue') else self.response.payload) or ''            
-            
+        if is_slow:
             data = {
                 'cid': self.cid,
                 'proc_time': self.processing_time,
                 'slow_threshold': self.slow_threshold,
-                'req_ts': self.invocation_time.isoformat(),
-                'resp_ts': self.handle_return_time.isoformat(),
-                'req': self.request.raw_request or '',
+                'req_ts': req_ts,
+                'resp_ts': resp_ts,
+                'req': raw_request or '',
                 'resp': resp,
             }
-            slow_response.store(self.kvdb, self.name, **data)
+            self.worker_store.response_writer.add(slow_response.store, self.name, **data)
             
+    def _get_stored_response(self):
+        """ Returns the response as it should be stored along with sample or slow responses.
+        Streamed responses are not stored because they haven't been produced yet.
+        """
+        if self.response.is_streamed:
+            return ''
+        return self.response.get_serialized_payload() or ''
+
     def translate(self, *args, **kwargs):
         raise NotImplementedError('An initializer should override this method')
         
@@ -716,32 +1401,42 @@ class Service(object):
 ################################################################################
 
     def call_hooks(self, prefix):
-        def call_job_hooks():
-            if self.channel == CHANNEL.SCHEDULER and prefix != 'finalize':
-                try:
-                    getattr(self, '{}_job'.format(prefix))()
-                except Exception, e:
-                    self.logger.error("Can't run {}_job, e:[{}]".format(prefix, format_exc(e)))
-                else:
-                    try:
-                        func_name = '{}_{}_job'.format(prefix, self.job_type)
-                        func = getattr(self, func_name)
-                        func()
-                    except Exception, e:
-                        self.logger.error("Can't run {}, e:[{}]".format(func_name, format_exc(e)))
-        def call_handle():
-            try:
-                getattr(self, '{}_handle'.format(prefix))()
-            except Exception, e:
-                self.logger.error("Can't run {}_handle, e:[{}]".format(prefix, format_exc(e)))
-                
+        """ Calls the hooks of a given prefix the service has overridden, if any.
+        """
+        hooks = self.get_hooks().get(prefix)
+        if not hooks:
+            return
+        
         if prefix == 'before':
-            call_job_hooks()
-            call_handle()
+            self._call_job_hooks(prefix, hooks)
+            self._call_handle_hook(prefix, hooks)
         else:
-            call_handle()
-            call_job_hooks()
+            self._call_handle_hook(prefix, hooks)
+            self._call_job_hooks(prefix, hooks)
             
+    def _call_handle_hook(self, prefix, hooks):
+        if hooks.handle:
+            try:
+                getattr(self, hooks.handle)()
+            except Exception, e:
+                self.logger.error("Can't run {}, e:[{}]".format(hooks.handle, format_exc(e)))
+                
+    def _call_job_hooks(self, prefix, hooks):
+        if self.channel == CHANNEL.SCHEDULER and prefix != 'finalize':
+            if hooks.job:
+                try:
+                    getattr(self, hooks.job)()
+                except Exception, e:
+                    self.logger.error("Can't run {}, e:[{}]".format(hooks.job, format_exc(e)))
+                    return
+                
+            func_name = hooks.job_types.get(self.job_type)
+            if func_name:
+                try:
+                    getattr(self, func_name)()
+                except Exception, e:
+                    self.logger.error("Can't run {}, e:[{}]".format(func_name, format_exc(e)))
+                    
     @staticmethod
     def before_add_to_store(logger):
         """ Invoked right before the class is added to the service store.
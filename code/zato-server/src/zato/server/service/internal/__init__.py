@@ -41,8 +41,7 @@ class AdminService(Service):
         raise NotImplementedError('Should be overridden by subclasses')
     
     def after_handle(self):
-        payload = self.response.payload
-        response = payload if isinstance(payload, basestring) else payload.getvalue()
+        response = self.response.get_serialized_payload()
             
         self.logger.info('cid:[{}], name:[{}], response:[{}]'.format(self.cid, self.name, response))
     
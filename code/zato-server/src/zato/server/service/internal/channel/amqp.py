@@ -13,13 +13,24 @@ from contextlib import closing
 from traceback import format_exc
 
 # Zato
+from zato.common import AMQP
 from zato.common.broker_message import CHANNEL, MESSAGE_TYPE
 from zato.common.odb.model import ChannelAMQP, Cluster, ConnDefAMQP, Service
 from zato.common.odb.query import channel_amqp_list
 from zato.server.connection.amqp.channel import start_connector
+from zato.server.service import Integer
 from zato.server.service.internal import AdminService, AdminSIO
 
 class _AMQPService(AdminService):
+    def set_consumer_config(self, item, input):
+        """ Sets prefetch count, acknowledgement batches and the number of consumers,
+        using defaults for any that haven't been given on input.
+        """
+        item.prefetch_count = input.prefetch_count or AMQP.DEFAULT.PREFETCH_COUNT
+        item.ack_every = input.ack_every or AMQP.DEFAULT.ACK_EVERY
+        item.ack_interval = input.ack_interval or AMQP.DEFAULT.ACK_INTERVAL
+        item.consumers = input.consumers or AMQP.DEFAULT.CONSUMERS
+        
     def delete_channel(self, channel):
         msg = {'action': CHANNEL.AMQP_DELETE, 'name': channel.name, 'id':channel.id}
         self.broker_client.publish(msg, MESSAGE_TYPE.TO_AMQP_CONNECTOR_ALL)
@@ -33,6 +44,7 @@ class GetList(AdminService):
         input_required = ('cluster_id',)
         output_required = ('id', 'name', 'is_active', 'queue', 'consumer_tag_prefix', 
             'def_name', 'def_id', 'service_name', 'data_format')
+        output_optional = ('prefetch_count', 'ack_every', 'ack_interval', 'consumers')
         
     def get_data(self, session):
         return channel_amqp_list(session, self.request.input.cluster_id, False)
@@ -41,14 +53,15 @@ class GetList(AdminService):
         with closing(self.odb.session()) as session:
             self.response.payload[:] = self.get_data(session)
         
-class Create(AdminService):
+class Create(_AMQPService):
     """ Creates a new AMQP channel.
     """
     class SimpleIO(AdminSIO):
         request_elem = 'zato_channel_amqp_create_request'
         response_elem = 'zato_channel_amqp_create_response'
         input_required = ('cluster_id', 'name', 'is_active', 'def_id', 'queue', 'consumer_tag_prefix', 'service')
-        input_optional = ('data_format',)
+        input_optional = ('data_format', Integer('prefetch_count'), Integer('ack_every'), 
+            Integer('ack_interval'), Integer('consumers'))
         output_required = ('id', 'name')
 
     def handle(self):
@@ -85,6 +98,7 @@ class Create(AdminService):
                 item.def_id = input.def_id
                 item.service = service
                 item.data_format = input.data_format
+                self.set_consumer_config(item, input)
                 
                 session.add(item)
                 session.commit()
@@ -108,7 +122,8 @@ class Edit(_AMQPService):
         request_elem = 'zato_channel_amqp_edit_request'
         response_elem = 'zato_channel_amqp_edit_response'
         input_required = ('id', 'cluster_id', 'name', 'is_active', 'def_id', 'queue', 'consumer_tag_prefix', 'service')
-        input_optional = ('data_format',)
+        input_optional = ('data_format', Integer('prefetch_count'), Integer('ack_every'), 
+            Integer('ack_interval'), Integer('consumers'))
         output_required = ('id', 'name')
 
     def handle(self):
@@ -147,6 +162,7 @@ class Edit(_AMQPService):
                 item.def_id = input.def_id
                 item.service = service
                 item.data_format = input.data_format
+                self.set_consumer_config(item, input)
                 
                 session.add(item)
                 session.commit()
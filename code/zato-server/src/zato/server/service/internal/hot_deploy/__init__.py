@@ -15,9 +15,6 @@ from datetime import datetime
 from errno import EEXIST
 from tempfile import mkdtemp, NamedTemporaryFile
 
-# anyjson
-from anyjson import dumps
-
 # pip
 from pip.download import is_archive_file
 
@@ -26,6 +23,7 @@ from retools.lock import Lock
 
 # Zato
 from zato.common import DEPLOYMENT_STATUS, KVDB
+from zato.common.json import dumps
 from zato.common.odb.model import DeploymentPackage, DeploymentStatus
 from zato.common.util import decompress, fs_safe_now, is_python_file, visit_py_source_from_distribution
 from zato.server.service.internal import AdminService, AdminSIO
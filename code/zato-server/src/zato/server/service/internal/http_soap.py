@@ -12,15 +12,17 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 from contextlib import closing
 from traceback import format_exc
 
-# anyjson
-from json import dumps
+# Paste
+from paste.util.converters import asbool
 
 # Zato
 from zato.common import URL_TYPE, ZATO_NONE
 from zato.common.broker_message import CHANNEL, OUTGOING
+from zato.common.json import dumps
 from zato.common.odb.model import Cluster, HTTPSOAP, SecurityBase, Service
 from zato.common.odb.query import http_soap_list
 from zato.common.util import security_def_type
+from zato.server.service import Boolean, Integer
 from zato.server.service.internal import AdminService, AdminSIO
 
 class _HTTPSOAPService(object):
@@ -67,7 +69,10 @@ class GetList(AdminService):
         input_required = ('cluster_id', 'connection', 'transport')
         output_required = ('id', 'name', 'is_active', 'is_internal', 'url_path')
         output_optional = ('service_id', 'service_name', 'security_id', 'security_name', 'sec_type', 
-                           'method', 'soap_action', 'soap_version', 'data_format', 'host')
+                           'method', 'soap_action', 'soap_version', 'data_format', 'host', 'request_streaming',
+                           'timeout', 'cb_error_threshold', 'cb_latency_threshold', 'cb_open_period', 'cb_half_open_probes',
+                           'pool_size', 'pool_max_per_host', 'pool_block', 'keep_alive', 'max_retries', 'dns_cache_ttl',
+                           'cache_ttl', 'cache_size', 'cache_kvdb', 'cache_key_headers')
         output_repeated = True
         
     def get_data(self, session):
@@ -85,7 +90,11 @@ class Create(AdminService, _HTTPSOAPService):
         request_elem = 'zato_http_soap_create_request'
         response_elem = 'zato_http_soap_create_response'
         input_required = ('cluster_id', 'name', 'is_active', 'connection', 'transport', 'is_internal', 'url_path')
-        input_optional = ('service', 'security_id', 'method', 'soap_action', 'soap_version', 'data_format', 'host')
+        input_optional = ('service', 'security_id', 'method', 'soap_action', 'soap_version', 'data_format', 'host',
+            Boolean('request_streaming'), Integer('timeout'), Integer('cb_error_threshold'), Integer('cb_latency_threshold'),
+            Integer('cb_open_period'), Integer('cb_half_open_probes'), Integer('pool_size'), Integer('pool_max_per_host'),
+            Boolean('pool_block'), 'keep_alive', Integer('max_retries'), Integer('dns_cache_ttl'), Integer('cache_ttl'),
+            Integer('cache_size'), Boolean('cache_kvdb'), 'cache_key_headers')
         output_required = ('id', 'name')
     
     def handle(self):
@@ -140,6 +149,24 @@ class Create(AdminService, _HTTPSOAPService):
                 item.soap_action = input.soap_action
                 item.soap_version = input.soap_version
                 item.data_format = input.data_format
+                item.request_streaming = bool(input.request_streaming)
+                item.timeout = input.timeout or None
+                item.cb_error_threshold = input.cb_error_threshold or None
+                item.cb_latency_threshold = input.cb_latency_threshold or None
+                item.cb_open_period = input.cb_open_period or None
+                item.cb_half_open_probes = input.cb_half_open_probes or None
+                item.pool_size = input.pool_size or None
+                item.pool_max_per_host = input.pool_max_per_host or None
+                item.pool_block = bool(input.pool_block)
+                item.max_retries = input.max_retries or None
+                item.dns_cache_ttl = input.dns_cache_ttl or None
+                item.cache_ttl = input.cache_ttl or None
+                item.cache_size = input.cache_size or None
+                item.cache_kvdb = bool(input.cache_kvdb)
+                item.cache_key_headers = input.cache_key_headers or None
+
+                # Connections are kept alive unless explicitly told otherwise
+                item.keep_alive = input.keep_alive = asbool(input.keep_alive) if input.keep_alive else True
                 item.service = service
 
                 session.add(item)
@@ -176,7 +203,11 @@ class Edit(AdminService, _HTTPSOAPService):
         request_elem = 'zato_http_soap_edit_request'
         response_elem = 'zato_http_soap_edit_response'
         input_required = ('id', 'cluster_id', 'name', 'is_active', 'connection', 'transport', 'url_path')
-        input_optional = ('service', 'security_id', 'method', 'soap_action', 'soap_version', 'data_format', 'host')
+        input_optional = ('service', 'security_id', 'method', 'soap_action', 'soap_version', 'data_format', 'host',
+            Boolean('request_streaming'), Integer('timeout'), Integer('cb_error_threshold'), Integer('cb_latency_threshold'),
+            Integer('cb_open_period'), Integer('cb_half_open_probes'), Integer('pool_size'), Integer('pool_max_per_host'),
+            Boolean('pool_block'), 'keep_alive', Integer('max_retries'), Integer('dns_cache_ttl'), Integer('cache_ttl'),
+            Integer('cache_size'), Boolean('cache_kvdb'), 'cache_key_headers')
         output_required = ('id', 'name')
     
     def handle(self):
@@ -233,6 +264,24 @@ class Edit(AdminService, _HTTPSOAPService):
                 item.soap_action = input.soap_action
                 item.soap_version = input.soap_version
                 item.data_format = input.data_format
+                item.request_streaming = bool(input.request_streaming)
+                item.timeout = input.timeout or None
+                item.cb_error_threshold = input.cb_error_threshold or None
+                item.cb_latency_threshold = input.cb_latency_threshold or None
+                item.cb_open_period = input.cb_open_period or None
+                item.cb_half_open_probes = input.cb_half_open_probes or None
+                item.pool_size = input.pool_size or None
+                item.pool_max_per_host = input.pool_max_per_host or None
+                item.pool_block = bool(input.pool_block)
+                item.max_retries = input.max_retries or None
+                item.dns_cache_ttl = input.dns_cache_ttl or None
+                item.cache_ttl = input.cache_ttl or None
+                item.cache_size = input.cache_size or None
+                item.cache_kvdb = bool(input.cache_kvdb)
+                item.cache_key_headers = input.cache_key_headers or None
+
+                # Connections are kept alive unless explicitly told otherwise
+                item.keep_alive = input.keep_alive = asbool(input.keep_alive) if input.keep_alive else True
                 item.service = service
 
                 session.add(item)
@@ -318,6 +367,82 @@ class Ping(AdminService):
             config_dict = getattr(self.outgoing, item.transport)
             self.response.payload.info = config_dict.get(item.name).ping(self.cid)
 
+class GetCircuitBreakerList(AdminService):
+    """ Returns the state of circuit breakers of all the outgoing HTTP/SOAP connections
+    which have one. Note that each worker keeps track of its own circuit breakers
+    and the states returned are of the worker the request happens to be served by.
+    """
+    class SimpleIO(AdminSIO):
+        request_elem = 'zato_http_soap_get_circuit_breaker_list_request'
+        response_elem = 'zato_http_soap_get_circuit_breaker_list_response'
+        output_required = ('name', 'transport', 'state', 'error_count', 'times_opened')
+        output_optional = ('opened_at', 'retry_in', 'last_error')
+        output_repeated = True
+
+    def handle(self):
+        out = []
+        for transport in('plain_http', 'soap'):
+            config_dict = getattr(self.outgoing, transport)
+            for name in sorted(config_dict.copy_keys()):
+                conn_info = config_dict.get(name) # It may have been deleted in the meantime
+                if conn_info and conn_info.conn.circuit_breaker:
+                    item = conn_info.conn.circuit_breaker.get_info()
+                    item['transport'] = transport
+                    out.append(item)
+
+        self.response.payload[:] = out
+
+class GetPoolStats(AdminService):
+    """ Returns the usage counters of the connection pools of all the outgoing HTTP/SOAP
+    connections - how many requests reused a pooled connection, how many had to open a new one
+    and how long they waited for a connection, in milliseconds. Note that each worker has its
+    own pools and the counters returned are of the worker the request happens to be served by.
+    """
+    class SimpleIO(AdminSIO):
+        request_elem = 'zato_http_soap_get_pool_stats_request'
+        response_elem = 'zato_http_soap_get_pool_stats_response'
+        output_required = ('name', 'transport', 'requests', 'pool_hits', 'new_connections', 'wait_time', 'wait_time_max')
+        output_optional = ('dns_cache_hits', 'dns_cache_misses')
+        output_repeated = True
+
+    def handle(self):
+        out = []
+        for transport in('plain_http', 'soap'):
+            config_dict = getattr(self.outgoing, transport)
+            for name in sorted(config_dict.copy_keys()):
+                conn_info = config_dict.get(name) # It may have been deleted in the meantime
+                if conn_info:
+                    item = conn_info.conn.get_pool_info()
+                    item['transport'] = transport
+                    out.append(item)
+
+        self.response.payload[:] = out
+
+class GetCacheStats(AdminService):
+    """ Returns how many responses of each of the outgoing HTTP/SOAP connections that cache them
+    were served from the cache, how many had to be fetched and how many were revalidated. Note that
+    each worker has its own counters and the ones returned are of the worker the request happens
+    to be served by, even if responses are shared through the KVDB.
+    """
+    class SimpleIO(AdminSIO):
+        request_elem = 'zato_http_soap_get_cache_stats_request'
+        response_elem = 'zato_http_soap_get_cache_stats_response'
+        output_required = ('name', 'transport', 'hits', 'misses', 'revalidated', 'size', 'max_size')
+        output_repeated = True
+
+    def handle(self):
+        out = []
+        for transport in('plain_http', 'soap'):
+            config_dict = getattr(self.outgoing, transport)
+            for name in sorted(config_dict.copy_keys()):
+                conn_info = config_dict.get(name) # It may have been deleted in the meantime
+                if conn_info and conn_info.conn.cache:
+                    item = conn_info.conn.cache.get_info()
+                    item['transport'] = transport
+                    out.append(item)
+
+        self.response.payload[:] = out
+
 class GetURLSecurity(AdminService):
     """ Returns a JSON document describing the security configuration of all
     Zato channels.
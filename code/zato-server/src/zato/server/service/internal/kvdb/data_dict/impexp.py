@@ -8,11 +8,9 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
-# anyjson
-from anyjson import loads
-
 # Zato
 from zato.common import KVDB
+from zato.common.json import loads
 from zato.common.util import dict_item_name, translation_name
 from zato.server.service.internal import AdminSIO
 from zato.server.service.internal.kvdb.data_dict import DataDictService
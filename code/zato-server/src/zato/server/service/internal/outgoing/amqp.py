@@ -13,7 +13,9 @@ from contextlib import closing
 from traceback import format_exc
 
 # Zato
+from zato.common import KVDB
 from zato.common.broker_message import MESSAGE_TYPE, OUTGOING
+from zato.common.histogram import Histogram
 from zato.common.odb.model import ConnDefAMQP, OutgoingAMQP
 from zato.common.odb.query import out_amqp_list
 from zato.server.connection.amqp.outgoing import start_connector
@@ -192,3 +194,33 @@ class Delete(_AMQPService):
                 self.logger.error(msg)
                 
                 raise
+
+class GetStats(AdminService):
+    """ Returns publish rate and confirm latency of an outgoing AMQP connection.
+    """
+    class SimpleIO(AdminSIO):
+        request_elem = 'zato_outgoing_amqp_get_stats_request'
+        response_elem = 'zato_outgoing_amqp_get_stats_response'
+        input_required = ('name',)
+        output_required = ('name', 'published', 'failed', 'rate')
+        output_optional = ('last_updated', 'confirm_latency_mean', 'confirm_latency_p50', 
+            'confirm_latency_p95', 'confirm_latency_p99')
+
+    def handle(self):
+        name = self.request.input.name
+        
+        stats = self.server.kvdb.conn.hgetall('{}{}'.format(KVDB.OUT_AMQP_STATS, name))
+        
+        self.response.payload.name = name
+        self.response.payload.published = int(stats.get('published', 0))
+        self.response.payload.failed = int(stats.get('failed', 0))
+        self.response.payload.rate = float(stats.get('rate', 0))
+        self.response.payload.last_updated = stats.get('last_updated')
+        
+        hist = Histogram.from_kvdb_hash(self.server.kvdb.conn.hgetall('{}{}'.format(KVDB.OUT_AMQP_STATS_CONFIRM_LATENCY, name)))
+        if hist.count:
+            p50, p95, p99 = hist.percentiles(50, 95, 99)
+            self.response.payload.confirm_latency_mean = round(hist.mean, 2)
+            self.response.payload.confirm_latency_p50 = p50
+            self.response.payload.confirm_latency_p95 = p95
+            self.response.payload.confirm_latency_p99 = p99
@@ -165,3 +165,19 @@ class Delete(AdminService):
                 self.logger.error(msg)
                 
                 raise
+
+class GetExecutorStats(AdminService):
+    """ Returns statistics of how busy the executor of service invocations delivered
+    by the broker is, one element per channel. Note that each worker has its own
+    executor and the statistics are of the worker the request happens to be served by.
+    """
+    class SimpleIO(AdminSIO):
+        request_elem = 'zato_server_get_executor_stats_request'
+        response_elem = 'zato_server_get_executor_stats_response'
+        output_required = ('channel', 'limit', 'running', 'waiting', 'submitted', 'completed', 'failed', 
+            'pool_size', 'queue_depth')
+        output_optional = ('pool_free',)
+        output_repeated = True
+        
+    def handle(self):
+        self.response.payload[:] = self.worker_store.executor.get_stats()
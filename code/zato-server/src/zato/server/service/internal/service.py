@@ -17,15 +17,13 @@ from traceback import format_exc
 from urlparse import parse_qs
 from uuid import uuid4
 
-# anyjson
-from anyjson import loads
-
 # validate
 from validate import is_boolean
 
 # Zato
 from zato.common import BROKER, KVDB, ZatoException
 from zato.common.broker_message import SERVICE
+from zato.common.json import loads
 from zato.common.odb.model import Cluster, ChannelAMQP, ChannelWMQ, ChannelZMQ, \
      DeployedService, HTTPSOAP, Server, Service
 from zato.common.odb.query import service, service_list
@@ -463,7 +461,19 @@ class ConfigureRequestResponse(AdminService):
         
     def handle(self):
         key = '{}{}'.format(KVDB.REQ_RESP_SAMPLE, self.request.input.name)
-        self.kvdb.conn.hset(key, 'freq', self.request.input.sample_req_resp_freq)
+        
+        # The index is what servers read the frequencies off when they're starting
+        with self.kvdb.conn.pipeline() as p:
+            p.hset(key, 'freq', self.request.input.sample_req_resp_freq)
+            if self.request.input.sample_req_resp_freq:
+                p.sadd(KVDB.REQ_RESP_SAMPLE_INDEX, self.request.input.name)
+            else:
+                p.srem(KVDB.REQ_RESP_SAMPLE_INDEX, self.request.input.name)
+            p.execute()
+        
+        # Let all the workers know, they don't read the frequency from the KVDB on their own
+        self.request.input.action = SERVICE.CONFIGURE_REQUEST_RESPONSE
+        self.broker_client.publish(self.request.input)
             
 class UploadPackage(AdminService):
     """ Returns a boolean flag indicating whether the server has a WSDL attached.
@@ -10,11 +10,9 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 from calendar import mdays
-from collections import OrderedDict
 from contextlib import closing
 from datetime import datetime, timedelta
-from heapq import nlargest
-from operator import itemgetter
+from itertools import izip
 from sys import maxint
 
 # Bunch
@@ -23,20 +21,33 @@ from bunch import Bunch
 # dateutil
 from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
-from dateutil.rrule import MINUTELY, rrule, rruleset
+from dateutil.rrule import DAILY, HOURLY, MINUTELY, rrule, rruleset
 
-# SciPy
-from scipy import stats as sp_stats
+# numpy
+from numpy import arange, argpartition, array, concatenate, empty, flatnonzero, lexsort, zeros
 
 # Zato
 from zato.common import KVDB, SECONDS_IN_DAY, StatsElem, ZatoException
+from zato.common.histogram import Histogram
 from zato.common.broker_message import STATS
 from zato.common.odb.model import Service
 from zato.server.service import Integer, UTC
 from zato.server.service.internal import AdminService, AdminSIO
+from zato.server.stats import get_index_key
 
 STATS_KEYS = ('usage', 'max', 'rate', 'mean', 'min')
 
+# How many commands at most to send to the KVDB in a single pipeline when reading statistics
+PIPELINE_BATCH_SIZE = 5000
+
+# How often each of the partly aggregated statistics are stored, under what suffixes
+# and what period they are aggregated into, e.g. 60 per-minute ones make up an hour.
+SOURCE_SUFFIXES = {
+    KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE: (MINUTELY, '%Y:%m:%d:%H:%M', relativedelta(hours=1)),
+    KVDB.SERVICE_TIME_AGGREGATED_BY_HOUR: (HOURLY, '%Y:%m:%d:%H', relativedelta(days=1)),
+    KVDB.SERVICE_TIME_AGGREGATED_BY_DAY: (DAILY, '%Y:%m:%d', relativedelta(months=1)),
+}
+
 def stop_excluding_rrset(freq, start, stop):
     rrs = rruleset()
     rrs.rrule(rrule(freq, dtstart=start, until=stop))
@@ -44,6 +55,73 @@ def stop_excluding_rrset(freq, start, stop):
     
     return rrs
 
+def top_n(values, n):
+    """ Returns indexes of n largest values of an array, largest first. Equal values
+    are returned in the order of their indexes. Runs in linear time, using argpartition,
+    save for sorting the n values found.
+    """
+    if n < len(values):
+        threshold = values[argpartition(-values, n - 1)[n - 1]]
+        greater = flatnonzero(values > threshold)
+        idx = concatenate((greater, flatnonzero(values == threshold)[:n - len(greater)]))
+    else:
+        idx = arange(len(values))
+        
+    return idx[lexsort((idx, -values[idx]))].tolist()
+
+def hgetall_many(conn, keys, batch_size=PIPELINE_BATCH_SIZE):
+    """ Returns contents of hashes under given keys, in the same order the keys were given in,
+    reading them in pipelines of batch_size commands each.
+    """
+    result = []
+    for idx in xrange(0, len(keys), batch_size):
+        with conn.pipeline(transaction=False) as p:
+            for key in keys[idx:idx + batch_size]:
+                p.hgetall(key)
+            result.extend(p.execute())
+            
+    return result
+
+def get_indexed_services(conn, key_prefix, suffixes):
+    """ Returns sets of names of services that have statistics stored under a given
+    prefix, one set for each of the suffixes, all of them read in one round trip.
+    """
+    with conn.pipeline() as p:
+        for suffix in suffixes:
+            p.smembers(get_index_key(key_prefix, suffix))
+        return p.execute()
+
+def hist_from_values(values):
+    """ Returns a histogram out of aggregated statistics read from the KVDB. Statistics
+    aggregated before histograms were introduced have only their mean value to stand
+    for all the response times.
+    """
+    if 'hist' in values:
+        return Histogram.from_string(values['hist'])
+
+    hist = Histogram()
+    usage = int(values.get('usage', 0))
+
+    if usage:
+        hist.add(float(values['mean']), usage)
+        hist.min = int(values['min'])
+        hist.max = int(values['max'])
+
+    return hist
+
+def stats_from_hist(hist, total_seconds=None):
+    """ Returns a dictionary of STATS_KEYS, plus the histogram itself, describing
+    a given histogram. Rate is computed only if total_seconds is given.
+    """
+    return {
+        'usage': hist.count,
+        'min': hist.min or 0,
+        'max': hist.max or 0,
+        'mean': hist.mean,
+        'rate': hist.count / total_seconds if total_seconds else 0,
+        'hist': hist,
+    }
+
 # ##############################################################################    
     
 class Delete(AdminService):
@@ -63,81 +141,43 @@ class Delete(AdminService):
 class BaseAggregatingService(AdminService):
     """ A base class for all services that process statistics into aggregated values.
     """
-    def aggregate_raw_times(self, key, service_name, max_batch_size=None):
-        """ Aggregates values from a list living under a given key. Returns its
-        min, max, mean and an overall usage count. 'max_batch_size' controls how
-        many items will be fetched from the list so it's possible to fetch less
-        items than its LLEN returns.
+    def get_raw_hist(self, key, index_key=None, service_name=None):
+        """ Returns a histogram of raw processing times living under a given key,
+        optionally deleting the key, and removing the service from an index, in the same
+        transaction so that no times stored by other workers in the meantime are lost.
         """
-        key_len = self.server.kvdb.conn.llen(key)
-        if max_batch_size:
-            batch_size = min(key_len, max_batch_size)
-            if batch_size < key_len:
-                msg = ('batch_size:[{}] < key_len:[{}], max_batch_size:[{}], key:[{}], '
-                'consider decreasing the job interval or increasing the max_batch_size').format(
-                    batch_size, key_len, max_batch_size, key)
-                self.logger.warn(msg)
-        else:
-            batch_size = key_len
+        with self.server.kvdb.conn.pipeline() as p:
+            p.hgetall(key)
+            if index_key:
+                p.delete(key)
+                p.srem(index_key, service_name)
+                
+            return Histogram.from_kvdb_hash(p.execute()[0])
+        
+    def get_hashes(self, key_prefix, suffixes):
+        """ Returns a list of (service_name, suffix, values) tuples for each of the services
+        having statistics under a given prefix and any of the suffixes. Both the indexes
+        and the statistics themselves are read in pipelines.
+        """
+        names_suffixes = []
+        for suffix, names in zip(suffixes, get_indexed_services(self.server.kvdb.conn, key_prefix, suffixes)):
+            names_suffixes.extend((name, suffix) for name in names)
             
-        times = [int(elem) for elem in self.server.kvdb.conn.lrange(key, 0, batch_size)]
-
-        if times:
-            mean_percentile = int(self.server.kvdb.conn.hget(KVDB.SERVICE_TIME_BASIC + service_name, 'mean_percentile') or 0)
-            max_score = int(sp_stats.scoreatpercentile(times, mean_percentile))
+        keys = ['{}{}:{}'.format(key_prefix, name, suffix) for name, suffix in names_suffixes]
+        results = hgetall_many(self.server.kvdb.conn, keys)
             
-            return min(times), max(times), (sp_stats.tmean(times, (None, max_score)) or 0), len(times)
-        else:
-            return 0, 0, 0, 0
+        return [(name, suffix, values) for (name, suffix), values in zip(names_suffixes, results)]
     
-    def collect_service_stats(self, keys_pattern, key_prefix, key_suffix, total_seconds, 
-                              suffix_needs_colon=True, chop_off_service_name=True, needs_rate=True):
+    def collect_service_stats(self, key_prefix, suffixes, total_seconds, needs_rate=True):
 
-        service_stats = {}
-        if suffix_needs_colon:
-            key_suffix = ':' + key_suffix
-            
-        for key in self.kvdb.conn.keys(keys_pattern):
-            service_name = key.replace(key_prefix, '').replace(key_suffix, '')
-            if chop_off_service_name:
-                service_name = service_name[:-3]
-                
-            values = self.kvdb.conn.hgetall(key)
-            
-            stats = service_stats.setdefault(service_name, {})
+        service_hists = {}
+        for service_name, _, values in self.get_hashes(key_prefix, suffixes):
+            hist = service_hists.setdefault(service_name, Histogram())
+            hist.merge(hist_from_values(values))
             
-            for name in STATS_KEYS:
-            
-                value = values[name]
-                if name in('rate', 'mean'):
-                    value = float(value)
-                else:
-                    value = int(value)
-                    
-                if not name in stats:
-                    if name == 'mean':
-                        stats[name] = []
-                    elif name == 'min':
-                        stats[name] = maxint
-                    else:
-                        stats[name] = 0
-                    
-                if name == 'usage':
-                    stats[name] += value
-                elif name == 'max':
-                    stats[name] = max(stats[name], value)
-                elif name == 'mean':
-                    stats[name].append(value)
-                elif name == 'min':
-                    stats[name] = min(stats[name], value)
-                    
-        for service_name, values in service_stats.items():
-            values['mean'] = sp_stats.tmean(values['mean'])
+        total_seconds = total_seconds if needs_rate else None
             
-            if needs_rate:
-                values['rate'] = values['usage'] / total_seconds
-            
-        return service_stats
+        return {service_name: stats_from_hist(hist, total_seconds) for service_name, hist in service_hists.items()}
         
     def aggregate_partly_aggregated(self, delta, source_strftime_format, source, target, now=None):
         """ Further aggregates service statistics, e.g. turns per-minute statistics
@@ -154,61 +194,72 @@ class BaseAggregatingService(AdminService):
             total_seconds = mdays[delta_diff.month] * SECONDS_IN_DAY # TODO: Use calendar.monthrange instead of mdays so leap years are taken into account
         
         key_suffix = delta_diff.strftime(source_strftime_format)
-        service_stats = self.collect_service_stats(
-            '{}*:{}*'.format(source, key_suffix), source, key_suffix, total_seconds)
+        
+        # All the source time elems the period is made of, e.g. each minute of an hour
+        freq, suffix_format, period = SOURCE_SUFFIXES[source]
+        period_start = datetime.strptime(key_suffix, source_strftime_format)
+        suffixes = [elem.strftime(suffix_format) for elem in 
+            stop_excluding_rrset(freq, period_start, period_start + period)]
+        
+        service_stats = self.collect_service_stats(source, suffixes, total_seconds)
         
         self.hset_aggr_keys(service_stats, target, key_suffix)
         
     def hset_aggr_keys(self, service_stats, key_prefix, key_suffix):
-        for service_name, values in service_stats.items():
-            if service_name.endswith(':'):
-                service_name = service_name[:-1]
+        """ Stores aggregated statistics of all the services, adding them to the index
+        of a given time elem, in one pipeline.
+        """
+        index_key = get_index_key(key_prefix, key_suffix)
+        
+        with self.server.kvdb.conn.pipeline() as p:
+            for service_name, values in service_stats.items():
+                aggr_key = '{}{}:{}'.format(key_prefix, service_name, key_suffix)
+                self.hset_aggr_key(p, aggr_key, values)
+                p.sadd(index_key, service_name)
                 
-            aggr_key = '{}{}:{}'.format(key_prefix, service_name, key_suffix)
-            for name in STATS_KEYS:
-                self.hset_aggr_key(aggr_key, name, values[name])
+            p.execute()
+        
+    def hset_aggr_key(self, p, aggr_key, values):
+        """ Stores aggregated statistics along with a histogram they've been computed out of.
+        """
+        data = {name: values[name] for name in STATS_KEYS}
+        data['hist'] = values['hist'].to_string()
         
-    def hset_aggr_key(self, aggr_key, hash_key, hash_value):
-        self.server.kvdb.conn.hset(aggr_key, hash_key, hash_value)
+        p.hmset(aggr_key, data)
         
 # ##############################################################################
         
 class ProcessRawTimes(BaseAggregatingService):
+    """ Merges histograms of raw processing times into all-time ones.
+    """
     def handle(self):
+        index_key = get_index_key(KVDB.SERVICE_TIME_RAW)
         
-        # 
-        # Sample config values
-        # 
-        # global_slow_threshold=120
-        # max_batch_size=99999
-        #
-        config = Bunch()
-        for item in self.request.payload.splitlines():
-            key, value = item.split('=')
-            config[key] = int(value)
-
-        for key in self.server.kvdb.conn.keys(KVDB.SERVICE_TIME_RAW + '*'):
+        for service_name in self.server.kvdb.conn.smembers(index_key):
             
-            service_name = key.replace(KVDB.SERVICE_TIME_RAW, '')
+            key = KVDB.SERVICE_TIME_RAW + service_name
+            basic_key = KVDB.SERVICE_TIME_BASIC + service_name
             
-            current_mean = float(
-                self.server.kvdb.conn.hget(KVDB.SERVICE_TIME_BASIC + service_name, 'mean_all_time') or 0)
-            current_min = float(self.server.kvdb.conn.hget(KVDB.SERVICE_TIME_BASIC + service_name, 'min_all_time') or 0)
-            current_max = float(self.server.kvdb.conn.hget(KVDB.SERVICE_TIME_BASIC + service_name, 'max_all_time') or 0)
+            current = self.server.kvdb.conn.hgetall(basic_key)
             
-            batch_min, batch_max, batch_mean, batch_total = self.aggregate_raw_times(
-                key, service_name, config.max_batch_size)
+            if 'hist' in current:
+                hist = Histogram.from_string(current['hist'])
+            else:
+                # All-time statistics computed before histograms were introduced
+                hist = Histogram()
+                if 'mean_all_time' in current:
+                    hist.add(float(current['mean_all_time']))
+                    hist.min = int(float(current['min_all_time']))
+                    hist.max = int(float(current['max_all_time']))
             
-            self.server.kvdb.conn.hset(
-               KVDB.SERVICE_TIME_BASIC + service_name, 'mean_all_time', sp_stats.tmean((batch_mean, current_mean)))
-            self.server.kvdb.conn.hset(
-               KVDB.SERVICE_TIME_BASIC + service_name, 'min_all_time', min(current_min, batch_min))
-            self.server.kvdb.conn.hset(
-                KVDB.SERVICE_TIME_BASIC + service_name, 'max_all_time', max(current_max, batch_max))
+            hist.merge(self.get_raw_hist(key, index_key, service_name))
             
-            # Services use RPUSH for storing raw times so we are safe to use LTRIM
-            # in order to do away with the already processed ones
-            self.server.kvdb.conn.ltrim(key, batch_total, -1)
+            self.server.kvdb.conn.hmset(basic_key, {
+                'hist': hist.to_string(),
+                'mean_all_time': hist.mean,
+                'min_all_time': hist.min or 0,
+                'max_all_time': hist.max or 0,
+            })
             
 # ##############################################################################
 
@@ -220,26 +271,19 @@ class AggregateByMinute(BaseAggregatingService):
         # Get all keys from a minute that is sure to have passed, for instance,
         # say it's 13:19 right now (regardless of the seconds part), we'll process everything
         # that happened in 13:17. Hence it's also important that any changes in the minutes
-        # to be picked up here below be kept in sync with the EXPIRE command Service._post_handle uses.
+        # to be picked up here below be kept in sync with the EXPIRE command StatsAccumulator uses.
         
         now = datetime.utcnow()
         key_suffix = (now - timedelta(minutes=2)).strftime('%Y:%m:%d:%H:%M')
         
-        for key in self.server.kvdb.conn.keys('{}*:{}'.format(KVDB.SERVICE_TIME_RAW_BY_MINUTE, key_suffix)):
-            
-            service_name = key.replace(KVDB.SERVICE_TIME_RAW_BY_MINUTE, '').replace(':' + key_suffix, '')
-            aggr_key = '{}{}:{}'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, service_name, key_suffix)
-            
-            batch_min, batch_max, batch_mean, batch_total = self.aggregate_raw_times(key, service_name)
+        service_stats = {}
+        for service_name, _, values in self.get_hashes(KVDB.SERVICE_TIME_RAW_BY_MINUTE, [key_suffix]):
+            service_stats[service_name] = stats_from_hist(Histogram.from_kvdb_hash(values), 60.0) # I.e. rate in req/s
             
-            self.hset_aggr_key(aggr_key, 'min', batch_min)
-            self.hset_aggr_key(aggr_key, 'max', batch_max)
-            self.hset_aggr_key(aggr_key, 'mean', batch_mean)
-            self.hset_aggr_key(aggr_key, 'usage', batch_total)
-            self.hset_aggr_key(aggr_key, 'rate', batch_total / 60.0) # I.e. req/s
+        self.hset_aggr_keys(service_stats, KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, key_suffix)
             
-            # Raw per-minute statistics keys will expire by themselves, we don't need
-            # to delete them manually.
+        # Raw per-minute statistics keys, along with their index, will expire by themselves,
+        # we don't need to delete them manually.
             
 class AggregateByHour(BaseAggregatingService):
     """ Creates per-hour stats.
@@ -285,7 +329,7 @@ class StatsReturningService(AdminService):
         input_required = (UTC('start'), UTC('stop'))
         input_optional = ('service_name', Integer('n'), 'n_type')
         output_optional = ('service_name', 'usage', 'mean', 'rate', 'time', 'usage_trend', 'mean_trend',
-            'min_resp_time', 'max_resp_time', 'all_services_usage', 'all_services_time',
+            'min_resp_time', 'max_resp_time', 'p50', 'p95', 'p99', 'all_services_usage', 'all_services_time',
             'mean_all_services', 'usage_perc_all_services', 'time_perc_all_services')
     
     stats_key_prefix = KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE
@@ -307,16 +351,13 @@ class StatsReturningService(AdminService):
             raise ZatoException(self.cid, msg)
 
         else:
-            data = dict.fromkeys(stats_elems, 0)
-            for name in data:
-                data[name] = getattr(stats_elems[name], n_type)
-
-            # It's itemgetter(1 ,0) because idx=1 is the actual value and idx=0
-            # is a name so in the end nlargest returns values in ascending order
-            # while also sorting lexicographically services that happen to have equal values.
-            names = nlargest(n, data.items(), key=itemgetter(1, 0)) 
-            for name, value in names:
-                yield stats_elems[name]
+            # Names are sorted in reverse so that services that happen to have equal values
+            # are returned in reverse lexicographical order, the same one as in earlier versions.
+            names = sorted(stats_elems, reverse=True)
+            values = array([getattr(stats_elems[name], n_type) for name in names], dtype=float)
+            
+            for idx in top_n(values, n):
+                yield stats_elems[names[idx]]
     
     def get_suffixes(self, start, stop):
         return [elem.strftime('%Y:%m:%d:%H:%M') for elem in stop_excluding_rrset(MINUTELY, start, stop)]
@@ -331,14 +372,8 @@ class StatsReturningService(AdminService):
         if not stats_key_prefix:
             stats_key_prefix = self.stats_key_prefix
             
+        conn = self.server.kvdb.conn
         stats_elems = {}
-        all_services_stats = Bunch({'usage':0, 'time':0})
-    
-        # All mean values
-        mean_all_services_list = []
-        
-        # A mean value of all the mean values (mean_all_services_list)
-        mean_all_services = 0
     
         start = parse(start)
         stop = parse(stop)
@@ -353,73 +388,108 @@ class StatsReturningService(AdminService):
             suffixes = self.get_suffixes(start, stop)
         
         # We make several passes. First two passes are made over Redis keys, one gathers the services, if any at all,
-        # and another one actually collects statistics for each service found. Next pass, a partly optional one,
-        # computes trends for mean response time and service usage. Another one computes each of the service's
-        # average rate and updates other attributes basing on values collected in the previous step.
+        # and another one actually collects statistics for each service found into a matrix of services x time elems.
+        # Next pass computes trends for mean response time and service usage, each of the service's
+        # average rate and other attributes as array operations over the matrix.
         # Optionally, the last one will pick only top n elements of a given type (top mean response time
         # or top usage).
         
-        # 1st pass
-        for suffix in suffixes:
-            keys = self.server.kvdb.conn.keys('{}{}:{}'.format(stats_key_prefix, service, suffix))
-            for key in keys:
-                service_name = key.replace(stats_key_prefix, '').replace(':{}'.format(suffix), '')
+        # 1st pass - each time elem has its own index of services, cells are (service_name, column) pairs
+        # of time elems a given service has any statistics for.
+        cells = []
+        for col, names in enumerate(get_indexed_services(conn, stats_key_prefix, suffixes)):
+            for service_name in names:
+                if service == '*' or service_name == service:
+                    cells.append((service_name, col))
+                    
+        if not cells:
+            return
+        
+        names = sorted(set(service_name for service_name, _ in cells))
+        rows = {service_name: row for row, service_name in enumerate(names)}
+        
+        for service_name in names:
+            stats_elem = StatsElem(service_name)
+            stats_elem.temp_hist = Histogram()
+            stats_elems[service_name] = stats_elem
             
-                stats_elem = StatsElem(service_name)
-                stats_elems[service_name] = stats_elem
-                
-                # When building statistics, we can't expect there will be data for all the time
-                # elems built above so to guard against it, this is a dictionary whose keys are the
-                # said elems and values are mean/usage for each elem. The values will remain
-                # 0/0.0 if there is no data for the time elem, which may mean that in this
-                # particular time slice the service wasn't invoked at all.
-                stats_elem.expected_time_elems = OrderedDict(
-                    (elem, Bunch({'mean':0, 'usage':0.0})) for elem in suffixes)
+        # 2nd pass - only hashes that really exist are fetched, in as few pipelines as possible.
+        # When building statistics, we can't expect there will be data for all the time elems
+        # hence each cell of a matrix remains 0 if there is no data for the time elem, which may mean
+        # that in this particular time slice the service wasn't invoked at all.
+        keys = ['{}{}:{}'.format(stats_key_prefix, service_name, suffixes[col]) for service_name, col in cells]
+        found_rows, found_cols, found_values = [], [], []
+        
+        for (service_name, col), values in izip(cells, hgetall_many(conn, keys)):
+            if values:
+                found_rows.append(rows[service_name])
+                found_cols.append(col)
+                found_values.append([float(values[name]) for name in ('usage', 'mean', 'min', 'max')])
+                stats_elems[service_name].temp_hist.merge(hist_from_values(values))
                 
-        # 2nd pass
-        for service, stats_elem in stats_elems.items():
-            for suffix in suffixes:
-                key = '{}{}:{}'.format(stats_key_prefix, service, suffix)
+        shape = (len(names), len(suffixes))
+        
+        usage = zeros(shape)
+        mean = zeros(shape)
+        min_resp_time = empty(shape)
+        min_resp_time.fill(maxint)
+        max_resp_time = zeros(shape)
+        present = zeros(shape, dtype=bool)
+        
+        if found_values:
+            found_values = array(found_values)
+            usage[found_rows, found_cols] = found_values[:,0]
+            mean[found_rows, found_cols] = found_values[:,1]
+            min_resp_time[found_rows, found_cols] = found_values[:,2]
+            max_resp_time[found_rows, found_cols] = found_values[:,3]
+            present[found_rows, found_cols] = True
                 
-                # We can convert all the values to floats here to ease with computing
-                # all the stuff and convert them still to integers later on, when necessary.
-                key_values = Bunch(
-                    ((name, float(value)) for (name, value) in self.server.kvdb.conn.hgetall(key).items()))
-                    
-                if key_values:
-    
-                    time = (key_values.usage * key_values.mean)
-                    stats_elem.time += time
-                    
-                    mean_all_services_list.append(key_values.mean)
-                    all_services_stats.time += time
-                    all_services_stats.usage += key_values.usage
-                    
-                    stats_elem.min_resp_time = min(stats_elem.min_resp_time, key_values.min)
-                    stats_elem.max_resp_time = max(stats_elem.max_resp_time, key_values.max)
-                    
-                    for attr in('mean', 'usage'):
-                        stats_elem.expected_time_elems[suffix][attr] = key_values[attr]
-                        
-        mean_all_services = '{:.0f}'.format(sp_stats.tmean(mean_all_services_list)) if mean_all_services_list else 0
-                        
-        # 3rd pass (partly optional)
-        for stats_elem in stats_elems.values():
+        # 3rd pass, everything is computed for all the services at once
+        time = (usage * mean).sum(axis=1)
+        all_services_time = time.sum()
+        all_services_usage = usage.sum()
+        
+        # A mean value of all the mean values
+        mean_all_services = '{:.0f}'.format(mean[present].mean()) if present.any() else 0
+        
+        mean_trend_int = mean.astype(int)
+        usage_trend_int = usage.astype(int)
+        usage_total = usage_trend_int.sum(axis=1)
+        rate = usage_total / delta_seconds
+        has_data = present.any(axis=1)
+        min_resp_time = min_resp_time.min(axis=1)
+        max_resp_time = max_resp_time.max(axis=1)
+        
+        if all_services_time:
+            time_perc_all_services = (100.0 * time / all_services_time).round(2)
+        if all_services_usage:
+            usage_perc_all_services = (100.0 * usage_total / all_services_usage).round(2)
+        
+        for service_name, row in rows.iteritems():
+            stats_elem = stats_elems[service_name]
             
             stats_elem.mean_all_services = mean_all_services
-            stats_elem.all_services_time = int(all_services_stats.time)
-            stats_elem.all_services_usage = int(all_services_stats.usage)
+            stats_elem.all_services_time = int(all_services_time)
+            stats_elem.all_services_usage = int(all_services_usage)
             
-            values = stats_elem.expected_time_elems.values()
+            stats_elem.mean_trend_int = mean_trend_int[row].tolist()
+            stats_elem.usage_trend_int = usage_trend_int[row].tolist()
             
-            stats_elem.mean_trend_int = [int(elem.mean) for elem in values]            
-            stats_elem.usage_trend_int = [int(elem.usage) for elem in values]
+            # Weighted by usage, as opposed to a mean of per-minute means
+            stats_elem.mean = float('{:.2f}'.format(stats_elem.temp_hist.mean))
+            stats_elem.usage = int(usage_total[row])
+            stats_elem.time = float(time[row])
+            stats_elem.set_percentiles()
+            stats_elem.rate = float('{:.2f}'.format(rate[row]))
             
-            stats_elem.mean = float('{:.2f}'.format(sp_stats.tmean(stats_elem.mean_trend_int)))
-            stats_elem.usage = sum(stats_elem.usage_trend_int)
-            stats_elem.rate = float('{:.2f}'.format(sum(stats_elem.usage_trend_int) / delta_seconds))
+            if has_data[row]:
+                stats_elem.min_resp_time = float(min_resp_time[row])
+                stats_elem.max_resp_time = float(max_resp_time[row])
             
-            self.set_percent_of_all_services(all_services_stats, stats_elem)
+            if all_services_time:
+                stats_elem.time_perc_all_services = float(time_perc_all_services[row])
+            if all_services_usage:
+                stats_elem.usage_perc_all_services = float(usage_perc_all_services[row])
 
             if needs_trends:
                 stats_elem.mean_trend = ','.join(str(elem) for elem in stats_elem.mean_trend_int)
@@ -442,7 +512,7 @@ class GetByService(StatsReturningService):
         response_elem = 'zato_stats_get_by_service_response'
         input_required = StatsReturningService.SimpleIO.input_required + ('service_id',)
         output_optional = ('service_name', 'usage', 'mean', 'rate', 'time', 'usage_trend', 'mean_trend',
-                    'min_resp_time', 'max_resp_time',)        
+                    'min_resp_time', 'max_resp_time', 'p50', 'p95', 'p99')
 
     def handle(self):
         with closing(self.odb.session()) as session:
@@ -10,10 +10,9 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 from calendar import monthrange
-from copy import deepcopy
 from datetime import date, datetime, timedelta
-from itertools import chain
-from sys import maxint
+from itertools import chain, groupby
+from operator import itemgetter
 
 # Bunch
 from bunch import Bunch
@@ -26,22 +25,16 @@ from dateutil.rrule import DAILY, HOURLY, MINUTELY, MONTHLY, YEARLY
 # paodate
 from paodate import Date
 
-# SciPy
-from scipy import stats as sp_stats
-
 # Zato
 from zato.common import KVDB, StatsElem, ZatoException
+from zato.common.histogram import Histogram
 from zato.server.service import Integer, UTC
 from zato.server.service.internal import AdminSIO
-from zato.server.service.internal.stats import BaseAggregatingService, STATS_KEYS, StatsReturningService, \
-    stop_excluding_rrset
+from zato.server.service.internal.stats import BaseAggregatingService, StatsReturningService, \
+    stats_from_hist, stop_excluding_rrset
 
 # ##############################################################################
 
-DEFAULT_STATS = {k:0 for k in STATS_KEYS}
-DEFAULT_STATS['mean'] = []
-DEFAULT_STATS['min'] = maxint
-
 class DT_PATTERNS(object):
     CURRENT_YEAR_START = '%Y-01-01'
     CURRENT_MONTH_START = '%Y-%m-01'
@@ -142,7 +135,7 @@ class BaseSummarizingService(BaseAggregatingService):
         return (elem.strftime('%Y') for elem in stop_excluding_rrset(YEARLY, start, stop))
     
     def _get_patterns(self, now, start, stop, kvdb_key, method):
-        return ('{}*:{}'.format(kvdb_key, elem) for elem in method(now, start, stop))
+        return ((kvdb_key, elem) for elem in method(now, start, stop))
     
     def get_by_minute_patterns(self, now, start=None, stop=None):
         return self._get_patterns(now, start, stop, KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, self.get_minutely_suffixes)
@@ -172,30 +165,19 @@ class BaseSummarizingService(BaseAggregatingService):
         for name in pattern_names:
             patterns.append(getattr(self, 'get_by_{}_patterns'.format(name))(now))
         
-        services = {}
+        hists = {}
         
-        for elem in chain(*patterns):
-            prefix, suffix = elem.split('*')
-            suffix = suffix[1:]
-            stats = self.collect_service_stats(elem, prefix, suffix, None, False, False, False)
+        for prefix, suffixes in groupby(chain(*patterns), itemgetter(0)):
+            stats = self.collect_service_stats(prefix, [suffix for _, suffix in suffixes], None, False)
             
             for service_name, values in stats.items():
-                stats = services.setdefault(service_name, deepcopy(DEFAULT_STATS))
+                hists.setdefault(service_name, Histogram()).merge(values['hist'])
                 
-                for name in STATS_KEYS:
-                    value = values[name]
-                    if name == 'usage':
-                        stats[name] += value
-                    elif name == 'max':
-                        stats[name] = max(stats[name], value)
-                    elif name == 'mean':
-                        stats[name].append(value)
-                    elif name == 'min':
-                        stats[name] = min(stats[name], value)
-                        
-        for service_name, values in services.items():
-            values['mean'] = round(sp_stats.tmean(values['mean']), 2)
-            values['rate'] = round(values['usage'] / total_seconds, 2)
+        services = {}
+        for service_name, hist in hists.items():
+            values = services[service_name] = stats_from_hist(hist, total_seconds)
+            values['mean'] = round(values['mean'], 2)
+            values['rate'] = round(values['rate'], 2)
             
         self.hset_aggr_keys(services, key_prefix, key_suffix)
         
@@ -583,7 +565,11 @@ class GetSummaryByRange(StatsReturningService, BaseSummarizingService):
                         seen_repeated_stats = True
 
                     # Fetch an existing elem or assign a new one
-                    merged_stats_elem = merged_stats_elems.setdefault(stats_elem.service_name, StatsElem(stats_elem.service_name))
+                    merged_stats_elem = merged_stats_elems.get(stats_elem.service_name)
+                    if merged_stats_elem is None:
+                        merged_stats_elem = StatsElem(stats_elem.service_name)
+                        merged_stats_elem.temp_hist = Histogram()
+                        merged_stats_elems[stats_elem.service_name] = merged_stats_elem
 
                     # Total time spent by this service and its total usage
                     merged_stats_elem.time += stats_elem.time
@@ -598,9 +584,8 @@ class GetSummaryByRange(StatsReturningService, BaseSummarizingService):
                     # after collecting all the stats.
                     merged_stats_elem.temp_rate += slice.total_seconds * stats_elem.rate
                     
-                    # Temporary data, aggregated later on
-                    merged_stats_elem.temp_mean += stats_elem.mean
-                    merged_stats_elem.temp_mean_count += 1
+                    # Response times of all the slices, the mean and percentiles are computed out of it
+                    merged_stats_elem.temp_hist.merge(stats_elem.temp_hist)
 
         if merged_stats_elems:
             mean_all_services = all_services_stats.mean / len(merged_stats_elems)
@@ -618,8 +603,9 @@ class GetSummaryByRange(StatsReturningService, BaseSummarizingService):
                 value.rate = round(value.temp_rate / total_seconds, 1)
                 value.mean_all_services = mean_all_services
                 
-                if value.temp_mean:
-                    value.mean = round(value.temp_mean / value.temp_mean_count)
+                if value.temp_hist:
+                    value.mean = round(value.temp_hist.mean)
+                    value.set_percentiles()
                     
                 self.set_percent_of_all_services(all_services_stats, value)
         
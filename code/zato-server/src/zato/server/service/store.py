@@ -10,6 +10,7 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 
 # stdlib
 import imp, inspect, logging, os
+from collections import deque
 from datetime import datetime
 from hashlib import sha256
 from importlib import import_module
@@ -20,9 +21,6 @@ from uuid import uuid4
 # pip
 from pip.download import is_archive_file
 
-# anyjson
-from anyjson import dumps
-
 # PyYAML
 try:
     from yaml import CDumper  # Looks awkward but
@@ -35,9 +33,10 @@ from springpython.context import InitializingObject
 
 # Zato
 from zato.common import DONT_DEPLOY_ATTR_NAME, NoDistributionFound, SourceInfo
+from zato.common.json import dumps
 from zato.common.util import decompress, deployment_info, fs_safe_now, is_python_file, \
     TRACE1, visit_py_source, visit_py_source_from_distribution
-from zato.server.service import Service
+from zato.server.service import InputParser, OutputSerializer, Service
 from zato.server.service.internal import AdminService
 
 logger = logging.getLogger(__name__)
@@ -52,10 +51,11 @@ def get_service_name(class_obj):
 class ServiceStore(InitializingObject):
     """ A store of Zato services.
     """
-    def __init__(self, services=None, service_store_config=None, odb=None):
+    def __init__(self, services=None, service_store_config=None, odb=None, simple_io_config=None):
         self.services = services
         self.service_store_config = service_store_config
         self.odb = odb
+        self.simple_io_config = simple_io_config or {}
         self.id_to_impl_name = {}
         self.name_to_impl_name = {}
 
@@ -71,9 +71,30 @@ class ServiceStore(InitializingObject):
             logger.error(msg)
 
     def new_instance(self, class_name):
-        """ Returns a new instance of a service of the given impl name.
+        """ Returns an instance of a service of the given impl name - an idle one
+        from the service's pool, if it has any, or a new one otherwise.
+        """
+        service_info = self.services[class_name]
+        
+        pool = service_info.get('instance_pool')
+        if pool:
+            try:
+                return pool.pop()
+            except IndexError:
+                pass # Another thread has just taken the last one
+                
+        return service_info['service_class']()
+        
+    def release_instance(self, service):
+        """ Puts an instance of a pooled service back into its pool once it has handled a request.
+        Instances of classes that have been redeployed in the meantime are let go of.
         """
-        return self.services[class_name]['service_class']()
+        service_info = self.services.get(service.impl_name)
+        if service_info and service_info['service_class'] is service.__class__:
+            pool = service_info.get('instance_pool')
+            if pool is not None:
+                service._reset()
+                pool.append(service)
         
     def new_instance_by_id(self, service_id):
         impl_name = self.id_to_impl_name[service_id]
@@ -213,6 +234,26 @@ class ServiceStore(InitializingObject):
             
         return si
                 
+    def _get_input_parser(self, service_class):
+        """ Compiles a parser of a service's SimpleIO input, if the service uses SimpleIO at all.
+        """
+        io = getattr(service_class, 'SimpleIO', None)
+        if io and InputParser.is_supported(io):
+            return InputParser(io, self.simple_io_config)
+
+    def _get_output_serializer(self, service_class):
+        """ Compiles a serializer of a service's SimpleIO output, if the service has any output declared.
+        """
+        io = getattr(service_class, 'SimpleIO', None)
+        if io and OutputSerializer.is_supported(io):
+            return OutputSerializer(io, self.simple_io_config)
+
+    def _get_instance_pool(self, service_class):
+        """ Returns a pool for idle instances of a service, if the service has opted in to reusing them.
+        """
+        if service_class.instance_pool_size:
+            return deque(maxlen=service_class.instance_pool_size)
+
     def _visit_module(self, mod, is_internal, fs_location):
         """ Actually imports services from a module object.
         """
@@ -233,6 +274,9 @@ class ServiceStore(InitializingObject):
                         self.services[impl_name]['name'] = name
                         self.services[impl_name]['deployment_info'] = depl_info
                         self.services[impl_name]['service_class'] = item
+                        self.services[impl_name]['input_parser'] = self._get_input_parser(item)
+                        self.services[impl_name]['output_serializer'] = self._get_output_serializer(item)
+                        self.services[impl_name]['instance_pool'] = self._get_instance_pool(item)
                         
                         si = self._get_source_code_info(mod)
                         
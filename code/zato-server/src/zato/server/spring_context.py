@@ -41,6 +41,11 @@ class ZatoContext(PythonConfig):
         store = ServiceStore()
         store.odb = self.odb_manager()
         store.services = {}
+        store.simple_io_config = {
+            'int_parameters': self.int_parameters(),
+            'int_parameter_suffixes': self.int_parameter_suffixes(),
+            'bool_parameter_prefixes': self.bool_parameter_prefixes(),
+        }
 
         return store
     
@@ -12,6 +12,8 @@ from __future__ import absolute_import, division, print_function, unicode_litera
 import logging
 from contextlib import closing
 from datetime import datetime
+from threading import RLock, Thread
+from time import sleep
 from traceback import format_exc
 
 # dateutil
@@ -22,17 +24,63 @@ from sqlalchemy.exc import IntegrityError
 
 # Zato
 from zato.common import KVDB, scheduler_date_time_format
+from zato.common.histogram import Histogram
+from zato.common.kvdb import scan_keys
 from zato.common.odb.model import Job, IntervalBasedJob, Service
 from zato.common.odb.query import _service as _service
+from zato.common.util import TRACE1
 
 logger = logging.getLogger(__name__)
 
+# Prefixes of statistics each time elem of which has its own index, along with how many
+# colon-separated parts their time suffixes are made of, e.g. 2013:07:12:17:45 by minute.
+INDEXED_KEY_PREFIXES = {
+    KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE: 5,
+    KVDB.SERVICE_TIME_AGGREGATED_BY_HOUR: 4,
+    KVDB.SERVICE_TIME_AGGREGATED_BY_DAY: 3,
+    KVDB.SERVICE_TIME_AGGREGATED_BY_MONTH: 2,
+    KVDB.SERVICE_SUMMARY_BY_DAY: 3,
+    KVDB.SERVICE_SUMMARY_BY_WEEK: 3,
+    KVDB.SERVICE_SUMMARY_BY_MONTH: 2,
+    KVDB.SERVICE_SUMMARY_BY_YEAR: 1,
+}
+
 def _get_service_by_name(session, cluster_id, name):
     logger.debug('Looking for name:[{}] in cluster_id:[{}]'.format(name, cluster_id))
     return _service(session, cluster_id).\
            filter(Service.name==name).\
            one()
 
+def get_index_key(key_prefix, key_suffix=''):
+    """ Returns the key of a set holding names of all the services that have statistics
+    stored under a given prefix and time suffix, e.g. all the services aggregated by minute
+    in 2013:07:12:17:45. Keeping such sets up to date on each write means the statistics
+    can be found without resorting to KEYS.
+    """
+    return '{}{}{}'.format(KVDB.SERVICE_STATS_INDEX, key_prefix, key_suffix)
+
+def rebuild_index(conn):
+    """ Adds statistics stored before indexes were introduced to the indexes of their time elems,
+    otherwise trends, summaries and deleting statistics wouldn't see them. This needs to be done
+    only once for each KVDB so a flag is set afterwards and the function returns early next time.
+    """
+    if conn.get(KVDB.SERVICE_STATS_INDEX_REBUILT):
+        return
+
+    for key_prefix, suffix_parts in INDEXED_KEY_PREFIXES.items():
+        with conn.pipeline() as p:
+            for key in scan_keys(conn, '{}*'.format(key_prefix)):
+                name_suffix = key[len(key_prefix):].rsplit(':', suffix_parts)
+
+                # Service names may contain colons of their own but time suffixes never miss any parts
+                if len(name_suffix) == suffix_parts + 1:
+                    p.sadd(get_index_key(key_prefix, ':'.join(name_suffix[1:])), name_suffix[0])
+
+            p.execute()
+
+    conn.set(KVDB.SERVICE_STATS_INDEX_REBUILT, datetime.utcnow().isoformat())
+    logger.info('Statistics index rebuilt')
+
 def add_stats_jobs(cluster_id, odb, stats_jobs):
     """ Adds one of the interval jobs to the ODB. Note that it isn't being added
     directly to the scheduler because we want users to be able to fine-tune the job's
@@ -70,10 +118,160 @@ class MaintenanceTool(object):
         self.conn = conn
         
     def delete(self, start, stop, interval):
+        """ Deletes per-minute statistics from a given range of time. Index of each minute
+        says what services need to be deleted so it takes exactly two round trips to the KVDB,
+        regardless of the range or how many services there are.
+        """
+        suffixes = [elem.strftime('%Y:%m:%d:%H:%M') for elem in rrule(MINUTELY, dtstart=start, until=stop)]
+        index_keys = [get_index_key(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, suffix) for suffix in suffixes]
+            
         with self.conn.pipeline() as p:
-            suffixes = (elem.strftime(':%Y:%m:%d:%H:%M') for elem in rrule(MINUTELY, dtstart=start, until=stop))
-            for suffix in suffixes:
-                for key in self.conn.keys('{}*{}'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, suffix)):
-                    p.delete(key)
+            for index_key in index_keys:
+                p.smembers(index_key)
+            services = p.execute()
+            
+        with self.conn.pipeline() as p:
+            for suffix, index_key, names in zip(suffixes, index_keys, services):
+                for name in names:
+                    p.delete('{}{}:{}'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, name, suffix))
+                p.delete(index_key)
                     
             p.execute()
+                
+class StatsAccumulator(object):
+    """ Keeps per-service usage counters and histograms of processing times in the worker's
+    memory and periodically flushes them to the KVDB in one pipelined batch
+    so that services themselves never wait for Redis.
+    """
+    def __init__(self, conn, flush_interval=1000, raw_by_minute_expire=300):
+        self.conn = conn
+        self.flush_interval = flush_interval / 1000.0 # In milliseconds on input
+        self.raw_by_minute_expire = raw_by_minute_expire
+        self.lock = RLock()
+        self.keep_running = True
+
+        # Last usage values as returned by the KVDB
+        self.kvdb_usage = {}
+
+        self._reset()
+
+    def _reset(self):
+        self.usage = {}
+        self.last = {}
+        self.raw = {}
+        self.raw_by_minute = {}
+
+    def incr_usage(self, name):
+        """ Increments the usage counter of a given service and returns the service's
+        current total usage, including the invocations that have not been flushed yet.
+        """
+        with self.lock:
+            usage = self.usage[name] = self.usage.get(name, 0) + 1
+            return self.kvdb_usage.get(name, 0) + usage
+
+    def add_time(self, name, processing_time, minute):
+        """ Stores a service's processing time (in milliseconds) along with
+        a minute it was recorded in, formatted as '%Y:%m:%d:%H:%M'.
+        """
+        with self.lock:
+            self.last[name] = processing_time
+            self.raw.setdefault(name, Histogram()).add(processing_time)
+            self.raw_by_minute.setdefault((name, minute), Histogram()).add(processing_time)
+
+    def _hincrby_hist(self, pipeline, key, hist):
+        for field, value in hist.to_kvdb_increments():
+            pipeline.hincrby(key, field, value)
+
+    def _merge(self, usage, last, raw, raw_by_minute):
+        """ Adds statistics that could not be flushed back to what has been collected since then
+        so that they go out along with the next flush.
+        """
+        with self.lock:
+            for name, value in usage.items():
+                self.usage[name] = self.usage.get(name, 0) + value
+
+            # Processing times recorded in the meantime are more recent
+            for name, value in last.items():
+                self.last.setdefault(name, value)
+
+            for name, hist in raw.items():
+                self.raw.setdefault(name, Histogram()).merge(hist)
+
+            for key, hist in raw_by_minute.items():
+                self.raw_by_minute.setdefault(key, Histogram()).merge(hist)
+
+    def flush(self):
+        """ Writes out everything collected since the last flush. If the KVDB can't be written to,
+        the statistics are kept in memory until the next flush.
+        """
+        with self.lock:
+            usage, last, raw, raw_by_minute = self.usage, self.last, self.raw, self.raw_by_minute
+            self._reset()
+
+        if not(usage or last):
+            return
+
+        try:
+            results = self._flush(usage, last, raw, raw_by_minute)
+        except Exception:
+            self._merge(usage, last, raw, raw_by_minute)
+            raise
+
+        with self.lock:
+            for name, value in zip(sorted(usage), results):
+                self.kvdb_usage[name] = int(value)
+
+        if logger.isEnabledFor(TRACE1):
+            logger.log(TRACE1, 'Flushed usage:[{}], last:[{}], raw:[{}], raw_by_minute:[{}]'.format(
+                usage, last, raw, raw_by_minute))
+
+    def _flush(self, usage, last, raw, raw_by_minute):
+        """ Writes out statistics in one pipelined batch and returns what the KVDB returned,
+        starting with the new usage totals of services sorted by name.
+        """
+        with self.conn.pipeline() as p:
+            for name in sorted(usage):
+                p.incrby('{}{}'.format(KVDB.SERVICE_USAGE, name), usage[name])
+
+            for name, value in last.items():
+                p.hset('{}{}'.format(KVDB.SERVICE_TIME_BASIC, name), 'last', value)
+
+            # Histograms are merged with whatever other workers have already stored
+            for name, hist in raw.items():
+                self._hincrby_hist(p, '{}{}'.format(KVDB.SERVICE_TIME_RAW, name), hist)
+                p.sadd(get_index_key(KVDB.SERVICE_TIME_RAW), name)
+
+            for (name, minute), hist in raw_by_minute.items():
+                key = '{}{}:{}'.format(KVDB.SERVICE_TIME_RAW_BY_MINUTE, name, minute)
+                index_key = get_index_key(KVDB.SERVICE_TIME_RAW_BY_MINUTE, minute)
+                
+                self._hincrby_hist(p, key, hist)
+                p.sadd(index_key, name)
+
+                # .. we'll have 5 minutes (by default) to aggregate processing
+                # times for a given minute and then it will expire
+                p.expire(key, self.raw_by_minute_expire)
+                p.expire(index_key, self.raw_by_minute_expire)
+
+            return p.execute()
+
+    def _run(self):
+        while self.keep_running:
+            sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception, e:
+                logger.warn('Could not flush statistics, e:[{}]'.format(format_exc(e)))
+
+    def start(self):
+        """ Starts a background thread (a greenlet under gevent) flushing the statistics.
+        """
+        t = Thread(target=self._run)
+        t.daemon = True
+        t.start()
+
+    def stop(self):
+        """ Stops the background thread and flushes anything that's still pending.
+        """
+        self.keep_running = False
+        self.flush()
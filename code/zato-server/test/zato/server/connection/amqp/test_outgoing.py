@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from threading import RLock
+from time import sleep
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# mock
+from mock import patch
+
+# nose
+from nose.tools import eq_
+
+# Zato
+from zato.common.broker_message import get_connector_topic, MESSAGE_TYPE
+from zato.common.test import rand_string
+from zato.server.connection.amqp.outgoing import OutgoingConnector, Publisher, PublisherStats
+
+class FakeBrokerClient(object):
+    def __init__(self):
+        self.subscribed = []
+        self.unsubscribed = []
+
+    def subscribe(self, topic, callback):
+        self.subscribed.append((topic, callback))
+
+    def unsubscribe(self, topic):
+        self.unsubscribed.append(topic)
+
+class FakeChannel(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.events = {'basic_ack': set(), 'basic_nack': set()}
+        self.published = 0
+        self.confirmed = 0
+
+    def confirm_select(self):
+        pass
+
+class FakeConnection(object):
+    """ Confirms all the messages published so far each time events are drained,
+    acking or nacking them depending on what the test wants.
+    """
+    connection_errors = (IOError,)
+
+    def __init__(self, conn_url, heartbeat):
+        self.conn_url = conn_url
+        self.heartbeat = heartbeat
+        self.is_released = False
+        self.drained = 0
+        self._channel = FakeChannel(self)
+        FakeConnection.instances.append(self)
+
+    def channel(self):
+        return self._channel
+
+    def drain_events(self, timeout):
+        self.drained += 1
+        event = 'basic_nack' if FakeConnection.nack else 'basic_ack'
+        for callback in self._channel.events[event]:
+            callback(self._channel.published, True)
+
+    def release(self):
+        self.is_released = True
+
+class FakeProducer(object):
+    def __init__(self, channel):
+        self.channel = channel
+
+    def publish(self, body, routing_key, exchange, headers, **properties):
+        if FakeConnection.errors:
+            raise FakeConnection.errors.pop(0)
+
+        self.channel.published += 1
+        FakeConnection.published.append(body)
+
+class PublisherTestCase(TestCase):
+
+    def setUp(self):
+        FakeConnection.instances = []
+        FakeConnection.published = []
+        FakeConnection.errors = []
+        FakeConnection.nack = False
+
+        self.patchers = [
+            patch('zato.server.connection.amqp.outgoing._Connection', FakeConnection),
+            patch('zato.server.connection.amqp.outgoing.Producer', FakeProducer),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+
+    def get_publisher(self, **kwargs):
+        return Publisher(rand_string(), 'amqp://localhost', PublisherStats(rand_string()), **kwargs)
+
+    def publish(self, publisher, body):
+        publisher.publish(body, 'my-exchange', 'my-key', {}, {})
+
+    def test_long_lived_connection(self):
+        publisher = self.get_publisher()
+
+        for x in range(3):
+            self.publish(publisher, x)
+
+        eq_(FakeConnection.published, [0, 1, 2])
+        eq_(len(FakeConnection.instances), 1)
+        eq_(FakeConnection.instances[0].heartbeat, 0)
+        eq_(publisher.stats.published, 3)
+
+        publisher.close()
+        eq_(FakeConnection.instances[0].is_released, True)
+
+    def test_batching(self):
+        publisher = self.get_publisher(confirms=True, batch_size=3, linger=5000)
+
+        # A full batch doesn't wait for linger to pass and is confirmed in one go
+        for x in range(3):
+            self.publish(publisher, x)
+
+        for x in range(200):
+            if publisher.stats.published == 3:
+                break
+            sleep(0.01)
+
+        eq_(FakeConnection.published, [0, 1, 2])
+        eq_(FakeConnection.instances[0].drained, 1)
+
+        # Whatever is still waiting in a batch is published on close
+        self.publish(publisher, 3)
+        publisher.close()
+
+        eq_(FakeConnection.published, [0, 1, 2, 3])
+        eq_(FakeConnection.instances[0].drained, 2)
+        eq_(publisher.stats.published, 4)
+        eq_(publisher.stats.failed, 0)
+        eq_(publisher.stats.confirm_latency.count, 4)
+
+    def test_confirms_nack(self):
+        FakeConnection.nack = True
+        publisher = self.get_publisher(confirms=True)
+
+        self.publish(publisher, 0)
+        self.publish(publisher, 1)
+
+        eq_(publisher.stats.published, 0)
+        eq_(publisher.stats.failed, 2)
+        eq_(publisher.pending, set())
+
+    def test_reconnect(self):
+        publisher = self.get_publisher(confirms=True)
+        self.publish(publisher, 0)
+
+        FakeConnection.errors.append(IOError('Connection reset'))
+        self.publish(publisher, 1)
+
+        # The broken connection was dropped and the message published over a new one
+        eq_(len(FakeConnection.instances), 2)
+        eq_(FakeConnection.instances[0].is_released, True)
+        eq_(FakeConnection.published, [0, 1])
+        eq_(publisher.stats.published, 2)
+        eq_(publisher.stats.failed, 0)
+
+    def test_reconnect_once(self):
+        publisher = self.get_publisher()
+
+        FakeConnection.errors.extend([IOError('Connection reset'), IOError('Connection refused')])
+        self.publish(publisher, 0)
+
+        eq_(len(FakeConnection.instances), 2)
+        eq_(FakeConnection.published, [])
+        eq_(publisher.stats.failed, 1)
+
+    def test_no_retry_on_other_errors(self):
+        publisher = self.get_publisher()
+
+        FakeConnection.errors.append(ValueError('Not a connection error'))
+        self.publish(publisher, 0)
+
+        eq_(len(FakeConnection.instances), 1)
+        eq_(FakeConnection.published, [])
+        eq_(publisher.stats.failed, 1)
+
+class OutgoingConnectorTestCase(TestCase):
+
+    def get_connector(self, name):
+        connector = OutgoingConnector.__new__(OutgoingConnector)
+        connector.def_amqp = Bunch(username='user', password='pass', host='localhost', port=5672, vhost='/', heartbeat=0)
+        connector.def_amqp_lock = RLock()
+        connector.out_amqp = Bunch(id=1, name=name)
+        connector.out_amqp_lock = RLock()
+        connector.fs_server_config = {}
+        connector.stats = PublisherStats(name)
+        connector.publisher = None
+        connector.broker_client = FakeBrokerClient()
+
+        return connector
+
+    def _get_topic(self, name):
+        return get_connector_topic(MESSAGE_TYPE.TO_AMQP_PUBLISHING_CONNECTOR_ALL, name)
+
+    def test_edit_rename(self):
+        old_name, new_name = rand_string(), rand_string()
+        connector = self.get_connector(old_name)
+
+        connector.on_broker_msg_OUTGOING_AMQP_EDIT(Bunch(id=1, name=new_name))
+
+        # Messages are now read off the topic of the new name only
+        eq_(connector.broker_client.unsubscribed, [self._get_topic(old_name)])
+        eq_(connector.broker_client.subscribed, [(self._get_topic(new_name), connector.on_broker_msg)])
+
+        eq_(connector.out_amqp.name, new_name)
+        eq_(connector.publisher.name, new_name)
+        eq_(connector.stats.name, new_name)
+
+    def test_edit_same_name(self):
+        name = rand_string()
+        connector = self.get_connector(name)
+
+        connector.on_broker_msg_OUTGOING_AMQP_EDIT(Bunch(id=1, name=name))
+
+        eq_(connector.broker_client.unsubscribed, [])
+        eq_(connector.broker_client.subscribed, [])
+        eq_(connector.publisher.name, name)
@@ -0,0 +1,329 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from threading import Thread
+from time import time
+from unittest import TestCase
+
+# nose
+from nose.tools import eq_
+
+# Requests
+from requests.models import Response
+
+# Zato
+from zato.common.util import new_cid
+from zato.server.connection.http_soap.cache import CacheEntry, ChannelCacheEntry, ChannelResponseCache, \
+     parse_cache_control, ResponseCache
+from zato.server.connection.http_soap.outgoing import HTTPSOAPWrapper
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Responds to GET and POST /<path> with the path and headers the path stands for.
+    """
+    # What each of the paths responds with, in addition to its name
+    path_headers = {
+        'plain': {},
+        'etag': {'ETag': '"v1"', 'Cache-Control': 'max-age=0'},
+        'no-store': {'Cache-Control': 'no-store'},
+    }
+
+    def _respond(self):
+        self.server.requests.append((self.command, self.path, dict(self.headers)))
+
+        path = self.path.strip('/').split('?')[0]
+        headers = self.path_headers[path]
+
+        if self.headers.get('If-None-Match') and self.headers['If-None-Match'] == headers.get('ETag'):
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header(b'Content-Type', b'text/plain')
+        self.send_header(b'Content-Length', str(len(path)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(path)
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self._respond()
+
+    def log_message(self, *ignored_args):
+        pass
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class FakeKVDB(object):
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def setex(self, key, expire, value):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+class ParseTestCase(TestCase):
+
+    def test_parse_cache_control(self):
+        eq_(parse_cache_control(None), {})
+        eq_(parse_cache_control('no-cache, Max-Age=60, private="x"'), {'no-cache':None, 'max-age':'60', 'private':'x'})
+
+    def test_entry_json(self):
+        entry = CacheEntry(200, {'ETag': '"v1"'}, b'\x00\xff', 'utf-8', 'http://example.com', 123.0, '"v1"')
+        entry = CacheEntry.from_json(entry.to_json())
+
+        eq_((entry.status_code, entry.headers, entry.content, entry.etag, entry.expires_at),
+            (200, {'ETag': '"v1"'}, b'\x00\xff', '"v1"', 123.0))
+
+        response = entry.to_response()
+        eq_((response.status_code, response.content, response.headers['etag']), (200, b'\x00\xff', '"v1"'))
+
+    def test_key(self):
+        cache = ResponseCache('crm', 60)
+        address = 'http://example.com/'
+
+        eq_(cache.get_key('GET', address, {'a':1, 'b':2}), cache.get_key('GET', address, {'b':2, 'a':1}))
+        self.assertNotEqual(cache.get_key('GET', address, {'a':1}), cache.get_key('GET', address, {'a':2}))
+        self.assertNotEqual(cache.get_key('GET', address), cache.get_key('POST', address))
+        self.assertNotEqual(cache.get_key('POST', address, data='a'), cache.get_key('POST', address, data='b'))
+
+        # Keys are made of what requests actually sends
+        eq_(cache.get_key('GET', address, 'a=1&b=2'), cache.get_key('GET', address, {'b':2, 'a':1}))
+        eq_(cache.get_key('GET', address, [('a', 1), ('b', 2)]), cache.get_key('GET', address, {'b':2, 'a':1}))
+        eq_(cache.get_key('POST', address, data={'b':2, 'a':1}), cache.get_key('POST', address, data='a=1&b=2'))
+        eq_(cache.get_key('POST', address, data={'a':['1', '2']}), cache.get_key('POST', address, data='a=1&a=2'))
+        eq_(cache.get_key('POST', address, data='żółw'), cache.get_key('POST', address, data='żółw'.encode('utf-8')))
+        eq_(cache.get_key('GET', address, {'a':'żółw'}), cache.get_key('GET', address, 'a=%C5%BC%C3%B3%C5%82w'))
+
+        # There's no key for anything that can't be encoded
+        eq_(cache.get_key('POST', address, data=object()), None)
+        eq_(cache.get_key('POST', address, data=[1, 2]), None)
+
+    def test_not_keyed(self):
+        cache = ResponseCache('crm', 60)
+        calls = []
+
+        def func(headers):
+            calls.append(headers)
+            response = Response()
+            response.status_code = 200
+            return response
+
+        # Requests that can't be keyed are not cached
+        for x in range(2):
+            eq_(cache.invoke(None, {}, func).status_code, 200)
+
+        eq_(len(calls), 2)
+        eq_(cache.entries, {})
+
+    def test_lru(self):
+        cache = ResponseCache('crm', 60, max_size=2)
+        for key in 'abc':
+            if key == 'c':
+                cache.get('a') # Makes 'b' the least recently used one
+            cache.set(key, CacheEntry(200, expires_at=0))
+
+        eq_(sorted(cache.entries), ['a', 'c'])
+
+class ResponseCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.server = StubServer((b'127.0.0.1', 0), StubHandler)
+        self.server.requests = []
+
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_wrapper(self, path, kvdb=None, **kwargs):
+        config = {'id': 1, 'is_active': True, 'method': 'GET', 'name': path, 'transport': 'plain_http',
+            'address': 'http://127.0.0.1:{}/{}'.format(self.server.server_port, path),
+            'soap_action': '', 'soap_version': None, 'sec_type': None, 'username': None, 'password': None,
+            'cache_ttl': 60}
+        config.update(kwargs)
+
+        return HTTPSOAPWrapper(config, kvdb)
+
+    def test_no_cache(self):
+        eq_(self.get_wrapper('plain', cache_ttl=None).cache, None)
+
+    def test_hit(self):
+        wrapper = self.get_wrapper('plain')
+
+        for x in range(3):
+            eq_(wrapper.get(new_cid(), {'a':1}).text, 'plain')
+        eq_(wrapper.get(new_cid(), {'a':2}).text, 'plain')
+
+        eq_(len(self.server.requests), 2)
+
+        info = wrapper.cache.get_info()
+        eq_((info['hits'], info['misses'], info['revalidated'], info['size']), (2, 2, 0, 2))
+
+    def test_post(self):
+        wrapper = self.get_wrapper('plain')
+
+        for data in ('a', 'a', 'b'):
+            eq_(wrapper.post(new_cid(), data).text, 'plain')
+
+        eq_(len(self.server.requests), 2)
+
+    def test_not_prefetched(self):
+        wrapper = self.get_wrapper('plain')
+
+        for x in range(2):
+            eq_(wrapper.get(new_cid(), prefetch=False).content, 'plain')
+
+        eq_(len(self.server.requests), 2)
+
+    def test_no_store(self):
+        wrapper = self.get_wrapper('no-store')
+
+        for x in range(2):
+            eq_(wrapper.get(new_cid()).text, 'no-store')
+
+        eq_(len(self.server.requests), 2)
+        eq_(wrapper.cache.get_info()['size'], 0)
+
+    def test_request_no_cache(self):
+        wrapper = self.get_wrapper('plain')
+
+        wrapper.get(new_cid())
+        wrapper.get(new_cid(), headers={'Cache-Control': 'no-cache'})
+
+        eq_(len(self.server.requests), 2)
+
+    def test_revalidation(self):
+        wrapper = self.get_wrapper('etag')
+
+        for x in range(3):
+            response = wrapper.get(new_cid())
+            eq_((response.status_code, response.text), (200, 'etag'))
+
+        # The response is stale at once because of its max-age=0 so each request is a conditional one
+        eq_(len(self.server.requests), 3)
+        eq_([headers.get('if-none-match') for _, _, headers in self.server.requests], [None, '"v1"', '"v1"'])
+
+        info = wrapper.cache.get_info()
+        eq_((info['hits'], info['misses'], info['revalidated']), (0, 1, 2))
+
+    def test_params_and_data(self):
+        wrapper = self.get_wrapper('plain')
+
+        for x in range(2):
+            eq_(wrapper.get(new_cid(), params=[('a', 1)]).text, 'plain')
+            eq_(wrapper.post(new_cid(), data={'a': 1}).text, 'plain')
+
+        eq_(len(self.server.requests), 2)
+
+    def test_kvdb(self):
+        kvdb = FakeKVDB()
+        wrapper1 = self.get_wrapper('plain', kvdb, cache_kvdb=True)
+        wrapper2 = self.get_wrapper('plain', kvdb, cache_kvdb=True)
+
+        eq_(wrapper1.get(new_cid()).text, 'plain')
+        eq_(wrapper2.get(new_cid()).text, 'plain')
+
+        # The other wrapper, as though in another worker, found the response in the KVDB
+        eq_(len(self.server.requests), 1)
+        eq_(wrapper2.cache.get_info()['hits'], 1)
+
+        # Deleted in-process and from the KVDB alike
+        key = wrapper1.cache.entries.keys()[0]
+        wrapper1.cache.delete(key)
+        eq_(wrapper1.cache.entries, {})
+        eq_(kvdb.data, {})
+
+    def test_kvdb_not_asked_for(self):
+        kvdb = FakeKVDB()
+        wrapper = self.get_wrapper('plain', kvdb)
+        wrapper.get(new_cid())
+
+        eq_(kvdb.data, {})
+
+class ChannelResponseCacheTestCase(TestCase):
+
+    def get_environ(self, path='/catalogue', query_string='', **headers):
+        environ = {'PATH_INFO':path, 'QUERY_STRING':query_string}
+        environ.update(headers)
+        return environ
+
+    def get_entry(self, path='/catalogue', query_string='', expires_at=None):
+        return ChannelCacheEntry(200, 'text/plain', {}, b'abc', '"abc"', expires_at or time() + 60, path, query_string)
+
+    def test_key(self):
+        cache = ChannelResponseCache()
+        environ = self.get_environ(query_string='a=1', HTTP_ACCEPT='text/xml', HTTP_X_CLIENT='x1')
+
+        eq_(cache.get_key(environ), cache.get_key(self.get_environ(query_string='a=1', HTTP_ACCEPT='application/json')))
+        eq_(cache.get_key(environ, 'Accept, X-Client'), cache.get_key(environ, 'x-client,accept'))
+
+        self.assertNotEqual(cache.get_key(environ), cache.get_key(self.get_environ(query_string='a=2')))
+        self.assertNotEqual(cache.get_key(environ, 'Accept'),
+            cache.get_key(self.get_environ(query_string='a=1', HTTP_ACCEPT='application/json'), 'Accept'))
+
+    def test_expired(self):
+        cache = ChannelResponseCache()
+        cache.set('catalogue', 'a', self.get_entry(expires_at=time() - 1), 10)
+
+        eq_(cache.get('catalogue', 'a'), None)
+        eq_(cache.channels['catalogue'].keys(), [])
+
+    def test_lru(self):
+        cache = ChannelResponseCache()
+        for key in 'abc':
+            if key == 'c':
+                cache.get('catalogue', 'a') # Makes 'b' the least recently used one
+            cache.set('catalogue', key, self.get_entry(), 2)
+
+        eq_(sorted(cache.channels['catalogue']), ['a', 'c'])
+
+    def test_invalidate(self):
+        cache = ChannelResponseCache()
+        cache.set('catalogue', 'a', self.get_entry('/catalogue', 'a=1'), 10)
+        cache.set('catalogue', 'b', self.get_entry('/catalogue', 'a=2'), 10)
+        cache.set('catalogue', 'c', self.get_entry('/catalogue/items'), 10)
+        cache.set('prices', 'd', self.get_entry('/prices'), 10)
+
+        eq_(cache.invalidate('catalogue', '/catalogue', 'a=1'), 1)
+        eq_(sorted(cache.channels['catalogue']), ['b', 'c'])
+
+        eq_(cache.invalidate('catalogue', '/catalogue'), 1)
+        eq_(sorted(cache.channels['catalogue']), ['c'])
+
+        eq_(cache.invalidate('catalogue'), 1)
+        eq_(cache.invalidate('catalogue'), 0)
+        eq_(sorted(cache.channels), ['prices'])
+
+    def test_entry_matches(self):
+        entry = self.get_entry()
+
+        eq_(entry.matches('"abc"'), True)
+        eq_(entry.matches('"xyz", "abc"'), True)
+        eq_(entry.matches('*'), True)
+        eq_(entry.matches('"xyz"'), False)
+        eq_(entry.matches(None), False)
@@ -9,12 +9,16 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 # stdlib
+import logging
 from unittest import TestCase
 from uuid import uuid4
 
 # anyjson
 from anyjson import loads
 
+# Bunch
+from bunch import Bunch
+
 # lxml
 from lxml import etree
 
@@ -25,7 +29,7 @@ from nose.tools import eq_
 from zato.common import SIMPLE_IO, URL_TYPE, zato_namespace, ZATO_OK
 from zato.common.util import new_cid
 from zato.server.connection.http_soap import channel
-from zato.server.service import Service
+from zato.server.service import Response, Service
 from zato.server.service.internal import AdminService, Service
 
 # Tokyo
@@ -48,6 +52,10 @@ class DummyResponse(object):
         self.payload = payload
         self.result = result
         self.result_details = result_details if result_details else uuid4().hex
+        self.is_streamed = False
+
+    def get_serialized_payload(self):
+        return self.payload if isinstance(self.payload, basestring) else self.payload.getvalue()
 
 class DummyService(Service):
     def __init__(self, response=None, cid=None):
@@ -171,4 +179,119 @@ class TestSetPayloadNonAdminServiceTestCase(MessageHandlingBase):
     def test_payload_provided_non_basestring(self):
         payload = DummyPayload(uuid4().hex)
         ignored, service = self.get_data(None, None, '', payload=payload, service_class=DummyService)
-        eq_(payload.value, service.response.payload)
\ No newline at end of file
+        eq_(payload.value, service.response.payload)
+
+class TestSetPayloadStreamedTestCase(TestCase):
+
+    def _get_payload(self, transport):
+        response = Response(logging.getLogger(__name__))
+        response.payload = (chunk for chunk in ('<a>', '<b/>', '</a>'))
+
+        channel._BaseMessageHandler().set_payload(response, SIMPLE_IO.FORMAT.XML, transport, DummyService(response))
+
+        # Still not consumed
+        self.assertTrue(response.is_streamed)
+
+        return b''.join(response.payload)
+
+    def test_iterable_body_plain_http(self):
+        eq_(self._get_payload(URL_TYPE.PLAIN_HTTP), '<a><b/></a>')
+
+    def test_iterable_body_soap(self):
+        eq_(self._get_payload(URL_TYPE.SOAP), channel.soap_doc.format(body='<a><b/></a>'))
+
+class DummyHandler(object):
+    """ Stands for a SOAP or plain HTTP handler, responds with what it's been told to
+    and counts how many times it's been invoked.
+    """
+    def __init__(self, status_code=200, payload=b'<catalogue/>'):
+        self.status_code = status_code
+        self.payload = payload
+        self.calls = 0
+
+    def handle(self, *ignored_args):
+        self.calls += 1
+
+        response = Response(logging.getLogger(__name__))
+        response.status_code = self.status_code
+        response.content_type = 'application/xml'
+        response.headers['X-Calls'] = str(self.calls)
+        response.payload = self.payload
+
+        return None, response
+
+class TestDispatchCachedTestCase(TestCase):
+
+    def setUp(self):
+        self.dispatcher = channel.RequestDispatcher()
+        self.channel_info = Bunch(name='catalogue', cache_ttl=60, cache_size=None, cache_key_headers='Accept')
+
+    def dispatch(self, handler, query_string='', **headers):
+        environ = {'PATH_INFO':'/catalogue', 'QUERY_STRING':query_string, 'REQUEST_METHOD':'GET',
+            'zato.http.response.headers':{}}
+        environ.update(headers)
+
+        payload = self.dispatcher.dispatch_cached(new_cid(), environ, '', URL_TYPE.PLAIN_HTTP, None,
+            SIMPLE_IO.FORMAT.XML, environ['PATH_INFO'], handler, self.channel_info)
+
+        return environ['zato.http.response.status'], environ['zato.http.response.headers'], payload
+
+    def test_cached(self):
+        handler = DummyHandler()
+
+        status1, headers1, payload1 = self.dispatch(handler, 'a=1')
+        status2, headers2, payload2 = self.dispatch(handler, 'a=1')
+
+        eq_(handler.calls, 1)
+        eq_((status1, payload1), ('200 OK', b'<catalogue/>'))
+        eq_((status2, payload2), ('200 OK', b'<catalogue/>'))
+        eq_((headers2['Content-Type'], headers2['X-Calls'], headers2['ETag']), ('application/xml', '1', headers1['ETag']))
+        self.assertTrue(headers2['Cache-Control'] in ('max-age=59', 'max-age=60'))
+
+        self.dispatch(handler, 'a=2')
+        self.dispatch(handler, 'a=1', HTTP_ACCEPT='application/json')
+        eq_(handler.calls, 3)
+
+    def test_if_none_match(self):
+        handler = DummyHandler()
+        _, headers, _ = self.dispatch(handler)
+
+        eq_(self.dispatch(handler, HTTP_IF_NONE_MATCH=headers['ETag'])[::2], ('304 Not Modified', b''))
+        eq_(self.dispatch(handler, HTTP_IF_NONE_MATCH='"xyz"')[::2], ('200 OK', b'<catalogue/>'))
+        eq_(handler.calls, 1)
+
+    def test_request_no_cache(self):
+        handler = DummyHandler()
+
+        self.dispatch(handler)
+        self.dispatch(handler, HTTP_CACHE_CONTROL='no-cache')
+        self.dispatch(handler)
+
+        eq_(handler.calls, 2)
+
+    def test_not_ok(self):
+        handler = DummyHandler(404)
+
+        for x in range(2):
+            status, headers, _ = self.dispatch(handler)
+
+        eq_(handler.calls, 2)
+        eq_(status, '404 Not Found')
+        self.assertFalse('ETag' in headers)
+
+    def test_streamed(self):
+        handler = DummyHandler(payload=(chunk for chunk in ('<a>', '</a>')))
+        _, headers, payload = self.dispatch(handler)
+
+        eq_(b''.join(payload), '<a></a>')
+        self.assertFalse('ETag' in headers)
+        eq_(self.dispatcher.response_cache.channels, {})
+
+    def test_invalidate(self):
+        handler = DummyHandler()
+
+        self.dispatch(handler)
+        self.dispatcher.response_cache.invalidate('catalogue', '/catalogue')
+        self.dispatch(handler)
+
+        eq_(handler.calls, 2)
@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from threading import Thread
+from time import sleep, time
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# mock
+from mock import patch
+
+# nose
+from nose.tools import eq_
+
+# Requests
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool
+
+# Zato
+from zato.common import CircuitOpen, Inactive, TimeoutException
+from zato.common.util import new_cid
+from zato.server.connection.http_soap.outgoing import CIRCUIT_STATE, CircuitBreaker, DNSCache, HTTPSOAPStore, \
+     HTTPSOAPWrapper
+
+logger = logging.getLogger(__name__)
+
+class StubHandler(BaseHTTPRequestHandler):
+    """ Responds to GET /<delay in milliseconds> with the delay once it has passed.
+    """
+    def do_GET(self):
+        delay = self.path.strip('/').split('?')[0]
+        sleep(int(delay) / 1000.0)
+
+        self.send_response(200)
+        self.send_header(b'Content-Type', b'text/plain')
+        self.send_header(b'Content-Length', str(len(delay)))
+        self.end_headers()
+        self.wfile.write(delay)
+
+    def log_message(self, *ignored_args):
+        pass
+
+class KeepAliveStubHandler(StubHandler):
+    """ Keeps connections open across requests.
+    """
+    protocol_version = b'HTTP/1.1'
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, *ignored_args):
+        pass # Clients that have timed out have closed their connections already
+
+class _StubServerTestCase(TestCase):
+    handler_class = StubHandler
+
+    def setUp(self):
+        self.server = StubServer((b'127.0.0.1', 0), self.handler_class)
+
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_config(self, name, address=None, is_active=True, **kwargs):
+        config = {'id': 1, 'is_active': is_active, 'method': 'GET', 'name': name, 'transport': 'plain_http',
+            'address': address or 'http://127.0.0.1:{}/{}'.format(self.server.server_port, name),
+            'soap_action': '', 'soap_version': None, 'sec_type': None, 'username': None, 'password': None}
+        config.update(kwargs)
+
+        return config
+
+class GatherTestCase(_StubServerTestCase):
+
+    def get_store(self, delays, pool_size=10, inactive=()):
+        """ Returns a store with one connection for each of the delays, named after the delays.
+        """
+        store = HTTPSOAPStore('out_plain_http', Bunch(), pool_size)
+
+        for delay in delays:
+            name = str(delay)
+            config = self.get_config(name, is_active=name not in inactive)
+            store[name] = Bunch(config=config, conn=HTTPSOAPWrapper(config))
+
+        return store
+
+    def test_wall_time_max_not_sum(self):
+        delays = (300, 200, 100, 250, 150)
+        store = self.get_store(delays)
+
+        start = time()
+        results = store.gather(new_cid(), [(str(delay), 'get') for delay in delays])
+        elapsed = time() - start
+
+        logger.info('delays:[%s], sum:[%.3fs], elapsed:[%.3fs]', delays, sum(delays) / 1000.0, elapsed)
+
+        # Results are in the order calls were given in
+        eq_([result.name for result in results], [str(delay) for delay in delays])
+        eq_([result.response.text for result in results], [str(delay) for delay in delays])
+        eq_([result.ok for result in results], [True] * len(delays))
+
+        self.assertTrue(elapsed < max(delays) / 1000.0 + 0.2, elapsed)
+
+    def test_pool_size(self):
+        store = self.get_store((100,), pool_size=1)
+
+        start = time()
+        results = store.map(new_cid(), '100', 'get', [{}, {}, {}])
+        elapsed = time() - start
+
+        eq_([result.ok for result in results], [True, True, True])
+        self.assertTrue(elapsed >= 0.3, elapsed)
+
+    def test_partial_failure(self):
+        store = self.get_store((100, 50), inactive=('50',))
+
+        ok, inactive, missing = store.gather(new_cid(), [('100', 'get'), ('50', 'get'), ('zzz', 'get')])
+
+        eq_(ok.ok, True)
+        eq_(ok.response.status_code, 200)
+
+        eq_(inactive.ok, False)
+        self.assertIsInstance(inactive.exception, Inactive)
+
+        eq_(missing.ok, False)
+        eq_(missing.response, None)
+        self.assertIsInstance(missing.exception, KeyError)
+
+    def test_timeout(self):
+        store = self.get_store((1000, 50))
+
+        slow, fast = store.gather(new_cid(), [('1000', 'get'), ('50', 'get')], timeout=0.3)
+
+        eq_(slow.ok, False)
+        eq_(fast.ok, True)
+
+    def test_deadline(self):
+        store = self.get_store((1000, 50))
+
+        start = time()
+        slow, fast = store.gather(new_cid(), [('1000', 'get'), ('50', 'get')], deadline=0.3)
+        elapsed = time() - start
+
+        self.assertIsInstance(slow.exception, TimeoutException)
+        eq_(fast.ok, True)
+        self.assertTrue(elapsed < 0.5, elapsed)
+
+    def test_no_calls(self):
+        eq_(self.get_store(()).gather(new_cid(), []), [])
+
+class CircuitBreakerTestCase(TestCase):
+
+    def test_opens_after_error_threshold(self):
+        cb = CircuitBreaker('crm', 3, open_period=60)
+
+        for x in range(2):
+            cb.before_call()
+            cb.after_call(False, 0.1, 'error')
+
+        eq_(cb.state, CIRCUIT_STATE.CLOSED)
+
+        # A success resets the count of consecutive errors
+        cb.before_call()
+        cb.after_call(True, 0.1)
+        eq_(cb.error_count, 0)
+
+        for x in range(3):
+            cb.before_call()
+            cb.after_call(False, 0.1, 'error')
+
+        eq_(cb.state, CIRCUIT_STATE.OPEN)
+        eq_(cb.times_opened, 1)
+        self.assertRaises(CircuitOpen, cb.before_call)
+
+        info = cb.get_info()
+        eq_(info['state'], CIRCUIT_STATE.OPEN)
+        eq_(info['last_error'], 'error')
+        self.assertTrue(0 < info['retry_in'] <= 60, info['retry_in'])
+
+    def test_latency_threshold(self):
+        cb = CircuitBreaker('crm', 2, latency_threshold=100)
+
+        cb.before_call()
+        cb.after_call(True, 0.05)
+        eq_(cb.error_count, 0)
+
+        for x in range(2):
+            cb.before_call()
+            cb.after_call(True, 0.2)
+
+        eq_(cb.state, CIRCUIT_STATE.OPEN)
+
+    def test_half_open(self):
+        cb = CircuitBreaker('crm', 1, open_period=0.1, half_open_probes=2)
+
+        cb.before_call()
+        cb.after_call(False, 0.1, 'error')
+        eq_(cb.state, CIRCUIT_STATE.OPEN)
+
+        sleep(0.15)
+
+        # Only as many probes as configured are let through at a time ..
+        cb.before_call()
+        cb.before_call()
+        eq_(cb.state, CIRCUIT_STATE.HALF_OPEN)
+        self.assertRaises(CircuitOpen, cb.before_call)
+
+        # .. and the circuit closes once all of them succeed.
+        cb.after_call(True, 0.1)
+        eq_(cb.state, CIRCUIT_STATE.HALF_OPEN)
+        cb.after_call(True, 0.1)
+        eq_(cb.state, CIRCUIT_STATE.CLOSED)
+
+    def test_half_open_probe_fails(self):
+        cb = CircuitBreaker('crm', 1, open_period=0.1)
+
+        cb.before_call()
+        cb.after_call(False, 0.1, 'error')
+        sleep(0.15)
+
+        cb.before_call()
+        cb.after_call(False, 0.1, 'error')
+
+        eq_(cb.state, CIRCUIT_STATE.OPEN)
+        eq_(cb.times_opened, 2)
+        self.assertRaises(CircuitOpen, cb.before_call)
+
+class WrapperTimeoutCircuitBreakerTestCase(_StubServerTestCase):
+
+    def test_no_circuit_breaker(self):
+        eq_(HTTPSOAPWrapper(self.get_config('50')).circuit_breaker, None)
+
+    def test_timeout(self):
+        wrapper = HTTPSOAPWrapper(self.get_config('1000', timeout=200))
+
+        start = time()
+        self.assertRaises(Exception, wrapper.get, new_cid())
+        self.assertTrue(time() - start < 0.8)
+
+        # A timeout given explicitly wins
+        eq_(HTTPSOAPWrapper(self.get_config('300', timeout=100)).get(new_cid(), timeout=1).text, '300')
+
+    def test_fail_fast(self):
+
+        # Nothing listens on the port of a server that has just been closed
+        server = StubServer((b'127.0.0.1', 0), StubHandler)
+        address = 'http://127.0.0.1:{}/50'.format(server.server_port)
+        server.server_close()
+
+        wrapper = HTTPSOAPWrapper(self.get_config('crm', address, cb_error_threshold=2, cb_open_period=60))
+
+        for x in range(2):
+            try:
+                wrapper.get(new_cid())
+            except CircuitOpen:
+                self.fail('Circuit should not have been open yet')
+            except Exception:
+                pass
+
+        eq_(wrapper.circuit_breaker.state, CIRCUIT_STATE.OPEN)
+        self.assertRaises(CircuitOpen, wrapper.get, new_cid())
+        self.assertRaises(CircuitOpen, wrapper.post, new_cid(), 'data')
+
+    def test_success_keeps_circuit_closed(self):
+        wrapper = HTTPSOAPWrapper(self.get_config('50', cb_error_threshold=1, cb_latency_threshold=1000))
+
+        for x in range(3):
+            eq_(wrapper.get(new_cid()).text, '50')
+
+        eq_(wrapper.circuit_breaker.state, CIRCUIT_STATE.CLOSED)
+        eq_(wrapper.circuit_breaker.error_count, 0)
+
+class DNSCacheTestCase(TestCase):
+
+    def test_resolve(self):
+        dns_cache = DNSCache(60)
+
+        eq_(dns_cache.resolve('127.0.0.1', 80), '127.0.0.1')
+        eq_(dns_cache.resolve('127.0.0.1', 80), '127.0.0.1')
+        eq_((dns_cache.hits, dns_cache.misses), (1, 1))
+
+        dns_cache.forget('127.0.0.1', 80)
+        dns_cache.resolve('127.0.0.1', 80)
+        eq_((dns_cache.hits, dns_cache.misses), (1, 2))
+
+    def test_ttl(self):
+        dns_cache = DNSCache(0.1)
+        dns_cache.resolve('127.0.0.1', 80)
+        sleep(0.15)
+        dns_cache.resolve('127.0.0.1', 80)
+
+        eq_((dns_cache.hits, dns_cache.misses), (0, 2))
+
+class PoolStatsTestCase(_StubServerTestCase):
+    handler_class = KeepAliveStubHandler
+
+    def test_pool_hits(self):
+        wrapper = HTTPSOAPWrapper(self.get_config('10'))
+        for x in range(5):
+            eq_(wrapper.get(new_cid()).text, '10')
+
+        info = wrapper.get_pool_info()
+        eq_(info['name'], '10')
+        eq_((info['requests'], info['pool_hits'], info['new_connections']), (5, 4, 1))
+        eq_((info['dns_cache_hits'], info['dns_cache_misses']), (None, None))
+
+    def test_no_keep_alive(self):
+        wrapper = HTTPSOAPWrapper(self.get_config('10', keep_alive=False))
+        for x in range(3):
+            eq_(wrapper.get(new_cid()).text, '10')
+
+        info = wrapper.get_pool_info()
+        eq_((info['requests'], info['pool_hits'], info['new_connections']), (3, 0, 3))
+
+    def test_pool_block_wait_time(self):
+        store = HTTPSOAPStore('out_plain_http', Bunch())
+        config = self.get_config('100', pool_max_per_host=1, pool_block=True)
+        store['100'] = Bunch(config=config, conn=HTTPSOAPWrapper(config))
+
+        results = store.map(new_cid(), '100', 'get', [{}, {}, {}])
+        eq_([result.ok for result in results], [True, True, True])
+
+        # All the calls shared the one connection there was, waiting for it in turn
+        info = store['100'].conn.get_pool_info()
+        eq_((info['requests'], info['new_connections']), (3, 1))
+        self.assertTrue(info['wait_time_max'] >= 150, info)
+
+    def test_pool_created_once(self):
+
+        class SlowPool(HTTPConnectionPool):
+            def __init__(self, *args, **kwargs):
+                sleep(0.05)
+                super(SlowPool, self).__init__(*args, **kwargs)
+
+        poolmanager = HTTPSOAPWrapper(self.get_config('10', pool_block=True)).session.poolmanager
+        pools = []
+
+        def _get_pool():
+            pools.append(poolmanager.connection_from_host(b'127.0.0.1', self.server.server_port))
+
+        # Threads asking for a new host at the same time all get the same pool
+        with patch.dict('requests.packages.urllib3.poolmanager.pool_classes_by_scheme', {'http': SlowPool}):
+            threads = [Thread(target=_get_pool) for x in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        eq_(len(pools), 3)
+        eq_(len(set(id(pool) for pool in pools)), 1)
+        eq_(pools[0].pool is None, False)
+
+class DNSCachePoolTestCase(_StubServerTestCase):
+
+    def test_dns_cache(self):
+
+        # The stub server closes connections after each request so each of them connects anew
+        wrapper = HTTPSOAPWrapper(self.get_config('10', dns_cache_ttl=60))
+        for x in range(3):
+            eq_(wrapper.get(new_cid()).text, '10')
+
+        info = wrapper.get_pool_info()
+        eq_((info['requests'], info['new_connections']), (3, 3))
+        eq_((info['dns_cache_hits'], info['dns_cache_misses']), (2, 1))
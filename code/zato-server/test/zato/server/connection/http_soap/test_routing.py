@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# nose
+from nose.tools import eq_
+
+# Paste
+from paste.util.multidict import MultiDict
+
+# Zato
+from zato.common import URL_TYPE, ZATO_NONE
+from zato.common.test import rand_string
+from zato.server.connection.http_soap.routing import RoutingTable
+
+def get_sec_info(transport, sec_def=ZATO_NONE, is_active=True, data_format=None):
+    return Bunch(sec_def=sec_def, is_active=is_active, transport=transport, data_format=data_format)
+
+def get_channel_info(impl_name):
+    return Bunch(impl_name=impl_name)
+
+class RoutingTableTestCase(TestCase):
+
+    def test_build_get(self):
+        url_path1, url_path2 = rand_string(), rand_string()
+        soap_action1, soap_action2 = rand_string(), rand_string()
+        impl_name1, impl_name2, impl_name3 = rand_string(), rand_string(), rand_string()
+
+        url_sec = MultiDict()
+        url_sec.add(url_path1, Bunch({soap_action1: get_sec_info(URL_TYPE.SOAP, data_format='xml')}))
+        url_sec.add(url_path1, Bunch({soap_action2: get_sec_info(URL_TYPE.SOAP, is_active=False)}))
+        url_sec.add(url_path2, Bunch({'': get_sec_info(URL_TYPE.PLAIN_HTTP, data_format='json')}))
+
+        soap_config = MultiDict()
+        soap_config.add(url_path1, Bunch({soap_action1: get_channel_info(impl_name1)}))
+        soap_config.add(url_path1, Bunch({soap_action2: get_channel_info(impl_name2)}))
+
+        plain_http_config = MultiDict()
+        plain_http_config.add(url_path2, Bunch({'': get_channel_info(impl_name3)}))
+
+        table = RoutingTable()
+        table.build(url_sec, soap_config, plain_http_config)
+
+        eq_(len(table), 3)
+
+        entry = table.get(url_path1, soap_action1)
+        eq_(entry.transport, URL_TYPE.SOAP)
+        eq_(entry.data_format, 'xml')
+        eq_(entry.is_active, True)
+        eq_(entry.sec_def, ZATO_NONE)
+        eq_(entry.channel_info.impl_name, impl_name1)
+
+        entry = table.get(url_path1, soap_action2)
+        eq_(entry.is_active, False)
+        eq_(entry.channel_info.impl_name, impl_name2)
+
+        entry = table.get(url_path2, '')
+        eq_(entry.transport, URL_TYPE.PLAIN_HTTP)
+        eq_(entry.data_format, 'json')
+        eq_(entry.channel_info.impl_name, impl_name3)
+
+        eq_(table.get(url_path2, soap_action1), None)
+        eq_(table.get(rand_string(), ''), None)
+
+    def test_build_replaces_table(self):
+        url_path = rand_string()
+
+        url_sec = MultiDict()
+        url_sec.add(url_path, Bunch({'': get_sec_info(URL_TYPE.PLAIN_HTTP)}))
+
+        plain_http_config = MultiDict()
+        plain_http_config.add(url_path, Bunch({'': get_channel_info(rand_string())}))
+
+        table = RoutingTable()
+        table.build(url_sec, MultiDict(), plain_http_config)
+
+        old_table = table._table
+        table.build(MultiDict(), MultiDict(), MultiDict())
+
+        # The old dictionary must have been left intact for anyone who's still using it
+        eq_(len(old_table), 1)
+        eq_(len(table), 0)
+        eq_(table.get(url_path, ''), None)
+
+    def test_channel_info_missing(self):
+        url_path = rand_string()
+
+        url_sec = MultiDict()
+        url_sec.add(url_path, Bunch({'': get_sec_info(URL_TYPE.PLAIN_HTTP)}))
+
+        table = RoutingTable()
+        table.build(url_sec, MultiDict(), MultiDict())
+
+        eq_(table.get(url_path, '').channel_info, None)
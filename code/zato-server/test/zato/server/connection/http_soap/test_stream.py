@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# lxml
+from lxml.etree import iterparse
+
+# nose
+from nose.tools import eq_
+
+# Zato
+from zato.common.util import new_cid
+from zato.server.connection.http_soap import RequestEntityTooLarge
+from zato.server.connection.http_soap.stream import CHUNK_SIZE, read_body, RequestBodyReader
+
+# 100 MB
+LARGE_SIZE = 100 * 1024 * 1024
+
+class SyntheticInput(object):
+    """ A wsgi.input whose data - head + fill * count + tail - is produced on demand
+    so that large bodies never exist in memory as a whole. Keeps track of how many
+    reads there were and of the largest one requested.
+    """
+    def __init__(self, count, fill=b'a', head=b'', tail=b''):
+        self.count = count
+        self.fill = fill
+        self.head = head
+        self.tail = tail
+        self.fill_end = len(head) + len(fill) * count
+        self.size = self.fill_end + len(tail)
+        self.pos = 0
+        self.reads = 0
+        self.max_read = 0
+
+    def _get_data(self, start, end):
+        if start < len(self.head):
+            yield self.head[start:end]
+            start = len(self.head)
+
+        if start < min(end, self.fill_end):
+            offset = (start - len(self.head)) % len(self.fill)
+            length = min(end, self.fill_end) - start
+            yield (self.fill * (length // len(self.fill) + 2))[offset:offset+length]
+            start += length
+
+        if end > self.fill_end:
+            yield self.tail[max(start - self.fill_end, 0):end - self.fill_end]
+
+    def read(self, size=-1):
+        self.reads += 1
+        if size is None or size < 0:
+            size = self.size - self.pos
+
+        self.max_read = max(self.max_read, size)
+
+        start = self.pos
+        self.pos = min(self.pos + size, self.size)
+
+        return b''.join(self._get_data(start, self.pos))
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+def get_wsgi_environ(wsgi_input, content_length=None):
+    wsgi_environ = {'wsgi.input': wsgi_input}
+    if content_length is not None:
+        wsgi_environ['CONTENT_LENGTH'] = str(content_length)
+
+    return wsgi_environ
+
+class RequestBodyReaderTestCase(TestCase):
+
+    def test_read_large_body_in_chunks(self):
+        wsgi_input = SyntheticInput(LARGE_SIZE)
+        reader = read_body(new_cid(), get_wsgi_environ(wsgi_input, LARGE_SIZE), streaming=True)
+
+        self.assertIsInstance(reader, RequestBodyReader)
+
+        total = 0
+        for chunk in iter(lambda: reader.read(CHUNK_SIZE), b''):
+            total += len(chunk)
+
+        eq_(total, LARGE_SIZE)
+        eq_(reader.bytes_read, LARGE_SIZE)
+        eq_(reader.remaining, 0)
+
+        # Nothing has ever been requested off the input in one go besides what fits in a chunk
+        eq_(wsgi_input.max_read, CHUNK_SIZE)
+
+    def test_never_reads_past_content_length(self):
+        wsgi_input = SyntheticInput(1000)
+        reader = read_body(new_cid(), get_wsgi_environ(wsgi_input, 10), streaming=True)
+
+        eq_(reader.read(), b'a' * 10)
+        eq_(reader.read(), b'')
+        eq_(wsgi_input.pos, 10)
+
+    def test_content_length_over_limit_rejected_before_reading(self):
+        wsgi_input = SyntheticInput(LARGE_SIZE)
+
+        for streaming in (True, False):
+            self.assertRaises(RequestEntityTooLarge, read_body, new_cid(),
+                get_wsgi_environ(wsgi_input, LARGE_SIZE), LARGE_SIZE - 1, streaming)
+
+        eq_(wsgi_input.reads, 0)
+
+    def test_no_content_length_over_limit(self):
+        max_size = CHUNK_SIZE * 3 + 1
+        wsgi_input = SyntheticInput(LARGE_SIZE)
+
+        reader = read_body(new_cid(), get_wsgi_environ(wsgi_input), max_size, True)
+
+        try:
+            while reader.read(CHUNK_SIZE):
+                pass
+        except RequestEntityTooLarge:
+            pass
+        else:
+            self.fail('Expected RequestEntityTooLarge')
+
+        # Gave up as soon as the limit was exceeded, no need to read the rest of the body
+        eq_(reader.bytes_read, CHUNK_SIZE * 4)
+
+        self.assertRaises(RequestEntityTooLarge, read_body, new_cid(), get_wsgi_environ(SyntheticInput(max_size + 1)), max_size)
+
+    def test_not_streaming_returns_string(self):
+        data = b'<a>123</a>'
+        wsgi_input = SyntheticInput(0, head=data)
+
+        eq_(read_body(new_cid(), get_wsgi_environ(wsgi_input, len(data)), len(data)), data)
+
+    def test_iterparse_large_xml(self):
+
+        # Roughly 10 MB worth of <item/> elements
+        fill = b'<item>123</item>'
+        count = 10 * 1024 * 1024 // len(fill)
+
+        wsgi_input = SyntheticInput(count, fill, b'<items>', b'</items>')
+        reader = read_body(new_cid(), get_wsgi_environ(wsgi_input, wsgi_input.size), streaming=True)
+
+        seen = 0
+        for event, elem in iterparse(reader, tag='item'):
+            eq_(elem.text, '123')
+            elem.clear()
+            seen += 1
+
+        eq_(seen, count)
+        eq_(reader.bytes_read, wsgi_input.size)
+        eq_(reader.remaining, 0)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from fnmatch import fnmatchcase
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# nose
+from nose.tools import eq_
+
+# Zato
+from zato.common import KVDB
+from zato.server.connection.request_response import get_freq_config, should_store
+
+class FakeConn(object):
+    def __init__(self, data, index):
+        self.data = data
+        self.index = index
+        self.scanned = []
+
+    def smembers(self, key):
+        eq_(key, KVDB.REQ_RESP_SAMPLE_INDEX)
+        return set(self.index)
+
+    def sadd(self, key, *values):
+        eq_(key, KVDB.REQ_RESP_SAMPLE_INDEX)
+        self.index.extend(values)
+
+    def execute_command(self, command, cursor, _match, pattern, _count, count):
+        self.scanned.append((command, pattern))
+        return ['0', [key for key in self.data if fnmatchcase(key, pattern)]]
+
+    def hget(self, key, name):
+        return self.data.get(key, {}).get(name)
+
+class RequestResponseTestCase(TestCase):
+
+    def test_get_freq_config(self):
+        kvdb = Bunch(conn=FakeConn({
+            '{}zato.ping'.format(KVDB.REQ_RESP_SAMPLE): {'freq': '2', 'cid': '123'},
+            '{}zato.ping2'.format(KVDB.REQ_RESP_SAMPLE): {'freq': '0'},
+            '{}my.service'.format(KVDB.REQ_RESP_SAMPLE): {'cid': '456'},
+            'zato:some:other:key': {'freq': '3'},
+
+            # Not in the index hence not looked up
+            '{}not.indexed'.format(KVDB.REQ_RESP_SAMPLE): {'freq': '4'},
+        }, ['zato.ping', 'zato.ping2', 'my.service', 'not.sampled.yet']))
+        eq_(get_freq_config(kvdb), {'zato.ping': 2})
+        eq_(kvdb.conn.scanned, [])
+
+    def test_get_freq_config_backfill(self):
+        kvdb = Bunch(conn=FakeConn({
+            '{}zato.ping'.format(KVDB.REQ_RESP_SAMPLE): {'freq': '2', 'cid': '123'},
+            '{}zato.ping2'.format(KVDB.REQ_RESP_SAMPLE): {'freq': '0'},
+            '{}my.service'.format(KVDB.REQ_RESP_SAMPLE): {'cid': '456'},
+            '{}not.indexed'.format(KVDB.REQ_RESP_SAMPLE): {'freq': '4'},
+            'zato:some:other:key': {'freq': '3'},
+        }, []))
+
+        # There's no index yet so frequencies configured before it was introduced are found with SCAN ..
+        eq_(get_freq_config(kvdb), {'zato.ping': 2, 'not.indexed': 4})
+        eq_(kvdb.conn.scanned, [('SCAN', '{}*'.format(KVDB.REQ_RESP_SAMPLE))])
+
+        # .. and added to the index so that it's read next time.
+        eq_(sorted(kvdb.conn.index), ['not.indexed', 'zato.ping'])
+
+        eq_(get_freq_config(kvdb), {'zato.ping': 2, 'not.indexed': 4})
+        eq_(len(kvdb.conn.scanned), 1)
+
+    def test_should_store(self):
+        key = '{}zato.ping'.format(KVDB.REQ_RESP_SAMPLE)
+
+        eq_(should_store(None, 10, 'zato.ping'), (None, None))
+        eq_(should_store(0, 10, 'zato.ping'), (None, None))
+        eq_(should_store(3, 10, 'zato.ping'), (None, None))
+        eq_(should_store(5, 10, 'zato.ping'), (key, 5))
+        eq_(should_store(1, 11, 'zato.ping'), (key, 1))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from unittest import TestCase
+
+# nose
+from nose.tools import eq_
+
+# Zato
+from zato.server.connection.response_writer import ResponseWriter
+
+class FakePipeline(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignored_args):
+        pass
+
+    def lpush(self, key, value):
+        self.commands.append(('lpush', key, value))
+
+    def execute(self):
+        self.conn.executed.append(self.commands)
+
+class FakeConn(object):
+    def __init__(self):
+        self.executed = []
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+def store(conn, key, value):
+    conn.lpush(key, value)
+
+class ResponseWriterTestCase(TestCase):
+
+    def test_flush(self):
+        conn = FakeConn()
+        writer = ResponseWriter(conn)
+
+        # Nothing to write yet
+        writer.flush()
+        eq_(conn.executed, [])
+
+        writer.add(store, 'a', 1)
+        writer.add(store, 'b', value=2)
+        writer.flush()
+
+        eq_(conn.executed, [[('lpush', 'a', 1), ('lpush', 'b', 2)]])
+        eq_(len(writer.queue), 0)
+
+    def test_queue_size(self):
+        conn = FakeConn()
+        writer = ResponseWriter(conn, queue_size=2)
+
+        for idx in range(3):
+            writer.add(store, 'key', idx)
+        writer.flush()
+
+        # The oldest write has been dropped
+        eq_(conn.executed, [[('lpush', 'key', 1), ('lpush', 'key', 2)]])
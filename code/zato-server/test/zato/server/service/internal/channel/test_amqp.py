@@ -19,6 +19,7 @@ from zato.common import zato_namespace
 from zato.common.broker_message import CHANNEL, MESSAGE_TYPE
 from zato.common.odb.model import ChannelAMQP, Service
 from zato.common.test import rand_bool, rand_int, rand_string, ServiceTestCase
+from zato.server.service import Integer
 from zato.server.service.internal.channel.amqp import Create, Edit, Delete, GetList
 
 # ##############################################################################
@@ -55,7 +56,8 @@ class GetListTestCase(ServiceTestCase):
         return Bunch(
             {'id':rand_int(), 'name':rand_string(), 'is_active':rand_bool(), 'queue':rand_string(), 
              'consumer_tag_prefix':rand_string(), 'def_name':rand_string(), 'def_id':rand_int(), 
-             'service_name':rand_string(), 'data_format':rand_string()}
+             'service_name':rand_string(), 'data_format':rand_string(), 'prefetch_count':rand_int(),
+             'ack_every':rand_int(), 'ack_interval':rand_int(), 'consumers':rand_int()}
         )
     
     def test_sio(self):
@@ -66,7 +68,7 @@ class GetListTestCase(ServiceTestCase):
             'def_name', 'def_id', 'service_name', 'data_format'))
         self.assertEquals(self.sio.namespace, zato_namespace)
         self.assertRaises(AttributeError, getattr, self.sio, 'input_optional')
-        self.assertRaises(AttributeError, getattr, self.sio, 'output_optional')
+        self.assertEquals(self.sio.output_optional, ('prefetch_count', 'ack_every', 'ack_interval', 'consumers'))
         
     def test_impl(self):
         self.assertEquals(self.service_class.get_name(), 'zato.channel.amqp.get-list')
@@ -93,7 +95,8 @@ class CreateTestCase(_Base):
     def get_request_data(self):
         return {'cluster_id':rand_int(), 'name':self.name, 'is_active':rand_bool(), 'def_id':self.def_id,
                 'queue':rand_string(), 'consumer_tag_prefix':rand_string(), 'service':rand_string(),
-                'data_format':rand_string()}
+                'data_format':rand_string(), 'prefetch_count':rand_int(), 'ack_every':rand_int(),
+                'ack_interval':rand_int(), 'consumers':rand_int()}
     
     def get_response_data(self):
         return Bunch({'id':self.id, 'name':self.name})
@@ -103,7 +106,9 @@ class CreateTestCase(_Base):
         self.assertEquals(self.sio.request_elem, 'zato_channel_amqp_create_request')
         self.assertEquals(self.sio.response_elem, 'zato_channel_amqp_create_response')
         self.assertEquals(self.sio.input_required, ('cluster_id', 'name', 'is_active', 'def_id', 'queue', 'consumer_tag_prefix', 'service'))
-        self.assertEquals(self.sio.input_optional, ('data_format',))
+        self.assertEquals(self.sio.input_optional, ('data_format', self.wrap_force_type(Integer('prefetch_count')),
+            self.wrap_force_type(Integer('ack_every')), self.wrap_force_type(Integer('ack_interval')),
+            self.wrap_force_type(Integer('consumers'))))
         self.assertEquals(self.sio.output_required, ('id', 'name'))
         self.assertEquals(self.sio.namespace, zato_namespace)
         self.assertRaises(AttributeError, getattr, self.sio, 'output_optional')
@@ -142,7 +147,8 @@ class EditTestCase(_Base):
     
     def get_request_data(self):
         return {'id': self.id, 'cluster_id':rand_int(), 'name':self.name, 'is_active':rand_bool(), 'queue':rand_string(), 
-             'consumer_tag_prefix':rand_string(), 'def_id':self.def_id, 'data_format':rand_string()}
+             'consumer_tag_prefix':rand_string(), 'def_id':self.def_id, 'data_format':rand_string(),
+             'prefetch_count':rand_int(), 'ack_every':rand_int(), 'ack_interval':rand_int(), 'consumers':rand_int()}
     
     def get_response_data(self):
         return Bunch({'id':rand_int(), 'name':self.name})
@@ -151,7 +157,9 @@ class EditTestCase(_Base):
         self.assertEquals(self.sio.request_elem, 'zato_channel_amqp_edit_request')
         self.assertEquals(self.sio.response_elem, 'zato_channel_amqp_edit_response')
         self.assertEquals(self.sio.input_required, ('id', 'cluster_id', 'name', 'is_active', 'def_id', 'queue', 'consumer_tag_prefix', 'service'))
-        self.assertEquals(self.sio.input_optional, ('data_format',))
+        self.assertEquals(self.sio.input_optional, ('data_format', self.wrap_force_type(Integer('prefetch_count')),
+            self.wrap_force_type(Integer('ack_every')), self.wrap_force_type(Integer('ack_interval')),
+            self.wrap_force_type(Integer('consumers'))))
         self.assertEquals(self.sio.output_required, ('id', 'name'))
         self.assertEquals(self.sio.namespace, zato_namespace)
         self.assertRaises(AttributeError, getattr, self.sio, 'output_optional')
@@ -15,7 +15,7 @@ from bunch import Bunch
 from zato.common import zato_namespace
 from zato.common.test import rand_bool, rand_int, rand_string, ServiceTestCase
 from zato.server.service import AsIs, Integer
-from zato.server.service.internal.outgoing.amqp import Create, Edit, Delete, GetList
+from zato.server.service.internal.outgoing.amqp import Create, Edit, Delete, GetList, GetStats
 
 ##############################################################################
 
@@ -138,4 +138,34 @@ class DeleteTestCase(ServiceTestCase):
         self.assertRaises(AttributeError, getattr, self.sio, 'output_repeated')
         
     def test_impl(self):
-        self.assertEquals(self.service_class.get_name(), 'zato.outgoing.amqp.delete')
\ No newline at end of file
+        self.assertEquals(self.service_class.get_name(), 'zato.outgoing.amqp.delete')
+
+##############################################################################
+
+class GetStatsTestCase(ServiceTestCase):
+    
+    def setUp(self):
+        self.service_class = GetStats
+        self.sio = self.service_class.SimpleIO
+         
+    def get_request_data(self):
+        return {'name': rand_string()}
+    
+    def get_response_data(self):
+        return Bunch({'name':rand_string(), 'published':rand_int(), 'failed':rand_int(), 'rate':rand_int(),
+                      'last_updated':rand_string(), 'confirm_latency_mean':rand_int(), 'confirm_latency_p50':rand_int(),
+                      'confirm_latency_p95':rand_int(), 'confirm_latency_p99':rand_int()})
+    
+    def test_sio(self):
+        self.assertEquals(self.sio.request_elem, 'zato_outgoing_amqp_get_stats_request')
+        self.assertEquals(self.sio.response_elem, 'zato_outgoing_amqp_get_stats_response')
+        self.assertEquals(self.sio.input_required, ('name',))
+        self.assertEquals(self.sio.output_required, ('name', 'published', 'failed', 'rate'))
+        self.assertEquals(self.sio.output_optional, ('last_updated', 'confirm_latency_mean', 'confirm_latency_p50',
+                                                     'confirm_latency_p95', 'confirm_latency_p99'))
+        self.assertEquals(self.sio.namespace, zato_namespace)
+        self.assertRaises(AttributeError, getattr, self.sio, 'input_optional')
+        self.assertRaises(AttributeError, getattr, self.sio, 'output_repeated')
+        
+    def test_impl(self):
+        self.assertEquals(self.service_class.get_name(), 'zato.outgoing.amqp.get-stats')
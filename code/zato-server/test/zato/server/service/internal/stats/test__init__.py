@@ -8,17 +8,43 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+# stdlib
+from unittest import TestCase
+
 # Bunch
 from bunch import Bunch
 
+# numpy
+from numpy import array
+
 # Zato
 from zato.common import zato_namespace
 from zato.common.test import rand_bool, rand_int, rand_string, ServiceTestCase
 from zato.server.service import Boolean, Integer, UTC
-from zato.server.service.internal.stats import Delete, StatsReturningService, GetByService
+from zato.server.service.internal.stats import Delete, StatsReturningService, GetByService, top_n
 
 ################################################################################
 
+class TopNTestCase(TestCase):
+    
+    def test_top_n(self):
+        values = array([5.0, 1.0, 7.0, 3.0, 7.0, 2.0])
+        
+        self.assertEquals(top_n(values, 1), [2])
+        self.assertEquals(top_n(values, 3), [2, 4, 0])
+        self.assertEquals(top_n(values, 6), [2, 4, 0, 3, 5, 1])
+        self.assertEquals(top_n(values, 100), [2, 4, 0, 3, 5, 1])
+        
+    def test_top_n_ties(self):
+        # Equal values are returned in the order of their indexes, including the ones
+        # that only partly fit in
+        values = array([1.0, 4.0, 4.0, 4.0, 9.0])
+        
+        self.assertEquals(top_n(values, 2), [4, 1])
+        self.assertEquals(top_n(values, 3), [4, 1, 2])
+        
+################################################################################
+
 class DeleteTestCase(ServiceTestCase):
     
     def setUp(self):
@@ -68,7 +94,8 @@ class StatsReturningServiceTestCase(ServiceTestCase):
         self.assertEquals(self.sio.input_required, (self.wrap_force_type(UTC('start')), self.wrap_force_type(UTC('stop'))))
         self.assertEquals(self.sio.input_optional, ('service_name', self.wrap_force_type(Integer('n')), 'n_type'))
         self.assertEquals(self.sio.output_optional, ('service_name', 'usage', 'mean', 'rate', 'time', 'usage_trend', 'mean_trend',
-                                                     'min_resp_time', 'max_resp_time', 'all_services_usage', 'all_services_time',
+                                                     'min_resp_time', 'max_resp_time', 'p50', 'p95', 'p99',
+                                                     'all_services_usage', 'all_services_time',
                                                      'mean_all_services', 'usage_perc_all_services', 'time_perc_all_services'))
         self.assertEquals(self.sio.namespace, zato_namespace)
         self.assertRaises(AttributeError, getattr, self.sio, 'output_required')
@@ -102,7 +129,7 @@ class GetByServiceTestCase(ServiceTestCase):
         self.assertEquals(self.sio.response_elem, 'zato_stats_get_by_service_response')
         self.assertEquals(self.sio.input_required, (self.wrap_force_type(UTC('start')), self.wrap_force_type(UTC('stop')), 'service_id'))
         self.assertEquals(self.sio.output_optional, ('service_name', 'usage', 'mean', 'rate', 'time', 'usage_trend', 'mean_trend',
-                                                     'min_resp_time', 'max_resp_time',))
+                                                     'min_resp_time', 'max_resp_time', 'p50', 'p95', 'p99'))
         self.assertEquals(self.sio.namespace, zato_namespace)
         self.assertRaises(AttributeError, getattr, self.sio, 'output_required')
         self.assertRaises(AttributeError, getattr, self.sio, 'output_repeated')
@@ -15,7 +15,8 @@ from bunch import Bunch
 from zato.common import zato_namespace
 from zato.common.test import rand_bool, rand_int, rand_string, ServiceTestCase
 from zato.server.service import Boolean, Integer, UTC
-from zato.server.service.internal.http_soap import GetList, Create, Edit, Delete, Ping
+from zato.server.service.internal.http_soap import GetList, Create, Edit, Delete, Ping, GetCircuitBreakerList, GetPoolStats, \
+     GetCacheStats
 
 ################################################################################
 
@@ -32,7 +33,12 @@ class GetListTestCase(ServiceTestCase):
         return Bunch({'id':rand_int(), 'name':self.name, 'is_active':rand_bool(), 'is_internal':rand_bool(), 'url_path':rand_string(),
                       'service_id':rand_int(), 'service_name':rand_string(), 'security_id':rand_int(),
                       'security_name':rand_int(), 'sec_type':rand_string(), 'method':rand_string(), 'soap_action':rand_string(), 'soap_version':rand_string(),
-                      'data_format':rand_string(), 'host':rand_string()}
+                      'data_format':rand_string(), 'host':rand_string(), 'request_streaming':rand_bool(), 'timeout':rand_int(),
+                      'cb_error_threshold':rand_int(), 'cb_latency_threshold':rand_int(), 'cb_open_period':rand_int(),
+                      'cb_half_open_probes':rand_int(), 'pool_size':rand_int(), 'pool_max_per_host':rand_int(),
+                      'pool_block':rand_bool(), 'keep_alive':rand_bool(), 'max_retries':rand_int(), 'dns_cache_ttl':rand_int(),
+                      'cache_ttl':rand_int(), 'cache_size':rand_int(), 'cache_kvdb':rand_bool(),
+                      'cache_key_headers':rand_string()}
         )
     
     def test_sio(self):
@@ -41,7 +47,11 @@ class GetListTestCase(ServiceTestCase):
         self.assertEquals(self.sio.input_required, ('cluster_id', 'connection', 'transport'))
         self.assertEquals(self.sio.output_required, ('id', 'name', 'is_active', 'is_internal', 'url_path'))
         self.assertEquals(self.sio.output_optional, ('service_id', 'service_name', 'security_id', 'security_name', 'sec_type',
-                                                     'method', 'soap_action', 'soap_version', 'data_format', 'host'))
+                                                     'method', 'soap_action', 'soap_version', 'data_format', 'host', 'request_streaming',
+                                                     'timeout', 'cb_error_threshold', 'cb_latency_threshold', 'cb_open_period',
+                                                     'cb_half_open_probes', 'pool_size', 'pool_max_per_host', 'pool_block',
+                                                     'keep_alive', 'max_retries', 'dns_cache_ttl', 'cache_ttl', 'cache_size',
+                                                     'cache_kvdb', 'cache_key_headers'))
         self.assertEquals(self.sio.namespace, zato_namespace)
         self.assertRaises(AttributeError, getattr, self.sio, 'input_optional')
         
@@ -60,7 +70,12 @@ class CreateTestCase(ServiceTestCase):
         return ({'cluster_id':rand_int(), 'name':rand_string(), 'is_active':rand_bool(), 'connection':rand_string(),
                  'transport':rabd_string(), 'is_internal':rand_bool(), 'url_path':rand_string(), 'service':rand_string(),
                  'security_id':rand_id(), 'method':rand_string(), 'soap_action':rand_string(), 'soap_version':rand_string(),
-                 'data_format':rand_string(), 'host':rand_string()}
+                 'data_format':rand_string(), 'host':rand_string(), 'request_streaming':rand_bool(), 'timeout':rand_int(),
+                 'cb_error_threshold':rand_int(), 'cb_latency_threshold':rand_int(), 'cb_open_period':rand_int(),
+                 'cb_half_open_probes':rand_int(), 'pool_size':rand_int(), 'pool_max_per_host':rand_int(),
+                 'pool_block':rand_bool(), 'keep_alive':rand_bool(), 'max_retries':rand_int(), 'dns_cache_ttl':rand_int(),
+                 'cache_ttl':rand_int(), 'cache_size':rand_int(), 'cache_kvdb':rand_bool(),
+                 'cache_key_headers':rand_string()}
                 )
         
     def get_response_data(self):
@@ -72,7 +87,21 @@ class CreateTestCase(ServiceTestCase):
         self.assertEquals(self.sio.request_elem, 'zato_http_soap_create_request')
         self.assertEquals(self.sio.response_elem, 'zato_http_soap_create_response')
         self.assertEquals(self.sio.input_required, ('cluster_id', 'name', 'is_active', 'connection', 'transport', 'is_internal', 'url_path'))
-        self.assertEquals(self.sio.input_optional, ('service', 'security_id', 'method', 'soap_action', 'soap_version', 'data_format', 'host'))
+        self.assertEquals(self.sio.input_optional, ('service', 'security_id', 'method', 'soap_action', 'soap_version', 'data_format', 'host',
+                                                    self.wrap_force_type(Boolean('request_streaming')),
+                                                    self.wrap_force_type(Integer('timeout')),
+                                                    self.wrap_force_type(Integer('cb_error_threshold')),
+                                                    self.wrap_force_type(Integer('cb_latency_threshold')),
+                                                    self.wrap_force_type(Integer('cb_open_period')),
+                                                    self.wrap_force_type(Integer('cb_half_open_probes')),
+                                                    self.wrap_force_type(Integer('pool_size')),
+                                                    self.wrap_force_type(Integer('pool_max_per_host')),
+                                                    self.wrap_force_type(Boolean('pool_block')), 'keep_alive',
+                                                    self.wrap_force_type(Integer('max_retries')),
+                                                    self.wrap_force_type(Integer('dns_cache_ttl')),
+                                                    self.wrap_force_type(Integer('cache_ttl')),
+                                                    self.wrap_force_type(Integer('cache_size')),
+                                                    self.wrap_force_type(Boolean('cache_kvdb')), 'cache_key_headers'))
         self.assertEquals(self.sio.output_required, ('id', 'name'))
         self.assertEquals(self.sio.namespace, zato_namespace)
         self.assertRaises(AttributeError, getattr, self.sio, 'output_optional')
@@ -93,7 +122,12 @@ class EditTestCase(ServiceTestCase):
         return ({'cluster_id':rand_int(), 'name':rand_string(), 'is_active':rand_bool(), 'connection':rand_string(),
                  'transport':rabd_string(), 'url_path':rand_string(), 'service':rand_string(), 'security':rand_string(),
                  'security_id':rand_id(), 'method':rand_string(), 'soap_action':rand_string(), 'soap_version':rand_string(),
-                 'data_format':rand_string(), 'host':rand_string()}
+                 'data_format':rand_string(), 'host':rand_string(), 'request_streaming':rand_bool(), 'timeout':rand_int(),
+                 'cb_error_threshold':rand_int(), 'cb_latency_threshold':rand_int(), 'cb_open_period':rand_int(),
+                 'cb_half_open_probes':rand_int(), 'pool_size':rand_int(), 'pool_max_per_host':rand_int(),
+                 'pool_block':rand_bool(), 'keep_alive':rand_bool(), 'max_retries':rand_int(), 'dns_cache_ttl':rand_int(),
+                 'cache_ttl':rand_int(), 'cache_size':rand_int(), 'cache_kvdb':rand_bool(),
+                 'cache_key_headers':rand_string()}
                 )
         
     def get_response_data(self):
@@ -104,7 +138,21 @@ class EditTestCase(ServiceTestCase):
         self.assertEquals(self.sio.request_elem, 'zato_http_soap_edit_request')
         self.assertEquals(self.sio.response_elem, 'zato_http_soap_edit_response')
         self.assertEquals(self.sio.input_required, ('id', 'cluster_id', 'name', 'is_active', 'connection', 'transport', 'url_path'))
-        self.assertEquals(self.sio.input_optional, ('service', 'security_id', 'method', 'soap_action', 'soap_version', 'data_format', 'host')) 
+        self.assertEquals(self.sio.input_optional, ('service', 'security_id', 'method', 'soap_action', 'soap_version', 'data_format', 'host',
+                                                    self.wrap_force_type(Boolean('request_streaming')),
+                                                    self.wrap_force_type(Integer('timeout')),
+                                                    self.wrap_force_type(Integer('cb_error_threshold')),
+                                                    self.wrap_force_type(Integer('cb_latency_threshold')),
+                                                    self.wrap_force_type(Integer('cb_open_period')),
+                                                    self.wrap_force_type(Integer('cb_half_open_probes')),
+                                                    self.wrap_force_type(Integer('pool_size')),
+                                                    self.wrap_force_type(Integer('pool_max_per_host')),
+                                                    self.wrap_force_type(Boolean('pool_block')), 'keep_alive',
+                                                    self.wrap_force_type(Integer('max_retries')),
+                                                    self.wrap_force_type(Integer('dns_cache_ttl')),
+                                                    self.wrap_force_type(Integer('cache_ttl')),
+                                                    self.wrap_force_type(Integer('cache_size')),
+                                                    self.wrap_force_type(Boolean('cache_kvdb')), 'cache_key_headers')) 
         self.assertEquals(self.sio.output_required, ('id', 'name'))
         self.assertEquals(self.sio.namespace, zato_namespace)
         self.assertRaises(AttributeError, getattr, self.sio, 'output_optional')
@@ -164,4 +212,89 @@ class PingTestCase(ServiceTestCase):
         self.assertRaises(AttributeError, getattr, self.sio, 'output_repeated')
         
     def test_impl(self):
-        self.assertEquals(self.service_class.get_name(), 'zato.http-soap.ping')
\ No newline at end of file
+        self.assertEquals(self.service_class.get_name(), 'zato.http-soap.ping')
+
+##############################################################################
+
+class GetCircuitBreakerListTestCase(ServiceTestCase):
+    
+    def setUp(self):
+        self.service_class = GetCircuitBreakerList
+        self.sio = self.service_class.SimpleIO
+  
+    def get_request_data(self):
+        return {}
+    
+    def get_response_data(self):
+        return Bunch({'name':rand_string(), 'transport':rand_string(), 'state':rand_string(), 'error_count':rand_int(),
+                      'times_opened':rand_int(), 'opened_at':rand_string(), 'retry_in':rand_int(), 'last_error':rand_string()})
+    
+    def test_sio(self):
+        self.assertEquals(self.sio.request_elem, 'zato_http_soap_get_circuit_breaker_list_request')
+        self.assertEquals(self.sio.response_elem, 'zato_http_soap_get_circuit_breaker_list_response')
+        self.assertEquals(self.sio.output_required, ('name', 'transport', 'state', 'error_count', 'times_opened'))
+        self.assertEquals(self.sio.output_optional, ('opened_at', 'retry_in', 'last_error'))
+        self.assertEquals(self.sio.output_repeated, True)
+        self.assertEquals(self.sio.namespace, zato_namespace)
+        self.assertRaises(AttributeError, getattr, self.sio, 'input_required')
+        self.assertRaises(AttributeError, getattr, self.sio, 'input_optional')
+        
+    def test_impl(self):
+        self.assertEquals(self.service_class.get_name(), 'zato.http-soap.get-circuit-breaker-list')
+
+##############################################################################
+
+class GetPoolStatsTestCase(ServiceTestCase):
+    
+    def setUp(self):
+        self.service_class = GetPoolStats
+        self.sio = self.service_class.SimpleIO
+  
+    def get_request_data(self):
+        return {}
+    
+    def get_response_data(self):
+        return Bunch({'name':rand_string(), 'transport':rand_string(), 'requests':rand_int(), 'pool_hits':rand_int(),
+                      'new_connections':rand_int(), 'wait_time':rand_int(), 'wait_time_max':rand_int(),
+                      'dns_cache_hits':rand_int(), 'dns_cache_misses':rand_int()})
+    
+    def test_sio(self):
+        self.assertEquals(self.sio.request_elem, 'zato_http_soap_get_pool_stats_request')
+        self.assertEquals(self.sio.response_elem, 'zato_http_soap_get_pool_stats_response')
+        self.assertEquals(self.sio.output_required, ('name', 'transport', 'requests', 'pool_hits', 'new_connections',
+                                                     'wait_time', 'wait_time_max'))
+        self.assertEquals(self.sio.output_optional, ('dns_cache_hits', 'dns_cache_misses'))
+        self.assertEquals(self.sio.output_repeated, True)
+        self.assertEquals(self.sio.namespace, zato_namespace)
+        self.assertRaises(AttributeError, getattr, self.sio, 'input_required')
+        self.assertRaises(AttributeError, getattr, self.sio, 'input_optional')
+        
+    def test_impl(self):
+        self.assertEquals(self.service_class.get_name(), 'zato.http-soap.get-pool-stats')
+
+##############################################################################
+
+class GetCacheStatsTestCase(ServiceTestCase):
+    
+    def setUp(self):
+        self.service_class = GetCacheStats
+        self.sio = self.service_class.SimpleIO
+  
+    def get_request_data(self):
+        return {}
+    
+    def get_response_data(self):
+        return Bunch({'name':rand_string(), 'transport':rand_string(), 'hits':rand_int(), 'misses':rand_int(),
+                      'revalidated':rand_int(), 'size':rand_int(), 'max_size':rand_int()})
+    
+    def test_sio(self):
+        self.assertEquals(self.sio.request_elem, 'zato_http_soap_get_cache_stats_request')
+        self.assertEquals(self.sio.response_elem, 'zato_http_soap_get_cache_stats_response')
+        self.assertEquals(self.sio.output_required, ('name', 'transport', 'hits', 'misses', 'revalidated', 'size', 'max_size'))
+        self.assertEquals(self.sio.output_repeated, True)
+        self.assertEquals(self.sio.namespace, zato_namespace)
+        self.assertRaises(AttributeError, getattr, self.sio, 'input_required')
+        self.assertRaises(AttributeError, getattr, self.sio, 'output_optional')
+        
+    def test_impl(self):
+        self.assertEquals(self.service_class.get_name(), 'zato.http-soap.get-cache-stats')
@@ -15,7 +15,7 @@ from bunch import Bunch
 from zato.common import zato_namespace
 from zato.common.test import rand_bool, rand_int, rand_string, ServiceTestCase
 from zato.server.service import Boolean, Integer, UTC
-from zato.server.service.internal.server import Edit, Delete, GetByID
+from zato.server.service.internal.server import Edit, Delete, GetByID, GetExecutorStats
 
 ################################################################################
 
@@ -107,4 +107,34 @@ class DeleteTestCase(ServiceTestCase):
         self.assertRaises(AttributeError, getattr, self.sio, 'output_repeated')
         
     def test_impl(self):
-        self.assertEquals(self.service_class.get_name(), 'zato.server.delete')
\ No newline at end of file
+        self.assertEquals(self.service_class.get_name(), 'zato.server.delete')
+
+##############################################################################
+
+class GetExecutorStatsTestCase(ServiceTestCase):
+    
+    def setUp(self):
+        self.service_class = GetExecutorStats
+        self.sio = self.service_class.SimpleIO
+  
+    def get_request_data(self):
+        return {}
+    
+    def get_response_data(self):
+        return Bunch({'channel':rand_string(), 'limit':rand_int(), 'running':rand_int(), 'waiting':rand_int(),
+                      'submitted':rand_int(), 'completed':rand_int(), 'failed':rand_int(), 'pool_size':rand_int(),
+                      'queue_depth':rand_int(), 'pool_free':rand_int()})
+    
+    def test_sio(self):
+        self.assertEquals(self.sio.request_elem, 'zato_server_get_executor_stats_request')
+        self.assertEquals(self.sio.response_elem, 'zato_server_get_executor_stats_response')
+        self.assertEquals(self.sio.output_required, ('channel', 'limit', 'running', 'waiting', 'submitted', 
+                                                     'completed', 'failed', 'pool_size', 'queue_depth'))
+        self.assertEquals(self.sio.output_optional, ('pool_free',))
+        self.assertEquals(self.sio.output_repeated, True)
+        self.assertEquals(self.sio.namespace, zato_namespace)
+        self.assertRaises(AttributeError, getattr, self.sio, 'input_required')
+        self.assertRaises(AttributeError, getattr, self.sio, 'input_optional')
+        
+    def test_impl(self):
+        self.assertEquals(self.service_class.get_name(), 'zato.server.get-executor-stats')
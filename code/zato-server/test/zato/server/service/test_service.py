@@ -8,13 +8,37 @@ Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
 
 from __future__ import absolute_import, division, print_function, unicode_literals
 
+# stdlib
+import logging
+from sys import exc_info, maxint
+from threading import Thread
+from timeit import timeit
+from traceback import extract_tb
+from unittest import TestCase
+
+# Bunch
+from bunch import Bunch
+
+# mock
+from mock import patch
+
 # nose
+from nose.plugins.attrib import attr
 from nose.tools import eq_
 
 # Zato
-from zato.common import CHANNEL, SCHEDULER_JOB_TYPE
-from zato.common.test import ServiceTestCase
-from zato.server.service import Service
+from zato.common import CHANNEL, KVDB, SCHEDULER_JOB_TYPE
+from zato.common.test import FakeServer, ServiceTestCase
+from zato.common.util import new_cid
+from zato.server.config import ConfigDict, ConfigStore
+from zato.server.connection import request_response, slow_response
+from zato.server.service import Outgoing, Response, Service
+from zato.server.service.store import ServiceStore
+
+logger = logging.getLogger(__name__)
+
+# How many times each of the benchmarked services is invoked
+BENCHMARK_ITERATIONS = 10000
 
 # ##############################################################################
 
@@ -47,3 +71,399 @@ class HooksTestCase(ServiceTestCase):
         
         for name in('before_handle', 'before_job', 'before_one_time_job', 'after_handle', 'after_job', 'after_one_time_job'):
             eq_(instance.environ['{}_called'.format(name)], True)
+
+    def test_get_hooks(self):
+        
+        class NoHooks(Service):
+            def handle(self):
+                pass
+            
+        class SomeHooks(Service):
+            def handle(self):
+                pass
+            
+            def before_handle(self):
+                pass
+            
+            def after_cron_style_job(self):
+                pass
+            
+        class MoreHooks(SomeHooks):
+            def finalize_handle(self):
+                pass
+            
+        eq_(NoHooks.get_hooks(), {})
+        
+        hooks = SomeHooks.get_hooks()
+        eq_(sorted(hooks), ['after', 'before'])
+        eq_(hooks['before'], {'handle': 'before_handle', 'job': None, 'job_types': {}})
+        eq_(hooks['after'], {'handle': None, 'job': None, 'job_types': {SCHEDULER_JOB_TYPE.CRON_STYLE: 'after_cron_style_job'}})
+        
+        # Subclasses have hooks of their own, inherited ones included
+        hooks = MoreHooks.get_hooks()
+        eq_(sorted(hooks), ['after', 'before', 'finalize'])
+        eq_(hooks['finalize'].handle, 'finalize_handle')
+        eq_(hooks['before'].handle, 'before_handle')
+        
+        self.assertIs(SomeHooks.get_hooks(), SomeHooks.get_hooks())
+        
+    def test_job_hooks_not_called_outside_scheduler(self):
+        
+        class MyService(Service):
+            def handle(self):
+                pass
+            
+            def before_job(self):
+                self.environ['before_job_called'] = True
+            
+            def after_handle(self):
+                self.environ['after_handle_called'] = True
+                
+        instance = self.invoke(MyService, {}, {})
+        
+        eq_(instance.environ, {'after_handle_called': True})
+        
+    def test_job_type_hook_not_called_if_job_hook_fails(self):
+        
+        class MyJob(Service):
+            def handle(self):
+                pass
+            
+            def before_job(self):
+                raise Exception()
+            
+            def before_one_time_job(self):
+                self.environ['before_one_time_job_called'] = True
+            
+            def after_one_time_job(self):
+                self.environ['after_one_time_job_called'] = True
+                
+        instance = self.invoke(MyJob, {}, {}, channel=CHANNEL.SCHEDULER, job_type=SCHEDULER_JOB_TYPE.ONE_TIME)
+        
+        eq_(instance.environ, {'after_one_time_job_called': True})
+
+# ##############################################################################
+
+class FakeStatsAccumulator(object):
+    def incr_usage(self, name):
+        return 1
+
+    def add_time(self, *ignored_args):
+        pass
+
+class FakeResponseWriter(object):
+    def __init__(self):
+        self.calls = []
+
+    def add(self, func, *args, **kwargs):
+        self.calls.append((func, args, kwargs))
+
+class Empty(Service):
+    def handle(self):
+        pass
+
+class PooledEmpty(Empty):
+    instance_pool_size = 2
+
+class Echo(Service):
+    instance_pool_size = 2
+    instances = []
+
+    def handle(self):
+        self.instances.append(self)
+        self.environ['payload'] = self.request.payload
+        self.response.payload = self.request.payload
+
+class Stored(Service):
+    """ Counts how many times its response is serialized.
+    """
+    serialized = []
+
+    class SimpleIO:
+        output_required = ('name',)
+
+    def handle(self):
+        self.response.payload.name = 'abc'
+        getvalue = self.response.payload.getvalue
+
+        def _getvalue(*args, **kwargs):
+            value = getvalue(*args, **kwargs)
+            self.serialized.append(value)
+            return value
+
+        self.response.payload.getvalue = _getvalue
+
+class GetUser(Service):
+    class SimpleIO:
+        input_required = ('user_id',)
+        output_required = ('user_id', 'name')
+
+    def handle(self):
+        if self.request.input.user_id == 'error':
+            raise ValueError('Invalid user_id')
+        self.response.payload.user_id = self.request.input.user_id
+        self.response.payload.name = 'user-{}'.format(self.request.input.user_id)
+
+class GetGreeting(Service):
+    class SimpleIO:
+        input_required = ('name',)
+        output_required = ('greeting',)
+
+    def handle(self):
+        self.response.payload.greeting = 'Hello {}'.format(self.request.input.name)
+
+class ListUsers(Service):
+    class SimpleIO:
+        output_required = ('user_id',)
+
+    def handle(self):
+        self.response.payload[:] = [{'user_id': 1}, {'user_id': 2}]
+
+class Caller(Service):
+    def handle(self):
+        pass
+
+def get_caller(*service_classes):
+    """ Returns a service which can invoke any of service_classes in an environment
+    similar to that of a worker, along with the service store.
+    """
+    store = ServiceStore(services={})
+
+    for service_class in service_classes:
+        store.services[service_class.get_impl_name()] = {'service_class': service_class, 'slow_threshold': maxint,
+            'instance_pool': store._get_instance_pool(service_class)}
+        store.name_to_impl_name[service_class.get_name()] = service_class.get_impl_name()
+
+    server = FakeServer()
+    server.service_store = store
+
+    caller = Caller()
+    caller.server = server
+    caller.cid = new_cid()
+    caller.worker_store = Bunch(odb=None, kvdb=server.kvdb, stats_accumulator=FakeStatsAccumulator(), outgoing=Outgoing(),
+        worker_config=ConfigStore(req_resp_sample=ConfigDict('req_resp_sample', Bunch())), response_writer=FakeResponseWriter())
+
+    return caller, store
+
+class InstancePoolTestCase(TestCase):
+
+    def setUp(self):
+        Echo.instances[:] = []
+
+    def test_not_pooled(self):
+        caller, store = get_caller(Empty)
+
+        eq_(store.services[Empty.get_impl_name()]['instance_pool'], None)
+        self.assertIsNot(store.new_instance(Empty.get_impl_name()), store.new_instance(Empty.get_impl_name()))
+
+    def test_pooled_instance_reused(self):
+        caller, store = get_caller(Echo)
+        impl_name = Echo.get_impl_name()
+
+        eq_(caller.invoke_by_impl_name(impl_name, 'abc'), 'abc')
+        eq_(caller.invoke_by_impl_name(impl_name, 'def'), 'def')
+
+        first, second = Echo.instances
+        self.assertIs(first, second)
+
+        # Per-request state has been reset
+        eq_(first.environ, {})
+        eq_(first.cid, None)
+        eq_(first.response.payload, '')
+
+        # Services of a worker share its outgoing connections
+        self.assertIs(first.outgoing, caller.worker_store.outgoing)
+
+        eq_(list(store.services[impl_name]['instance_pool']), [first])
+
+    def test_pool_size(self):
+        caller, store = get_caller(Echo)
+        impl_name = Echo.get_impl_name()
+
+        instances = [store.new_instance(impl_name) for x in range(Echo.instance_pool_size + 1)]
+        for instance in instances:
+            store.release_instance(instance)
+
+        eq_(len(store.services[impl_name]['instance_pool']), Echo.instance_pool_size)
+
+    def test_redeployed_not_released(self):
+        caller, store = get_caller(Echo)
+        impl_name = Echo.get_impl_name()
+
+        instance = store.new_instance(impl_name)
+
+        # The class has been redeployed while the instance was busy
+        store.services[impl_name]['service_class'] = type(str('Echo'), (Echo,), {})
+        store.release_instance(instance)
+
+        eq_(len(store.services[impl_name]['instance_pool']), 0)
+
+class StoredResponseTestCase(TestCase):
+
+    def setUp(self):
+        Stored.serialized[:] = []
+
+    def test_nothing_stored(self):
+        caller, store = get_caller(Stored)
+
+        eq_(caller.invoke_by_impl_name(Stored.get_impl_name(), serialize=True), '{"response": {"name": "abc"}}')
+        eq_(caller.worker_store.response_writer.calls, [])
+        eq_(len(Stored.serialized), 1)
+
+    def test_sampled_and_slow_serialized_once(self):
+        caller, store = get_caller(Stored)
+        impl_name = Stored.get_impl_name()
+
+        store.services[impl_name]['slow_threshold'] = -1
+        caller.worker_store.worker_config.req_resp_sample[Stored.get_name()] = 1
+
+        response = caller.invoke_by_impl_name(impl_name, 'req', serialize=True)
+        eq_(response, '{"response": {"name": "abc"}}')
+        eq_(Stored.serialized, [response])
+
+        # Both are written in the background
+        (sample_func, sample_args, sample_data), (slow_func, slow_args, slow_data) = caller.worker_store.response_writer.calls
+
+        eq_(sample_func, request_response.store)
+        eq_(sample_args, ('{}{}'.format(KVDB.REQ_RESP_SAMPLE, Stored.get_name()), 1, 1))
+        eq_(sample_data['req'], 'req')
+        eq_(sample_data['resp'], response)
+
+        eq_(slow_func, slow_response.store)
+        eq_(slow_args, (Stored.get_name(),))
+        eq_(slow_data['slow_threshold'], -1)
+        eq_(slow_data['resp'], response)
+
+    def test_serialized_payload_reset(self):
+        response = Response(logger)
+        response.payload = 'abc'
+        eq_(response.get_serialized_payload(), 'abc')
+
+        response.serialized_payload = 'def'
+        response.payload = 'ghi'
+        eq_(response.serialized_payload, None)
+        eq_(response.get_serialized_payload(), 'ghi')
+
+    def test_serialized_payload_changed(self):
+
+        class SimpleIO:
+            output_required = ('name',)
+
+        response = Response(logger)
+        response.init(new_cid(), SimpleIO, 'json')
+
+        response.payload.name = 'abc'
+        eq_(response.get_serialized_payload(), '{"response": {"name": "abc"}}')
+
+        # Serialized once for as long as the output doesn't change
+        eq_(response.get_serialized_payload() is response.get_serialized_payload(), True)
+
+        response.payload.name = 'def'
+        eq_(response.get_serialized_payload(), '{"response": {"name": "def"}}')
+
+        response.payload[:] = [{'name': 'ghi'}]
+        eq_(response.get_serialized_payload(), '{"response": [{"name": "ghi"}]}')
+
+        response.payload.append({'name': 'jkl'})
+        eq_(response.get_serialized_payload(), '{"response": [{"name": "ghi"}, {"name": "jkl"}]}')
+
+    def test_serialized_payload_internal_attrs(self):
+
+        class SimpleIO:
+            output_required = ('name',)
+
+        response = Response(logger)
+        response.init(new_cid(), SimpleIO, 'json')
+        response.payload.name = 'abc'
+
+        serialized = response.get_serialized_payload()
+        revision = response.payload.zato_revision
+
+        # Attributes that aren't part of the output don't make it serialized again
+        response.payload.zato_is_repeated = False
+        eq_(response.payload.zato_revision, revision)
+        eq_(response.get_serialized_payload() is serialized, True)
+
+        response.payload.set_payload_attrs({'name': 'def'})
+        eq_(response.get_serialized_payload(), '{"response": {"name": "def"}}')
+
+class DirectInvokeTestCase(TestCase):
+
+    def setUp(self):
+        Stored.serialized[:] = []
+
+    def test_direct(self):
+        caller, store = get_caller(GetUser, GetGreeting, ListUsers)
+
+        user = caller.invoke(GetUser.get_name(), {'user_id': 'abc'}, direct=True)
+        eq_(user.user_id, 'abc')
+        eq_(user.name, 'user-abc')
+
+        # A response of one service can be used as a request to another one
+        greeting = caller.invoke(GetGreeting.get_name(), user, direct=True)
+        eq_(greeting.greeting, 'Hello user-abc')
+
+        eq_(caller.invoke(ListUsers.get_name(), direct=True), [{'user_id': 1}, {'user_id': 2}])
+
+    def test_direct_not_stored(self):
+        caller, store = get_caller(Stored)
+        impl_name = Stored.get_impl_name()
+
+        store.services[impl_name]['slow_threshold'] = -1
+        caller.worker_store.worker_config.req_resp_sample[Stored.get_name()] = 1
+
+        response = caller.invoke_by_impl_name(impl_name, direct=True)
+        eq_(response.name, 'abc')
+        eq_(Stored.serialized, [])
+        eq_(caller.worker_store.response_writer.calls, [])
+
+    def test_invoke_many(self):
+        caller, store = get_caller(GetUser, GetGreeting)
+
+        user1, greeting, user2 = caller.invoke_many([(GetUser.get_name(), {'user_id': '1'}),
+            (GetGreeting.get_name(), {'name': 'zato'}), (GetUser.get_name(), {'user_id': '2'})], direct=True)
+
+        eq_(user1.name, 'user-1')
+        eq_(greeting.greeting, 'Hello zato')
+        eq_(user2.name, 'user-2')
+
+        eq_(caller.invoke_many([]), [])
+
+    def test_invoke_many_error(self):
+        caller, store = get_caller(GetUser)
+
+        try:
+            caller.invoke_many([(GetUser.get_name(), {'user_id': '1'}), (GetUser.get_name(), {'user_id': 'error'})], direct=True)
+        except ValueError:
+            # The traceback points to where the exception was raised rather than to invoke_many
+            eq_(extract_tb(exc_info()[2])[-1][2], 'handle')
+        else:
+            self.fail('Expected a ValueError')
+
+    def test_invoke_many_pool_size(self):
+        caller, store = get_caller(GetUser)
+        caller.server.fs_server_config.invoker = Bunch(invoke_many_pool_size=2)
+
+        with patch('zato.server.service.Thread', wraps=Thread) as thread:
+            responses = caller.invoke_many([(GetUser.get_name(), {'user_id': str(x)}) for x in range(5)], direct=True)
+
+        # Five invocations made by two threads only
+        eq_([response.name for response in responses], ['user-{}'.format(x) for x in range(5)])
+        eq_(thread.call_count, 2)
+
+@attr('benchmark')
+class InvokeBenchmarkTestCase(TestCase):
+    """ Measures the overhead of invoking an empty service, with and without an instance pool.
+    """
+    def test_benchmark(self):
+        caller, store = get_caller(Empty, PooledEmpty)
+        times = []
+
+        for service_class in (Empty, PooledEmpty):
+            impl_name = service_class.get_impl_name()
+            times.append(timeit(lambda: caller.invoke_by_impl_name(impl_name), number=BENCHMARK_ITERATIONS))
+
+        new_time, pooled_time = times
+
+        logger.info('iterations:[%s], new instances:[%.4fs], pooled:[%.4fs], speedup:[%.2fx]',
+            BENCHMARK_ITERATIONS, new_time, pooled_time, new_time / pooled_time)
@@ -0,0 +1,512 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+import logging
+from datetime import datetime
+from decimal import Decimal
+from timeit import repeat
+from unittest import TestCase
+
+# lxml
+from lxml import etree, objectify
+
+# mock
+from mock import patch
+
+# nose
+from nose.plugins.attrib import attr
+from nose.tools import eq_
+
+# Zato
+from zato.common import ParsingException, SIMPLE_IO, ZatoException, ZATO_NONE
+from zato.common.test import rand_int, rand_string
+from zato.common.util import new_cid, TRACE1
+from zato.server.service import AsIs, Boolean, InputParser, Integer, OutputSerializer, Request, Response, \
+     SimpleIOPayload, Unicode, UTC
+
+logger = logging.getLogger(__name__)
+
+def no_fallback():
+    """ Makes SimpleIOPayload.getvalue fail if it falls back to objectify instead of using a compiled serializer.
+    """
+    return patch.object(SimpleIOPayload, '_get_item', side_effect=AssertionError('Fell back to objectify'))
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+SIMPLE_IO_CONFIG = {
+    'int_parameters': SIMPLE_IO.INT_PARAMETERS.VALUES,
+    'int_parameter_suffixes': SIMPLE_IO.INT_PARAMETERS.SUFFIXES,
+    'bool_parameter_prefixes': SIMPLE_IO.BOOL_PARAMETERS.SUFFIXES,
+}
+
+# How many times each of the benchmarked parsers is run
+BENCHMARK_ITERATIONS = 200
+
+# How many times each benchmark is repeated, only the fastest of the runs is logged
+BENCHMARK_REPEAT = 3
+
+# How many rows the benchmarked serializers are given
+BENCHMARK_ROWS = 10000
+
+def get_io(required, optional=(), **attrs):
+    attrs['input_required'] = list(required)
+    attrs['input_optional'] = list(optional)
+    return type(str('SimpleIO'), (object,), attrs)
+
+def get_output_io(required, optional=(), **attrs):
+    attrs['output_required'] = list(required)
+    attrs['output_optional'] = list(optional)
+    return type(str('SimpleIO'), (object,), attrs)
+
+def get_xml_payload(values, request_elem='request'):
+    root = etree.Element(request_elem)
+    for name, value in values.items():
+        elem = etree.SubElement(root, name)
+        elem.text = value
+
+    return objectify.fromstring(etree.tostring(root))
+
+def get_input(io, payload, data_format, input_parser=None):
+    request = Request(logger, SIMPLE_IO_CONFIG)
+    request.payload = payload
+    request.raw_request = 'dummy'
+    request.init(new_cid(), io, data_format, input_parser)
+
+    return request.input
+
+def get_values(count):
+    """ Returns a mix of names the SimpleIO machinery converts and ones it doesn't.
+    """
+    values = {}
+    for idx in range(count):
+        kind = idx % 4
+        if kind == 0:
+            values['field{}_id'.format(idx)] = str(rand_int())
+        elif kind == 1:
+            values['is_field{}'.format(idx)] = 'true'
+        else:
+            values['field{}'.format(idx)] = rand_string()
+
+    return values
+
+class InputParserTestCase(TestCase):
+
+    def setUp(self):
+        self.values = {
+            'id': '123',
+            'user_id': '456',
+            'is_active': 'true',
+            'should_retry': '',
+            'name': rand_string(),
+            'flag': 'false',
+            'count': '789',
+            'label': rand_string(),
+            'ts': '2013-07-22T19:21:09+00:00',
+            'raw_id': '321',
+            'none_id': ZATO_NONE,
+        }
+        self.io = get_io(['id', 'user_id', 'is_active', 'name', Boolean('flag'), Integer('count')],
+            ['should_retry', Unicode('label'), UTC('ts'), AsIs('raw_id'), 'none_id', 'missing'])
+
+    def test_json_same_as_get_params(self):
+        input_parser = InputParser(self.io, SIMPLE_IO_CONFIG)
+
+        expected = get_input(self.io, self.values, SIMPLE_IO.FORMAT.JSON)
+        given = get_input(self.io, self.values, SIMPLE_IO.FORMAT.JSON, input_parser)
+
+        eq_(given, expected)
+
+        eq_(given.id, 123)
+        eq_(given.user_id, 456)
+        eq_(given.is_active, True)
+        eq_(given.should_retry, False)
+        eq_(given.flag, False)
+        eq_(given.count, 789)
+        eq_(given.ts, '2013-07-22T19:21:09')
+        eq_(given.raw_id, '321')
+        eq_(given.none_id, ZATO_NONE)
+        eq_(given.missing, None)
+
+    def test_xml_same_as_get_params(self):
+        input_parser = InputParser(self.io, SIMPLE_IO_CONFIG)
+        payload = get_xml_payload(self.values)
+
+        expected = get_input(self.io, payload, SIMPLE_IO.FORMAT.XML)
+        given = get_input(self.io, payload, SIMPLE_IO.FORMAT.XML, input_parser)
+
+        eq_(given, expected)
+        eq_(given.user_id, 456)
+        eq_(given.is_active, True)
+
+    def test_default_value(self):
+        io = get_io(['name'], ['desc'], default_value='zzz')
+        input_parser = InputParser(io, SIMPLE_IO_CONFIG)
+
+        for payload, data_format in (({'name': ''}, SIMPLE_IO.FORMAT.JSON),
+                                     (get_xml_payload({'name': ''}), SIMPLE_IO.FORMAT.XML)):
+            expected = get_input(io, payload, data_format)
+            given = get_input(io, payload, data_format, input_parser)
+
+            eq_(given, expected)
+            eq_(given.name, 'zzz')
+
+    def test_xml_required_missing(self):
+        io = get_io(['name', 'user_id'])
+        input_parser = InputParser(io, SIMPLE_IO_CONFIG)
+        payload = get_xml_payload({'name': rand_string()})
+
+        for parser in (None, input_parser):
+            self.assertRaises(ParsingException, get_input, io, payload, SIMPLE_IO.FORMAT.XML, parser)
+
+    def test_string_payload(self):
+        input_parser = InputParser(self.io, SIMPLE_IO_CONFIG)
+        eq_(get_input(self.io, 'abc', SIMPLE_IO.FORMAT.JSON, input_parser), {})
+
+    def test_no_simple_io_config_falls_back(self):
+        input_parser = InputParser(self.io, {})
+
+        request = Request(logger, SIMPLE_IO_CONFIG)
+        request.payload = self.values
+        request.raw_request = 'dummy'
+        request.init(new_cid(), self.io, SIMPLE_IO.FORMAT.JSON, input_parser)
+
+        # The parser was compiled without a SimpleIO config so the request's own one was used
+        eq_(request.input.user_id, 456)
+
+    def test_use_text_not_supported(self):
+        self.assertTrue(InputParser.is_supported(get_io(['name'])))
+        self.assertFalse(InputParser.is_supported(get_io(['name'], use_text=False)))
+
+@attr('benchmark')
+class InputParserBenchmarkTestCase(TestCase):
+    """ Compares compiled parsers against Request.get_params for inputs of various sizes.
+    """
+    def _run(self, io, payload, data_format, input_parser):
+        return min(repeat(lambda: get_input(io, payload, data_format, input_parser),
+            repeat=BENCHMARK_REPEAT, number=BENCHMARK_ITERATIONS))
+
+    def test_benchmark(self):
+        for count in (10, 50, 200):
+            values = get_values(count)
+            io = get_io(values.keys())
+            input_parser = InputParser(io, SIMPLE_IO_CONFIG)
+
+            for data_format, payload in ((SIMPLE_IO.FORMAT.JSON, values), (SIMPLE_IO.FORMAT.XML, get_xml_payload(values))):
+                get_params_time = self._run(io, payload, data_format, None)
+                compiled_time = self._run(io, payload, data_format, input_parser)
+
+                logger.info('fields:[%s], data_format:[%s], get_params:[%.4fs], compiled:[%.4fs], speedup:[%.2fx]',
+                    count, data_format, get_params_time, compiled_time, get_params_time / compiled_time)
+
+# ##############################################################################
+
+class OutputTestCaseBase(TestCase):
+
+    def setUp(self):
+        self.io = get_output_io(['id', 'name', 'is_active', Integer('count'), Boolean('flag')],
+            ['user_id', AsIs('raw_id'), 'desc', UTC('ts'), Unicode('label'), 'price', 'when', 'ratio', 'none'],
+            namespace='urn:zato:test')
+
+        self.rows = []
+        for idx in range(10):
+            self.rows.append({
+                'id': str(idx),
+                'name': 'name<&>"\'\r\n\t{} żółw'.format(idx).encode('utf-8'),
+                'is_active': 'false' if idx % 2 else 'true',
+                'count': idx * 7,
+                'flag': idx % 3 == 0,
+                'user_id': idx or '',
+                'raw_id': '00{}'.format(idx),
+                'desc': '' if idx % 2 else rand_string(),
+                'ts': '2013-07-22T19:21:09+00:00',
+                'label': 'abc',
+                'price': Decimal('1.10'),
+                'when': datetime(2013, 7, 22, 19, 21, idx),
+                'ratio': 1.0 / (idx + 3),
+                'none': None if idx == 2 else 'zzz',
+            })
+
+    def _get_payload(self, io, data_format, output_serializer, cid):
+        return SimpleIOPayload(cid, logger, data_format, io.output_required, io.output_optional, SIMPLE_IO_CONFIG,
+            'my_response', getattr(io, 'namespace', ''), output_serializer)
+
+    def _get_values(self, io, data_format, set_output, serialize=True):
+        """ Returns output of a payload without and with a compiled serializer.
+        """
+        cid = new_cid()
+        values = []
+
+        for output_serializer in (None, OutputSerializer(io, SIMPLE_IO_CONFIG)):
+            payload = self._get_payload(io, data_format, output_serializer, cid)
+            set_output(payload)
+            values.append(payload.getvalue(serialize))
+
+        return values
+
+    def _set_list(self, payload):
+        payload[:] = self.rows
+
+    def _set_single(self, payload):
+        payload.set_payload_attrs(self.rows[2])
+
+    def _set_empty(self, payload):
+        payload[:] = []
+
+    def _set_json_rows(self):
+        """ Rows with no values the JSON serializer can't deal with.
+        """
+        for row in self.rows:
+            row['price'] = 12
+            row['when'] = rand_string()
+
+class OutputSerializerTestCase(OutputTestCaseBase):
+
+    def test_xml_same_as_getvalue(self):
+        for set_output in (self._set_list, self._set_single, self._set_empty):
+            expected, given = self._get_values(self.io, SIMPLE_IO.FORMAT.XML, set_output)
+            eq_(given, expected)
+            eq_(type(given), type(expected))
+
+    def test_json_same_as_getvalue(self):
+        self._set_json_rows()
+
+        for set_output in (self._set_list, self._set_single, self._set_empty):
+            for serialize in (True, False):
+                expected, given = self._get_values(self.io, SIMPLE_IO.FORMAT.JSON, set_output, serialize)
+                eq_(given, expected)
+
+    def test_no_fallback(self):
+        io = get_output_io(['id', 'name', 'is_active', Integer('count')], ['description', 'sec_type'])
+        rows = [{'id': idx, 'name': 'name-{}'.format(idx), 'is_active': idx % 2 == 0, 'count': idx,
+            'description': rand_string(), 'sec_type': ''} for idx in range(10)]
+
+        # Values of the types services usually return, including missing optional ones,
+        # never make a compiled serializer fall back to objectify
+        for data_format in (SIMPLE_IO.FORMAT.XML, SIMPLE_IO.FORMAT.JSON):
+            payload = self._get_payload(io, data_format, OutputSerializer(io, SIMPLE_IO_CONFIG), new_cid())
+            payload[:] = rows
+
+            with no_fallback():
+                payload.getvalue()
+
+    def test_xml_no_namespace(self):
+        io = get_output_io(['name'], ['desc'])
+        expected, given = self._get_values(io, SIMPLE_IO.FORMAT.XML, lambda payload: payload.append({'name': 'a', 'desc': None}))
+        eq_(given, expected)
+
+    def test_xml_unsupported_values(self):
+        io = get_output_io(['name'], ['desc'])
+
+        # A list is turned into repeated elements by objectify
+        expected, given = self._get_values(io, SIMPLE_IO.FORMAT.XML, lambda payload: payload.append({'name': 'a', 'desc': [1, 2]}))
+        eq_(given, expected)
+
+        # Control characters can't be serialized in either case
+        for output_serializer in (None, OutputSerializer(io, SIMPLE_IO_CONFIG)):
+            payload = self._get_payload(io, SIMPLE_IO.FORMAT.XML, output_serializer, new_cid())
+            payload.append({'name': 'a\x01'})
+            self.assertRaises(ValueError, payload.getvalue)
+
+    def test_missing_optional_trace1(self):
+        io = get_output_io(['name'], ['desc'])
+        rows = [{'name': 'a', 'desc': ''}, {'name': 'b', 'desc': 'x'}, {'name': 'c'}]
+
+        trace_logger = logging.getLogger('{}.trace1'.format(__name__))
+        trace_logger.setLevel(TRACE1)
+        trace_logger.propagate = False
+
+        cid = new_cid()
+
+        for data_format in (SIMPLE_IO.FORMAT.XML, SIMPLE_IO.FORMAT.JSON):
+            values = []
+            messages = []
+
+            for output_serializer in (None, OutputSerializer(io, SIMPLE_IO_CONFIG)):
+                handler = ListHandler()
+                trace_logger.addHandler(handler)
+
+                payload = SimpleIOPayload(cid, trace_logger, data_format, io.output_required, io.output_optional,
+                    SIMPLE_IO_CONFIG, 'my_response', '', output_serializer)
+                payload[:] = rows
+
+                # Logging missing optional elements doesn't make the compiled serializer fall back to objectify
+                if output_serializer:
+                    with no_fallback():
+                        values.append(payload.getvalue())
+                else:
+                    values.append(payload.getvalue())
+
+                trace_logger.removeHandler(handler)
+                messages.append(handler.messages)
+
+            eq_(values[0], values[1])
+            eq_(messages[0], messages[1])
+            eq_(len(messages[1]), 2)
+
+    def test_missing_required(self):
+        io = get_output_io(['name'], ['desc'])
+
+        for data_format in (SIMPLE_IO.FORMAT.XML, SIMPLE_IO.FORMAT.JSON):
+            for output_serializer in (None, OutputSerializer(io, SIMPLE_IO_CONFIG)):
+                payload = self._get_payload(io, data_format, output_serializer, new_cid())
+                payload.append({'desc': 'a'})
+                self.assertRaises(ZatoException, payload.getvalue)
+
+class StreamedOutputTestCase(OutputTestCaseBase):
+
+    def _iter_rows(self, consumed=None):
+        for row in self.rows:
+            if consumed is not None:
+                consumed.append(row)
+            yield row
+
+    def _get_streamed(self, io, data_format, rows, batch_size):
+        """ Returns output of a streamed payload, as a list of chunks, and of the same one not streamed,
+        without and with a compiled serializer.
+        """
+        cid = new_cid()
+        values = []
+
+        for output_serializer in (None, OutputSerializer(io, SIMPLE_IO_CONFIG)):
+            streamed = self._get_payload(io, data_format, output_serializer, cid)
+            streamed[:] = iter(rows)
+
+            self.assertTrue(streamed.zato_is_streamed)
+
+            payload = self._get_payload(io, data_format, output_serializer, cid)
+            payload[:] = rows
+
+            values.append((list(streamed.itervalue(batch_size)), payload.getvalue()))
+
+        return values
+
+    def test_json_same_as_getvalue(self):
+        self._set_json_rows()
+
+        for rows in (self.rows, []):
+            for batch_size in (1, 3, 100):
+                for chunks, expected in self._get_streamed(self.io, SIMPLE_IO.FORMAT.JSON, rows, batch_size):
+                    eq_(b''.join(chunks), expected)
+
+    def test_xml_same_as_getvalue(self):
+
+        # There's a nil value among the rows so getvalue declares the xsi namespace too
+        for rows in (self.rows, []):
+            for batch_size in (1, 3, 100):
+                for chunks, expected in self._get_streamed(self.io, SIMPLE_IO.FORMAT.XML, rows, batch_size):
+                    eq_(b''.join(chunks), expected)
+
+    def test_chunks(self):
+        self._set_json_rows()
+        batch_size = 3
+
+        for data_format in (SIMPLE_IO.FORMAT.XML, SIMPLE_IO.FORMAT.JSON):
+            for (chunks, _) in self._get_streamed(self.io, data_format, self.rows, batch_size):
+
+                # Beginning of the document, one chunk per batch and the end of it
+                eq_(len(chunks), 1 + (len(self.rows) + batch_size - 1) // batch_size + 1)
+
+    def test_consumed_lazily(self):
+        self._set_json_rows()
+        batch_size = 3
+
+        for data_format in (SIMPLE_IO.FORMAT.XML, SIMPLE_IO.FORMAT.JSON):
+            consumed = []
+
+            payload = self._get_payload(self.io, data_format, OutputSerializer(self.io, SIMPLE_IO_CONFIG), new_cid())
+            payload[:] = self._iter_rows(consumed)
+
+            chunks = payload.itervalue(batch_size)
+            eq_(consumed, [])
+
+            # Beginning of the document doesn't need any output items
+            next(chunks)
+            eq_(consumed, [])
+
+            next(chunks)
+            eq_(len(consumed), batch_size)
+
+            next(chunks)
+            eq_(len(consumed), batch_size * 2)
+
+    def test_getvalue_consumes_stream(self):
+        self._set_json_rows()
+
+        for data_format in (SIMPLE_IO.FORMAT.XML, SIMPLE_IO.FORMAT.JSON):
+            for output_serializer in (None, OutputSerializer(self.io, SIMPLE_IO_CONFIG)):
+                cid = new_cid()
+
+                expected = self._get_payload(self.io, data_format, output_serializer, cid)
+                expected[:] = self.rows
+
+                payload = self._get_payload(self.io, data_format, output_serializer, cid)
+                payload[:] = self._iter_rows()
+                payload.append(self.rows[0])
+
+                self.assertFalse(payload.zato_is_streamed)
+                eq_(len(payload.zato_output), len(self.rows) + 1)
+
+                payload = self._get_payload(self.io, data_format, output_serializer, cid)
+                payload[:] = self._iter_rows()
+                eq_(payload.getvalue(), expected.getvalue())
+                self.assertFalse(payload.zato_is_streamed)
+
+    def test_response_iterable_body(self):
+        response = Response(logger)
+        response.payload = (chunk for chunk in ('a', 'b'))
+
+        self.assertTrue(response.is_streamed)
+        eq_(list(response.payload), ['a', 'b'])
+
+        response.payload = 'ab'
+        self.assertFalse(response.is_streamed)
+
+        response.init(new_cid(), self.io, SIMPLE_IO.FORMAT.JSON)
+        self.assertFalse(response.is_streamed)
+
+        response.payload[:] = self._iter_rows()
+        self.assertTrue(response.is_streamed)
+
+@attr('benchmark')
+class OutputSerializerBenchmarkTestCase(TestCase):
+    """ Compares compiled serializers against SimpleIOPayload.getvalue for list responses.
+    """
+    def test_benchmark(self):
+        io = get_output_io(['id', 'name', 'is_active', 'cluster_id', Integer('count')],
+            ['description', 'service_name', 'sec_type'], namespace='urn:zato:test')
+
+        rows = []
+        for idx in range(BENCHMARK_ROWS):
+            rows.append({'id': idx, 'name': 'name-{}'.format(idx), 'is_active': idx % 2 == 0, 'cluster_id': 1,
+                'count': idx, 'description': rand_string(), 'service_name': 'zato.ping', 'sec_type': ''})
+
+        cid = new_cid()
+
+        for data_format in (SIMPLE_IO.FORMAT.XML, SIMPLE_IO.FORMAT.JSON):
+            times = []
+
+            for output_serializer in (None, OutputSerializer(io, SIMPLE_IO_CONFIG)):
+                payload = SimpleIOPayload(cid, logger, data_format, io.output_required, io.output_optional,
+                    SIMPLE_IO_CONFIG, 'my_response', io.namespace, output_serializer)
+                payload[:] = rows
+
+                times.append(min(repeat(payload.getvalue, repeat=BENCHMARK_REPEAT, number=1)))
+
+            getvalue_time, compiled_time = times
+
+            logger.info('rows:[%s], data_format:[%s], getvalue:[%.4fs], compiled:[%.4fs], speedup:[%.2fx]',
+                BENCHMARK_ROWS, data_format, getvalue_time, compiled_time, getvalue_time / compiled_time)
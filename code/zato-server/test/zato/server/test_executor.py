@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from threading import Event, RLock, Thread
+from time import sleep
+from unittest import TestCase
+
+# nose
+from nose.tools import eq_
+
+# Zato
+from zato.common.test import rand_string
+from zato.server.executor import Executor
+
+class ExecutorTestCase(TestCase):
+
+    def _wait_for(self, predicate, timeout=5.0):
+        for x in range(int(timeout / 0.01)):
+            if predicate():
+                return
+            sleep(0.01)
+        self.fail('Predicate not met in {}s'.format(timeout))
+
+    def _get_stats(self, executor, channel):
+        for elem in executor.get_stats():
+            if elem['channel'] == channel:
+                return elem
+
+    def test_runs_concurrently(self):
+        channel = rand_string()
+        event = Event()
+        lock = RLock()
+        started = []
+
+        def func(idx):
+            with lock:
+                started.append(idx)
+            event.wait()
+
+        executor = Executor(pool_size=5)
+        executor.start()
+
+        for idx in range(5):
+            executor.submit(channel, func, idx)
+
+        # All of them must have been started even though none has completed yet
+        self._wait_for(lambda: len(started) == 5)
+        eq_(sorted(started), range(5))
+
+        event.set()
+        self._wait_for(lambda: self._get_stats(executor, channel)['completed'] == 5)
+
+        stats = self._get_stats(executor, channel)
+        eq_(stats['submitted'], 5)
+        eq_(stats['running'], 0)
+        eq_(stats['waiting'], 0)
+        eq_(stats['failed'], 0)
+        eq_(stats['pool_size'], 5)
+
+    def test_channel_limit(self):
+        limited, other = rand_string(), rand_string()
+        event = Event()
+        lock = RLock()
+        running = {'now': 0, 'max': 0}
+        other_done = []
+
+        def limited_func():
+            with lock:
+                running['now'] += 1
+                running['max'] = max(running['max'], running['now'])
+            event.wait()
+            with lock:
+                running['now'] -= 1
+
+        executor = Executor(pool_size=10, channel_limits={limited: 2})
+        executor.start()
+
+        for x in range(6):
+            executor.submit(limited, limited_func)
+
+        # The limited channel is saturated yet it doesn't hold up other channels
+        executor.submit(other, other_done.append, True)
+        self._wait_for(lambda: other_done == [True])
+
+        self._wait_for(lambda: self._get_stats(executor, limited)['running'] == 2)
+        stats = self._get_stats(executor, limited)
+        eq_(stats['waiting'], 4)
+        eq_(stats['limit'], 2)
+
+        event.set()
+        self._wait_for(lambda: self._get_stats(executor, limited)['completed'] == 6)
+
+        eq_(running['max'], 2)
+        eq_(self._get_stats(executor, limited)['waiting'], 0)
+        eq_(self._get_stats(executor, limited)['running'], 0)
+
+    def test_failures(self):
+        channel = rand_string()
+
+        def func():
+            raise Exception('Expected')
+
+        executor = Executor(pool_size=1)
+        executor.start()
+
+        executor.submit(channel, func)
+        executor.submit(channel, func)
+
+        self._wait_for(lambda: self._get_stats(executor, channel)['completed'] == 2)
+        eq_(self._get_stats(executor, channel)['failed'], 2)
+
+    def test_done_callback(self):
+        channel = rand_string()
+        event = Event()
+        done = []
+
+        executor = Executor(pool_size=1)
+        executor.start()
+
+        task = executor.submit(channel, event.wait)
+        task.add_done_callback(lambda: done.append(1))
+
+        sleep(0.1)
+        eq_(done, [])
+
+        event.set()
+        self._wait_for(lambda: done == [1])
+
+        # Added once the task is done, a callback is called right away
+        task.add_done_callback(lambda: done.append(2))
+        eq_(done, [1, 2])
+
+    def test_channel_queue_size(self):
+        channel = rand_string()
+        event = Event()
+        submitted = []
+
+        executor = Executor(pool_size=5, channel_limits={channel: 1}, channel_queue_size=2)
+        executor.start()
+
+        def submit():
+            for x in range(4):
+                executor.submit(channel, event.wait)
+                submitted.append(x)
+
+        thread = Thread(target=submit)
+        thread.daemon = True
+        thread.start()
+
+        # One is running, two are waiting and the fourth one blocks the caller
+        self._wait_for(lambda: len(submitted) == 3)
+        sleep(0.1)
+        eq_(len(submitted), 3)
+        eq_(self._get_stats(executor, channel)['waiting'], 2)
+
+        event.set()
+        self._wait_for(lambda: len(submitted) == 4)
+        self._wait_for(lambda: self._get_stats(executor, channel)['completed'] == 4)
+        thread.join()
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+
+"""
+Copyright (C) 2013 Dariusz Suchojad <dsuch at zato.io>
+
+Licensed under LGPLv3, see LICENSE.txt for terms and conditions.
+"""
+
+from __future__ import absolute_import, division, print_function, unicode_literals
+
+# stdlib
+from datetime import datetime
+from fnmatch import fnmatchcase
+from unittest import TestCase
+
+# nose
+from nose.tools import eq_
+
+# redis
+from redis.exceptions import ResponseError
+
+# Zato
+from zato.common import KVDB
+from zato.common.histogram import Histogram
+from zato.common.test import rand_int, rand_string
+from zato.server.stats import get_index_key, MaintenanceTool, rebuild_index, StatsAccumulator
+
+class FakePipeline(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *ignored):
+        pass
+
+    def __getattr__(self, name):
+        def _command(*args):
+            self.commands.append((name,) + args)
+        return _command
+
+    def execute(self):
+        if self.conn.fail:
+            raise Exception('Could not connect to the KVDB')
+
+        self.conn.executed.append(self.commands)
+        if self.conn.results:
+            return self.conn.results.pop(0)
+        return [self.conn.usage_result] * len(self.commands)
+
+class FakeConn(object):
+    def __init__(self, usage_result=0, results=None):
+        self.usage_result = usage_result
+        self.results = results or []
+        self.executed = []
+        self.fail = False
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+class FakeScanConn(FakeConn):
+    """ Returns keys matching a pattern a page at a time, the way SCAN does, or rejects SCAN
+    altogether the way Redis versions older than 2.8 do.
+    """
+    def __init__(self, keys, page_size=2, has_scan=True):
+        super(FakeScanConn, self).__init__()
+        self.keys_ = keys
+        self.page_size = page_size
+        self.has_scan = has_scan
+        self.scanned = 0
+        self.values = {}
+
+    def execute_command(self, command, cursor, _match, pattern, _count, count):
+        if not self.has_scan:
+            raise ResponseError("unknown command 'SCAN'")
+
+        self.scanned += 1
+        cursor = int(cursor)
+        page = self.keys_[cursor:cursor + self.page_size]
+        cursor = cursor + self.page_size if cursor + self.page_size < len(self.keys_) else 0
+
+        return [str(cursor), [key for key in page if fnmatchcase(key, pattern)]]
+
+    def keys(self, pattern):
+        return [key for key in self.keys_ if fnmatchcase(key, pattern)]
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def set(self, key, value):
+        self.values[key] = value
+
+class StatsAccumulatorTestCase(TestCase):
+
+    def test_incr_usage(self):
+        name = rand_string()
+        usage_result = rand_int()
+
+        acc = StatsAccumulator(FakeConn(usage_result))
+
+        eq_(acc.incr_usage(name), 1)
+        eq_(acc.incr_usage(name), 2)
+
+        acc.flush()
+
+        # What the KVDB returned plus what has not been flushed yet
+        eq_(acc.incr_usage(name), usage_result + 1)
+
+    def test_flush_batch(self):
+        name = rand_string()
+        minute = '2013:07:12:17:45'
+
+        conn = FakeConn()
+        acc = StatsAccumulator(conn, raw_by_minute_expire=123)
+
+        acc.incr_usage(name)
+        acc.incr_usage(name)
+        acc.add_time(name, 10, minute)
+        acc.add_time(name, 20, minute)
+
+        acc.flush()
+
+        # Everything goes out in one pipeline
+        eq_(len(conn.executed), 1)
+
+        raw_key = '{}{}'.format(KVDB.SERVICE_TIME_RAW, name)
+        raw_by_minute_key = '{}{}:{}'.format(KVDB.SERVICE_TIME_RAW_BY_MINUTE, name, minute)
+
+        hist = Histogram()
+        hist.add(10)
+        hist.add(20)
+
+        raw_by_minute_index_key = get_index_key(KVDB.SERVICE_TIME_RAW_BY_MINUTE, minute)
+
+        expected = [
+            ('incrby', '{}{}'.format(KVDB.SERVICE_USAGE, name), 2),
+            ('hset', '{}{}'.format(KVDB.SERVICE_TIME_BASIC, name), 'last', 20),
+            ('sadd', get_index_key(KVDB.SERVICE_TIME_RAW), name),
+            ('sadd', raw_by_minute_index_key, name),
+            ('expire', raw_by_minute_key, 123),
+            ('expire', raw_by_minute_index_key, 123),
+        ]
+
+        # Histograms are merged into what's already in the KVDB
+        for field, value in hist.to_kvdb_increments():
+            expected.append(('hincrby', raw_key, field, value))
+            expected.append(('hincrby', raw_by_minute_key, field, value))
+
+        eq_(sorted(conn.executed[0]), sorted(expected))
+
+    def test_flush_nothing_pending(self):
+        conn = FakeConn()
+        acc = StatsAccumulator(conn)
+
+        acc.flush()
+        eq_(conn.executed, [])
+
+        acc.incr_usage(rand_string())
+        acc.flush()
+        acc.flush()
+        eq_(len(conn.executed), 1)
+
+    def test_flush_failed(self):
+        name = rand_string()
+        minute = '2013:07:12:17:45'
+
+        conn = FakeConn()
+        acc = StatsAccumulator(conn)
+
+        acc.incr_usage(name)
+        acc.add_time(name, 10, minute)
+
+        conn.fail = True
+        self.assertRaises(Exception, acc.flush)
+
+        # Nothing has been lost, what has been collected since then goes out along with it
+        acc.incr_usage(name)
+        acc.add_time(name, 20, minute)
+
+        conn.fail = False
+        acc.flush()
+
+        hist = Histogram()
+        hist.add(10)
+        hist.add(20)
+
+        commands = conn.executed[0]
+        raw_key = '{}{}'.format(KVDB.SERVICE_TIME_RAW, name)
+
+        self.assertIn(('incrby', '{}{}'.format(KVDB.SERVICE_USAGE, name), 2), commands)
+        self.assertIn(('hset', '{}{}'.format(KVDB.SERVICE_TIME_BASIC, name), 'last', 20), commands)
+        eq_(sorted(command[2:] for command in commands if command[:2] == ('hincrby', raw_key)),
+            sorted(hist.to_kvdb_increments()))
+
+    def test_stop(self):
+        conn = FakeConn()
+        acc = StatsAccumulator(conn)
+
+        acc.incr_usage(rand_string())
+        acc.stop()
+
+        eq_(acc.keep_running, False)
+        eq_(len(conn.executed), 1)
+
+class MaintenanceToolTestCase(TestCase):
+
+    def test_delete(self):
+        name1, name2, name3 = rand_string(), rand_string(), rand_string()
+
+        start = datetime(2013, 7, 12, 17, 45)
+        stop = datetime(2013, 7, 12, 17, 47)
+        suffixes = ['2013:07:12:17:45', '2013:07:12:17:46', '2013:07:12:17:47']
+
+        conn = FakeConn(results=[[set([name1, name2]), set(), set([name3])]])
+        MaintenanceTool(conn).delete(start, stop, None)
+
+        # One pipeline to read the indexes and one to delete the keys, no KEYS whatsoever
+        eq_(len(conn.executed), 2)
+
+        index_keys = [get_index_key(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, suffix) for suffix in suffixes]
+        eq_(conn.executed[0], [('smembers', index_key) for index_key in index_keys])
+
+        def get_key(name, suffix):
+            return '{}{}:{}'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, name, suffix)
+
+        expected = [
+            ('delete', get_key(name1, suffixes[0])),
+            ('delete', get_key(name2, suffixes[0])),
+            ('delete', get_key(name3, suffixes[2])),
+        ]
+        expected.extend(('delete', index_key) for index_key in index_keys)
+
+        eq_(sorted(conn.executed[1]), sorted(expected))
+
+class RebuildIndexTestCase(TestCase):
+
+    def get_keys(self, name1, name2):
+        return [
+            '{}{}:2013:07:12:17:45'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, name1),
+            '{}{}:2013:07:12:17:45'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, name2),
+            '{}{}:2013:07:12'.format(KVDB.SERVICE_TIME_AGGREGATED_BY_DAY, name1),
+            '{}{}:2013'.format(KVDB.SERVICE_SUMMARY_BY_YEAR, name2),
+            '{}{}'.format(KVDB.SERVICE_USAGE, name1),
+        ]
+
+    def get_expected(self, name1, name2):
+        return sorted([
+            ('sadd', get_index_key(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, '2013:07:12:17:45'), name1),
+            ('sadd', get_index_key(KVDB.SERVICE_TIME_AGGREGATED_BY_MINUTE, '2013:07:12:17:45'), name2),
+            ('sadd', get_index_key(KVDB.SERVICE_TIME_AGGREGATED_BY_DAY, '2013:07:12'), name1),
+            ('sadd', get_index_key(KVDB.SERVICE_SUMMARY_BY_YEAR, '2013'), name2),
+        ])
+
+    def get_executed(self, conn):
+        return sorted(command for commands in conn.executed for command in commands)
+
+    def test_rebuild_index(self):
+
+        # Service names may contain colons
+        name1, name2 = rand_string(), '{}:{}'.format(rand_string(), rand_string())
+
+        conn = FakeScanConn(self.get_keys(name1, name2))
+        rebuild_index(conn)
+
+        # Each of the prefixes has been walked through in more than one page
+        self.assertTrue(conn.scanned > 8)
+
+        eq_(self.get_executed(conn), self.get_expected(name1, name2))
+        self.assertTrue(conn.values[KVDB.SERVICE_STATS_INDEX_REBUILT])
+
+        # The index is rebuilt only once
+        conn.executed[:] = []
+        conn.scanned = 0
+        rebuild_index(conn)
+
+        eq_(conn.executed, [])
+        eq_(conn.scanned, 0)
+
+    def test_rebuild_index_no_scan(self):
+        name1, name2 = rand_string(), rand_string()
+
+        conn = FakeScanConn(self.get_keys(name1, name2), has_scan=False)
+        rebuild_index(conn)
+
+        eq_(self.get_executed(conn), self.get_expected(name1, name2))
@@ -21,7 +21,8 @@ $(document).ready(function() {
     $.fn.zato.data_table.class_ = $.fn.zato.data_table.ChannelAMQP;
     $.fn.zato.data_table.new_row_func = $.fn.zato.channel.amqp.data_table.new_row;
     $.fn.zato.data_table.parse();
-    $.fn.zato.data_table.setup_forms(['name', 'def_id', 'queue', 'consumer_tag_prefix', 'service']);
+    $.fn.zato.data_table.setup_forms(['name', 'def_id', 'queue', 'consumer_tag_prefix', 'service',
+        'prefetch_count', 'ack_every', 'ack_interval', 'consumers']);
 })
 
 $.fn.zato.channel.amqp.create = function() {
@@ -55,6 +56,11 @@ $.fn.zato.channel.amqp.data_table.new_row = function(item, data, include_tr) {
     row += String.format("<td class='ignore item_id_{0}'>{0}</td>", item.id);
     row += String.format("<td class='ignore'>{0}</td>", is_active);
     row += String.format("<td class='ignore'>{0}</td>", item.def_id);
+    row += String.format("<td class='ignore'>{0}</td>", item.data_format);
+    row += String.format("<td class='ignore'>{0}</td>", item.prefetch_count);
+    row += String.format("<td class='ignore'>{0}</td>", item.ack_every);
+    row += String.format("<td class='ignore'>{0}</td>", item.ack_interval);
+    row += String.format("<td class='ignore'>{0}</td>", item.consumers);
 
     if(include_tr) {
         row += '</tr>';
@@ -76,6 +76,25 @@ $.fn.zato.http_soap.data_table.new_row = function(item, data, include_tr) {
 	}
     row += String.format("<td class='ignore item_id_{0}'>{0}</td>", item.id);
     row += String.format("<td class='ignore'>{0}</td>", is_active);
+    row += String.format("<td class='ignore'>{0}</td>", item.security);
+    row += String.format("<td class='ignore'>{0}</td>", item.service);
+    row += String.format("<td class='ignore'>{0}</td>", item.data_format);
+    row += String.format("<td class='ignore'>{0}</td>", item.request_streaming == true);
+    row += String.format("<td class='ignore'>{0}</td>", item.timeout ? item.timeout : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.cb_error_threshold ? item.cb_error_threshold : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.cb_latency_threshold ? item.cb_latency_threshold : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.cb_open_period ? item.cb_open_period : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.cb_half_open_probes ? item.cb_half_open_probes : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.pool_size ? item.pool_size : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.pool_max_per_host ? item.pool_max_per_host : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.pool_block == true);
+    row += String.format("<td class='ignore'>{0}</td>", item.keep_alive == true);
+    row += String.format("<td class='ignore'>{0}</td>", item.max_retries ? item.max_retries : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.dns_cache_ttl ? item.dns_cache_ttl : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.cache_ttl ? item.cache_ttl : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.cache_size ? item.cache_size : '');
+    row += String.format("<td class='ignore'>{0}</td>", item.cache_kvdb == true);
+    row += String.format("<td class='ignore'>{0}</td>", item.cache_key_headers ? item.cache_key_headers : '');
 
     if(include_tr) {
         row += '</tr>';
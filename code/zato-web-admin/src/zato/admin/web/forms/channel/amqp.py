@@ -16,6 +16,7 @@ from django import forms
 
 # Zato
 from zato.admin.web.forms import DataFormatForm
+from zato.common import AMQP
 
 class CreateForm(DataFormatForm):
     name = forms.CharField(widget=forms.TextInput(attrs={'style':'width:100%'}))
@@ -24,6 +25,10 @@ class CreateForm(DataFormatForm):
     queue = forms.CharField(widget=forms.TextInput(attrs={'style':'width:50%'}))
     consumer_tag_prefix = forms.CharField(widget=forms.TextInput(attrs={'style':'width:50%'}))
     service = forms.CharField(widget=forms.TextInput(attrs={'style':'width:100%'}))
+    prefetch_count = forms.CharField(initial=AMQP.DEFAULT.PREFETCH_COUNT, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    ack_every = forms.CharField(initial=AMQP.DEFAULT.ACK_EVERY, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    ack_interval = forms.CharField(initial=AMQP.DEFAULT.ACK_INTERVAL, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    consumers = forms.CharField(initial=AMQP.DEFAULT.CONSUMERS, widget=forms.TextInput(attrs={'style':'width:20%'}))
 
     def __init__(self, prefix=None, post_data=None):
         super(CreateForm, self).__init__(post_data, prefix=prefix)
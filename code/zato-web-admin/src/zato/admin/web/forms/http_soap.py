@@ -26,6 +26,22 @@ class CreateForm(DataFormatForm):
     soap_version = forms.ChoiceField(widget=forms.Select())
     service = forms.CharField(widget=forms.TextInput(attrs={'style':'width:100%'}))
     security = forms.ChoiceField(widget=forms.Select())
+    request_streaming = forms.BooleanField(required=False, widget=forms.CheckboxInput())
+    timeout = forms.IntegerField(required=False, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    cb_error_threshold = forms.IntegerField(required=False, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    cb_latency_threshold = forms.IntegerField(required=False, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    cb_open_period = forms.IntegerField(required=False, initial=30, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    cb_half_open_probes = forms.IntegerField(required=False, initial=1, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    pool_size = forms.IntegerField(required=False, initial=10, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    pool_max_per_host = forms.IntegerField(required=False, initial=10, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    pool_block = forms.BooleanField(required=False, widget=forms.CheckboxInput())
+    keep_alive = forms.BooleanField(required=False, widget=forms.CheckboxInput(attrs={'checked':'checked'}))
+    max_retries = forms.IntegerField(required=False, initial=0, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    dns_cache_ttl = forms.IntegerField(required=False, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    cache_ttl = forms.IntegerField(required=False, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    cache_size = forms.IntegerField(required=False, initial=1000, widget=forms.TextInput(attrs={'style':'width:20%'}))
+    cache_kvdb = forms.BooleanField(required=False, widget=forms.CheckboxInput())
+    cache_key_headers = forms.CharField(required=False, widget=forms.TextInput(attrs={'style':'width:100%'}))
     connection = forms.CharField(widget=forms.HiddenInput())
     transport = forms.CharField(widget=forms.HiddenInput())
 
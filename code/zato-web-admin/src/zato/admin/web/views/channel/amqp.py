@@ -40,6 +40,10 @@ def _get_edit_create_message(params, prefix=''):
         'consumer_tag_prefix': params[prefix + 'consumer_tag_prefix'],
         'service': params[prefix + 'service'],
         'data_format': params.get(prefix + 'data_format'),
+        'prefetch_count': params.get(prefix + 'prefetch_count'),
+        'ack_every': params.get(prefix + 'ack_every'),
+        'ack_interval': params.get(prefix + 'ack_interval'),
+        'consumers': params.get(prefix + 'consumers'),
     }
 
 def _edit_create_response(client, verb, id, name, def_id, cluster_id):
@@ -61,6 +65,7 @@ class Index(_Index):
         input_required = ('cluster_id',)
         output_required = ('id', 'name', 'is_active', 'queue', 'consumer_tag_prefix', 
             'def_name', 'def_id', 'service_name', 'data_format')
+        output_optional = ('prefetch_count', 'ack_every', 'ack_interval', 'consumers')
         output_repeated = True
     
     def handle(self):
@@ -73,6 +73,22 @@ def _get_edit_create_message(params, prefix=''):
         'data_format': params.get(prefix + 'data_format', None),
         'service': params.get(prefix + 'service'),
         'security_id': security_id,
+        'request_streaming': bool(params.get(prefix + 'request_streaming')),
+        'timeout': params.get(prefix + 'timeout'),
+        'cb_error_threshold': params.get(prefix + 'cb_error_threshold'),
+        'cb_latency_threshold': params.get(prefix + 'cb_latency_threshold'),
+        'cb_open_period': params.get(prefix + 'cb_open_period'),
+        'cb_half_open_probes': params.get(prefix + 'cb_half_open_probes'),
+        'pool_size': params.get(prefix + 'pool_size'),
+        'pool_max_per_host': params.get(prefix + 'pool_max_per_host'),
+        'pool_block': bool(params.get(prefix + 'pool_block')),
+        'keep_alive': bool(params.get(prefix + 'keep_alive')),
+        'max_retries': params.get(prefix + 'max_retries'),
+        'dns_cache_ttl': params.get(prefix + 'dns_cache_ttl'),
+        'cache_ttl': params.get(prefix + 'cache_ttl'),
+        'cache_size': params.get(prefix + 'cache_size'),
+        'cache_kvdb': bool(params.get(prefix + 'cache_kvdb')),
+        'cache_key_headers': params.get(prefix + 'cache_key_headers'),
     }
 
 def _edit_create_response(id, verb, transport, connection, name):
@@ -150,7 +166,14 @@ def index(req):
             item = HTTPSOAP(item.id, item.name, item.is_active, item.is_internal, connection, 
                     transport, item.host, item.url_path, item.method, item.soap_action,
                     item.soap_version, item.data_format, service_id=item.service_id,
-                    service_name=item.service_name, security_id=security_id, security_name=security_name)
+                    service_name=item.service_name, security_id=security_id, security_name=security_name,
+                    request_streaming=item.request_streaming, timeout=item.timeout,
+                    cb_error_threshold=item.cb_error_threshold, cb_latency_threshold=item.cb_latency_threshold,
+                    cb_open_period=item.cb_open_period, cb_half_open_probes=item.cb_half_open_probes,
+                    pool_size=item.pool_size, pool_max_per_host=item.pool_max_per_host, pool_block=item.pool_block,
+                    keep_alive=item.keep_alive is not False, max_retries=item.max_retries, dns_cache_ttl=item.dns_cache_ttl,
+                    cache_ttl=item.cache_ttl, cache_size=item.cache_size, cache_kvdb=item.cache_kvdb,
+                    cache_key_headers=item.cache_key_headers)
             items.append(item)
 
     return_data = {'zato_clusters':req.zato.clusters,